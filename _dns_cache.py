@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Persistent DNS Answer Cache ---
+# Purpose: SQLite-backed key -> answer store used by _nslookup_tool.py --cache so that
+#          daily reruns of the same inventory only send queries for names whose cached
+#          answer has expired. Entries honor the record TTL (or a --max-age override)
+#          and the table is kept under a size bound by evicting least recently used rows.
+
+import json
+import sqlite3
+import time
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_MAX_ENTRIES = 100000 # LRU size bound for the cache file
+DEFAULT_NEGATIVE_TTL = 300   # Seconds to keep NXDOMAIN/NoAnswer when the reply has no SOA
+WRITE_BATCH_SIZE = 1000      # Buffered puts/touches flushed per transaction
+MMAP_SIZE_BYTES = 256 * 1024 * 1024 # Let SQLite memory-map the file for cheap lookups
+
+
+class DnsAnswerCache:
+    """
+    On-disk cache of DNS answers keyed by (server, name, record type).
+    Values are any JSON-serializable object (the tool stores its CSV row fields).
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, max_age=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age # When set, replaces the stored TTL as the freshness limit
+        self.hits = 0
+        self.misses = 0
+        self._pending_puts = []
+        self._touched = []
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"PRAGMA mmap_size={MMAP_SIZE_BYTES}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(server, qname, rdtype):
+        """Builds the cache key; answers from different DNS servers are kept apart."""
+        return f"{server}|{str(qname).lower()}|{rdtype}"
+
+    def get(self, key, now=None):
+        """Returns the cached value for key, or None if missing or expired."""
+        now = time.time() if now is None else now
+        row = self.conn.execute(
+            "SELECT value, stored_at, expires_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        value, stored_at, expires_at = row
+        valid_until = stored_at + self.max_age if self.max_age is not None else expires_at
+        if now >= valid_until:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched.append((now, key))
+        if len(self._touched) >= WRITE_BATCH_SIZE:
+            self.flush()
+        return json.loads(value)
+
+    def put(self, key, value, ttl, now=None):
+        """Stores value under key for ttl seconds (writes are batched, see flush())."""
+        now = time.time() if now is None else now
+        self._pending_puts.append((key, json.dumps(value), now, now + max(0, ttl), now))
+        if len(self._pending_puts) >= WRITE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Writes buffered puts and LRU touches in one transaction."""
+        if not self._pending_puts and not self._touched:
+            return
+        with self.conn:
+            if self._pending_puts:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO answers (key, value, stored_at, expires_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                    self._pending_puts
+                    )
+            if self._touched:
+                self.conn.executemany("UPDATE answers SET last_used = ? WHERE key = ?", self._touched)
+        self._pending_puts = []
+        self._touched = []
+
+    def evict(self):
+        """Deletes least recently used entries until the table is within max_entries. Returns rows removed."""
+        self.flush()
+        count = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return 0
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used ASC LIMIT ?)",
+                (excess,)
+                )
+        return excess
+
+    def close(self):
+        """Flushes pending writes, applies the size bound and closes the database."""
+        try:
+            self.evict()
+        finally:
+            self.conn.close()
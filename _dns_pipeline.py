@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Pipelined DNS Query Engine ---
+# Purpose: Resolves large batches of (name, record type) queries by sending bursts of
+#          pre-built DNS packets over a few UDP sockets instead of one resolver.resolve()
+#          round trip per item. Replies are matched by transaction ID, retransmits are
+#          driven by our own timers, and truncated replies are retried over TCP.
+#          Used by _nslookup_tool.py --pipeline; run directly for a throughput benchmark.
+
+import heapq
+import random
+import selectors
+import socket
+import struct
+import sys
+import time
+
+# --- Required 3rd Party Library ---
+try:
+    import dns.exception
+    import dns.message
+    import dns.name
+    import dns.query
+    import dns.rdatatype
+except ImportError:
+    print("Error: 'dnspython' library not found.")
+    print("Please install it using: pip install dnspython")
+    sys.exit(1)
+# --- End Required Library ---
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_TIMEOUT = 2.0   # Seconds to wait for a reply before retransmitting
+DEFAULT_RETRIES = 2     # Retransmits per query after the first send (UDP only)
+DEFAULT_WINDOW = 2000   # Max queries in flight across all sockets
+DEFAULT_SOCKETS = 1     # UDP sockets to spread the in-flight window over
+RECV_BUFSIZE = 65535    # Max UDP datagram size we accept
+SOCKET_BUFFER_BYTES = 4 * 1024 * 1024 # Ask the kernel for roomy buffers for bursts
+
+
+class _QueryState:
+    """Book-keeping for one query while it moves through the pipeline."""
+    __slots__ = ('index', 'query', 'wire', 'question', 'attempts', 'generation')
+
+    def __init__(self, index, query, wire):
+        self.index = index
+        self.query = query
+        self.wire = wire               # Pre-built packet; the ID bytes are patched per send
+        self.question = wire[12:].lower() # Echoed back in replies (case-insensitively)
+        self.attempts = 0
+        self.generation = 0
+
+
+_RDTYPE_CODES = {}
+
+
+def build_query_wire(qname, rdtype):
+    """
+    Builds the wire format of a recursive query for qname/rdtype (text or dnspython
+    objects) with a zero transaction ID. Plain ASCII names are encoded directly since
+    going through dns.message costs more than the rest of the pipeline combined.
+    """
+    code = _RDTYPE_CODES.get(rdtype)
+    if code is None:
+        code = _RDTYPE_CODES[rdtype] = int(dns.rdatatype.RdataType.make(rdtype))
+    if isinstance(qname, str) and qname.isascii() and '\\' not in qname:
+        labels = qname.rstrip('.').split('.') if qname not in ('', '.') else []
+        if all(0 < len(label) < 64 for label in labels):
+            name_wire = b''.join(bytes((len(label),)) + label.encode('ascii') for label in labels) + b'\x00'
+            if len(name_wire) <= 255:
+                return b'\x00\x00\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00' + name_wire + struct.pack('!HH', code, 1)
+    if not isinstance(qname, dns.name.Name):
+        qname = dns.name.from_text(qname)
+    message = dns.message.make_query(qname, code)
+    message.id = 0
+    return message.to_wire()
+
+
+def parse_response(wire):
+    """Parses a reply returned by resolve_pipelined() into a dns.message.Message."""
+    return dns.message.from_wire(wire, ignore_trailing=True)
+
+
+def _tcp_fallback(state, servers, timeout):
+    """Re-asks a query that came back truncated over TCP. Returns a (response_wire, error) tuple."""
+    error = None
+    message = dns.message.from_wire(state.wire)
+    message.id = random.randint(0, 65535)
+    for ns, ns_port in servers:
+        try:
+            return dns.query.tcp(message, ns, timeout=timeout, port=ns_port).to_wire(), None
+        except (dns.exception.DNSException, OSError) as e:
+            error = e
+    return None, error
+
+
+def _canonical_address(address):
+    """address as recvfrom() reports it (IPv6 written in its shortest form)."""
+    if ':' in address:
+        try:
+            return socket.inet_ntop(socket.AF_INET6, socket.inet_pton(socket.AF_INET6, address.split('%', 1)[0]))
+        except OSError:
+            pass
+    return address
+
+
+def iter_resolve_pipelined(queries, nameservers, port=53, timeout=DEFAULT_TIMEOUT,
+                           retries=DEFAULT_RETRIES, window=DEFAULT_WINDOW, sockets=DEFAULT_SOCKETS):
+    """
+    Resolves an iterable of (qname, rdtype) pairs against the given nameservers and
+    yields ((qname, rdtype), (response_wire, error)) in input order. Exactly one of
+    response_wire (raw reply bytes, see parse_response) or error (an exception) is set.
+
+    `queries` may contain None placeholders (e.g. for answers the caller found in a
+    cache); they are passed straight through as (None, (None, None)) in their slot.
+    `queries` is consumed lazily, only as fast as the in-flight window drains, and
+    replies that arrive ahead of older queries count against the window too, so memory
+    stays bounded by `window` however long the input is. Retransmits rotate through
+    `nameservers`; the first reply with a matching ID and question wins. `nameservers`
+    may mix IPv4 and IPv6 addresses; `sockets` UDP sockets are opened per address family.
+    """
+    if not nameservers:
+        raise ValueError("At least one nameserver is required")
+    servers = [(ns, port) for ns in nameservers]
+    server_families = [socket.AF_INET6 if ':' in ns else socket.AF_INET for ns in nameservers]
+    queries = iter(queries)
+    retry_queue = [] # Timed-out queries waiting to be re-sent; they go out before new ones
+    done = {}        # index -> (query, reply) finished out of order, waiting to be yielded
+    next_index = 0   # Index given to the next query pulled from `queries`
+    next_yield = 0   # Index of the next result to hand back to the caller
+    exhausted = False
+
+    selector = selectors.DefaultSelector()
+    socks = []
+    family_slots = {} # Address family -> indexes into socks of that family's sockets
+    for family in dict.fromkeys(server_families):
+        for _ in range(max(1, sockets)):
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            for opt in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, opt, SOCKET_BUFFER_BYTES)
+                except OSError:
+                    pass # Not fatal, the kernel default just means smaller bursts
+            # Each socket owns a shuffled pool of free transaction IDs and its in-flight map
+            free_ids = list(range(65536))
+            random.shuffle(free_ids)
+            slot = {'sock': sock, 'free_ids': free_ids, 'inflight': {}}
+            family_slots.setdefault(family, []).append(len(socks))
+            socks.append(slot)
+            selector.register(sock, selectors.EVENT_READ, slot)
+
+    window = max(1, min(window, 65536 * len(socks)))
+    valid_sources = {_canonical_address(ns) for ns in nameservers}
+    timers = [] # heap of (deadline, seq, slot_index, qid, generation)
+    seq = 0
+    inflight_total = 0
+    next_slot = dict.fromkeys(family_slots, 0) # Round-robin position per family
+
+    try:
+        while True:
+            # --- Hand back everything that is complete, in input order (frees window space) ---
+            while next_yield in done:
+                yield done.pop(next_yield)
+                next_yield += 1
+
+            # --- Fill the window (retries first, then new queries from the input) ---
+            now = time.monotonic()
+            while inflight_total + len(done) < window:
+                if retry_queue:
+                    state = retry_queue.pop()
+                elif not exhausted:
+                    try:
+                        query = next(queries)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if query is None:
+                        # Placeholder for an answer the caller already has; keeps its slot in the output order
+                        done[next_index] = (None, (None, None))
+                        next_index += 1
+                        continue
+                    state = _QueryState(next_index, query, build_query_wire(*query))
+                    next_index += 1
+                else:
+                    break
+                server_index = state.attempts % len(servers)
+                family = server_families[server_index]
+                slot_indexes = family_slots[family]
+                slot_index = slot_indexes[next_slot[family]]
+                next_slot[family] = (next_slot[family] + 1) % len(slot_indexes)
+                slot = socks[slot_index]
+                if not slot['free_ids']:
+                    retry_queue.append(state)
+                    break
+                qid = slot['free_ids'].pop()
+                server = servers[server_index]
+                try:
+                    slot['sock'].sendto(struct.pack('!H', qid) + state.wire[2:], server)
+                except BlockingIOError:
+                    # Send buffer full: put the query back and drain replies first
+                    slot['free_ids'].append(qid)
+                    retry_queue.append(state)
+                    break
+                except OSError as e:
+                    slot['free_ids'].append(qid)
+                    done[state.index] = (state.query, (None, e))
+                    continue
+                state.attempts += 1
+                state.generation += 1
+                slot['inflight'][qid] = state
+                inflight_total += 1
+                seq += 1
+                heapq.heappush(timers, (now + timeout, seq, slot_index, qid, state.generation))
+
+            if not inflight_total:
+                if exhausted and not retry_queue and not done:
+                    break
+                continue # Only local send errors completed this round; yield them and refill
+
+            # --- Wait for replies or the next retransmit deadline ---
+            wait = timeout
+            if timers:
+                wait = max(0.0, timers[0][0] - time.monotonic())
+            for key, _ in selector.select(wait):
+                slot = key.data
+                sock = slot['sock']
+                while True:
+                    try:
+                        data, source = sock.recvfrom(RECV_BUFSIZE)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        break # e.g. ICMP port unreachable surfaced on the socket
+                    if len(data) < 12 or source[0].split('%', 1)[0] not in valid_sources:
+                        continue
+                    qid = (data[0] << 8) | data[1]
+                    state = slot['inflight'].get(qid)
+                    if state is None:
+                        continue # Late duplicate or stray packet
+                    truncated = data[2] & 0x02
+                    # Must be a response (QR bit) echoing our question; parsing is left to the caller
+                    if not data[2] & 0x80 or (not truncated and
+                                              data[12:12 + len(state.question)].lower() != state.question):
+                        continue
+                    del slot['inflight'][qid]
+                    slot['free_ids'].append(qid)
+                    inflight_total -= 1
+                    state.generation += 1 # Invalidate the pending retransmit timer
+                    if truncated:
+                        # Rare, so it is fine to block the pipeline briefly for the TCP retry
+                        done[state.index] = (state.query, _tcp_fallback(state, servers, timeout))
+                    else:
+                        done[state.index] = (state.query, (data, None))
+
+            # --- Expire timers: retransmit or give up ---
+            now = time.monotonic()
+            while timers and timers[0][0] <= now:
+                _, _, slot_index, qid, generation = heapq.heappop(timers)
+                slot = socks[slot_index]
+                state = slot['inflight'].get(qid)
+                if state is None or state.generation != generation:
+                    continue # Already answered (or re-sent under a new timer)
+                del slot['inflight'][qid]
+                slot['free_ids'].append(qid)
+                inflight_total -= 1
+                if state.attempts <= retries:
+                    retry_queue.append(state)
+                else:
+                    done[state.index] = (state.query, (None, dns.exception.Timeout(timeout=timeout * state.attempts)))
+    finally:
+        selector.close()
+        for slot in socks:
+            slot['sock'].close()
+
+
+def resolve_pipelined(queries, nameservers, **kwargs):
+    """
+    Resolves a list of (qname, rdtype) pairs and returns a list of (response_wire, error)
+    tuples aligned with `queries`. See iter_resolve_pipelined() for the keyword options.
+    """
+    return [reply for _, reply in iter_resolve_pipelined(queries, nameservers, **kwargs)]
+
+
+# --- Benchmark ---
+
+def _stub_responder(port_holder, ready):
+    """
+    Minimal UDP responder for the benchmark: answers A queries with 127.0.0.1 and
+    everything else with NXDOMAIN, built straight from the query bytes.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_BYTES)
+    sock.bind(('127.0.0.1', 0))
+    port_holder.value = sock.getsockname()[1]
+    ready.set()
+    answer_a = b'\xc0\x0c\x00\x01\x00\x01\x00\x00\x01\x2c\x00\x04\x7f\x00\x00\x01'
+    while True:
+        data, source = sock.recvfrom(RECV_BUFSIZE)
+        if len(data) < 17:
+            continue
+        qend = data.index(b'\x00', 12) + 5 # End of QNAME + QTYPE + QCLASS
+        qtype = data[qend - 4:qend - 2]
+        if qtype == b'\x00\x01':
+            reply = data[:2] + b'\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00' + data[12:qend] + answer_a
+        else:
+            reply = data[:2] + b'\x81\x83\x00\x01\x00\x00\x00\x00\x00\x00' + data[12:qend]
+        sock.sendto(reply, source)
+
+
+def run_benchmark(count, server=None, port=53, sockets=DEFAULT_SOCKETS, window=DEFAULT_WINDOW):
+    """Resolves `count` synthetic names and prints the achieved queries/second."""
+    responder = None
+    if not server:
+        import multiprocessing
+        port_holder = multiprocessing.Value('i', 0)
+        ready = multiprocessing.Event()
+        responder = multiprocessing.Process(target=_stub_responder, args=(port_holder, ready), daemon=True)
+        responder.start()
+        ready.wait(5)
+        server, port = '127.0.0.1', port_holder.value
+        print(f"Started local stub responder on {server}:{port}")
+
+    queries = [(f"host{i}.bench.example.", 'A') for i in range(count)]
+    print(f"Resolving {count} queries via {server}:{port} (sockets={sockets}, window={window})...")
+    start = time.perf_counter()
+    results = resolve_pipelined(queries, [server], port=port, sockets=sockets, window=window)
+    elapsed = time.perf_counter() - start
+    answered = sum(1 for response, _ in results if response is not None)
+    print(f"Answered: {answered}/{count}  Elapsed: {elapsed:.3f}s  Rate: {count / elapsed:,.0f} qps")
+
+    if responder is not None:
+        responder.terminate()
+    return count / elapsed
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipelined DNS engine. Without --server a local stub responder is started.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+    parser.add_argument("-n", "--count", type=int, default=50000, help="Number of queries to send.")
+    parser.add_argument("-s", "--server", help="Resolver IP to benchmark against (e.g. a local unbound).")
+    parser.add_argument("-p", "--port", type=int, default=53, help="Resolver port (with --server).")
+    parser.add_argument("--sockets", type=int, default=DEFAULT_SOCKETS, help="UDP sockets to use.")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="Max queries in flight.")
+    bench_args = parser.parse_args()
+    run_benchmark(bench_args.count, server=bench_args.server, port=bench_args.port,
+                  sockets=bench_args.sockets, window=bench_args.window)
@@ -2,20 +2,78 @@ import ipaddress
 import sys
 import csv
 import datetime
-import argparse # Module for command-line arguments
 import os
+import collections
+import importlib
+import queue
+import threading
+import time
 
 # --- Required 3rd Party Library ---
-try:
-    import dns.resolver
-    import dns.reversename
-    import dns.exception
-except ImportError:
-    print("Error: 'dnspython' library not found.")
-    print("Please install it using: pip install dnspython")
-    sys.exit(1)
+# dnspython (like argparse and the local helper modules) is imported on first use, so
+# '--help' and importing this file as a library (see resolve_many()) stay fast.
+dns = None
+
+def import_dnspython():
+    """Imports dnspython into the module namespace. Raises ConfigError if it is missing."""
+    global dns
+    if dns is not None:
+        return
+    try:
+        import dns.resolver
+        import dns.reversename
+        import dns.exception
+        import dns.name
+        import dns.rcode
+        import dns.rdataclass
+        import dns.rdatatype
+    except ImportError:
+        raise ConfigError("'dnspython' library not found.\nPlease install it using: pip install dnspython")
 # --- End Required Library ---
 
+
+class ConfigError(Exception):
+    """Invalid input or settings; main() prints it and exits with status 1."""
+
+
+# --- Console Output ---
+verbose = True  # Progress messages; resolve_many() turns them off unless asked
+renderer = None # progress_render.ProgressRenderer during a command line run (--progress / --quiet)
+profiler = None # stage_profiler.StageProfiler with --profile, else its no-op NULL_PROFILER; set by configure()
+
+def log(message=""):
+    if verbose:
+        print(message)
+
+def report(message, failed=False):
+    """Per-item line: buffered by the renderer during a command line run, printed directly otherwise."""
+    if renderer is not None:
+        with profiler.stage('render'):
+            renderer.detail(message, failed)
+    elif verbose:
+        print(message)
+
+def import_shared(name):
+    """Imports a helper module shared with the network test scripts in infra_testing_script/."""
+    shared_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'infra_testing_script')
+    if shared_dir not in sys.path:
+        sys.path.insert(0, shared_dir)
+    return importlib.import_module(name)
+
+def start_rendering(total, unit, failure_label="failed"):
+    """Routes per-item lines through a progress_render.ProgressRenderer for this run's --progress/--quiet mode."""
+    global renderer
+    progress_render = import_shared('progress_render')
+    renderer = progress_render.ProgressRenderer(mode=args.output_mode, total=total, unit=unit, failure_label=failure_label)
+
+def stop_rendering():
+    """Flushes buffered lines and ends the status line; call before printing the run summary."""
+    global renderer
+    if renderer is not None:
+        renderer.close()
+        renderer = None
+# --- End Console Output ---
+
 # --- Default Configuration (Used if not overridden by CLI args) ---
 DEFAULT_INPUT_LIST = [
     "google.com",
@@ -28,223 +86,920 @@ DEFAULT_INPUT_LIST = [
     "10.0.0.50"
 ]
 DEFAULT_OUTPUT_DIR = "." # Current directory
+OUTPUT_FORMATS = ("csv", "csv.gz", "csv.zst", "jsonl", "jsonl.gz", "parquet") # result_writers.FORMATS, not imported for --help
 # --- End Default Configuration ---
 
 # --- Command Line Argument Parsing ---
-parser = argparse.ArgumentParser(
-    description="Perform DNS lookups for a list of inputs (hostnames/IPs) and save results to CSV.",
-    formatter_class=argparse.ArgumentDefaultsHelpFormatter # Show defaults in help message
-    )
-parser.add_argument(
-    "-i", "--input-file",
-    help="Path to a text file containing one IP or hostname per line. Overrides the default internal list.",
-    metavar="FILE"
-    )
-parser.add_argument(
-    "-d", "--dns-server",
-    help="Optional: IP address of the custom DNS server to use. If omitted, uses system default.",
-    metavar="IP_ADDRESS"
-    )
-parser.add_argument(
-    "-o", "--output-dir",
-    default=DEFAULT_OUTPUT_DIR,
-    help="Directory where the output CSV file will be saved.",
-    metavar="DIRECTORY"
-    )
-parser.add_argument(
-    "-t", "--timeout",
-    type=float, default=2.0,
-    help="DNS query timeout in seconds.",
-    metavar="SECONDS"
-    )
-
-args = parser.parse_args()
+def build_arg_parser():
+    import argparse # Module for command-line arguments
+    parser = argparse.ArgumentParser(
+        description="Perform DNS lookups for a list of inputs (hostnames/IPs) and save results to CSV.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter # Show defaults in help message
+        )
+    parser.add_argument(
+        "-i", "--input-file",
+        help="Path to a text file containing one IP or hostname per line. Overrides the default internal list.",
+        metavar="FILE"
+        )
+    parser.add_argument(
+        "-d", "--dns-server",
+        help="Optional: IP address of the custom DNS server to use. If omitted, uses system default.",
+        metavar="IP_ADDRESS"
+        )
+    parser.add_argument(
+        "-o", "--output-dir",
+        default=DEFAULT_OUTPUT_DIR,
+        help="Directory where the output CSV file will be saved.",
+        metavar="DIRECTORY"
+        )
+    parser.add_argument(
+        "-t", "--timeout",
+        type=float, default=2.0,
+        help="DNS query timeout in seconds.",
+        metavar="SECONDS"
+        )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Send all queries as pipelined bursts over a few UDP sockets instead of one lookup at a time. Much faster for large input lists."
+        )
+    parser.add_argument(
+        "--pipeline-sockets",
+        type=int, default=1,
+        help="Number of UDP sockets to spread pipelined queries over (with --pipeline).",
+        metavar="N"
+        )
+    parser.add_argument(
+        "--skip-network-broadcast",
+        action="store_true",
+        help="When an input line is a CIDR range (e.g. 10.20.0.0/16), skip its network and broadcast addresses."
+        )
+    parser.add_argument(
+        "--collapse-nxdomain",
+        action="store_true",
+        help="Collapse runs of consecutive IPs whose reverse lookup is NXDOMAIN into one CSV row (e.g. '10.20.3.0-10.20.3.255')."
+        )
+    parser.add_argument(
+        "--cache",
+        help="Optional: path to an on-disk (SQLite) answer cache. Fresh cached answers are reused instead of querying, and marked in a 'FromCache' CSV column.",
+        metavar="FILE"
+        )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        help="With --cache: reuse cached answers for up to this many seconds, overriding the record TTL.",
+        metavar="SECONDS"
+        )
+    parser.add_argument(
+        "--cache-size",
+        type=int, default=100000,
+        help="With --cache: maximum number of cached answers; least recently used entries are evicted beyond this.",
+        metavar="N"
+        )
+    parser.add_argument(
+        "--sites",
+        help="Optional: CSV of 'site,dns_servers' rows. Resolves the inventory against every site's DNS servers concurrently and writes one merged CSV with a column per site.",
+        metavar="SITES_CSV"
+        )
+    parser.add_argument(
+        "--diff-against",
+        help="Optional: a previous dns_lookup_results_*.csv. After the run, only rows added, removed or changed since then are reported (and saved as dns_lookup_diff_*.csv).",
+        metavar="PREVIOUS_CSV"
+        )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS, default="csv",
+        help="Output file format: CSV, gzip/Zstandard-compressed CSV, JSON Lines or Parquet (csv.zst needs zstandard, parquet needs pyarrow)."
+        )
+    parser.add_argument(
+        "--rotate-mb",
+        type=float, default=0,
+        help="Start a new output part file (dns_lookup_results_*.1.csv, ...) once one reaches this size (0 = never).",
+        metavar="MB"
+        )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time each stage (configuration, lookups, reply parsing, cache, rendering, writing) and waits on DNS replies or site workers; writes a JSON report next to the output file (*.profile.json)."
+        )
+    parser.add_argument(
+        "--profile-sample",
+        action="store_true",
+        help="Like --profile, and also sample the main thread's call stacks every few milliseconds (folded stacks in the report)."
+        )
+    replay_group = parser.add_mutually_exclusive_group()
+    replay_group.add_argument(
+        "--record",
+        help="Save every DNS reply (or error) with its latency to a trace file for --replay (JSON Lines, gzip-compressed if it ends in .gz).",
+        metavar="TRACE"
+        )
+    replay_group.add_argument(
+        "--replay",
+        help="Serve DNS replies from a trace (--record, or infra_testing_script/net_replay.py scenario) instead of querying. Latencies count as virtual time and are not waited out.",
+        metavar="TRACE"
+        )
+    parser.add_argument(
+        "--replay-speed",
+        type=float, default=0,
+        help="With --replay, also sleep each recorded latency times this factor (1 = as recorded).",
+        metavar="FACTOR"
+        )
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument(
+        "--progress",
+        dest="output_mode", action="store_const", const="progress", default="lines",
+        help="Show one status line (lookups done, rate, ETA, failures) instead of several lines per lookup."
+        )
+    output_group.add_argument(
+        "-q", "--quiet",
+        dest="output_mode", action="store_const", const="quiet",
+        help="Only print failed lookups (and site mismatches with --sites)."
+        )
+    return parser
+
 # --- End Argument Parsing ---
 
 
-# --- Determine Input List ---
+# --- Run Configuration ---
+# Set by configure() and read by the lookup functions below (one run at a time per process)
+args = None
 input_list = []
-if args.input_file:
-    try:
-        with open(args.input_file, 'r') as f:
-            input_list = [line.strip() for line in f if line.strip()]
-        print(f"Reading input list from file: {args.input_file}")
-    except FileNotFoundError:
-        print(f"Error: Input file '{args.input_file}' not found.")
-        sys.exit(1)
-    except IOError as e:
-         print(f"Error reading input file '{args.input_file}': {e}")
-         sys.exit(1)
-else:
-    print("Using the default internal input list.")
-    input_list = DEFAULT_INPUT_LIST
+cidr_networks = {}
+sites = {}
+resolver = None
+dns_server_display = "System Default"
+answer_cache = None
+csv_header = []
+_dns_pipeline = None
+_dns_cache = None
+net_replay = None
+recorder = None # net_replay.TraceRecorder with --record
+replay = None   # net_replay.ReplayBackend with --replay
 
-if not input_list:
-     print("Error: Input list is empty.")
-     sys.exit(1)
-# --- End Determine Input List ---
 
+def configure(run_args, items=None):
+    """
+    Validates run_args (parsed CLI arguments) and prepares the input list, sites, resolver,
+    answer cache and CSV header for a run. items, when given, replaces --input-file and the
+    default list. Raises ConfigError for invalid input.
+    """
+    global args, input_list, cidr_networks, sites, resolver, dns_server_display, answer_cache, csv_header
+    global _dns_pipeline, _dns_cache, profiler, net_replay, recorder, replay
+    args = run_args
+    stage_profiler = import_shared('stage_profiler')
+    args.profile = args.profile or args.profile_sample
+    profiler = stage_profiler.StageProfiler() if args.profile else stage_profiler.NULL_PROFILER
+    import_dnspython()
 
-# --- Prepare Output Path ---
-output_dir = args.output_dir
-if not os.path.isdir(output_dir):
+    if args.diff_against and not os.path.isfile(args.diff_against):
+        raise ConfigError(f"Previous results file '{args.diff_against}' not found.")
+    if args.sites and not os.path.isfile(args.sites):
+        raise ConfigError(f"Sites file '{args.sites}' not found.")
+    result_writers = import_shared('result_writers')
     try:
-        print(f"Output directory '{output_dir}' does not exist. Creating it...")
-        os.makedirs(output_dir, exist_ok=True)
-    except OSError as e:
-        print(f"Error: Could not create output directory '{output_dir}': {e}")
-        sys.exit(1)
+        result_writers.require_format(args.output_format)
+    except result_writers.ExportFormatError as e:
+        raise ConfigError(str(e))
+    if args.diff_against and (args.output_format != 'csv' or args.rotate_mb):
+        raise ConfigError("--diff-against reads the new results back as one plain CSV; use --output-format csv without --rotate-mb.")
 
-timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-output_csv_file = os.path.join(output_dir, f'dns_lookup_results_{timestamp}.csv')
-# --- End Prepare Output Path ---
+    # --- Determine Input List ---
+    input_list = []
+    if items is not None:
+        input_list = [str(item).strip() for item in items if str(item).strip()]
+    elif args.input_file:
+        try:
+            with open(args.input_file, 'r') as f:
+                input_list = [line.strip() for line in f if line.strip()]
+            log(f"Reading input list from file: {args.input_file}")
+        except FileNotFoundError:
+            raise ConfigError(f"Input file '{args.input_file}' not found.")
+        except IOError as e:
+            raise ConfigError(f"Could not read input file '{args.input_file}': {e}")
+    else:
+        log("Using the default internal input list.")
+        input_list = DEFAULT_INPUT_LIST
 
+    if not input_list:
+        raise ConfigError("Input list is empty.")
 
-# --- Setup DNS Resolver based on input ---
-resolver = dns.resolver.Resolver()
-custom_dns_server = args.dns_server # Get from command line argument
-dns_server_display = "System Default"
+    # CIDR lines (e.g. 10.20.0.0/16) are expanded lazily later on; validate them up front
+    cidr_networks = {}
+    for line in input_list:
+        if '/' in line:
+            try:
+                cidr_networks[line] = ipaddress.ip_network(line, strict=False)
+            except ValueError:
+                raise ConfigError(f"Invalid CIDR range '{line}' in input.")
+    if cidr_networks:
+        total_addresses = sum(net.num_addresses for net in cidr_networks.values())
+        log(f"Input contains {len(cidr_networks)} CIDR range(s) covering {total_addresses:,} addresses (expanded on the fly).")
+        if not args.pipeline:
+            log("Enabling --pipeline for the CIDR sweep (one lookup at a time would take far too long).")
+            args.pipeline = True
+
+    # --- Determine Sites (--sites) ---
+    # Same layout as the network test targets.csv: a header row, then one site per line
+    # with its DNS servers as a comma-separated (quoted) list, e.g.  HQ,"10.0.0.53,10.0.0.54"
+    sites = {}
+    if args.sites:
+        try:
+            with open(args.sites, 'r', encoding='utf-8', newline='') as f:
+                reader = csv.reader(row for row in f if row.strip() and not row.strip().startswith('#'))
+                header = next(reader, None)
+                if not header or len(header) < 2 or header[0].strip().lower() != 'site' or header[1].strip().lower() != 'dns_servers':
+                    raise ConfigError(f"Invalid header in sites file '{args.sites}'. Expected 'site,dns_servers'.")
+                for row in reader:
+                    if len(row) < 2 or not row[0].strip():
+                        continue
+                    site_name = row[0].strip()
+                    servers = [s.strip() for s in row[1].replace(';', ',').split(',') if s.strip()]
+                    for server in servers:
+                        try:
+                            ipaddress.ip_address(server)
+                        except ValueError:
+                            raise ConfigError(f"Invalid DNS server IP '{server}' for site '{site_name}'.")
+                    if servers:
+                        sites[site_name] = servers
+                    else:
+                        log(f"Warning: Skipping site '{site_name}' - no DNS servers listed.")
+        except IOError as e:
+            raise ConfigError(f"Could not read sites file '{args.sites}': {e}")
+        if not sites:
+            raise ConfigError(f"No valid sites found in '{args.sites}'.")
+        log(f"Comparing {len(sites)} site(s): {', '.join(sites)}")
+        if args.cache or args.collapse_nxdomain:
+            log("Note: --cache and --collapse-nxdomain are not used with --sites.")
+        args.pipeline = True # Every site's sweep runs through its own pipelined engine
+
+    recorder = replay = None
+    if args.record or args.replay:
+        net_replay = import_shared('net_replay')
+        try:
+            if args.replay:
+                replay = net_replay.ReplayBackend.load(args.replay, speed=args.replay_speed, layers=(net_replay.LAYER_DNS,))
+                log(f"Replaying DNS replies from: {args.replay} ({replay.stats['operations']:,} recorded)")
+            else:
+                recorder = net_replay.TraceRecorder(args.record, tool='nslookup')
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"Cannot use trace file '{args.record or args.replay}': {e}")
+
+    if args.pipeline or replay is not None:
+        import _dns_pipeline # Local module next to this script (replayed replies are parsed like pipelined ones)
+
+    # --- Setup DNS Resolver based on input ---
+    resolver = dns.resolver.Resolver()
+    custom_dns_server = args.dns_server # Get from command line argument
+    dns_server_display = "System Default"
+
+    if custom_dns_server and custom_dns_server.strip():
+        # Basic validation if it looks like an IP
+        try:
+            ipaddress.ip_address(custom_dns_server.strip()) # Validate format
+            resolver.nameservers = [custom_dns_server.strip()]
+            dns_server_display = resolver.nameservers[0]
+            log(f"Using custom DNS server: {dns_server_display}")
+        except ValueError:
+             log(f"Warning: Invalid IP format for --dns-server '{custom_dns_server}'. Using system default.")
+             custom_dns_server = None # Fallback
+             dns_server_display = "System Default (Invalid Input)"
+
+    if not custom_dns_server: # If None or fallback occurred
+        try:
+             default_servers = dns.resolver.get_default_resolver().nameservers
+             if default_servers:
+                 resolver.nameservers = default_servers
+                 dns_server_display = "; ".join(resolver.nameservers) # Can be multiple
+                 log(f"Using system default DNS server(s): {dns_server_display}")
+             else:
+                  log("Warning: Could not determine system default DNS servers. Relying on resolver defaults.")
+                  dns_server_display = "System Default (Unknown)"
+        except Exception as e:
+             log(f"Warning: Could not determine system default DNS servers: {e}. Relying on resolver defaults.")
+             dns_server_display = "System Default (Error)"
+
+    # Apply timeout from arguments
+    resolver.timeout = args.timeout
+    resolver.lifetime = args.timeout * 2 # Allow slightly longer overall lifetime
+    if args.pipeline and not args.sites and not resolver.nameservers and replay is None:
+        raise ConfigError("--pipeline needs at least one known DNS server (use --dns-server).")
+
+    # --- Optional: Persistent Answer Cache ---
+    answer_cache = None
+    if args.cache and not args.sites:
+        import _dns_cache # Local module next to this script
+        try:
+            answer_cache = _dns_cache.DnsAnswerCache(args.cache, max_entries=args.cache_size, max_age=args.max_age)
+            log(f"Using answer cache: {args.cache}" + (f" (max age {args.max_age:g}s)" if args.max_age is not None else ""))
+        except Exception as e:
+            log(f"Warning: Could not open answer cache '{args.cache}': {e}. Continuing without cache.")
+
+    if args.sites:
+        csv_header = ['Input', 'LookupType'] + list(sites) + ['Consistent']
+    else:
+        csv_header = ['Input', 'LookupType', 'Result', 'Status', 'ErrorMessage', 'DnsServerUsed']
+        if answer_cache is not None:
+            csv_header.append('FromCache')
+# --- End Run Configuration ---
 
-if custom_dns_server and custom_dns_server.strip():
-    # Basic validation if it looks like an IP
+
+# --- Lookup Helpers ---
+def query_for_item(item):
+    """Returns the (qname, rdtype) pair looked up for an input item (PTR for IPs, A otherwise)."""
     try:
-        ipaddress.ip_address(custom_dns_server.strip()) # Validate format
-        resolver.nameservers = [custom_dns_server.strip()]
-        dns_server_display = resolver.nameservers[0]
-        print(f"Using custom DNS server: {dns_server_display}")
+        ip_obj = ipaddress.ip_address(item)
     except ValueError:
-         print(f"Warning: Invalid IP format for --dns-server '{custom_dns_server}'. Using system default.")
-         custom_dns_server = None # Fallback
-         dns_server_display = "System Default (Invalid Input)"
+        return item, 'A'
+    # Same name dns.reversename.from_address() builds, but far cheaper for large sweeps
+    return ip_obj.reverse_pointer + '.', 'PTR'
 
-if not custom_dns_server: # If None or fallback occurred
+
+pipelined_answers = {} # (qname text, rdtype) -> (response wire, error) when --pipeline is used
+
+def resolve_record(qname, rdtype):
+    """
+    Resolves qname/rdtype like resolver.resolve(), but serves pre-fetched --pipeline replies
+    and raises the same dnspython exceptions for them so the main loop handles both alike.
+    """
+    key = (str(qname), rdtype)
+    if key in pipelined_answers:
+        reply = pipelined_answers[key]
+    elif replay is not None:
+        reply = replayed_reply(qname, rdtype)
+    else:
+        with profiler.stage('lookup'):
+            return resolver.resolve(qname, rdtype) if recorder is None else recorded_resolve(qname, rdtype)
+    with profiler.stage('parse_reply'):
+        return answer_from_reply(qname, rdtype, reply, dns_server_display)
+
+
+def recorded_resolve(qname, rdtype):
+    """resolver.resolve() for --record: saves the reply (or the error, when there was none) and its latency."""
+    started = time.perf_counter()
     try:
-         default_servers = dns.resolver.get_default_resolver().nameservers
-         if default_servers:
-             resolver.nameservers = default_servers
-             dns_server_display = "; ".join(resolver.nameservers) # Can be multiple
-             print(f"Using system default DNS server(s): {dns_server_display}")
-         else:
-              print("Warning: Could not determine system default DNS servers. Relying on resolver defaults.")
-              dns_server_display = "System Default (Unknown)"
-    except Exception as e:
-         print(f"Warning: Could not determine system default DNS servers: {e}. Relying on resolver defaults.")
-         dns_server_display = "System Default (Error)"
+        answer = resolver.resolve(qname, rdtype)
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+        responses = [r for r in [e.kwargs.get('response')] + list(e.kwargs.get('responses', {}).values()) if r is not None]
+        wire = responses[0].to_wire() if responses else None
+        recorder.record_dns(qname, rdtype, time.perf_counter() - started, wire, e)
+        raise
+    except dns.exception.DNSException as e:
+        recorder.record_dns(qname, rdtype, time.perf_counter() - started, None, e)
+        raise
+    recorder.record_dns(qname, rdtype, time.perf_counter() - started, answer.response.to_wire(), None)
+    return answer
 
-# Apply timeout from arguments
-resolver.timeout = args.timeout
-resolver.lifetime = args.timeout * 2 # Allow slightly longer overall lifetime
-# --- End Setup DNS Resolver ---
 
+def replayed_reply(qname, rdtype, scope=''):
+    """--replay: the recorded (response wire, error) of a query, with errors rebuilt as dnspython exceptions."""
+    outcome = replay.dns(qname, rdtype, scope)
+    if outcome is None:
+        return None, dns.exception.DNSException(net_replay.NOT_RECORDED)
+    wire, error = outcome
+    if error is None:
+        return wire, None
+    error_type, message = error
+    if error_type == 'Timeout':
+        return None, dns.exception.Timeout()
+    if error_type == 'NoNameservers':
+        return None, dns.resolver.NoNameservers()
+    if error_type == 'NXDOMAIN':
+        return None, dns.resolver.NXDOMAIN(qnames=[dns.name.from_text(str(qname))])
+    if error_type == 'NoAnswer':
+        return None, dns.resolver.NoAnswer()
+    return None, dns.exception.DNSException(f"{error_type}: {message}")
 
-print(f"Starting DNS lookups... Output will be saved to '{output_csv_file}'")
 
-# Prepare data for CSV
-csv_data = []
-csv_header = ['Input', 'LookupType', 'Result', 'Status', 'ErrorMessage', 'DnsServerUsed']
+def resolve_pipelined(queries, nameservers, scope=''):
+    """
+    _dns_pipeline.iter_resolve_pipelined() for the run: --replay serves the replies from the trace
+    instead, and --record saves each one with the time the pipeline took to produce it.
+    scope names the --sites site the queries go to.
+    """
+    if replay is not None:
+        for query in queries:
+            yield query, (None, None) if query is None else replayed_reply(query[0], query[1], scope)
+        return
+    replies = _dns_pipeline.iter_resolve_pipelined(queries, nameservers, timeout=args.timeout, sockets=args.pipeline_sockets)
+    if recorder is None:
+        yield from replies
+        return
+    waited = time.perf_counter()
+    for query, reply in replies:
+        if query is not None:
+            recorder.record_dns(query[0], query[1], time.perf_counter() - waited, reply[0], reply[1], scope)
+        yield query, reply
+        waited = time.perf_counter()
 
-# --- Main Lookup Loop ---
-for item in input_list:
-    # (The lookup logic inside the loop remains the same as the previous Python script)
-    # ... [Lookup logic as in dns_lookup_to_csv_custom_dns.py] ...
 
-    print(f"Processing: {item}")
+def answer_from_reply(qname, rdtype, reply, server_label):
+    """Turns a pipelined (response wire, error) reply into a dns.resolver.Answer or raises like resolve()."""
+    response_wire, error = reply
+    if error is not None:
+        raise error
+    if response_wire[3] & 0x0F == dns.rcode.NXDOMAIN and answer_cache is None:
+        # Common in PTR sweeps; skip parsing a reply that only carries the rcode we need
+        # (with --cache it is parsed, so negative_ttl() finds the SOA minimum)
+        raise dns.resolver.NXDOMAIN(qnames=[dns.name.from_text(str(qname))])
+    response = _dns_pipeline.parse_response(response_wire)
+    answered_name = response.question[0].name
+    rcode = response.rcode()
+    if rcode == dns.rcode.NXDOMAIN:
+        raise dns.resolver.NXDOMAIN(qnames=[answered_name], responses={answered_name: response})
+    if rcode != dns.rcode.NOERROR:
+        raise dns.resolver.NoNameservers(request=response,
+                                         errors=[(server_label, False, 53, dns.rcode.to_text(rcode), response)])
+    answer = dns.resolver.Answer(answered_name, dns.rdatatype.from_text(rdtype), dns.rdataclass.IN, response)
+    if answer.rrset is None:
+        raise dns.resolver.NoAnswer(response=response)
+    return answer
+
+
+def cache_key(item):
+    """Answer cache key for an input item, scoped to the DNS server(s) in use."""
+    return _dns_cache.DnsAnswerCache.make_key(dns_server_display, *query_for_item(item))
+
+
+def cached_row(item):
+    """Returns the CSV row for item from the answer cache, or None on a miss."""
+    if answer_cache is None:
+        return None
+    with profiler.stage('cache'):
+        cached = answer_cache.get(cache_key(item))
+    if cached is None:
+        return None
+    lookup_type, result_value, status, error_message = cached
+    report(f"Processing: {item}")
+    report(f"  💾 CACHE HIT ({status}): {item} -> {result_value}", failed=status != "SUCCESS")
+    report("-" * 20)
+    return [item, lookup_type, result_value, status, error_message, dns_server_display]
+
+
+def negative_ttl(error):
+    """How long an NXDOMAIN/NoAnswer may be cached: the SOA minimum from the reply (RFC 2308), if present."""
+    responses = list(error.kwargs.get('responses', {}).values())
+    if error.kwargs.get('response') is not None:
+        responses.append(error.kwargs['response'])
+    for response in responses:
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+    return _dns_cache.DEFAULT_NEGATIVE_TTL
+# --- End Lookup Helpers ---
+
+
+# --- Input Expansion ---
+def count_items():
+    """Number of items expand_inputs() yields for the input list (for the progress ETA)."""
+    total = 0
+    for line in input_list:
+        network = cidr_networks.get(line)
+        if network is None:
+            total += 1
+        elif args.skip_network_broadcast and network.num_addresses > 2:
+            total += network.num_addresses - (2 if network.version == 4 else 1) # As network.hosts()
+        else:
+            total += network.num_addresses
+    return total
+
+
+def expand_inputs(lines):
+    """Yields every item to look up, expanding CIDR lines address by address without building a list."""
+    for line in lines:
+        network = cidr_networks.get(line)
+        if network is None:
+            yield line
+        elif args.skip_network_broadcast:
+            # hosts() already skips network/broadcast (and keeps both addresses of a /31 or /32)
+            for address in network.hosts():
+                yield str(address)
+        else:
+            for address in network:
+                yield str(address)
+
+
+def iter_lookup_items():
+    """
+    Yields (item, cached_row) pairs in input order; cached_row is set for --cache hits.
+    With --pipeline the replies for the other items are fetched ahead in bursts and staged
+    in pipelined_answers just before each item is yielded.
+    """
+    if not args.pipeline:
+        for item in expand_inputs(input_list):
+            yield item, cached_row(item)
+        return
+    log(f"Replaying pipelined queries from {args.replay}..." if replay is not None else f"Pipelining queries to {dns_server_display}...")
+    queued_items = collections.deque() # (item, cached_row) in the pipeline, oldest first
+
+    def queries():
+        for item in expand_inputs(input_list):
+            row = cached_row(item)
+            queued_items.append((item, row))
+            yield None if row else query_for_item(item) # Cache hits only hold their place in line
+
+    replies = resolve_pipelined(queries(), [str(ns) for ns in resolver.nameservers])
+    for query, reply in profiler.timed_iter(replies, 'dns_replies'): # Includes queueing (and cache checks) for the next burst
+        if query is not None:
+            pipelined_answers[(str(query[0]), query[1])] = reply
+        yield queued_items.popleft()
+        pipelined_answers.clear()
+# --- End Input Expansion ---
+
+
+# --- Lookup Function ---
+def lookup_item(item):
+    """Looks up a single input item (reverse for IPs, forward otherwise) and returns its CSV row."""
+    report(f"Processing: {item}")
     lookup_type = "Unknown"
     result_value = ""
     status = "FAILED"
     error_message = ""
     # Use the display string determined earlier
     dns_server_used_for_row = dns_server_display
+    ttl = None # Set for answers that may be cached (not for timeouts/errors)
 
     is_ip = False
     try:
         ip_obj = ipaddress.ip_address(item)
         is_ip = True
         if ip_obj.is_loopback or ip_obj.is_private:
-             print(f"  ℹ️  Info: Input '{item}' is a loopback/private IP.")
+             report(f"  ℹ️  Info: Input '{item}' is a loopback/private IP.")
     except ValueError:
         is_ip = False
 
     if is_ip:
         lookup_type = "Reverse (IP -> Hostname)"
         try:
-            reversed_name = dns.reversename.from_address(item)
-            answers = resolver.resolve(reversed_name, 'PTR')
+            reversed_name = query_for_item(item)[0]
+            answers = resolve_record(reversed_name, 'PTR')
             hostnames = [str(rdata.target).rstrip('.') for rdata in answers] # Clean trailing dot
             result_value = "; ".join(hostnames)
             status = "SUCCESS"
-            print(f"  ✅ SUCCESS: IP: {item} -> Hostname(s): {result_value}")
-        except dns.resolver.NXDOMAIN:
+            ttl = answers.rrset.ttl
+            report(f"  ✅ SUCCESS: IP: {item} -> Hostname(s): {result_value}")
+        except dns.resolver.NXDOMAIN as e:
             error_message = "NXDOMAIN (No such domain for reverse lookup)"
             result_value = "Not Found"
-            print(f"  ❌ FAILED (Reverse - NXDOMAIN): IP: {item} -> {error_message}")
-        except dns.resolver.NoAnswer:
+            ttl = negative_ttl(e) if answer_cache else None
+            report(f"  ❌ FAILED (Reverse - NXDOMAIN): IP: {item} -> {error_message}", failed=True)
+        except dns.resolver.NoAnswer as e:
              error_message = "NoAnswer (Record type PTR does not exist at this name)"
              result_value = "Not Found (No PTR Record)"
-             print(f"  ❌ FAILED (Reverse - NoAnswer): IP: {item} -> {error_message}")
+             ttl = negative_ttl(e) if answer_cache else None
+             report(f"  ❌ FAILED (Reverse - NoAnswer): IP: {item} -> {error_message}", failed=True)
         except dns.exception.Timeout:
             error_message = f"Timeout querying DNS server ({dns_server_display})"
             result_value = "Timeout"
-            print(f"  ❌ FAILED (Reverse - Timeout): IP: {item} -> {error_message}")
+            report(f"  ❌ FAILED (Reverse - Timeout): IP: {item} -> {error_message}", failed=True)
         except dns.resolver.NoNameservers as e:
              error_message = f"No nameservers available: {e}"
              result_value = "Configuration Error"
              status="ERROR"
-             print(f"  ❌ ERROR (Reverse - NoNameservers): IP: {item} -> {error_message}")
+             report(f"  ❌ ERROR (Reverse - NoNameservers): IP: {item} -> {error_message}", failed=True)
         except Exception as e:
             error_message = f"Unexpected error: {type(e).__name__} - {e}"
             result_value = "Error"
             status = "ERROR"
-            print(f"  ❌ ERROR (Reverse - Other): IP: {item} -> {error_message}")
+            report(f"  ❌ ERROR (Reverse - Other): IP: {item} -> {error_message}", failed=True)
 
     else: # Hostname
         lookup_type = "Forward (Hostname -> IP)"
         try:
             # Prefer A records (IPv4), but could query 'AAAA' for IPv6
-            answers = resolver.resolve(item, 'A')
+            answers = resolve_record(item, 'A')
             ips = [rdata.address for rdata in answers]
             result_value = "; ".join(ips)
             status = "SUCCESS"
-            print(f"  ✅ SUCCESS: Hostname: {item} -> IP(s): {result_value}")
-        except dns.resolver.NXDOMAIN:
+            ttl = answers.rrset.ttl
+            report(f"  ✅ SUCCESS: Hostname: {item} -> IP(s): {result_value}")
+        except dns.resolver.NXDOMAIN as e:
             error_message = "NXDOMAIN (No such domain)"
             result_value = "Not Found"
-            print(f"  ❌ FAILED (Forward - NXDOMAIN): Hostname: {item} -> {error_message}")
-        except dns.resolver.NoAnswer:
+            ttl = negative_ttl(e) if answer_cache else None
+            report(f"  ❌ FAILED (Forward - NXDOMAIN): Hostname: {item} -> {error_message}", failed=True)
+        except dns.resolver.NoAnswer as e:
              error_message = "NoAnswer (Record type A does not exist at this name, but domain exists)"
              result_value = "Not Found (No A Record)"
-             print(f"  ❌ FAILED (Forward - NoAnswer): Hostname: {item} -> {error_message}")
+             ttl = negative_ttl(e) if answer_cache else None
+             report(f"  ❌ FAILED (Forward - NoAnswer): Hostname: {item} -> {error_message}", failed=True)
         except dns.exception.Timeout:
             error_message = f"Timeout querying DNS server ({dns_server_display})"
             result_value = "Timeout"
-            print(f"  ❌ FAILED (Forward - Timeout): Hostname: {item} -> {error_message}")
+            report(f"  ❌ FAILED (Forward - Timeout): Hostname: {item} -> {error_message}", failed=True)
         except dns.resolver.NoNameservers as e:
              error_message = f"No nameservers available: {e}"
              result_value = "Configuration Error"
              status="ERROR"
-             print(f"  ❌ ERROR (Forward - NoNameservers): Hostname: {item} -> {error_message}")
+             report(f"  ❌ ERROR (Forward - NoNameservers): Hostname: {item} -> {error_message}", failed=True)
         except Exception as e:
             error_message = f"Unexpected error: {type(e).__name__} - {e}"
             result_value = "Error"
             status = "ERROR"
-            print(f"  ❌ ERROR (Forward - Other): Hostname: {item} -> {error_message}")
+            report(f"  ❌ ERROR (Forward - Other): Hostname: {item} -> {error_message}", failed=True)
+
+    if answer_cache is not None and ttl is not None:
+        with profiler.stage('cache'):
+            answer_cache.put(cache_key(item), [lookup_type, result_value, status, error_message], ttl)
+
+    report("-" * 20)
+    return [item, lookup_type, result_value, status, error_message, dns_server_used_for_row]
+# --- End Lookup Function ---
+
+
+def is_reverse_nxdomain(row):
+    """True for rows that --collapse-nxdomain may merge with their neighbours."""
+    return row[1].startswith("Reverse") and row[4].startswith("NXDOMAIN")
+
+
+def collapsed_row(run):
+    """Turns a run of consecutive NXDOMAIN IPs back into a single CSV row."""
+    first_ip, last_ip, count, row = run
+    if count == 1:
+        return row
+    return [f"{first_ip}-{last_ip}", row[1], f"Not Found ({count} addresses)", row[3], row[4]] + row[5:]
+
 
-    # Append row data for CSV
-    csv_data.append([item, lookup_type, result_value, status, error_message, dns_server_used_for_row])
-    print("-" * 20)
+# --- Result Output ---
+DICTIONARY_COLUMNS = ('LookupType', 'Status', 'DnsServerUsed', 'FromCache', 'Consistent') # Dictionary-encoded in Parquet
+
+def open_result_writer(output_file):
+    """Batched writer for --output-format / --rotate-mb (infra_testing_script/result_writers.py)."""
+    result_writers = import_shared('result_writers')
+    return result_writers.open_writer(output_file, csv_header, fmt=args.output_format,
+                                      max_bytes=int(args.rotate_mb * 1024 * 1024), dictionary_columns=DICTIONARY_COLUMNS)
+
+def write_result_row(writer, row):
+    with profiler.stage('write'):
+        writer.write_row(row)
+
+def close_result_writer(writer):
+    """Writes the last batch inside the 'write' stage (the with block's close() is then a no-op)."""
+    with profiler.stage('write'):
+        writer.close()
+
+def parts_note(writer):
+    return f" (rotated into {len(writer.paths)} part files)" if len(writer.paths) > 1 else ""
+# --- End Result Output ---
+
+
+# --- Main Lookup Loop ---
+def iter_result_rows():
+    """Yields the CSV row for every input item in order (cache hits included, before any collapsing)."""
+    for item, row in iter_lookup_items():
+        if row is None:
+            row = lookup_item(item)
+            if answer_cache is not None:
+                row.append('No')
+        else:
+            row.append('Yes')
+        yield item, row
+
+
+def run_lookups(output_csv_file):
+    """
+    Looks up every input item and writes the result rows. Rows are written as they are
+    produced, so sweeping large CIDR ranges never holds the whole result set in memory.
+    """
+    print(f"Starting DNS lookups... Output will be saved to '{output_csv_file}'")
+    start_rendering(count_items(), "lookups")
+    rows_written = 0
+    try:
+        with open_result_writer(output_csv_file) as writer:
+            nxdomain_run = None # [first_ip, last_ip, count, row] while collapsing
+
+            for item, row in iter_result_rows():
+                renderer.advance(1, failed=row[3] != "SUCCESS")
+                if args.collapse_nxdomain:
+                    if is_reverse_nxdomain(row):
+                        ip_obj = ipaddress.ip_address(item)
+                        if (nxdomain_run and nxdomain_run[1].version == ip_obj.version
+                                and int(ip_obj) == int(nxdomain_run[1]) + 1):
+                            nxdomain_run[1] = ip_obj
+                            nxdomain_run[2] += 1
+                            continue
+                        if nxdomain_run:
+                            write_result_row(writer, collapsed_row(nxdomain_run))
+                            rows_written += 1
+                        nxdomain_run = [ip_obj, ip_obj, 1, row]
+                        continue
+                    if nxdomain_run:
+                        write_result_row(writer, collapsed_row(nxdomain_run))
+                        rows_written += 1
+                        nxdomain_run = None
+                write_result_row(writer, row)
+                rows_written += 1
+
+            if nxdomain_run:
+                write_result_row(writer, collapsed_row(nxdomain_run))
+                rows_written += 1
+            close_result_writer(writer)
+        stop_rendering()
+        print(f"\nSuccessfully wrote {rows_written} row(s) to '{output_csv_file}'{parts_note(writer)}")
+    except IOError as e:
+        stop_rendering()
+        print(f"\nError writing to CSV file '{output_csv_file}': {e}")
+    except Exception as e:
+         stop_rendering()
+         print(f"\nAn unexpected error occurred during CSV writing: {e}")
 # --- End Main Lookup Loop ---
 
 
-# Write data to CSV file
-try:
-    with open(output_csv_file, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(csv_header) # Write header
-        writer.writerows(csv_data) # Write all data rows
-    print(f"\nSuccessfully wrote results to '{output_csv_file}'")
-except IOError as e:
-    print(f"\nError writing to CSV file '{output_csv_file}': {e}")
-except Exception as e:
-     print(f"\nAn unexpected error occurred during CSV writing: {e}")
+# --- Cross-Site Comparison (--sites) ---
+SITE_QUEUE_SIZE = 1000 # Results a fast site may run ahead of the slowest one
+LOOKUP_TYPE_LABELS = {'PTR': "Reverse (IP -> Hostname)", 'A': "Forward (Hostname -> IP)"}
+
+
+def site_cell(query, reply, site_name):
+    """Summarizes one site's reply for its CSV column; values are sorted so sites compare cleanly."""
+    qname, rdtype = query
+    try:
+        answers = answer_from_reply(qname, rdtype, reply, site_name)
+    except dns.resolver.NXDOMAIN:
+        return "NXDOMAIN"
+    except dns.resolver.NoAnswer:
+        return "NoAnswer"
+    except dns.exception.Timeout:
+        return "Timeout"
+    except dns.resolver.NoNameservers:
+        return "Error (server failure)"
+    except Exception as e:
+        return f"Error ({type(e).__name__})"
+    if rdtype == 'PTR':
+        values = [str(rdata.target).rstrip('.') for rdata in answers]
+    else:
+        values = [rdata.address for rdata in answers]
+    return "; ".join(sorted(values))
+
+
+def site_worker(site_name, servers, results_queue):
+    """Sweeps the whole inventory against one site's DNS servers, queueing one cell per item in input order."""
+    try:
+        replies = resolve_pipelined((query_for_item(item) for item in expand_inputs(input_list)), servers, scope=site_name)
+        for query, reply in replies:
+            results_queue.put(site_cell(query, reply, site_name))
+    except Exception as e:
+        results_queue.put(e) # Handed to the writer, which reports it
+
+
+def run_site_comparison(output_csv_file):
+    """Resolves the inventory against every site at once and writes one merged row per item."""
+    print(f"Starting cross-site DNS comparison... Output will be saved to '{output_csv_file}'")
+    site_queues = {}
+    for site_name, servers in sites.items():
+        site_queues[site_name] = queue.Queue(maxsize=SITE_QUEUE_SIZE)
+        threading.Thread(target=site_worker, args=(site_name, servers, site_queues[site_name]), daemon=True).start()
+
+    start_rendering(count_items(), "items", failure_label="mismatched")
+    rows_written = mismatches = 0
+    try:
+        with open_result_writer(output_csv_file) as writer:
+            for item in expand_inputs(input_list):
+                cells = []
+                for site_name, site_queue in site_queues.items():
+                    waited = time.perf_counter()
+                    cell = site_queue.get()
+                    profiler.wait(f"site:{site_name}", time.perf_counter() - waited)
+                    if isinstance(cell, Exception):
+                        raise RuntimeError(f"Lookups for site '{site_name}' failed: {cell}")
+                    cells.append(cell)
+                consistent = len(set(cells)) == 1
+                if not consistent:
+                    mismatches += 1
+                    report(f"  ⚠️  MISMATCH: {item} -> " + " | ".join(f"{name}: {cell}" for name, cell in zip(sites, cells)),
+                           failed=True)
+                write_result_row(writer, [item, LOOKUP_TYPE_LABELS[query_for_item(item)[1]]] + cells + ['Yes' if consistent else 'No'])
+                rows_written += 1
+                renderer.advance(1, failed=not consistent)
+            close_result_writer(writer)
+        stop_rendering()
+        print(f"\nSuccessfully wrote {rows_written} row(s) to '{output_csv_file}'{parts_note(writer)} ({mismatches} with differing answers between sites)")
+    except IOError as e:
+        stop_rendering()
+        print(f"\nError writing to CSV file '{output_csv_file}': {e}")
+    except Exception as e:
+        stop_rendering()
+        print(f"\nAn unexpected error occurred during the site comparison: {e}")
+# --- End Cross-Site Comparison ---
+
+
+
+# --- Library API ---
+def resolve_many(items, dns_server=None, timeout=2.0, pipeline=False, pipeline_sockets=1,
+                 skip_network_broadcast=False, cache=None, max_age=None, progress=False):
+    """
+    Looks up hostnames/IPs/CIDR ranges in-process and yields one dict per address, keyed
+    like the CSV columns (Input, LookupType, Result, Status, ErrorMessage, DnsServerUsed
+    and FromCache when cache is set). Options mirror the command line flags. Uses module
+    state, so run one at a time per process. Raises ConfigError for invalid input.
+    """
+    global verbose
+    argv = ['--timeout', str(timeout), '--pipeline-sockets', str(pipeline_sockets)]
+    if dns_server:
+        argv += ['--dns-server', dns_server]
+    if pipeline:
+        argv.append('--pipeline')
+    if skip_network_broadcast:
+        argv.append('--skip-network-broadcast')
+    if cache:
+        argv += ['--cache', cache]
+    if max_age is not None:
+        argv += ['--max-age', str(max_age)]
+    previous_verbose, verbose = verbose, progress
+    try:
+        configure(build_arg_parser().parse_args(argv), items=items)
+        for _item, row in iter_result_rows():
+            yield dict(zip(csv_header, row))
+    finally:
+        verbose = previous_verbose
+        if answer_cache is not None:
+            answer_cache.close()
+# --- End Library API ---
+
+
+def main(argv=None):
+    """Command line entry point."""
+    started, started_cpu = time.perf_counter(), time.thread_time()
+    try:
+        configure(build_arg_parser().parse_args(argv))
+    except ConfigError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    profiler.record('configure', time.perf_counter() - started, time.thread_time() - started_cpu)
+    if args.profile_sample:
+        profiler.start_sampling()
+
+    # --- Prepare Output Path ---
+    output_dir = args.output_dir
+    if not os.path.isdir(output_dir):
+        try:
+            print(f"Output directory '{output_dir}' does not exist. Creating it...")
+            os.makedirs(output_dir, exist_ok=True)
+        except OSError as e:
+            print(f"Error: Could not create output directory '{output_dir}': {e}")
+            sys.exit(1)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    if args.sites:
+        output_csv_file = os.path.join(output_dir, f'dns_site_comparison_{timestamp}.{args.output_format}')
+        output_diff_file = os.path.join(output_dir, f'dns_site_comparison_diff_{timestamp}.csv')
+    else:
+        output_csv_file = os.path.join(output_dir, f'dns_lookup_results_{timestamp}.{args.output_format}')
+        output_diff_file = os.path.join(output_dir, f'dns_lookup_diff_{timestamp}.csv')
+    # --- End Prepare Output Path ---
+
+    if args.sites:
+        run_site_comparison(output_csv_file)
+    else:
+        run_lookups(output_csv_file)
+
+    if answer_cache is not None:
+        try:
+            evicted = answer_cache.evict()
+            print(f"Answer cache: {answer_cache.hits} hit(s), {answer_cache.misses} miss(es)"
+                  + (f", evicted {evicted} least recently used entr{'y' if evicted == 1 else 'ies'}" if evicted else ""))
+            answer_cache.close()
+        except Exception as e:
+            print(f"Warning: Could not update answer cache '{args.cache}': {e}")
+
+    if replay is not None:
+        print(f"Replay: {replay.summary()}")
+    if recorder is not None:
+        recorder.close()
+        print(f"Recorded {recorder.count:,} DNS repl{'y' if recorder.count == 1 else 'ies'} to '{args.record}'")
+
+    # --- Optional: Change Detection Against a Previous Run ---
+    if args.diff_against:
+        result_diff = import_shared('result_diff')
+        print(f"\nComparing with previous results '{args.diff_against}'...")
+        try:
+            key_columns, ignore_columns = result_diff.DNS_RESULT_KEYS
+            changes = result_diff.diff_against_file(
+                args.diff_against, result_diff.read_csv_rows(output_csv_file), csv_header, key_columns, ignore_columns
+                )
+            with profiler.stage('diff'):
+                counts = result_diff.write_diff_csv(changes, csv_header, output_diff_file)
+            print(f"  Added: {counts[result_diff.CHANGE_ADDED]}  Removed: {counts[result_diff.CHANGE_REMOVED]}"
+                  f"  Changed: {counts[result_diff.CHANGE_CHANGED]}")
+            print(f"  Changes written to '{output_diff_file}'")
+        except (IOError, ValueError) as e:
+            print(f"Error comparing with '{args.diff_against}': {e}")
+    # --- End Change Detection ---
+
+    # --- Optional: Profile Report ---
+    if args.profile:
+        stage_profiler = import_shared('stage_profiler')
+        profile_file = import_shared('result_writers').split_extension(output_csv_file, args.output_format)[0] + '.profile.json'
+        try:
+            profile = profiler.write_report(profile_file, tool='nslookup', items=count_items(), sites=len(sites),
+                                            pipeline=args.pipeline, dns_server=dns_server_display)
+            print(f"\n{stage_profiler.format_summary(profile)}")
+            print(f"Profile written to '{profile_file}'")
+        except IOError as e:
+            print(f"Error writing profile report '{profile_file}': {e}")
+    # --- End Profile Report ---
+
+    print("\nDNS lookups complete.")
+
 
-print("\nDNS lookups complete.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Startup-Time Benchmark ---
+# Purpose: Measures how long _nslookup_tool.py and infra_testing_script/network_test.py take
+#          to start: '--help' (pure startup) and a cold single-host run. With --baseline REF
+#          the same commands are also run from a git checkout of REF (e.g. HEAD~1) so an
+#          import-time change can be compared side by side. Each command runs in a fresh
+#          interpreter; the median of --repeat runs is reported.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_REPEAT = 10
+DEFAULT_DNS_SERVER = '127.0.0.1' # Resolver for the single-host DNS run (a local resolver keeps network time out of it)
+DEFAULT_TCP_TARGET = '127.0.0.1' # Host for the single-host network_test.py run (tcp:1 is refused at once)
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def build_commands(tree, work_dir, dns_server, tcp_target):
+    """Returns [(label, argv)] for the tool copies under tree."""
+    nslookup = os.path.join(tree, '_nslookup_tool.py')
+    network_test = os.path.join(tree, 'infra_testing_script', 'network_test.py')
+    input_file = os.path.join(work_dir, 'one_host.txt')
+    with open(input_file, 'w') as f:
+        f.write('localhost\n')
+    return [
+        ("nslookup --help", [sys.executable, nslookup, '--help']),
+        ("nslookup 1 host", [sys.executable, nslookup, '-i', input_file, '-d', dns_server, '-t', '1',
+                             '-o', work_dir]),
+        ("network_test --help", [sys.executable, network_test, '--help']),
+        ("network_test 1 host", [sys.executable, network_test, '--host', tcp_target, '--services', 'tcp:1',
+                                 '--output-file', os.path.join(work_dir, 'one_host.csv')]),
+    ]
+
+
+def time_command(argv, repeat, cwd):
+    """Median wall-clock milliseconds of argv over repeat runs (output discarded, exit code ignored)."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def export_tree(ref, destination):
+    """Extracts the files of git ref into destination."""
+    archive = subprocess.run(['git', '-C', REPO_ROOT, 'archive', ref], check=True, capture_output=True).stdout
+    subprocess.run(['tar', '-x', '-C', destination], input=archive, check=True)
+
+
+def run_benchmark(repeat, baseline=None, dns_server=DEFAULT_DNS_SERVER, tcp_target=DEFAULT_TCP_TARGET):
+    with tempfile.TemporaryDirectory() as work_dir:
+        trees = [("current", REPO_ROOT)]
+        if baseline:
+            baseline_tree = os.path.join(work_dir, 'baseline')
+            os.makedirs(baseline_tree)
+            export_tree(baseline, baseline_tree)
+            trees.insert(0, (baseline, baseline_tree))
+
+        timings = {}
+        for tree_label, tree in trees:
+            for label, argv in build_commands(tree, work_dir, dns_server, tcp_target):
+                timings.setdefault(label, {})[tree_label] = time_command(argv, repeat, work_dir)
+
+    header = f"{'Command':<22}" + ''.join(f"{tree_label:>14}" for tree_label, _ in trees)
+    print(header + ("     Change" if baseline else ''))
+    for label, by_tree in timings.items():
+        line = f"{label:<22}" + ''.join(f"{by_tree[tree_label]:>11.1f} ms" for tree_label, _ in trees)
+        if baseline:
+            line += f"  {(by_tree['current'] / by_tree[baseline] - 1) * 100:>+8.1f}%"
+        print(line)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark startup time of _nslookup_tool.py and network_test.py ('--help' and one host).",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+    parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT, metavar='N', help="Runs per command (median reported).")
+    parser.add_argument("--baseline", metavar='GIT_REF', help="Also time the tools as of this git ref, e.g. HEAD~1.")
+    parser.add_argument("-d", "--dns-server", default=DEFAULT_DNS_SERVER, metavar='IP_ADDRESS', help="Resolver for the single-host DNS run.")
+    parser.add_argument("--tcp-target", default=DEFAULT_TCP_TARGET, metavar='HOST', help="Host for the single-host network_test.py run.")
+    bench_args = parser.parse_args()
+    if bench_args.repeat < 1:
+        print("Error: --repeat must be at least 1.")
+        sys.exit(1)
+    run_benchmark(bench_args.repeat, baseline=bench_args.baseline, dns_server=bench_args.dns_server,
+                  tcp_target=bench_args.tcp_target)
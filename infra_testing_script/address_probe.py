@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Dual-Stack / All-Addresses TCP Probing ---
+# Purpose: Shared by network_test.py and app.py. Resolves every A/AAAA record of a host
+#          with getaddrinfo (gethostbyname only ever returns one IPv4 address) and either
+#          connects to all of them at once, so a dead load-balancer pool member shows up
+#          without the run taking N times longer, or races them Happy Eyeballs style
+#          (RFC 8305) to measure the connect time a real dual-stack client would see.
+#          All connects run non-blocking in one selector loop; no thread per address.
+
+import errno
+import selectors
+import socket
+import time
+from datetime import datetime
+
+# --- Configuration (Defaults & Constants) ---
+HAPPY_EYEBALLS_DELAY = 0.25 # Seconds before the next address is tried while one is pending (RFC 8305)
+
+_IN_PROGRESS = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, getattr(errno, 'WSAEWOULDBLOCK', -1)}
+
+
+class AddressOutcome:
+    """Connect result for one resolved address."""
+    __slots__ = ('address', 'family', 'ok', 'error_code', 'timed_out', 'elapsed_ms')
+
+    def __init__(self, address, family):
+        self.address = address
+        self.family = family
+        self.ok = False
+        self.error_code = None
+        self.timed_out = False
+        self.elapsed_ms = None
+
+    @property
+    def family_label(self):
+        return 'IPv6' if self.family == socket.AF_INET6 else 'IPv4'
+
+
+def resolve_all(hostname, port):
+    """Returns [(family, sockaddr)] for every distinct address of hostname. Raises socket.gaierror."""
+    seen, addresses = set(), []
+    for family, _type, _proto, _canon, sockaddr in socket.getaddrinfo(hostname, port, socket.AF_UNSPEC, socket.SOCK_STREAM):
+        if family in (socket.AF_INET, socket.AF_INET6) and sockaddr[0] not in seen:
+            seen.add(sockaddr[0])
+            addresses.append((family, sockaddr))
+    return addresses
+
+
+def interleave_families(addresses):
+    """Orders addresses IPv6, IPv4, IPv6, ... starting with the resolver's first family (RFC 8305 section 4)."""
+    if not addresses:
+        return []
+    first = addresses[0][0]
+    preferred = [a for a in addresses if a[0] == first]
+    other = [a for a in addresses if a[0] != first]
+    ordered = []
+    for i in range(max(len(preferred), len(other))):
+        if i < len(preferred):
+            ordered.append(preferred[i])
+        if i < len(other):
+            ordered.append(other[i])
+    return ordered
+
+
+def _start_connect(selector, family, sockaddr, outcome):
+    """Starts a non-blocking connect. Returns the socket, or None when it finished immediately."""
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    code = sock.connect_ex(sockaddr)
+    if code in _IN_PROGRESS:
+        selector.register(sock, selectors.EVENT_WRITE, (outcome, time.perf_counter()))
+        return sock
+    outcome.ok, outcome.error_code, outcome.elapsed_ms = code == 0, code or None, 0.0
+    sock.close()
+    return None
+
+
+def _finish_ready(selector, timeout):
+    """Waits up to timeout for pending connects. Returns the outcomes that completed."""
+    finished = []
+    for key, _events in selector.select(timeout):
+        outcome, started = key.data
+        code = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        outcome.ok, outcome.error_code = code == 0, code or None
+        outcome.elapsed_ms = (time.perf_counter() - started) * 1000
+        selector.unregister(key.fileobj)
+        key.fileobj.close()
+        finished.append(outcome)
+    return finished
+
+
+def _close_pending(selector):
+    for key in list(selector.get_map().values()):
+        key.data[0].timed_out = True
+        selector.unregister(key.fileobj)
+        key.fileobj.close()
+
+
+def probe_all_addresses(addresses, timeout):
+    """Connects to every (family, sockaddr) concurrently. Returns AddressOutcomes in input order."""
+    outcomes = [AddressOutcome(sockaddr[0], family) for family, sockaddr in addresses]
+    with selectors.DefaultSelector() as selector:
+        try:
+            for (family, sockaddr), outcome in zip(addresses, outcomes):
+                try:
+                    _start_connect(selector, family, sockaddr, outcome)
+                except OSError as e:
+                    outcome.error_code = e.errno
+            deadline = time.monotonic() + timeout
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                _finish_ready(selector, remaining)
+        finally:
+            _close_pending(selector)
+    return outcomes
+
+
+def happy_eyeballs(addresses, timeout, delay=HAPPY_EYEBALLS_DELAY):
+    """
+    Races connects over interleaved addresses, starting the next one every `delay` seconds
+    (or as soon as one fails). Returns (winning AddressOutcome or None, all attempted outcomes).
+    """
+    ordered = interleave_families(addresses)
+    attempted = []
+    winner = None
+    with selectors.DefaultSelector() as selector:
+        try:
+            deadline = time.monotonic() + timeout
+            next_index, next_start = 0, time.monotonic()
+            while winner is None:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if next_index < len(ordered) and (now >= next_start or not selector.get_map()):
+                    family, sockaddr = ordered[next_index]
+                    outcome = AddressOutcome(sockaddr[0], family)
+                    attempted.append(outcome)
+                    next_index += 1
+                    next_start = now + delay
+                    try:
+                        _start_connect(selector, family, sockaddr, outcome)
+                    except OSError as e:
+                        outcome.error_code = e.errno
+                    if outcome.ok:
+                        winner = outcome
+                    elif outcome.error_code is not None:
+                        next_start = now # Failed at once: no need to wait
+                    continue
+                if not selector.get_map():
+                    break # Every address failed
+                wait_until = deadline if next_index >= len(ordered) else min(deadline, next_start)
+                for outcome in _finish_ready(selector, max(0.0, wait_until - now)):
+                    if outcome.ok and winner is None:
+                        winner = outcome
+                    elif not outcome.ok:
+                        next_start = time.monotonic() # Failed: try the next address now
+        finally:
+            _close_pending(selector)
+    if winner is not None:
+        for outcome in attempted:
+            if outcome is not winner and outcome.timed_out:
+                outcome.timed_out = False # Abandoned, not timed out
+    return winner, attempted
+
+
+# --- Result Rows (same layout as test_tcp_port) ---
+
+def _describe(outcome, port):
+    if outcome.ok:
+        return f"Port {port} is open"
+    if outcome.timed_out:
+        return f"Timeout connecting to port {port}"
+    if outcome.error_code is None:
+        return "Not attempted"
+    return f"Port {port} is closed or filtered (Error code: {outcome.error_code})"
+
+
+def _attempt_timing(outcome):
+    if outcome.ok:
+        return f"{outcome.address} {outcome.elapsed_ms:.0f} ms"
+    if outcome.error_code is not None:
+        return f"{outcome.address} error {outcome.error_code}"
+    return f"{outcome.address} {'timeout' if outcome.timed_out else 'abandoned'}"
+
+
+def tcp_address_results(hostname, port, timeout, mode='all'):
+    """
+    Probes TCP port on every address of hostname and returns result dicts.
+    mode 'all': one row per address, Service 'tcp:<port>@<address>'.
+    mode 'happy-eyeballs': one row for the address that connected first.
+    """
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    def row(service, ok, details, timing=''):
+        return {'Timestamp': timestamp, 'TargetHost': hostname, 'Service': service, 'Status': 'SUCCESS' if ok else 'FAILED',
+                'Details': details, 'Timing': timing, 'SuccessBool': ok}
+    try:
+        addresses = resolve_all(hostname, port)
+    except socket.gaierror:
+        return [row(f'tcp:{port}', False, 'DNS Resolution Error')]
+    if not addresses:
+        return [row(f'tcp:{port}', False, 'No IPv4/IPv6 addresses found')]
+
+    if mode == 'happy-eyeballs':
+        winner, attempted = happy_eyeballs(addresses, timeout)
+        timing = ' -> '.join(_attempt_timing(outcome) for outcome in attempted)
+        if winner is None:
+            return [row(f'tcp:{port}', False, f"No address accepted port {port} ({len(attempted)} of {len(addresses)} tried)", timing)]
+        return [row(f'tcp:{port}', True, f"Port {port} is open via {winner.address} ({winner.family_label})", timing)]
+
+    return [row(f'tcp:{port}@{outcome.address}', outcome.ok, f"{_describe(outcome, port)} ({outcome.family_label})",
+                f"{outcome.elapsed_ms:.0f} ms" if outcome.elapsed_ms is not None else '')
+            for outcome in probe_all_addresses(addresses, timeout)]
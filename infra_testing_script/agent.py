@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Probe Agent ---
+# Purpose: Runs next to a site's backend and connects OUT to a coordinator backend (any
+#          app.py / serve.py instance) instead of waiting for browsers to call it. The agent
+#          leases batches of (target, service) work items from the coordinator's /agent/lease,
+#          probes them with the same test functions as app.py, and posts the results back to
+#          /agent/results in bulk. Items not returned within the visibility timeout are handed
+#          to another agent, so one large sweep is spread across all agents by site and capacity.
+
+# --- Prerequisites ---
+# pip install Flask Flask-CORS requests colorama
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import app as backend # Test functions (run_single_test); the Flask app itself is not started
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_CAPACITY = 50        # Items leased per request
+DEFAULT_CONCURRENCY = 16     # Items probed at the same time
+IDLE_POLL_MIN = 1.0          # Seconds between lease requests while there is no work...
+IDLE_POLL_MAX = 15.0         # ...backing off up to this
+HTTP_TIMEOUT = 30            # Timeout for coordinator requests
+
+stop_requested = False
+
+
+def run_item(item):
+    """Probes one leased item. Returns its result payload for /agent/results."""
+    rows = backend.run_single_test(item['host'], item['service'])
+    rows = rows if isinstance(rows, list) else [rows]
+    for row in rows:
+        row.pop('SuccessBool', None)
+    return {"job_id": item['job_id'], "seq": item['seq'], "rows": rows}
+
+
+def post_results(session, coordinator, results, give_up_after):
+    """Posts a finished batch, retrying until give_up_after (after that the items are re-leased elsewhere)."""
+    delay = IDLE_POLL_MIN
+    while True:
+        try:
+            response = session.post(f"{coordinator}/agent/results", json={"results": results}, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            if time.monotonic() + delay > give_up_after:
+                print(f"Error: could not post {len(results)} result(s), dropping the batch: {e}")
+                return None
+            print(f"Warning: posting results failed ({e}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, IDLE_POLL_MAX)
+
+
+def run_agent(coordinator, agent_id, site, capacity, concurrency, exit_when_idle=False):
+    """Lease/probe/post loop. Returns the number of items completed."""
+    completed = 0
+    idle_delay = IDLE_POLL_MIN
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while not stop_requested:
+            try:
+                response = session.post(f"{coordinator}/agent/lease", timeout=HTTP_TIMEOUT,
+                                        json={"agent_id": agent_id, "site": site, "capacity": capacity})
+                response.raise_for_status()
+                lease = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"Warning: lease request to {coordinator} failed: {e}")
+                time.sleep(idle_delay)
+                idle_delay = min(idle_delay * 2, IDLE_POLL_MAX)
+                continue
+
+            items = lease.get('items', [])
+            if not items:
+                if exit_when_idle:
+                    break
+                time.sleep(idle_delay)
+                idle_delay = min(idle_delay * 2, IDLE_POLL_MAX)
+                continue
+            idle_delay = IDLE_POLL_MIN
+
+            leased_at = time.monotonic()
+            results = list(pool.map(run_item, items))
+            outcome = post_results(session, coordinator, results, leased_at + lease.get('visibility_timeout', HTTP_TIMEOUT))
+            if outcome:
+                completed += outcome.get('accepted', 0)
+                print(f"[{agent_id}] {len(items)} item(s) probed in {time.monotonic() - leased_at:.1f}s, "
+                      f"{outcome.get('accepted', 0)} accepted ({completed} total)")
+    return completed
+
+
+def setup_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Probe agent: leases test work from a coordinator backend and posts results back.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Queue a sweep on the coordinator with POST /sweeps {\"csv_data\": \"hostname,services,site\\n...\"}."
+    )
+    parser.add_argument('--coordinator', required=True, help='Base URL of the coordinator backend, e.g. http://coord:5000')
+    parser.add_argument('--site', default=None, help='Site name; items tagged with this site are only leased to its agents.')
+    parser.add_argument('--agent-id', default=f"{socket.gethostname()}-{os.getpid()}", help='Name reported to the coordinator.')
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY, metavar='N', help='Items leased per batch.')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, metavar='N', help='Items probed in parallel.')
+    parser.add_argument('--exit-when-idle', action='store_true', help='Stop once the coordinator has no work left.')
+    return parser
+
+
+if __name__ == "__main__":
+    args = setup_arg_parser().parse_args()
+    if args.capacity < 1 or args.concurrency < 1:
+        print("Error: --capacity and --concurrency must be at least 1.")
+        sys.exit(1)
+
+    def request_stop(signum, frame):
+        global stop_requested
+        stop_requested = True # Finish and post the current batch, then exit
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    print(f"Agent {args.agent_id} (site: {args.site or 'any'}) pulling work from {args.coordinator.rstrip('/')}")
+    total = run_agent(args.coordinator.rstrip('/'), args.agent_id, args.site, args.capacity, args.concurrency,
+                      exit_when_idle=args.exit_when_idle)
+    print(f"Agent {args.agent_id} stopped after completing {total} item(s).")
@@ -16,10 +16,26 @@ import subprocess
 import platform
 import requests
 import socket
+import threading
+import time
+import hashlib
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
 import traceback
+import job_store # Local module: job state shared by all worker processes
+import probe_coalescer # Local module: shares identical probes between concurrent requests
+import http_probe # Local module: streamed HTTP probe with byte budget and redirect cap
+import address_probe # Local module: all-addresses / Happy Eyeballs TCP probing
+import result_writers # Local module: CSV / compressed / JSON Lines / Parquet export writers
+import stage_profiler # Local module: per-job stage timings and stack sampling (X-Profile)
+import response_compression # Local module: gzip / Brotli response bodies (Accept-Encoding)
+import host_patterns # Local module: web[01-64] / tcp:{22,443} target patterns, expanded lazily
+import job_deadline # Local module: "deadline_s" probe timeouts, round-robin order, SKIPPED (deadline)
+import tls_probe # Local module: tls:<port> handshake and certificate inspection, certificate cache
+import udp_probe # Local module: batched udp:/dns:/ntp:/snmp:<port> probes
+import path_trace # Local module: 'trace' service, all TTLs of all targets in parallel
+import net_replay # Local module: NETTEST_RECORD / NETTEST_REPLAY trace files
 
 # --- Configuration ---
 RESULTS_OUTPUT_DIR = "./test_results"
@@ -27,6 +43,31 @@ REQUEST_TIMEOUT = 5 # Timeout for HTTP/HTTPS requests
 # --- Increased PING_TIMEOUT for debugging ---
 PING_TIMEOUT = 5    # Timeout for ping command execution (Increased to 5s)
 TCP_TIMEOUT = 3     # Timeout for generic TCP port connections
+UDP_TIMEOUT = 3     # Timeout for UDP probes (udp/dns/ntp/snmp), retries included
+TRACE_TIMEOUT = 2   # Seconds each trace probe (one TTL of one round) is waited for
+HTTP_MAX_BODY_BYTES = http_probe.DEFAULT_MAX_BODY_BYTES # Body bytes read per HTTP/S probe (0 = headers only)
+HTTP_MAX_REDIRECTS = http_probe.DEFAULT_MAX_REDIRECTS
+JOB_PROGRESS_INTERVAL = 1.0 # Seconds between progress writes to the shared job store
+AGENT_VISIBILITY_TIMEOUT = 120 # Seconds an agent has to return a leased batch before it is handed out again
+AGENT_MAX_BATCH = 500          # Upper bound on items per lease, whatever capacity an agent asks for
+UPLOAD_MAX_CHUNK_BYTES = 4 * 1024 * 1024 # Larger /uploads chunks are rejected (413)
+UPLOAD_MAX_CHUNKS = 100000
+UPLOAD_PROBE_THREADS = 4                 # Chunks probed at once per worker process; later ones wait their turn
+MAX_RESULTS_PAGE = 5000 # Upper bound on rows per /jobs/<id>/results page, whatever 'limit' asks for
+# Identical (host, service) probes are shared while in flight and reused for this many seconds.
+# Set NETTEST_PROBE_FRESHNESS=0 (or serve.py --probe-freshness 0) to always probe anew.
+PROBE_FRESHNESS_SECONDS = float(os.environ.get('NETTEST_PROBE_FRESHNESS', probe_coalescer.DEFAULT_FRESHNESS_SECONDS))
+PROBE_CACHE_SIZE = probe_coalescer.DEFAULT_MAX_ENTRIES
+# Jobs are profiled when the /test request sends 'X-Profile: 1' (or 'sample' to also sample stacks),
+# or all of them with NETTEST_PROFILE=1|sample (serve.py --profile / --profile-sample).
+PROFILE_MODE = os.environ.get('NETTEST_PROFILE', '')
+PROFILE_STAGES, PROFILE_SAMPLE = '1', 'sample'
+# NETTEST_RECORD=<trace> (serve.py --record) appends every probe's outcome and latency to a trace file;
+# NETTEST_REPLAY=<trace> (serve.py --replay) serves them from one instead of the network (see net_replay.py),
+# sleeping each recorded latency times NETTEST_REPLAY_SPEED (default 0: not at all). Job deadlines stay wall-clock time.
+RECORD_TRACE = os.environ.get('NETTEST_RECORD', '')
+REPLAY_TRACE = os.environ.get('NETTEST_REPLAY', '')
+REPLAY_SPEED = float(os.environ.get('NETTEST_REPLAY_SPEED', 0))
 
 # --- Status Constants ---
 # (Colorama setup remains the same)
@@ -43,14 +84,16 @@ except ImportError:
     STATUS_FAILED = "FAILED"
     STATUS_SKIPPED = "SKIPPED"
 
-CSV_FIELDNAMES = ['Timestamp', 'TargetHost', 'Service', 'Status', 'Details']
+CSV_FIELDNAMES = ['Timestamp', 'TargetHost', 'Service', 'Status', 'Details', 'Timing']
+DICTIONARY_COLUMNS = ('TargetHost', 'Service', 'Status') # Dictionary-encoded in Parquet exports
 
 # --- Actual Network Test Functions (Adapted from script) ---
 
 # --- MODIFIED test_ping function ---
-def test_ping(hostname):
+def test_ping(hostname, timeout=PING_TIMEOUT, limit=None):
     """
-    Tests reachability using the system's ping command.
+    Tests reachability using the system's ping command (timeout in whole seconds).
+    limit: seconds the ping process may run at most (a job deadline's remaining time); one packet is sent then.
     Captures stderr for better diagnostics. Increased timeout.
     Returns a dictionary with test result details.
     """
@@ -60,15 +103,16 @@ def test_ping(hostname):
         'Details': '', 'SuccessBool': False
     }
     param = '-n' if platform.system().lower() == 'windows' else '-c'
-    count = '2' # Send 2 packets instead of 1 for slightly more robustness
+    count = '2' if limit is None else '1' # Send 2 packets instead of 1 for slightly more robustness, unless time is short
+    process_timeout = timeout + 1 if limit is None else min(timeout + 1, limit) # Overall timeout for the subprocess
     timeout_param = []
     if platform.system().lower() == 'windows':
         # Windows timeout is in milliseconds, per hop. -w affects overall timeout less directly.
         # Using a larger overall subprocess timeout is more reliable here.
-        timeout_param = ['-w', str(PING_TIMEOUT * 1000)] # Still set -w
+        timeout_param = ['-w', str(timeout * 1000)] # Still set -w
     else:
         # Linux/macOS '-W' is overall timeout in seconds
-        timeout_param = ['-W', str(PING_TIMEOUT)]
+        timeout_param = ['-W', str(timeout)]
     # Use full path if known and potentially helpful (e.g., on Linux)
     ping_executable = 'ping'
     # if platform.system().lower() == 'linux': ping_executable = '/bin/ping' # Example
@@ -82,7 +126,7 @@ def test_ping(hostname):
             command,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.PIPE, # CAPTURE stderr
-            timeout=PING_TIMEOUT + 1, # Overall timeout for the subprocess
+            timeout=process_timeout,
             check=False,
             text=True # Decode stderr as text
         )
@@ -113,7 +157,7 @@ def test_ping(hostname):
                  result_data['Details'] = details
 
     except subprocess.TimeoutExpired:
-        result_data['Details'] = f'Timeout waiting for ping command (>{PING_TIMEOUT}s)'
+        result_data['Details'] = f'Timeout waiting for ping command (>{process_timeout:g}s)'
         if stderr_output: result_data['Details'] += f" | Stderr: {stderr_output}"
     except FileNotFoundError:
         result_data['Details'] = f"Ping command '{ping_executable}' not found?"
@@ -128,6 +172,7 @@ def test_ping(hostname):
 def test_http_https(hostname, service_type='https', timeout=REQUEST_TIMEOUT):
     """
     Tests HTTP or HTTPS connectivity and checks for a successful status code (2xx).
+    Reads only the headers (or HTTP_MAX_BODY_BYTES) and follows at most HTTP_MAX_REDIRECTS.
     Returns a dictionary with test result details.
     """
     protocol = 'https' if service_type == 'https' else 'http'
@@ -140,13 +185,17 @@ def test_http_https(hostname, service_type='https', timeout=REQUEST_TIMEOUT):
     try:
         verify_ssl = False
         headers = {'User-Agent': 'Python-NetworkTestScript/1.3-Backend'}
-        response = requests.get(
-            url, timeout=timeout, verify=verify_ssl,
-            allow_redirects=True, headers=headers
+        probe = http_probe.probe_url(
+            url, timeout=timeout, verify=verify_ssl, headers=headers,
+            max_body_bytes=HTTP_MAX_BODY_BYTES, max_redirects=HTTP_MAX_REDIRECTS
         )
-        result_data['Details'] = f"HTTP Status {response.status_code}"
-        if 200 <= response.status_code < 300:
+        result_data['Details'] = f"HTTP Status {probe.status_code}"
+        if probe.redirects: result_data['Details'] += f" after {probe.redirects} redirect(s)"
+        result_data['Timing'] = probe.timing_summary()
+        if 200 <= probe.status_code < 300:
             result_data.update({'Status': STATUS_SUCCESS, 'SuccessBool': True})
+    except requests.exceptions.TooManyRedirects:
+        result_data['Details'] = f"Too many redirects (limit {HTTP_MAX_REDIRECTS})"
     except requests.exceptions.Timeout:
         result_data['Details'] = 'Timeout'
     except requests.exceptions.SSLError as e:
@@ -208,50 +257,179 @@ def test_tcp_port(hostname, port, timeout=TCP_TIMEOUT):
 
 
 # --- Core Test Execution Logic ---
-# (No changes needed from previous version)
-def run_network_tests(targets):
+probe_cache = probe_coalescer.ProbeCoalescer(PROBE_FRESHNESS_SECONDS, PROBE_CACHE_SIZE)
+# Appended to with a flush per line, so every worker process can record into the same (uncompressed) trace
+recorder = net_replay.TraceRecorder(RECORD_TRACE, tool='app', append=True) if RECORD_TRACE else None
+replay = net_replay.ReplayBackend.load(REPLAY_TRACE, speed=REPLAY_SPEED, layers=(net_replay.LAYER_PROBE,)) if REPLAY_TRACE else None
+
+TCP_ADDRESS_MODES = ('all', 'happy-eyeballs') # Values accepted for "tcp_addresses" in /test requests
+
+def run_single_test(host, service, address_mode=None, deadline=None, tls_options=None):
+    """
+    Runs one service test for one host and returns its result dictionary (errors become FAILED results).
+    With an address_mode, tcp:<port> tests return a list (one dictionary per address for 'all').
+    With a job_deadline.Deadline, timeouts are cut to the time the job has left.
+    tls_options: (resume, min_days) for tls:<port> tests, else the tls_probe defaults.
+    With NETTEST_REPLAY the result comes from the trace; with NETTEST_RECORD it is also recorded.
+    """
+    if replay is not None: return replay.probe(host, service)
+    started = time.perf_counter()
+    result_data = _probe_service(host, service, address_mode, deadline, tls_options)
+    if recorder is not None: recorder.record_probe(host, service, time.perf_counter() - started, result_data)
+    return result_data
+
+def _probe_service(host, service, address_mode, deadline, tls_options):
+    service_lower = service.lower()
+    def timeout(default): return job_deadline.timeout_for(deadline, default) or job_deadline.MIN_PROBE_SECONDS
+    try:
+        if service_lower == 'ping':
+            if deadline is None: return test_ping(host, PING_TIMEOUT)
+            seconds = deadline.whole_seconds(PING_TIMEOUT)
+            if seconds is None: return job_deadline.skipped_result(host, service, datetime.now().strftime('%Y-%m-%d %H:%M:%S')) # Under a second left
+            return test_ping(host, seconds, limit=deadline.remaining())
+        elif service_lower == 'http': return test_http_https(host, service_type='http', timeout=timeout(REQUEST_TIMEOUT))
+        elif service_lower == 'https': return test_http_https(host, service_type='https', timeout=timeout(REQUEST_TIMEOUT))
+        elif udp_probe.parse_service(service_lower): return udp_probe.udp_result(host, service_lower, timeout(UDP_TIMEOUT))
+        elif service_lower == 'trace': return path_trace.trace_result(host, timeout(TRACE_TIMEOUT))
+        elif ':' in service_lower:
+            service_type, port_str = service_lower.split(':', 1)
+            if service_type == 'tcp' and address_mode and port_str.isdigit() and 0 < int(port_str) < 65536:
+                return address_probe.tcp_address_results(host, int(port_str), timeout(TCP_TIMEOUT), mode=address_mode)
+            if service_type == 'tcp': return test_tcp_port(host, port_str, timeout=timeout(TCP_TIMEOUT))
+            if service_type == 'tls' and port_str.isdigit() and 0 < int(port_str) < 65536:
+                resume, min_days = tls_options or (False, tls_probe.DEFAULT_MIN_DAYS)
+                return tls_probe.tls_result(host, int(port_str), timeout(TCP_TIMEOUT), resume=resume, min_days=min_days)
+            if service_type == 'tls':
+                return {'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host, 'Service': service, 'Status': STATUS_FAILED, 'Details': f'Invalid port number specified: {port_str}'}
+            details = f'Unsupported service type {service_type}'
+        else: details = 'Unknown service type'
+        return {'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host, 'Service': service, 'Status': STATUS_SKIPPED, 'Details': details}
+    except Exception as test_err:
+        print(f"Error during test '{service}' for host '{host}': {test_err}"); traceback.print_exc()
+        return {'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host, 'Service': service, 'Status': STATUS_FAILED, 'Details': f'Test execution error: {test_err}'}
+
+def test_service(host, service, address_mode=None, profiler=stage_profiler.NULL_PROFILER, deadline=None, tls_options=None, batched_results=None):
+    """
+    Runs one service test of a target for run_network_tests() and returns its result dictionaries
+    (without 'SuccessBool'). Past the deadline, the test is not started and reported SKIPPED (deadline).
+    UDP and trace tests already run by batch_udp_tests() / batch_trace_tests() (batched_results) just return their result.
+    """
+    if batched_results and (host, service.lower()) in batched_results:
+        result_data = dict(batched_results[(host, service.lower())], Service=service) # As spelled in this request
+        result_data.pop('SuccessBool', None)
+        return [result_data]
+    if deadline is not None and deadline.expired():
+        result_data = job_deadline.skipped_result(host, service, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        result_data.pop('SuccessBool')
+        return [result_data]
+    # Concurrent requests for the same (host, service) share one probe (see probe_coalescer.py);
+    # a probe cut short by this job's deadline is not handed to other requests nor cached
+    started, ran = time.perf_counter(), []
+    def probe():
+        ran.append(True)
+        with profiler.stage(f"probe:{service.lower().split(':', 1)[0]}"): return run_single_test(host, service, address_mode, deadline, tls_options)
+    try: result_data = probe_cache.run((host.strip().lower(), service.strip().lower(), address_mode, tls_options), probe,
+                                       wait=None if deadline is None else max(deadline.remaining(), 0), share=deadline is None)
+    except probe_coalescer.WaitTimeout: # Another request's probe outlasted this job's deadline
+        result_data = job_deadline.skipped_result(host, service, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    if not ran: profiler.wait('shared_probe', time.perf_counter() - started)
+    if isinstance(result_data, list): # Per-address results keep their 'tcp:<port>@<address>' service
+        for result_item in result_data:
+            result_item.pop('SuccessBool', None); result_item['TargetHost'] = host
+        return result_data
+    if not result_data: return []
+    result_data.pop('SuccessBool', None)
+    result_data['TargetHost'], result_data['Service'] = host, service # As spelled in this request
+    return [result_data]
+
+def batch_udp_tests(targets, profiler=stage_profiler.NULL_PROFILER, deadline=None):
+    """Runs every udp/dns/ntp/snmp test of the targets as one batch (see udp_probe.py). Returns {(host, service): result} or None."""
+    udp_tests = [(target['host'], service) for target in targets if target.get('host')
+                 for service in target.get('services', []) if udp_probe.parse_service(service)]
+    if not udp_tests or replay is not None: return None # Replayed test by test
+    started = time.perf_counter()
+    with profiler.stage('udp_batch'):
+        results = udp_probe.run_batch(udp_tests, job_deadline.timeout_for(deadline, UDP_TIMEOUT) or job_deadline.MIN_PROBE_SECONDS)
+    if recorder is not None: record_batch(results, time.perf_counter() - started)
+    return results
+
+def batch_trace_tests(targets, profiler=stage_profiler.NULL_PROFILER, deadline=None):
+    """Traces every host with a 'trace' service as one batch (see path_trace.py). Returns {(host, 'trace'): result} or None."""
+    hosts = [target['host'] for target in targets if target.get('host')
+             and any(service.lower() == 'trace' for service in target.get('services', []))]
+    if not hosts or replay is not None: return None # Replayed test by test
+    started = time.perf_counter()
+    with profiler.stage('trace_batch'):
+        results = path_trace.run_batch(hosts, job_deadline.timeout_for(deadline, TRACE_TIMEOUT) or job_deadline.MIN_PROBE_SECONDS)
+    results = {(host, 'trace'): result for host, result in results.items()}
+    if recorder is not None: record_batch(results, time.perf_counter() - started)
+    return results
+
+def record_batch(results, seconds):
+    """NETTEST_RECORD: the tests of a batch, {(host, service): result}, each with its share of the batch's time."""
+    for (host, service), result in results.items(): recorder.record_probe(host, service, seconds / len(results), result)
+
+def run_network_tests(targets, progress_callback=None, profiler=stage_profiler.NULL_PROFILER, deadline=None):
     """
     Runs the actual network tests based on the target list.
     Takes a list of target dictionaries [{'host': '...', 'services': [...]}]
+    A target may carry 'address_mode' ('all' or 'happy-eyeballs') for its tcp:<port> services,
+    and 'tls_options' ((resume, min_days)) for its tls:<port> services.
+    UDP tests (udp/dns/ntp/snmp) are all sent up front as one batch, and so are traces; both are reported in target order.
+    Optional progress_callback(completed_count) is called after each service test.
+    Probes are timed as 'probe:<type>' stages; time spent on a probe another request ran is a 'shared_probe' wait.
+    With a job_deadline.Deadline the tests run in rounds (the first service of every target, then the
+    second, ...) so every host gets a check before any gets a second; results stay in target order.
     Returns a list of result dictionaries (without 'SuccessBool').
     """
     all_results = []
+    completed = 0
     print(f"Backend processing {len(targets)} target(s)...") # Server-side log
     if not targets: return all_results
+    batched_results = {**(batch_udp_tests(targets, profiler, deadline) or {}), **(batch_trace_tests(targets, profiler, deadline) or {})}
+
+    if deadline is not None:
+        slots = {} # (target index, service index) -> result dictionaries, gathered in target order below
+        for target_index, target, service_index in job_deadline.priority_order(targets):
+            if not target.get('host'): continue
+            slots[target_index, service_index] = test_service(target['host'], target['services'][service_index],
+                                                              target.get('address_mode'), profiler, deadline, target.get('tls_options'), batched_results)
+            completed += 1
+            if progress_callback: progress_callback(completed)
+        for target_index, target in enumerate(targets):
+            for service_index in range(len(target.get('services') or ()) if target.get('host') else 0):
+                all_results.extend(slots.pop((target_index, service_index)))
+        print(f"Backend finished testing. Returning {len(all_results)} results.")
+        return all_results
 
     for target in targets:
         host, services = target.get('host'), target.get('services', [])
         if not host or not services: continue
         print(f"Testing target: {host} for services: {services}") # Server log
 
+        address_mode, tls_options = target.get('address_mode'), target.get('tls_options')
         for service in services:
-            result_data = None
-            service_lower = service.lower()
-            try:
-                if service_lower == 'ping': result_data = test_ping(host)
-                elif service_lower == 'http': result_data = test_http_https(host, service_type='http', timeout=REQUEST_TIMEOUT)
-                elif service_lower == 'https': result_data = test_http_https(host, service_type='https', timeout=REQUEST_TIMEOUT)
-                elif ':' in service_lower:
-                    service_type, port_str = service_lower.split(':', 1)
-                    if service_type == 'tcp': result_data = test_tcp_port(host, port_str, timeout=TCP_TIMEOUT)
-                    else: details = f'Unsupported service type {service_type}'; result_data = {'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host, 'Service': service, 'Status': STATUS_SKIPPED, 'Details': details}
-                else: details = 'Unknown service type'; result_data = {'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host, 'Service': service, 'Status': STATUS_SKIPPED, 'Details': details}
-            except Exception as test_err:
-                 print(f"Error during test '{service}' for host '{host}': {test_err}"); traceback.print_exc()
-                 result_data = {'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host, 'Service': service, 'Status': STATUS_FAILED, 'Details': f'Test execution error: {test_err}'}
-
-            if result_data: result_data.pop('SuccessBool', None); all_results.append(result_data)
+            all_results.extend(test_service(host, service, address_mode, profiler, tls_options=tls_options, batched_results=batched_results))
+            completed += 1
+            if progress_callback: progress_callback(completed)
             # import time; time.sleep(0.05) # Optional delay
 
     print(f"Backend finished testing. Returning {len(all_results)} results.")
     return all_results
 
+def count_deadline_skipped(results):
+    return sum(1 for r in results if r.get('Status') == STATUS_SKIPPED and r.get('Details') == job_deadline.DEADLINE_DETAILS)
+
 
 # --- Helper Function to Parse CSV Data from String ---
 # (No changes needed from previous version)
 def parse_csv_data(csv_string_data):
-    """Parses CSV data from a string and returns a list of target dicts."""
-    targets = []
+    """
+    Parses CSV data from a string and returns a TargetList of target dicts. Hosts and services
+    may be patterns (web[01-64].corp.local, tcp:{22,443}), expanded only as the list is iterated.
+    An optional third 'site' column pins a target to probe agents of that site (see /sweeps).
+    """
+    targets = host_patterns.TargetList()
     if not csv_string_data: return targets
     try:
         csvfile = io.StringIO(csv_string_data)
@@ -260,12 +438,14 @@ def parse_csv_data(csv_string_data):
         try: header = next(reader)
         except StopIteration: return targets
         if not header or len(header) < 2 or header[0].lower().strip() != 'hostname' or header[1].lower().strip() != 'services': raise ValueError("Invalid CSV header")
+        has_site = len(header) >= 3 and header[2].lower().strip() == 'site'
         for i, row in enumerate(reader):
              if len(row) >= 2:
                 host, services_str = row[0].strip(), row[1].strip()
                 if host and services_str:
-                    services_list = [s.strip().lower() for s in services_str.split(',') if s.strip()]
-                    if services_list: targets.append({'host': host, 'services': services_list})
+                    extra = {'site': row[2].strip()} if has_site and len(row) >= 3 and row[2].strip() else {}
+                    try: targets.add(host, services_str, **extra)
+                    except host_patterns.PatternError as e: raise ValueError(f"Row {i + 2}: {e}")
     except ValueError as ve: raise ve
     except Exception as e: raise ValueError(f"Failed to parse CSV data: {e}")
     return targets
@@ -273,7 +453,7 @@ def parse_csv_data(csv_string_data):
 # --- Helper Function to Save Results to CSV ---
 # (No changes needed from previous version)
 def save_results_to_csv(results, filename):
-    """Saves the results list of dicts to a CSV file on the server."""
+    """Saves the results list of dicts on the server, as CSV or the format implied by the extension (e.g. .csv.gz, .parquet)."""
     if not filename: return "No output filename provided."
     if not results: return "No results to save."
     base_filename = os.path.basename(filename)
@@ -283,18 +463,181 @@ def save_results_to_csv(results, filename):
     full_path = os.path.join(RESULTS_OUTPUT_DIR, base_filename)
     print(f"Attempting to save results to server path: {full_path}")
     try:
-        with open(full_path, mode='w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES, extrasaction='ignore')
-            writer.writeheader()
-            writer.writerows(results)
+        with result_writers.open_writer(full_path, CSV_FIELDNAMES, dictionary_columns=DICTIONARY_COLUMNS) as writer:
+            writer.write_rows(results)
         return f"Successfully saved results to '{base_filename}' on the server."
+    except result_writers.ExportFormatError as e: return f"Error: Could not save '{base_filename}': {e}"
     except IOError as e: return f"Error: Could not write results to file '{base_filename}' on server: {e}"
     except Exception as e: print(f"Unexpected error saving CSV to {full_path}: {e}"); traceback.print_exc(); return f"Error: Unexpected error saving results file '{base_filename}' on server."
 
 
+# --- Shared Job State ---
+# Every /test request becomes a job in a SQLite store under RESULTS_OUTPUT_DIR, so with
+# several worker processes (see serve.py) any worker can answer /jobs/<id> requests.
+_job_store = None
+_job_store_lock = threading.Lock()
+_background_jobs = set() # Threads running async jobs in this process
+_background_jobs_lock = threading.Lock()
+
+def get_job_store():
+    """Returns the process-wide JobStore, creating the results directory on first use."""
+    global _job_store
+    with _job_store_lock:
+        if _job_store is None:
+            os.makedirs(RESULTS_OUTPUT_DIR, exist_ok=True)
+            _job_store = job_store.JobStore(os.path.join(RESULTS_OUTPUT_DIR, job_store.DEFAULT_DB_FILENAME))
+        return _job_store
+
+def count_services(targets):
+    if isinstance(targets, host_patterns.TargetList): return targets.count_services() # Without expanding the patterns
+    return sum(len(target.get('services', [])) for target in targets)
+
+def profile_path(job_id):
+    return os.path.join(RESULTS_OUTPUT_DIR, f"job_{job_id}.profile.json")
+
+def make_profiler(mode):
+    """StageProfiler for an X-Profile / NETTEST_PROFILE value ('1' or 'sample'), else the no-op profiler."""
+    mode = (mode or '').strip().lower()
+    if mode in (PROFILE_STAGES, 'true', 'yes', 'on', PROFILE_SAMPLE): return stage_profiler.StageProfiler()
+    return stage_profiler.NULL_PROFILER
+
+def execute_job(job_id, targets_to_test, output_filename, profiler=stage_profiler.NULL_PROFILER, sample=False, deadline=None):
+    """
+    Runs a job's tests (within the optional job_deadline.Deadline), saves the optional CSV and records everything in the job store.
+    With a profiler the stage timings (and stack samples of this thread if sample) are written to
+    profile_path(job_id). Returns (results, file_save_status, profile report or None).
+    """
+    if sample: profiler.start_sampling()
+    jobs = get_job_store()
+    with profiler.stage('job_store'): jobs.set_running(job_id, total=count_services(targets_to_test))
+    last_progress_write = [0.0]
+    def report_progress(completed):
+        now = time.monotonic()
+        if now - last_progress_write[0] >= JOB_PROGRESS_INTERVAL:
+            last_progress_write[0] = now
+            with profiler.stage('job_store'): jobs.set_progress(job_id, completed)
+    results = run_network_tests(targets_to_test, progress_callback=report_progress, profiler=profiler, deadline=deadline) if targets_to_test else []
+    file_save_status = None
+    if output_filename:
+        with profiler.stage('save_results'): file_save_status = save_results_to_csv(results, output_filename)
+        print(f"File save status: {file_save_status}")
+    profile = None
+    if profiler.enabled:
+        # Written before the job is marked done, so it is there as soon as /jobs/<id> says so
+        try: profile = profiler.write_report(profile_path(job_id), tool='app', job_id=job_id, targets=len(targets_to_test), tests=count_services(targets_to_test))
+        except IOError as e: print(f"Error: Could not write profile for job {job_id}: {e}")
+    jobs.finish_job(job_id, results, file_save_status)
+    return results, file_save_status, profile
+
+def _run_tracked(target, args):
+    try: target(*args)
+    finally:
+        with _background_jobs_lock: _background_jobs.discard(threading.current_thread())
+
+def start_tracked_thread(target, args, name):
+    """Runs target(*args) on a thread that wait_for_background_jobs() waits for."""
+    thread = threading.Thread(target=_run_tracked, args=(target, args), name=name)
+    with _background_jobs_lock: _background_jobs.add(thread)
+    thread.start()
+
+def _run_background_job(job_id, targets_to_test, output_filename, profiler, sample, queued_at, deadline):
+    try:
+        profiler.wait('job_queue', time.perf_counter() - queued_at)
+        execute_job(job_id, targets_to_test, output_filename, profiler=profiler, sample=sample, deadline=deadline)
+    except Exception as e:
+        print(f"Error in background job {job_id}: {e}"); traceback.print_exc()
+        get_job_store().fail_job(job_id, f"Job execution error: {e}")
+
+def start_background_job(job_id, targets_to_test, output_filename, profiler=stage_profiler.NULL_PROFILER, sample=False, deadline=None):
+    start_tracked_thread(_run_background_job, (job_id, targets_to_test, output_filename, profiler, sample, time.perf_counter(), deadline),
+                         f"job-{job_id}")
+
+def wait_for_background_jobs(timeout=None):
+    """Blocks until this process's async jobs finish (used for graceful drain). Returns True if all finished."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        with _background_jobs_lock: pending = list(_background_jobs)
+        if not pending: return True
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0: return False
+        pending[0].join(remaining)
+
+# --- Chunked Uploads ---
+# Large CSVs are sent as POST /uploads (header line and options), then PUT /uploads/<id>/chunks/<n>
+# for each chunk of whole data lines, in any order and from any worker, then POST .../complete with
+# the chunk count. Each chunk is parsed and probed as soon as it arrives; whichever worker probes
+# the last one saves the output file and marks the job (same id) done. Re-sent chunks are ignored,
+# so a client resumes by asking GET /uploads/<id> which chunks arrived and sending the rest.
+_upload_slots = threading.BoundedSemaphore(UPLOAD_PROBE_THREADS)
+
+def finish_upload(upload_id, options):
+    jobs = get_job_store()
+    results = jobs.upload_results(upload_id)
+    file_save_status = None
+    if options.get('output_filename'):
+        file_save_status = save_results_to_csv(results, options['output_filename'])
+        print(f"File save status: {file_save_status}")
+    jobs.finish_job(upload_id, results, file_save_status)
+
+def _run_upload_chunk(upload_id, chunk_index, targets, options):
+    try:
+        with _upload_slots: results = run_network_tests(targets)
+        if get_job_store().complete_chunk(upload_id, chunk_index, results): finish_upload(upload_id, options)
+    except Exception as e:
+        print(f"Error in upload {upload_id} chunk {chunk_index}: {e}"); traceback.print_exc()
+        get_job_store().fail_job(upload_id, f"Job execution error: {e}")
+
+def upload_status_payload(upload_id, upload):
+    """Chunk bookkeeping plus the job's status and test counts, so an uploading client needs only this one request."""
+    missing = None
+    if upload['total_chunks'] is not None:
+        received = set(upload['received'])
+        missing = [index for index in range(upload['total_chunks']) if index not in received]
+    job = get_job_store().get_job(upload_id)
+    return {"upload_id": upload_id, "job_id": upload_id, "status": job['status'], "total": job['total'], "completed": job['completed'],
+            "error": job['error'], "received_chunks": upload['received'], "probed_chunks": len(upload['probed']),
+            "total_chunks": upload['total_chunks'], "missing_chunks": missing, "finished": upload['finished'],
+            "status_url": f"/jobs/{upload_id}", "results_url": f"/jobs/{upload_id}/results"}
+
+def parse_results_query(args):
+    """
+    Paging and filter options from /jobs/<id>/results query parameters: limit (rows per page,
+    at most MAX_RESULTS_PAGE), cursor (next_cursor of the previous page), status (comma-separated,
+    e.g. FAILED,SKIPPED) and host (TargetHost prefix). Raises ValueError for malformed values.
+    """
+    query = {'limit': None, 'cursor': None, 'statuses': None, 'host_prefix': args.get('host') or None}
+    if args.get('limit'):
+        try: query['limit'] = int(args['limit'])
+        except ValueError: raise ValueError("'limit' must be a whole number")
+        if not 1 <= query['limit'] <= MAX_RESULTS_PAGE: raise ValueError(f"'limit' must be between 1 and {MAX_RESULTS_PAGE}")
+    if args.get('cursor'):
+        try: query['cursor'] = int(args['cursor'])
+        except ValueError: raise ValueError("Invalid 'cursor'")
+    if args.get('status'):
+        query['statuses'] = sorted({status.strip().upper() for status in args['status'].split(',') if status.strip()}) or None
+    return query
+
+def results_etag(job, query):
+    """Weak validator for a finished job's results under one set of query options (they never change afterwards)."""
+    key = f"{job['job_id']}|{job['status']}|{job['finished']}|{sorted(query.items())}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+def job_status_payload(job):
+    """Public view of a job row."""
+    return {"job_id": job['job_id'], "status": job['status'], "total": job['total'], "completed": job['completed'],
+            "created": datetime.fromtimestamp(job['created']).strftime('%Y-%m-%d %H:%M:%S'),
+            "finished": datetime.fromtimestamp(job['finished']).strftime('%Y-%m-%d %H:%M:%S') if job['finished'] else None,
+            "file_save_status": job['file_save_status'], "error": job['error']}
+
+
 # --- Flask App Setup ---
 app = Flask(__name__)
-CORS(app) # Enable CORS
+CORS(app, expose_headers=['ETag']) # Enable CORS
+
+@app.after_request
+def compress_response_body(response):
+    """gzip / Brotli for large JSON and CSV bodies when the client accepts it."""
+    return response_compression.compress_response(response, request.headers.get('Accept-Encoding'))
 
 # --- API Endpoint for Testing ---
 # (No changes needed from previous version)
@@ -302,42 +645,241 @@ CORS(app) # Enable CORS
 def handle_test_request():
     """Handles POST requests to run network tests."""
     print(f"[{datetime.now()}] Received request on /test")
-    targets_to_test = []
+    received_at = time.time()
+    targets_to_test = host_patterns.TargetList()
     output_filename = None
     file_save_status = None
     try:
         data = request.get_json()
         if not data: return jsonify({"error": "Invalid or empty JSON payload"}), 400
         output_filename = data.get('output_filename')
+        profile_mode = request.headers.get('X-Profile') or PROFILE_MODE
+        profiler = make_profiler(profile_mode)
+        sample = profile_mode.strip().lower() == PROFILE_SAMPLE
 
         if 'csv_data' in data:
             print("Processing CSV data from request...")
-            try: targets_to_test = parse_csv_data(data['csv_data'])
+            try:
+                with profiler.stage('parse_csv'): targets_to_test = parse_csv_data(data['csv_data'])
             except ValueError as e: return jsonify({"error": f"CSV Parsing Error: {e}"}), 400
         elif 'host' in data and 'services' in data:
              print("Processing single host data from request...")
              host, services = data.get('host'), data.get('services')
-             if isinstance(host, str) and isinstance(services, list) and host and services: targets_to_test.append({'host': host, 'services': services})
+             if isinstance(host, str) and isinstance(services, list) and host and services and all(isinstance(s, str) for s in services):
+                 try: targets_to_test.add(host.strip(), services, lower_services=False) # Results keep the services as spelled
+                 except host_patterns.PatternError as e: return jsonify({"error": str(e)}), 400
              else: return jsonify({"error": "Invalid 'host' or 'services' format"}), 400
         else: return jsonify({"error": "Missing 'csv_data' or 'host'/'services' pair"}), 400
 
-        if not targets_to_test: results = []
-        else: results = run_network_tests(targets_to_test)
-
-        if output_filename:
-            file_save_status = save_results_to_csv(results, output_filename)
-            print(f"File save status: {file_save_status}")
-
-        response_payload = {"results": results, "file_save_status": file_save_status}
+        address_mode = data.get('tcp_addresses')
+        if address_mode:
+            if address_mode not in TCP_ADDRESS_MODES:
+                return jsonify({"error": f"Invalid 'tcp_addresses' (use one of: {', '.join(TCP_ADDRESS_MODES)})"}), 400
+            targets_to_test.set_option('address_mode', address_mode)
+        tls_resume, tls_min_days = data.get('tls_resume', False), data.get('tls_min_days', tls_probe.DEFAULT_MIN_DAYS)
+        if not isinstance(tls_resume, bool): return jsonify({"error": "Invalid 'tls_resume' (true or false)"}), 400
+        if isinstance(tls_min_days, bool) or not isinstance(tls_min_days, int): return jsonify({"error": "Invalid 'tls_min_days'"}), 400
+        if tls_resume or tls_min_days != tls_probe.DEFAULT_MIN_DAYS: targets_to_test.set_option('tls_options', (tls_resume, tls_min_days))
+
+        # Counted from the request's arrival, so queueing (async) is part of the budget
+        deadline_s = data.get('deadline_s')
+        if deadline_s is not None:
+            if isinstance(deadline_s, bool) or not isinstance(deadline_s, (int, float)) or deadline_s <= 0:
+                return jsonify({"error": "Invalid 'deadline_s' (a positive number of seconds)"}), 400
+            deadline = job_deadline.Deadline(deadline_s, now=received_at)
+        else: deadline = None
+        # Synchronous requests only: the first page inline, the rest via results_url?cursor=<next_cursor>
+        page_size = data.get('page_size')
+        if page_size and (isinstance(page_size, bool) or not isinstance(page_size, int) or page_size < 1):
+            return jsonify({"error": "Invalid 'page_size'"}), 400
+
+        jobs = get_job_store()
+        with profiler.stage('job_store'): job_id = jobs.create_job(total=count_services(targets_to_test))
+        if data.get('async'):
+            # Return immediately; progress and results are served by /jobs/<job_id> from any worker
+            start_background_job(job_id, targets_to_test, output_filename, profiler=profiler, sample=sample, deadline=deadline)
+            response_payload = {"job_id": job_id, "status": job_store.JOB_QUEUED, "status_url": f"/jobs/{job_id}",
+                                "results_url": f"/jobs/{job_id}/results"}
+            if profiler.enabled: response_payload['profile_url'] = f"/jobs/{job_id}/profile"
+            return jsonify(response_payload), 202
+
+        try: results, file_save_status, profile = execute_job(job_id, targets_to_test, output_filename, profiler=profiler, sample=sample, deadline=deadline)
+        except Exception as e: jobs.fail_job(job_id, f"Job execution error: {e}"); raise
+
+        response_payload = {"job_id": job_id, "results": results, "file_save_status": file_save_status}
+        if deadline: response_payload.update(deadline_s=deadline_s, deadline_skipped=count_deadline_skipped(results))
+        if page_size:
+            # Row seq == list index, so the cursor of the last inline row is page_size - 1
+            page_size = min(page_size, MAX_RESULTS_PAGE)
+            response_payload.update(results=results[:page_size], matched=len(results), limit=page_size,
+                                    next_cursor=page_size - 1 if len(results) > page_size else None,
+                                    results_url=f"/jobs/{job_id}/results")
+        if profile: response_payload['profile'] = profile
         return jsonify(response_payload)
 
     except Exception as e:
         print(f"Error processing /test request: {e}"); traceback.print_exc()
         return jsonify({"error": "An internal server error occurred."}), 500
 
+# --- API Endpoints for Job Status / Results ---
+@app.route('/jobs/<job_id>', methods=['GET'])
+def handle_job_status(job_id):
+    """Status and progress of a job started by any worker."""
+    job = get_job_store().get_job(job_id)
+    if not job: return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+    return jsonify(job_status_payload(job))
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def handle_job_results(job_id):
+    """
+    Results of a finished job (409 while it is still running). All rows by default; with ?limit=N
+    one page at a time (pass the returned next_cursor as ?cursor= for the next; null on the last),
+    optionally filtered by ?status=FAILED[,SKIPPED] and ?host=<TargetHost prefix>. The first page
+    also reports how many rows match. Finished results never change, so responses carry an ETag
+    and a matching If-None-Match gets 304 without reading the rows.
+    """
+    jobs = get_job_store()
+    job = jobs.get_job(job_id)
+    if not job: return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+    if job['status'] not in (job_store.JOB_DONE, job_store.JOB_FAILED):
+        return jsonify(dict(job_status_payload(job), error="Job has not finished yet")), 409
+    try: query = parse_results_query(request.args)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    etag = results_etag(job, query)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        after_seq = query['cursor'] if query['cursor'] is not None else -1
+        rows, next_cursor = jobs.get_results_page(job_id, after_seq, query['limit'], query['statuses'], query['host_prefix'])
+        payload = {"job_id": job_id, "status": job['status'], "results": rows,
+                   "file_save_status": job['file_save_status'], "error": job['error']}
+        if query['limit'] is not None or query['cursor'] is not None:
+            payload.update(limit=query['limit'], next_cursor=next_cursor)
+        if query['cursor'] is None and (query['limit'] is not None or query['statuses'] or query['host_prefix']):
+            payload['matched'] = len(rows) if next_cursor is None else jobs.count_results(job_id, query['statuses'], query['host_prefix'])
+        response = jsonify(payload)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache' # Keep a copy, but revalidate with If-None-Match
+    return response
+
+@app.route('/jobs/<job_id>/profile', methods=['GET'])
+def handle_job_profile(job_id):
+    """Stage timing report of a job run with 'X-Profile' (404 until the job has finished)."""
+    if not get_job_store().get_job(job_id): return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+    try:
+        with open(profile_path(os.path.basename(job_id)), encoding='utf-8') as f: return app.response_class(f.read(), mimetype='application/json')
+    except FileNotFoundError: return jsonify({"error": f"No profile for job '{job_id}' (not profiled, or not finished yet)"}), 404
+
+# --- API Endpoints for Chunked Uploads ---
+@app.route('/uploads', methods=['POST'])
+def handle_create_upload():
+    """Starts a chunked upload: {'header': 'hostname,services[,site]', 'output_filename', 'tcp_addresses'}."""
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('header'), str): return jsonify({"error": "Missing 'header' (the CSV header line)"}), 400
+    header = data['header'].strip()
+    try: parse_csv_data(header) # Validates the header
+    except ValueError as e: return jsonify({"error": f"CSV Parsing Error: {e}"}), 400
+    address_mode = data.get('tcp_addresses')
+    if address_mode and address_mode not in TCP_ADDRESS_MODES:
+        return jsonify({"error": f"Invalid 'tcp_addresses' (use one of: {', '.join(TCP_ADDRESS_MODES)})"}), 400
+    upload_id = get_job_store().create_upload(header, {"output_filename": data.get('output_filename'), "tcp_addresses": address_mode})
+    print(f"[{datetime.now()}] Started chunked upload {upload_id}")
+    return jsonify({"upload_id": upload_id, "job_id": upload_id, "chunk_url": f"/uploads/{upload_id}/chunks/<index>",
+                    "max_chunk_bytes": UPLOAD_MAX_CHUNK_BYTES,
+                    "status_url": f"/jobs/{upload_id}", "results_url": f"/jobs/{upload_id}/results"}), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def handle_upload_status(upload_id):
+    """Which chunks have arrived (to resume an interrupted upload) and, once completed, which are missing."""
+    upload = get_job_store().get_upload(upload_id)
+    if not upload: return jsonify({"error": f"Unknown upload '{upload_id}'"}), 404
+    return jsonify(upload_status_payload(upload_id, upload))
+
+@app.route('/uploads/<upload_id>/chunks/<int:chunk_index>', methods=['PUT'])
+def handle_upload_chunk(upload_id, chunk_index):
+    """One chunk of whole CSV data lines (no header) as the request body; probing starts right away."""
+    jobs = get_job_store()
+    upload = jobs.get_upload(upload_id)
+    if not upload: return jsonify({"error": f"Unknown upload '{upload_id}'"}), 404
+    limit = upload['total_chunks'] if upload['total_chunks'] is not None else UPLOAD_MAX_CHUNKS
+    if chunk_index >= limit: return jsonify({"error": f"Chunk index must be below {limit}"}), 400
+    if (request.content_length or 0) > UPLOAD_MAX_CHUNK_BYTES: return jsonify({"error": f"Chunk larger than {UPLOAD_MAX_CHUNK_BYTES} bytes"}), 413
+    if chunk_index in upload['received']: return jsonify({"upload_id": upload_id, "chunk": chunk_index, "duplicate": True}), 200
+    try: targets = parse_csv_data(upload['header'] + '\n' + request.get_data(as_text=True))
+    except ValueError as e: return jsonify({"error": f"CSV Parsing Error in chunk {chunk_index}: {e}"}), 400
+    options = upload['options']
+    if options.get('tcp_addresses'): targets.set_option('address_mode', options['tcp_addresses'])
+    if not jobs.add_chunk(upload_id, chunk_index, count_services(targets)): # Another request just stored it
+        return jsonify({"upload_id": upload_id, "chunk": chunk_index, "duplicate": True}), 200
+    start_tracked_thread(_run_upload_chunk, (upload_id, chunk_index, targets, options), f"upload-{upload_id}-{chunk_index}")
+    return jsonify({"upload_id": upload_id, "chunk": chunk_index, "duplicate": False, "targets": len(targets)}), 202
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def handle_complete_upload(upload_id):
+    """Declares the chunk count: {'total_chunks': N}. Lists chunks still missing (send them, then complete again)."""
+    data = request.get_json(silent=True) or {}
+    try: total_chunks = int(data['total_chunks'])
+    except (KeyError, TypeError, ValueError): return jsonify({"error": "Missing or invalid 'total_chunks'"}), 400
+    if not 0 <= total_chunks <= UPLOAD_MAX_CHUNKS: return jsonify({"error": f"'total_chunks' must be between 0 and {UPLOAD_MAX_CHUNKS}"}), 400
+    jobs = get_job_store()
+    upload = jobs.get_upload(upload_id)
+    if not upload: return jsonify({"error": f"Unknown upload '{upload_id}'"}), 404
+    sealed = jobs.seal_upload(upload_id, total_chunks)
+    if sealed is None: return jsonify({"error": "'total_chunks' conflicts with the chunks already received"}), 409
+    _missing, finished = sealed
+    if finished: finish_upload(upload_id, upload['options']) # Every chunk was already probed (or there were none)
+    return jsonify(upload_status_payload(upload_id, jobs.get_upload(upload_id)))
+
+# --- API Endpoints for Distributed Probe Agents ---
+# A sweep is a job whose (target, service) items are run by agent.py processes at the sites
+# instead of by this backend. Agents connect out, lease batches, and post results back in bulk.
+@app.route('/sweeps', methods=['POST'])
+def handle_create_sweep():
+    """Queues a CSV (hostname,services[,site]) for probe agents. Progress/results via /jobs/<job_id>."""
+    data = request.get_json(silent=True)
+    if not data or 'csv_data' not in data: return jsonify({"error": "Missing 'csv_data'"}), 400
+    try: targets = parse_csv_data(data['csv_data'])
+    except ValueError as e: return jsonify({"error": f"CSV Parsing Error: {e}"}), 400
+    items = [(target['host'], service, target.get('site')) for target in targets for service in target['services']]
+    job_id = get_job_store().create_sweep(items)
+    print(f"[{datetime.now()}] Queued sweep {job_id} with {len(items)} item(s) for agents")
+    return jsonify({"job_id": job_id, "items": len(items), "status_url": f"/jobs/{job_id}",
+                    "results_url": f"/jobs/{job_id}/results"}), 202
+
+@app.route('/agent/lease', methods=['POST'])
+def handle_agent_lease():
+    """Hands an agent up to 'capacity' pending items (its own 'site' first) for AGENT_VISIBILITY_TIMEOUT seconds."""
+    data = request.get_json(silent=True) or {}
+    agent_id = data.get('agent_id')
+    if not agent_id: return jsonify({"error": "Missing 'agent_id'"}), 400
+    try: capacity = max(1, min(AGENT_MAX_BATCH, int(data.get('capacity', 50))))
+    except (TypeError, ValueError): return jsonify({"error": "Invalid 'capacity'"}), 400
+    items = get_job_store().lease_work(agent_id, data.get('site') or None, capacity, AGENT_VISIBILITY_TIMEOUT)
+    return jsonify({"items": items, "visibility_timeout": AGENT_VISIBILITY_TIMEOUT})
+
+@app.route('/agent/results', methods=['POST'])
+def handle_agent_results():
+    """Accepts [{'job_id', 'seq', 'rows': [result dicts]}] from an agent."""
+    data = request.get_json(silent=True) or {}
+    try: results = [(item['job_id'], int(item['seq']), list(item['rows'])) for item in data.get('results', [])]
+    except (KeyError, TypeError, ValueError): return jsonify({"error": "Invalid 'results' format"}), 400
+    accepted = get_job_store().complete_work(results)
+    return jsonify({"accepted": accepted, "ignored": len(results) - accepted})
+
+@app.route('/health', methods=['GET'])
+def handle_health():
+    """Liveness check for load balancers and serve.py's load test."""
+    return jsonify({"status": "ok", "pid": os.getpid(), "probe_cache": probe_cache.stats(), "tls_cert_cache": tls_probe.cert_cache.stats(),
+                    "replay": replay.stats if replay else None, "recorded": recorder.count if recorder else None})
+
 # --- Run the Flask App ---
 # (No changes needed from previous version)
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Development server for the network test backend.")
+    parser.add_argument('--profile', action='store_const', const=PROFILE_STAGES, dest='profile_mode', help="Profile every job (see X-Profile).")
+    parser.add_argument('--profile-sample', action='store_const', const=PROFILE_SAMPLE, dest='profile_mode', help="Profile every job and sample its stacks.")
+    PROFILE_MODE = parser.parse_args().profile_mode or PROFILE_MODE
     missing_deps = []
     try: import requests
     except ImportError: missing_deps.append('requests')
@@ -348,5 +890,6 @@ if __name__ == '__main__':
     print(f"Results directory configured: '{os.path.abspath(RESULTS_OUTPUT_DIR)}'")
     try: os.makedirs(RESULTS_OUTPUT_DIR, exist_ok=True)
     except OSError as e: print(f"Warning: Could not create results directory '{RESULTS_OUTPUT_DIR}': {e}")
+    print("Note: this is the single-process development server. For production use: python serve.py --workers 4")
     app.run(host='127.0.0.1', port=5000, debug=True)
 
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Endpoint Planning (Probe Deduplication) ---
+# Purpose: Used by network_test.py after the targets are loaded. Many target names are vhosts
+#          of the same server, and for 'ping' and 'tcp:<port>' a probe of one name is a probe of
+#          its IP address. The plan resolves every name once (concurrently), groups the tests by
+#          (IP, service), and during the run the first name of each group is probed while the
+#          others get a copy of its result, marked 'same endpoint as <name> (<ip>)'.
+#          HTTP/HTTPS stay per name (SNI and Host header make them different requests), as do
+#          names that do not resolve (each reports its own DNS error).
+
+import socket
+import threading
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_RESOLVE_WORKERS = 32 # Names resolved at once while planning
+
+
+def endpoint_service(service, tcp=True):
+    """
+    'ping' or 'tcp:<port>' normalized, for services whose probe depends only on the IP; else None.
+    tcp=False leaves tcp:<port> per name (--all-addresses / --happy-eyeballs test every address of a name).
+    """
+    service = service.strip().lower()
+    if service == 'ping':
+        return service
+    kind, _, port = service.partition(':')
+    if tcp and kind == 'tcp' and port.isdigit() and 0 < int(port) < 65536:
+        return f"tcp:{int(port)}"
+    return None
+
+
+def resolve_names(names, workers=DEFAULT_RESOLVE_WORKERS, resolver=socket.gethostbyname):
+    """{name: IPv4 address or None} for an iterable of distinct names, resolved on a thread pool (workers > 1)."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def resolve(name):
+        try:
+            return name, resolver(name)
+        except (OSError, UnicodeError):
+            return name, None
+
+    names = list(names)
+    if not names:
+        return {}
+    if workers <= 1: # e.g. answered from memory (network_test.py --replay)
+        return dict(map(resolve, names))
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(names)))) as pool:
+        return dict(pool.map(resolve, names))
+
+
+class EndpointPlan:
+    """
+    Name-to-address map for the targets of a run, plus the results probed so far per
+    (address, service). Picklable, so --processes workers each get a copy (and share
+    results between the targets they run themselves).
+    """
+
+    def __init__(self, addresses, stats, tcp=True):
+        self.addresses = addresses # name (lower case) -> IPv4 address, or None if it did not resolve
+        self.stats = stats
+        self.tcp = tcp
+        self.shared = 0            # Results copied instead of probed, in this process
+        self._results = {}         # (address, service) -> (first name, result dict)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, targets, tcp=True, workers=DEFAULT_RESOLVE_WORKERS, resolver=socket.gethostbyname):
+        """Resolves the names of targets that have ping / tcp:<port> services and counts the unique endpoints."""
+        names, name_tests = {}, 0
+        for target in targets:
+            services = [s for s in (endpoint_service(s, tcp) for s in target['services']) if s]
+            if services:
+                names.setdefault(target['host'].strip().lower(), set()).update(services)
+                name_tests += len(services)
+        addresses = resolve_names(names, workers, resolver)
+        endpoints = set()
+        unresolved_tests = 0
+        for name, services in names.items():
+            address = addresses.get(name)
+            if address is None:
+                unresolved_tests += len(services)
+            else:
+                endpoints.update((address, service) for service in services)
+        stats = {'names': len(names), 'unresolved': sum(1 for a in addresses.values() if a is None),
+                 'addresses': len({a for a in addresses.values() if a is not None}),
+                 'tests': name_tests, 'endpoint_tests': len(endpoints) + unresolved_tests}
+        return cls(addresses, stats, tcp)
+
+    def key(self, host, service):
+        """(address, service) that a test shares with other names, or None if it must be probed on its own."""
+        service = endpoint_service(service, self.tcp)
+        if service is None:
+            return None
+        address = self.addresses.get(host.strip().lower())
+        return (address, service) if address else None
+
+    def lookup(self, key):
+        """(first name, result) if this endpoint was already probed, else None."""
+        with self._lock:
+            return self._results.get(key)
+
+    def store(self, key, host, result):
+        with self._lock:
+            self._results.setdefault(key, (host, result))
+
+    def shared_result(self, key, host, first_host, result):
+        """Copy of another name's result for host, with the shared endpoint noted in Details."""
+        copy = dict(result, TargetHost=host)
+        note = f"same endpoint as {first_host} ({key[0]})"
+        copy['Details'] = f"{result['Details']}; {note}" if result.get('Details') else note
+        with self._lock:
+            self.shared += 1
+        return copy
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def summary(self):
+        s = self.stats
+        text = (f"{s['names']:,} name(s) with ping/tcp tests resolve to {s['addresses']:,} address(es): "
+                f"{s['tests']:,} test(s) need {s['endpoint_tests']:,} probe(s)")
+        if s['unresolved']:
+            text += f" ({s['unresolved']:,} name(s) did not resolve and are probed on their own)"
+        return text
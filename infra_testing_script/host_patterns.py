@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Host and Service Pattern Expansion ---
+# Purpose: Shared by network_test.py (load_targets_from_csv, --host) and app.py (parse_csv_data,
+#          /test, /uploads, /sweeps). One target row can stand for many targets:
+#            web[01-64].corp.local     numeric range; a leading zero pads to the start's width
+#            10.1.[0-3].[1-254]        several ranges multiply out (4 x 254 addresses)
+#            db[1-3,7,10-12]           comma-separated numbers and ranges
+#            {web,app}-[1-4].example   brace alternatives
+#            tcp:{22,443,8443}         the same forms in the services column
+#          TargetList keeps only the parsed rows and expands them while it is iterated, so
+#          memory and request payloads stay proportional to the patterns, not to the number of
+#          targets they produce. len() and count_services() are computed without expanding.
+#          Brackets that are not a number list (e.g. an IPv6 literal '[::1]') and braces without
+#          a comma are kept as literal text.
+
+import re
+
+# --- Configuration (Defaults & Constants) ---
+MAX_PATTERN_EXPANSION = 1000000 # Targets (or services) one pattern may produce
+
+_RANGE_LIST = re.compile(r'^\d+(-\d+)?(,\d+(-\d+)?)*$')
+
+
+class PatternError(ValueError):
+    """Malformed range (e.g. [9-1]) or a pattern that expands past MAX_PATTERN_EXPANSION."""
+
+
+def has_pattern(text):
+    return '[' in text or '{' in text
+
+
+def _number_range(spec, pattern):
+    """Re-iterable values for the inside of [...]: a tuple of ranges rendered with zero padding."""
+    parts = []
+    for item in spec.split(','):
+        start, _, end = item.partition('-')
+        end = end or start
+        if int(end) < int(start):
+            raise PatternError(f"Range '[{item}]' runs backwards in '{pattern}'")
+        width = len(start) if len(start) > 1 and start.startswith('0') else 0
+        parts.append((int(start), int(end), width))
+    return _Numbers(parts)
+
+
+class _Numbers:
+    __slots__ = ('parts', 'size')
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.size = sum(end - start + 1 for start, end, _width in parts)
+
+    def __iter__(self):
+        for start, end, width in self.parts:
+            for n in range(start, end + 1):
+                yield str(n).zfill(width)
+
+    def __len__(self):
+        return self.size
+
+
+def parse_pattern(pattern):
+    """
+    Splits a pattern into segments: each a tuple of alternatives or a _Numbers range, both
+    re-iterable. Plain text becomes one-element tuples.
+    """
+    segments, literal, i = [], [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        close = pattern.find(']' if c == '[' else '}', i + 1) if c in '[{' else -1
+        if close != -1:
+            inner = pattern[i + 1:close]
+            if c == '[' and _RANGE_LIST.match(inner):
+                if literal:
+                    segments.append((''.join(literal),))
+                    literal = []
+                segments.append(_number_range(inner, pattern))
+                i = close + 1
+                continue
+            if c == '{' and ',' in inner:
+                if literal:
+                    segments.append((''.join(literal),))
+                    literal = []
+                segments.append(tuple(inner.split(',')))
+                i = close + 1
+                continue
+        literal.append(c)
+        i += 1
+    if literal or not segments:
+        segments.append((''.join(literal),))
+    return segments
+
+
+def pattern_size(segments):
+    size = 1
+    for segment in segments:
+        size *= len(segment)
+    return size
+
+
+def _expand_segments(segments, prefix=''):
+    if not segments:
+        yield prefix
+        return
+    head, rest = segments[0], segments[1:]
+    for value in head:
+        yield from _expand_segments(rest, prefix + value)
+
+
+def expand(pattern):
+    """Generator over every string a pattern stands for, in order ('web[1-2]' -> 'web1', 'web2')."""
+    if not has_pattern(pattern):
+        yield pattern
+        return
+    segments = parse_pattern(pattern)
+    if pattern_size(segments) > MAX_PATTERN_EXPANSION:
+        raise PatternError(f"'{pattern}' expands to more than {MAX_PATTERN_EXPANSION} values")
+    yield from _expand_segments(segments)
+
+
+def split_list(text):
+    """Splits a comma-separated list, ignoring commas inside [...] and {...}: 'ping,tcp:{22,443}' -> 2 items."""
+    items, depth, current = [], 0, []
+    for c in text:
+        if c in '[{':
+            depth += 1
+        elif c in ']}' and depth:
+            depth -= 1
+        if c == ',' and not depth:
+            items.append(''.join(current))
+            current = []
+        else:
+            current.append(c)
+    items.append(''.join(current))
+    return [item.strip() for item in items if item.strip()]
+
+
+def expand_services(services, lower=True):
+    """Service list (a 'ping,tcp:{22,443}' string or a list of entries) expanded and, unless lower is False, lower-cased."""
+    if isinstance(services, str):
+        services = split_list(services)
+    expanded = []
+    for service in services:
+        service = service.strip().lower() if lower else service.strip()
+        if service:
+            expanded.extend(expand(service))
+    return expanded
+
+
+class TargetList:
+    """
+    Target dicts ({'host', 'services', ...}) from pattern rows, expanded each time the list is
+    iterated. Every target of a row shares that row's services list; treat it as read-only.
+    """
+
+    def __init__(self):
+        self._rows = [] # (host segments or None for a plain host, host, services, extra, target count)
+        self._options = {}
+
+    def add(self, host, services, lower_services=True, **extra):
+        """Adds a row; host may be a pattern, services a string or list of (pattern) entries. Returns its target count."""
+        services = expand_services(services, lower_services)
+        if not services:
+            return 0
+        if has_pattern(host):
+            segments = parse_pattern(host)
+            count = pattern_size(segments)
+            if count > MAX_PATTERN_EXPANSION:
+                raise PatternError(f"'{host}' expands to more than {MAX_PATTERN_EXPANSION} hosts")
+        else:
+            segments, count = None, 1
+        self._rows.append((segments, host, services, extra, count))
+        return count
+
+    def set_option(self, key, value):
+        """Adds key: value to every target produced (e.g. 'address_mode')."""
+        self._options[key] = value
+
+    def __iter__(self):
+        options = self._options
+        for segments, host, services, extra, _count in self._rows:
+            for name in (_expand_segments(segments) if segments is not None else (host,)):
+                target = {'host': name, 'services': services}
+                if extra:
+                    target.update(extra)
+                if options:
+                    target.update(options)
+                yield target
+
+    def __len__(self):
+        return sum(row[4] for row in self._rows)
+
+    def count_services(self):
+        """Number of tests the list stands for (targets x services per row)."""
+        return sum(len(services) * count for _segments, _host, services, _extra, count in self._rows)
+
+    def pattern_rows(self):
+        return len(self._rows)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description="Expands a host pattern and compares memory with a materialized list.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('pattern', nargs='?', default='10.[0-3].[0-255].[1-254]', help="Host pattern to expand.")
+    parser.add_argument('--services', default='ping,tcp:{22,443,8443}', help="Services column (may use patterns).")
+    parser.add_argument('--show', type=int, default=5, help="Print the first N targets.")
+    bench_args = parser.parse_args()
+
+    try:
+        tracemalloc.start()
+        targets = TargetList()
+        targets.add(bench_args.pattern, bench_args.services)
+        lazy_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    except PatternError as e:
+        sys.exit(f"Error: {e}")
+    print(f"{bench_args.pattern}: {len(targets):,} targets, {targets.count_services():,} tests; TargetList holds {lazy_bytes / 1024:.1f} KB")
+    for i, target in enumerate(targets):
+        if i >= bench_args.show:
+            break
+        print(f"  {target['host']}  {','.join(target['services'])}")
+    start = time.perf_counter()
+    count = sum(1 for _target in targets)
+    elapsed = time.perf_counter() - start
+    print(f"Iterated {count:,} targets in {elapsed:.2f}s ({count / elapsed if elapsed else 0:,.0f}/s)")
+    tracemalloc.start()
+    materialized = list(targets)
+    print(f"The same {len(materialized):,} targets as a list of dicts: {tracemalloc.get_traced_memory()[1] / 1e6:.1f} MB")
+    tracemalloc.stop()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Bounded-Body HTTP/HTTPS Probe ---
+# Purpose: Shared by network_test.py and app.py. Requests are streamed and the body is
+#          read only up to a byte budget (0 = stop after the headers), instead of
+#          downloading whole landing pages or files just to read the status code.
+#          Redirects are followed by hand so the chain length can be capped and each hop
+#          timed, and an optional content-match string is searched within the budget.
+
+import time
+from urllib.parse import urljoin
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_MAX_BODY_BYTES = 0      # Body bytes read from the final response (0 = headers only)
+DEFAULT_MATCH_BODY_BYTES = 65536 # Budget used when a match string is given but no budget
+DEFAULT_MAX_REDIRECTS = 5
+CHUNK_SIZE = 8192
+
+
+class HttpProbeResult:
+    """Outcome of probe_url(): final status, redirect hops and body match state."""
+    __slots__ = ('status_code', 'url', 'hops', 'bytes_read', 'matched')
+
+    def __init__(self):
+        self.status_code = None
+        self.url = None
+        self.hops = []        # (status code, url, milliseconds) per request, in order
+        self.bytes_read = 0
+        self.matched = None   # None when no match string was given
+
+    @property
+    def redirects(self):
+        return len(self.hops) - 1
+
+    def timing_summary(self):
+        """Per-hop timing, e.g. '301 12 ms -> 200 48 ms'."""
+        return ' -> '.join(f"{status} {elapsed_ms:.0f} ms" for status, _url, elapsed_ms in self.hops)
+
+
+def _read_body(response, budget, match):
+    """Reads at most budget body bytes. Returns (bytes read, matched or None)."""
+    needle = match.encode('utf-8') if match else None
+    buffer = bytearray()
+    read = 0
+    for chunk in response.iter_content(chunk_size=min(CHUNK_SIZE, budget)):
+        chunk = chunk[:budget - read]
+        read += len(chunk)
+        if needle is not None:
+            buffer += chunk
+            if needle in buffer:
+                return read, True
+            del buffer[:max(0, len(buffer) - len(needle) + 1)] # Keep a tail for matches across chunks
+        if read >= budget:
+            break
+    return read, (False if needle is not None else None)
+
+
+def probe_url(url, timeout, max_body_bytes=DEFAULT_MAX_BODY_BYTES, match=None,
+              max_redirects=DEFAULT_MAX_REDIRECTS, headers=None, verify=False):
+    """
+    Fetches url, following at most max_redirects redirects, and returns an HttpProbeResult.
+    Raises requests exceptions like requests.get() (TooManyRedirects when the cap is hit).
+    """
+    import requests # Deferred: importing requests costs more than the rest of a --help run
+    result = HttpProbeResult()
+    budget = max_body_bytes if max_body_bytes > 0 else (DEFAULT_MATCH_BODY_BYTES if match else 0)
+    with requests.Session() as session:
+        for _hop in range(max_redirects + 1):
+            start = time.perf_counter()
+            response = session.get(url, timeout=timeout, verify=verify, headers=headers,
+                                   allow_redirects=False, stream=True)
+            try:
+                if response.is_redirect:
+                    result.hops.append((response.status_code, url, (time.perf_counter() - start) * 1000))
+                    url = urljoin(response.url, response.headers['location'])
+                    continue
+                result.status_code, result.url = response.status_code, response.url
+                if budget:
+                    result.bytes_read, result.matched = _read_body(response, budget, match)
+                result.hops.append((response.status_code, url, (time.perf_counter() - start) * 1000))
+                return result
+            finally:
+                response.close() # Drops the rest of the body without downloading it
+    raise requests.exceptions.TooManyRedirects(f"Exceeded {max_redirects} redirects")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Job Deadlines ---
+# Purpose: Shared by network_test.py (--deadline) and app.py ("deadline_s" in /test requests).
+#          A job without a deadline runs as long as its probes' timeouts add up to. With one:
+#            - every probe's timeout is cut to the time the job has left
+#            - probes run in rounds: the first service of every host, then the second of every
+#              host, and so on, so each host gets at least one check before any gets a second
+#            - a probe that cannot start with at least MIN_PROBE_SECONDS left is not started;
+#              its result row is SKIPPED with Details 'deadline'
+#            - ping, which takes whole seconds, is not started with less than a second left, and
+#              its process is killed once the deadline passes
+#          The deadline is wall-clock time (time.time()), so it can be handed to worker processes;
+#          a replayed run (net_replay.py) passes its virtual clock instead.
+
+import time
+
+# --- Configuration (Defaults & Constants) ---
+MIN_PROBE_SECONDS = 0.5    # Probes are not started with less time than this left
+DEADLINE_DETAILS = 'deadline'
+
+
+class Deadline:
+    """Point in time a job must finish by, on clock (time.time or another picklable callable). Picklable."""
+
+    def __init__(self, seconds, now=None, clock=time.time):
+        if seconds <= 0:
+            raise ValueError("A deadline must be positive")
+        self.seconds = seconds
+        self.clock = clock
+        self.at = (clock() if now is None else now) + seconds
+
+    def remaining(self):
+        return self.at - self.clock()
+
+    def expired(self):
+        return self.remaining() < MIN_PROBE_SECONDS
+
+    def timeout(self, default):
+        """default cut to the time left, or None when there is too little left to start a probe."""
+        remaining = self.remaining()
+        if remaining < MIN_PROBE_SECONDS:
+            return None
+        return min(default, remaining)
+
+    def whole_seconds(self, default):
+        """
+        timeout() rounded down to whole seconds (for tools like ping that take integer timeouts),
+        or None when less than a second is left.
+        """
+        timeout = self.timeout(default)
+        if timeout is None or timeout < 1:
+            return None
+        return int(timeout)
+
+
+def timeout_for(deadline, default):
+    """default, or the deadline's cut of it (None: do not start the probe)."""
+    return default if deadline is None else deadline.timeout(default)
+
+
+def skipped_result(host, service, timestamp):
+    """Result row of a probe the deadline left no time for."""
+    return {'Timestamp': timestamp, 'TargetHost': host, 'Service': service, 'Status': 'SKIPPED',
+            'Details': DEADLINE_DETAILS, 'SuccessBool': True}
+
+
+def priority_order(targets):
+    """
+    (target index, target, service index) in rounds: service 0 of every target, then service 1 of
+    every target that has one, and so on. targets (a list or host_patterns.TargetList of
+    {'host', 'services'} dicts) is iterated once per round instead of being held as a list.
+    """
+    service_index, more = 0, True
+    while more:
+        more = False
+        for target_index, target in enumerate(targets):
+            count = len(target.get('services') or ())
+            if service_index < count:
+                yield target_index, target, service_index
+                more = more or service_index + 1 < count
+        service_index += 1
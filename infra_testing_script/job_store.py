@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Shared Job State for the Flask Backend ---
+# Purpose: Keeps test job status and result rows in a SQLite file so that every worker
+#          process started by serve.py (or any other multi-process server) can answer
+#          status and result requests for jobs that another worker is running. Also holds
+#          the work queue that probe agents (agent.py) lease sweep items from, and the
+#          chunks of CSV files uploaded in pieces (POST /uploads), probed as they arrive.
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+# --- Configuration ---
+DEFAULT_DB_FILENAME = "jobs.sqlite" # Created inside the backend's results directory
+BUSY_TIMEOUT_SECONDS = 10           # How long a writer waits for another process's lock
+MAX_LEASE_ATTEMPTS = 5              # Work items leased this often without a result are failed
+
+JOB_QUEUED = "QUEUED"
+JOB_RUNNING = "RUNNING"
+JOB_DONE = "DONE"
+JOB_FAILED = "FAILED"
+
+
+class JobStore:
+    """
+    Job table plus one row per result. A short-lived connection is opened per call, which
+    keeps the store safe to use from request threads and background job threads alike.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, status TEXT NOT NULL, total INTEGER NOT NULL DEFAULT 0,"
+                " completed INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, finished REAL,"
+                " worker_pid INTEGER, file_save_status TEXT, error TEXT)"
+                )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_results ("
+                " job_id TEXT NOT NULL, seq INTEGER NOT NULL, row TEXT NOT NULL,"
+                " PRIMARY KEY (job_id, seq))"
+                )
+            # Sweeps handed out to probe agents: one row per (target, service) work item
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS work_items ("
+                " job_id TEXT NOT NULL, seq INTEGER NOT NULL, host TEXT NOT NULL, service TEXT NOT NULL,"
+                " site TEXT, lease_owner TEXT, lease_expires REAL NOT NULL DEFAULT 0,"
+                " attempts INTEGER NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0, rows TEXT,"
+                " PRIMARY KEY (job_id, seq))"
+                )
+            conn.execute("CREATE INDEX IF NOT EXISTS work_items_pending ON work_items (done, lease_expires)")
+            # Chunked uploads: upload_id is also the job id; total_chunks is known once the client completes it
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                " upload_id TEXT PRIMARY KEY, header TEXT NOT NULL, options TEXT NOT NULL,"
+                " total_chunks INTEGER, finished INTEGER NOT NULL DEFAULT 0)"
+                )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS upload_chunks ("
+                " upload_id TEXT NOT NULL, chunk_index INTEGER NOT NULL, services INTEGER NOT NULL,"
+                " worker_pid INTEGER, done INTEGER NOT NULL DEFAULT 0, rows TEXT,"
+                " PRIMARY KEY (upload_id, chunk_index))"
+                )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SECONDS)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def create_job(self, total=0):
+        """Registers a new job and returns its id."""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, total, created, worker_pid) VALUES (?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, total, time.time(), os.getpid())
+                )
+        return job_id
+
+    def set_running(self, job_id, total=None):
+        with self._connect() as conn:
+            if total is None:
+                conn.execute("UPDATE jobs SET status = ? WHERE job_id = ?", (JOB_RUNNING, job_id))
+            else:
+                conn.execute("UPDATE jobs SET status = ?, total = ? WHERE job_id = ?", (JOB_RUNNING, total, job_id))
+
+    def set_progress(self, job_id, completed):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET completed = ? WHERE job_id = ?", (completed, job_id))
+
+    def finish_job(self, job_id, results, file_save_status=None):
+        """Stores the result rows (list of dicts) and marks the job done."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO job_results (job_id, seq, row) VALUES (?, ?, ?)",
+                ((job_id, seq, json.dumps(row)) for seq, row in enumerate(results))
+                )
+            conn.execute(
+                "UPDATE jobs SET status = ?, completed = ?, finished = ?, file_save_status = ? WHERE job_id = ?",
+                (JOB_DONE, len(results), time.time(), file_save_status, job_id)
+                )
+
+    def fail_job(self, job_id, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE job_id = ?",
+                (JOB_FAILED, time.time(), str(error), job_id)
+                )
+
+    def get_job(self, job_id):
+        """Returns the job's status fields as a dict, or None if unknown."""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_results(self, job_id):
+        """Returns the job's result rows in the order they were produced."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT row FROM job_results WHERE job_id = ? ORDER BY seq", (job_id,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    @staticmethod
+    def _results_filter(job_id, statuses, host_prefix):
+        where, params = ["job_id = ?"], [job_id]
+        if statuses:
+            where.append(f"json_extract(row, '$.Status') IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if host_prefix:
+            escaped = host_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            where.append("json_extract(row, '$.TargetHost') LIKE ? ESCAPE '\\'")
+            params.append(escaped + '%')
+        return ' AND '.join(where), params
+
+    def get_results_page(self, job_id, after_seq=-1, limit=None, statuses=None, host_prefix=None):
+        """
+        One page of a job's result rows after the row numbered after_seq, optionally only rows
+        whose Status is in statuses and whose TargetHost starts with host_prefix (case-insensitive).
+        Returns (rows, next_cursor); next_cursor is the seq to pass as after_seq for the next
+        page, or None when there are no more matching rows.
+        """
+        where, params = self._results_filter(job_id, statuses, host_prefix)
+        sql = f"SELECT seq, row FROM job_results WHERE {where} AND seq > ? ORDER BY seq"
+        params.append(after_seq)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1) # One extra row tells whether another page follows
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+        return [json.loads(row) for _seq, row in rows], next_cursor
+
+    def count_results(self, job_id, statuses=None, host_prefix=None):
+        """Number of result rows matching the same filters as get_results_page()."""
+        where, params = self._results_filter(job_id, statuses, host_prefix)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM job_results WHERE {where}", params).fetchone()[0]
+
+    # --- Agent work queue ---
+
+    def create_sweep(self, items):
+        """
+        Registers a job whose (host, service, site) items are run by probe agents instead of
+        this process. site may be None (any agent). Returns the job id.
+        """
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            # No worker_pid: the sweep does not die with the process that created it
+            conn.execute("INSERT INTO jobs (job_id, status, total, created) VALUES (?, ?, ?, ?)",
+                         (job_id, JOB_QUEUED, len(items), time.time()))
+            conn.executemany(
+                "INSERT INTO work_items (job_id, seq, host, service, site) VALUES (?, ?, ?, ?, ?)",
+                ((job_id, seq, host, service, site) for seq, (host, service, site) in enumerate(items))
+                )
+        if not items:
+            self.finish_job(job_id, [])
+        return job_id
+
+    def lease_work(self, agent_id, site, capacity, visibility_timeout, now=None):
+        """
+        Leases up to capacity pending items to an agent for visibility_timeout seconds.
+        Items tagged with a site only go to agents of that site; untagged items go to anyone,
+        after the agent's own site items. Items whose lease expired are handed out again.
+        Returns a list of dicts with job_id, seq, host and service.
+        """
+        now = time.time() if now is None else now
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE") # One leaser at a time across all worker processes
+            self._fail_abandoned(conn, now)
+            rows = conn.execute(
+                "SELECT job_id, seq, host, service FROM work_items"
+                " WHERE done = 0 AND lease_expires <= ? AND (site IS NULL OR site = ?)"
+                " ORDER BY site IS NULL, rowid LIMIT ?",
+                (now, site, capacity)
+                ).fetchall()
+            conn.executemany(
+                "UPDATE work_items SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1"
+                " WHERE job_id = ? AND seq = ?",
+                ((agent_id, now + visibility_timeout, job_id, seq) for job_id, seq, _host, _service in rows)
+                )
+            for job_id in {row[0] for row in rows}:
+                conn.execute("UPDATE jobs SET status = ? WHERE job_id = ? AND status = ?", (JOB_RUNNING, job_id, JOB_QUEUED))
+            conn.commit()
+        finally:
+            conn.close()
+        return [{"job_id": job_id, "seq": seq, "host": host, "service": service} for job_id, seq, host, service in rows]
+
+    def _fail_abandoned(self, conn, now):
+        """Completes items that exhausted MAX_LEASE_ATTEMPTS with a FAILED row (caller holds the write lock)."""
+        abandoned = conn.execute(
+            "SELECT job_id, seq, host, service FROM work_items WHERE done = 0 AND lease_expires <= ? AND attempts >= ?",
+            (now, MAX_LEASE_ATTEMPTS)
+            ).fetchall()
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+        self._complete_items(conn, [
+            (job_id, seq, [{'Timestamp': timestamp, 'TargetHost': host, 'Service': service, 'Status': 'FAILED',
+                            'Details': f'No agent returned a result after {MAX_LEASE_ATTEMPTS} leases'}])
+            for job_id, seq, host, service in abandoned
+            ])
+
+    def complete_work(self, results):
+        """
+        Stores agent results: an iterable of (job_id, seq, rows) where rows is a list of result
+        dicts. Results for items already completed (e.g. by an agent whose lease had expired
+        first) are ignored. Returns the number of items accepted.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            accepted = self._complete_items(conn, results)
+            conn.commit()
+        finally:
+            conn.close()
+        return accepted
+
+    def _complete_items(self, conn, results):
+        accepted, touched_jobs = 0, set()
+        for job_id, seq, rows in results:
+            updated = conn.execute(
+                "UPDATE work_items SET done = 1, rows = ?, lease_owner = NULL WHERE job_id = ? AND seq = ? AND done = 0",
+                (json.dumps(rows), job_id, seq)
+                ).rowcount
+            if updated:
+                accepted += 1
+                touched_jobs.add(job_id)
+        for job_id in touched_jobs:
+            done, total = conn.execute(
+                "SELECT SUM(done), COUNT(*) FROM work_items WHERE job_id = ?", (job_id,)
+                ).fetchone()
+            conn.execute("UPDATE jobs SET completed = ? WHERE job_id = ?", (done, job_id))
+            if done == total: # Materialize the results in input order, like a local job
+                result_rows = [row for (rows,) in conn.execute(
+                    "SELECT rows FROM work_items WHERE job_id = ? ORDER BY seq", (job_id,)) for row in json.loads(rows)]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO job_results (job_id, seq, row) VALUES (?, ?, ?)",
+                    ((job_id, seq, json.dumps(row)) for seq, row in enumerate(result_rows))
+                    )
+                conn.execute("UPDATE jobs SET status = ?, finished = ? WHERE job_id = ?", (JOB_DONE, time.time(), job_id))
+        return accepted
+
+    # --- Chunked uploads ---
+
+    def create_upload(self, header, options):
+        """
+        Registers a job fed by CSV chunks that share the given header line. options (a dict,
+        e.g. output_filename) are kept for whichever worker finishes the upload. Returns the id.
+        """
+        upload_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            # No worker_pid: chunks may arrive at any worker process
+            conn.execute("INSERT INTO jobs (job_id, status, total, created) VALUES (?, ?, 0, ?)",
+                         (upload_id, JOB_QUEUED, time.time()))
+            conn.execute("INSERT INTO uploads (upload_id, header, options) VALUES (?, ?, ?)",
+                         (upload_id, header, json.dumps(options)))
+        return upload_id
+
+    def get_upload(self, upload_id):
+        """Returns header, options, total_chunks, finished and the received/probed chunk indices, or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT header, options, total_chunks, finished FROM uploads WHERE upload_id = ?",
+                               (upload_id,)).fetchone()
+            if not row:
+                return None
+            chunks = conn.execute("SELECT chunk_index, done FROM upload_chunks WHERE upload_id = ? ORDER BY chunk_index",
+                                  (upload_id,)).fetchall()
+        return {'header': row[0], 'options': json.loads(row[1]), 'total_chunks': row[2], 'finished': bool(row[3]),
+                'received': [index for index, _done in chunks], 'probed': [index for index, done in chunks if done]}
+
+    def add_chunk(self, upload_id, chunk_index, services):
+        """Records a received chunk with its number of service tests. Returns False if it was already received."""
+        with self._connect() as conn:
+            added = conn.execute(
+                "INSERT OR IGNORE INTO upload_chunks (upload_id, chunk_index, services, worker_pid) VALUES (?, ?, ?, ?)",
+                (upload_id, chunk_index, services, os.getpid())
+                ).rowcount
+            if added:
+                conn.execute("UPDATE jobs SET status = ?, total = total + ? WHERE job_id = ?", (JOB_RUNNING, services, upload_id))
+        return bool(added)
+
+    def complete_chunk(self, upload_id, chunk_index, rows):
+        """
+        Stores a probed chunk's result rows. Returns True if this completed the whole upload;
+        the caller then finishes the job (see upload_results()). Only one caller gets True.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE upload_chunks SET done = 1, rows = ? WHERE upload_id = ? AND chunk_index = ?",
+                         (json.dumps(rows), upload_id, chunk_index))
+            conn.execute("UPDATE jobs SET completed = completed + (SELECT services FROM upload_chunks"
+                         " WHERE upload_id = ? AND chunk_index = ?) WHERE job_id = ?", (upload_id, chunk_index, upload_id))
+            finished = self._claim_finished_upload(conn, upload_id)
+            conn.commit()
+        finally:
+            conn.close()
+        return finished
+
+    def seal_upload(self, upload_id, total_chunks):
+        """
+        Sets the number of chunks the upload consists of. Returns (missing chunk indices,
+        finished) where finished is True if every chunk had already been probed (as above),
+        or None if total_chunks conflicts with an earlier call or with a received chunk.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            known, highest = conn.execute(
+                "SELECT total_chunks, (SELECT MAX(chunk_index) FROM upload_chunks WHERE upload_id = ?) FROM uploads"
+                " WHERE upload_id = ?", (upload_id, upload_id)).fetchone()
+            if (known is not None and known != total_chunks) or (highest is not None and highest >= total_chunks):
+                return None
+            conn.execute("UPDATE uploads SET total_chunks = ? WHERE upload_id = ?", (total_chunks, upload_id))
+            received = {index for (index,) in conn.execute("SELECT chunk_index FROM upload_chunks WHERE upload_id = ?", (upload_id,))}
+            finished = self._claim_finished_upload(conn, upload_id)
+            conn.commit()
+        finally:
+            conn.close()
+        return [index for index in range(total_chunks) if index not in received], finished
+
+    def _claim_finished_upload(self, conn, upload_id):
+        """Marks the upload finished if it is sealed and every chunk is probed (caller holds the write lock)."""
+        total_chunks, finished = conn.execute("SELECT total_chunks, finished FROM uploads WHERE upload_id = ?",
+                                              (upload_id,)).fetchone()
+        if total_chunks is None or finished:
+            return False
+        probed = conn.execute("SELECT COUNT(*) FROM upload_chunks WHERE upload_id = ? AND done = 1", (upload_id,)).fetchone()[0]
+        if probed != total_chunks:
+            return False
+        conn.execute("UPDATE uploads SET finished = 1 WHERE upload_id = ?", (upload_id,))
+        return True
+
+    def upload_results(self, upload_id):
+        """Result rows of all probed chunks, in file order."""
+        with self._connect() as conn:
+            chunks = conn.execute("SELECT rows FROM upload_chunks WHERE upload_id = ? AND done = 1 ORDER BY chunk_index",
+                                  (upload_id,)).fetchall()
+        return [row for (rows,) in chunks for row in json.loads(rows)]
+
+    def mark_interrupted(self, worker_pid):
+        """
+        Fails jobs a worker left unfinished (e.g. after it was killed instead of drained), and
+        forgets upload chunks it had not probed yet so that the client sends them again.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE worker_pid = ? AND status IN (?, ?)",
+                (JOB_FAILED, time.time(), "Worker stopped before the job finished", worker_pid, JOB_QUEUED, JOB_RUNNING)
+                )
+            lost = conn.execute("SELECT upload_id, chunk_index, services FROM upload_chunks WHERE worker_pid = ? AND done = 0",
+                                (worker_pid,)).fetchall()
+            for upload_id, chunk_index, services in lost:
+                conn.execute("DELETE FROM upload_chunks WHERE upload_id = ? AND chunk_index = ?", (upload_id, chunk_index))
+                conn.execute("UPDATE jobs SET total = total - ? WHERE job_id = ?", (services, upload_id))
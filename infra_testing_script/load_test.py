@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Load Test for the Backend Server ---
+# Purpose: Starts serve.py with different worker counts and measures requests/second and
+#          latency percentiles for concurrent POST /test requests mixed with GET /health.
+#          The /test payload is a large CSV of rows with an unknown service type, so the
+#          backend does real parsing/serialization work without touching the network.
+
+import argparse
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_WORKER_COUNTS = "1,2,4"
+DEFAULT_PORT = 5099
+DEFAULT_REQUESTS = 400
+DEFAULT_CONCURRENCY = 16
+DEFAULT_ROWS = 500      # CSV rows per /test request
+HEALTH_EVERY = 4        # Every Nth request is a GET /health
+STARTUP_TIMEOUT = 15    # Seconds to wait for serve.py to accept connections
+GRACEFUL_TIMEOUT = 10   # serve.py --graceful-timeout: its workers are SIGKILLed after this
+STOP_TIMEOUT = GRACEFUL_TIMEOUT + 10 # Seconds to wait for serve.py to exit before killing its process group
+
+SERVE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')
+
+
+def build_payload(rows):
+    lines = ["hostname,services"] + [f"host{i}.loadtest.invalid,loadtest" for i in range(rows)]
+    return json.dumps({"csv_data": "\n".join(lines) + "\n"}).encode('utf-8')
+
+
+def wait_for_server(port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))]
+
+
+def run_load(port, total_requests, concurrency, payload):
+    """Fires total_requests from `concurrency` threads (a new connection per request)."""
+    latencies, errors, lock = [], [0], threading.Lock()
+
+    def one_request(i):
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            if i % HEALTH_EVERY == 0:
+                conn.request('GET', '/health')
+            else:
+                conn.request('POST', '/test', body=payload, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            ok = response.status == 200
+        except OSError:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(total_requests)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {"rps": len(latencies) / wall if wall else 0.0, "errors": errors[0],
+            "p50": percentile(latencies, 50) * 1000, "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000}
+
+
+def benchmark(worker_count, args, payload):
+    """Starts serve.py in a scratch directory, runs the load, then stops it gracefully."""
+    with tempfile.TemporaryDirectory(prefix='load_test_') as work_dir:
+        # In a session of its own, so a master that does not stop can be killed along with its workers,
+        # which would otherwise keep the port for the next worker count
+        server = subprocess.Popen([sys.executable, SERVE_SCRIPT, '--workers', str(worker_count), '--port', str(args.port),
+                                   '--graceful-timeout', str(GRACEFUL_TIMEOUT)],
+                                  cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        try:
+            if not wait_for_server(args.port, STARTUP_TIMEOUT):
+                raise RuntimeError(f"serve.py did not start on port {args.port}")
+            run_load(args.port, args.concurrency * 2, args.concurrency, payload) # Warm-up
+            return run_load(args.port, args.requests, args.concurrency, payload)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                os.killpg(server.pid, signal.SIGKILL)
+                server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load-test serve.py with several worker counts.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--workers', default=DEFAULT_WORKER_COUNTS, help='Comma-separated worker counts to compare.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port for the test server.')
+    parser.add_argument('-n', '--requests', type=int, default=DEFAULT_REQUESTS, help='Requests per worker count.')
+    parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Concurrent clients.')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='CSV rows per POST /test request.')
+    args = parser.parse_args()
+
+    payload = build_payload(args.rows)
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.rows} rows per /test "
+          f"(1 in {HEALTH_EVERY} is GET /health), {os.cpu_count()} CPU(s)")
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for worker_count in [int(w) for w in args.workers.split(',') if w.strip()]:
+        try:
+            stats = benchmark(worker_count, args, payload)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"{worker_count:>7} {stats['rps']:>9.1f} {stats['p50']:>9.1f} {stats['p95']:>9.1f} "
+              f"{stats['p99']:>9.1f} {stats['errors']:>7}")
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Network Record & Replay ---
+# Purpose: Runs that do not depend on the live network, for benchmarking scheduling, output and
+#          aggregation changes in network_test.py (--record / --replay), app.py (serve.py
+#          --record / --replay) and _nslookup_tool.py (--record / --replay).
+#          A trace file is JSON Lines (gzip-compressed if the name ends in .gz): a header line,
+#          then one line per network operation with its layer, key, latency and outcome:
+#            probe    one (host, service) test of network_test.py / app.py: its result row(s)
+#            resolve  a name lookup (gethostbyname) made while planning: the IPv4 address, or none
+#            dns      a query of _nslookup_tool.py: the raw DNS reply, or the error
+#          Replaying serves these outcomes in place of sockets, ping and DNS. Latencies are not
+#          waited out: they advance a virtual clock (which --deadline counts against), so a run
+#          over 100,000 targets takes seconds. With speed > 0 each latency x speed is also slept.
+#          An operation recorded several times is replayed in turn, then from the start again.
+#          Tests that run as a batch (udp/dns/ntp/snmp, trace, --pipeline) are recorded one by
+#          one, each with its share of the batch's time.
+#          'python net_replay.py scenario' writes a synthetic trace with realistic failure patterns
+#          plus the matching target CSV and lookup list; 'python net_replay.py summary' describes a trace.
+
+import base64
+import gzip
+import json
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+# --- Configuration (Defaults & Constants) ---
+FORMAT_VERSION = 1
+LAYER_PROBE = 'probe'
+LAYER_RESOLVE = 'resolve'
+LAYER_DNS = 'dns'
+NOT_RECORDED = 'Not in replay trace'
+RESULT_FIELDS = ('Status', 'Details', 'Timing', 'SuccessBool') # Kept per recorded result row
+
+# Synthetic scenarios (generate_scenario)
+SCENARIO_SERVICES = ('ping', 'tcp:22', 'https')
+SUBNET_SIZE = 254            # Hosts per simulated /24; outages take out a whole subnet
+PROBE_TIMEOUT = 3.0          # Latency of a probe that times out (network_test.py's PING/TCP timeouts)
+HTTP_TIMEOUT = 5.0
+
+
+def _open(path, mode):
+    """Text-mode file; gzip for .gz names."""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8', newline='\n')
+
+
+def probe_key(host, service):
+    return f"{host.strip().lower()} {service.strip().lower()}"
+
+
+def dns_key(qname, rdtype, scope=''):
+    """Key of a DNS query; scope separates the servers of _nslookup_tool.py --sites ('*' = any)."""
+    return f"{scope or '*'} {str(qname).lower().rstrip('.')} {rdtype}"
+
+
+class VirtualClock:
+    """Network time replayed so far, counted from the wall-clock time of creation. Thread-safe and picklable."""
+
+    def __init__(self, start=None):
+        self.start = time.time() if start is None else start
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def advance(self, seconds):
+        with self._lock:
+            self.elapsed += seconds
+
+    def time(self):
+        return self.start + self.elapsed
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class TraceRecorder:
+    """
+    Writes network operations to a trace file. Thread-safe. append=True adds to an existing
+    trace and flushes every line, so several processes can record into one (plain) file.
+    """
+
+    def __init__(self, path, tool, append=False):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._flush = append
+        new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = _open(path, 'a' if append else 'w')
+        if new:
+            self._write({'net_replay': FORMAT_VERSION, 'tool': tool, 'recorded': datetime.now().isoformat(timespec='seconds')})
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            if self._flush:
+                self._file.flush()
+
+    def record(self, layer, key, latency, outcome):
+        self._write({'layer': layer, 'key': key, 'at': round(time.perf_counter() - self._started, 6),
+                     'latency': round(latency, 6), 'outcome': outcome})
+        with self._lock:
+            self.count += 1
+
+    def record_probe(self, host, service, latency, result):
+        """A test's result dictionary (or list of them, e.g. --all-addresses)."""
+        items = result if isinstance(result, list) else [result] if result else []
+        fields = ('Service',) + RESULT_FIELDS if isinstance(result, list) else RESULT_FIELDS # Per-address rows keep their service
+        rows = [{field: item[field] for field in fields if field in item} for item in items]
+        self.record(LAYER_PROBE, probe_key(host, service), latency, {'rows': rows, 'list': isinstance(result, list)})
+
+    def record_resolve(self, name, latency, address):
+        self.record(LAYER_RESOLVE, name.strip().lower(), latency, {'address': address})
+
+    def record_dns(self, qname, rdtype, latency, wire, error, scope=''):
+        """A DNS reply (wire bytes) or, when there was none, the error (an exception)."""
+        if wire is not None:
+            outcome = {'wire': base64.b64encode(wire).decode('ascii')}
+        else:
+            outcome = {'error': type(error).__name__, 'message': str(error)}
+        self.record(LAYER_DNS, dns_key(qname, rdtype, scope), latency, outcome)
+
+    def recording_resolver(self, resolve=socket.gethostbyname):
+        """resolve (gethostbyname-like), recording every lookup."""
+        def resolver(name):
+            started = time.perf_counter()
+            try:
+                address = resolve(name)
+            except (OSError, UnicodeError):
+                self.record_resolve(name, time.perf_counter() - started, None)
+                raise
+            self.record_resolve(name, time.perf_counter() - started, address)
+            return address
+        return resolver
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_OUTCOME_MARK = ',"outcome":' # TraceRecorder writes the outcome last
+
+
+def read_trace(path, layers=None):
+    """
+    Yields (layer, key, latency, outcome as JSON text) for the operations of a trace file,
+    only those of the given layers if set. Header lines are checked and skipped.
+    """
+    skip = tuple(f'{{"layer":"{layer}"' for layer in {LAYER_PROBE, LAYER_RESOLVE, LAYER_DNS} - set(layers)) if layers else ()
+    with _open(path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if skip and line.startswith(skip):
+                continue
+            line = line.rstrip('\r\n')
+            if not line.strip():
+                continue
+            record = None
+            mark = line.find(_OUTCOME_MARK)
+            if mark > 0 and line.endswith('}'):
+                try: # Parse only the short part before the outcome; it is parsed when replayed
+                    record, text = json.loads(line[:mark] + '}'), line[mark + len(_OUTCOME_MARK):-1]
+                except ValueError:
+                    pass
+            if record is None:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    raise ValueError(f"{path}:{line_number}: not a JSON line")
+                text = json.dumps(record['outcome']) if isinstance(record, dict) and 'outcome' in record else None
+            if not isinstance(record, dict):
+                raise ValueError(f"{path}:{line_number}: not a trace record")
+            if 'net_replay' in record:
+                if record['net_replay'] != FORMAT_VERSION:
+                    raise ValueError(f"{path}: trace format {record['net_replay']} (expected {FORMAT_VERSION})")
+                continue
+            if 'layer' not in record or 'key' not in record or text is None:
+                raise ValueError(f"{path}:{line_number}: not a trace record")
+            if layers and record['layer'] not in layers:
+                continue
+            yield record['layer'], record['key'], record.get('latency') or 0.0, text
+
+
+class ReplayBackend:
+    """
+    Serves recorded outcomes by (layer, key) in place of the network, advancing clock by each
+    operation's recorded latency. Thread-safe. Operations missing from the trace are counted
+    and fail (probe: a FAILED row with Details NOT_RECORDED; resolve: gaierror; dns: None).
+    """
+
+    def __init__(self, operations, clock=None, speed=0.0):
+        """operations: (layer, key, latency, outcome JSON text), as read_trace() yields them."""
+        self.clock = clock or VirtualClock()
+        self.speed = speed
+        # '<layer> <key>' -> (latency, outcome text), or [index of the next, (latency, text), ...] if recorded
+        # more than once. Outcomes stay JSON text until served, and equal texts are stored once.
+        self._operations = {}
+        intern = {}
+        count = 0
+        for layer, key, latency, text in operations:
+            operation = (latency, intern.setdefault(text, text))
+            name = f"{layer} {key}"
+            entry = self._operations.get(name)
+            if entry is None:
+                self._operations[name] = operation
+            elif isinstance(entry, list):
+                entry.append(operation)
+            else:
+                self._operations[name] = [0, entry, operation]
+            count += 1
+        self._lock = threading.Lock()
+        self.stats = {'operations': count, 'served': 0, 'missing': 0}
+
+    @classmethod
+    def load(cls, path, clock=None, speed=0.0, layers=None):
+        """Reads a trace file (only the given layers, if set). Raises OSError or ValueError."""
+        return cls(read_trace(path, layers), clock, speed)
+
+    def has(self, layer, key):
+        return f"{layer} {key}" in self._operations
+
+    def _next(self, layer, key):
+        with self._lock:
+            entry = self._operations.get(f"{layer} {key}")
+            if entry is None:
+                self.stats['missing'] += 1
+                return None
+            if isinstance(entry, list):
+                index = entry[0]
+                entry[0] = (index + 1) % (len(entry) - 1)
+                entry = entry[index + 1]
+            self.stats['served'] += 1
+        latency, text = entry
+        self.clock.advance(latency)
+        if self.speed:
+            time.sleep(latency * self.speed)
+        return json.loads(text)
+
+    def probe(self, host, service):
+        """Result dictionary (or list) of a recorded test, as the live probe returned it, stamped now."""
+        outcome = self._next(LAYER_PROBE, probe_key(host, service))
+        base = {'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host, 'Service': service}
+        if outcome is None:
+            return dict(base, Status='FAILED', Details=NOT_RECORDED, Timing='', SuccessBool=False)
+        rows = [dict(base, **row) for row in outcome['rows']]
+        return rows if outcome['list'] else rows[0] if rows else None
+
+    def resolve(self, name):
+        """gethostbyname() as recorded: the address, else socket.gaierror."""
+        outcome = self._next(LAYER_RESOLVE, name.strip().lower())
+        if not outcome or not outcome['address']:
+            raise socket.gaierror(socket.EAI_NONAME, NOT_RECORDED if outcome is None else 'Name or service not known')
+        return outcome['address']
+
+    def dns(self, qname, rdtype, scope=''):
+        """(reply wire, None) or (None, (error type name, message)) as recorded; None if not in the trace."""
+        key = dns_key(qname, rdtype, scope)
+        if scope and not self.has(LAYER_DNS, key):
+            key = dns_key(qname, rdtype) # Recorded without --sites
+        outcome = self._next(LAYER_DNS, key)
+        if outcome is None:
+            return None
+        if 'wire' in outcome:
+            return base64.b64decode(outcome['wire']), None
+        return None, (outcome['error'], outcome.get('message', ''))
+
+    def summary(self):
+        return (f"{self.stats['served']:,} operation(s) replayed from {self.stats['operations']:,} recorded, "
+                f"{self.stats['missing']:,} not in the trace; {self.clock.elapsed:,.1f}s of virtual network time")
+
+
+# --- Synthetic Scenarios ---
+
+def _dns_name(name):
+    return b''.join(bytes((len(label),)) + label.encode('ascii') for label in name.rstrip('.').split('.')) + b'\x00'
+
+
+def dns_reply_wire(qname, rdtype, answers=(), rcode=0, ttl=300):
+    """A minimal DNS reply (A or PTR answers, names compressed against the question)."""
+    qtype = {'A': 1, 'PTR': 12}[rdtype]
+    wire = struct.pack('!HHHHHH', 0, 0x8180 | rcode, 1, len(answers), 0, 0) + _dns_name(qname) + struct.pack('!HH', qtype, 1)
+    for answer in answers:
+        rdata = socket.inet_aton(answer) if rdtype == 'A' else _dns_name(answer)
+        wire += struct.pack('!HHHIH', 0xc00c, qtype, 1, ttl, len(rdata)) + rdata
+    return wire
+
+
+def generate_scenario(prefix, targets=100000, services=SCENARIO_SERVICES, seed=1, outage_rate=0.01, down_rate=0.02,
+                      refused_rate=0.03, nxdomain_rate=0.005, slow_rate=0.01, dns_timeout_rate=0.001):
+    """
+    Writes <prefix>.trace.jsonl.gz, <prefix>_targets.csv (hostname,services for network_test.py)
+    and <prefix>_lookups.txt (names and addresses for _nslookup_tool.py). Hosts sit in /24
+    subnets with a per-site round-trip time; failure patterns:
+      outage_rate    whole subnets that time out on every probe
+      down_rate      single hosts that time out
+      refused_rate   tcp tests refused right away (service stopped)
+      nxdomain_rate  names that do not resolve (every test reports a DNS error)
+      slow_rate      probes 10-50x slower than their site's RTT
+      dns_timeout_rate  DNS queries (_nslookup_tool.py) without a reply
+    Returns a dictionary of counts.
+    """
+    for service in services:
+        kind, _, port = service.partition(':')
+        if not (service in ('ping', 'http', 'https') or kind == 'tcp' and port.isdigit()):
+            raise ValueError(f"Scenarios support ping, http, https and tcp:<port>, not '{service}'")
+    rng = random.Random(seed)
+    counts = {'targets': targets, 'probes': 0, 'failed_probes': 0, 'outage_subnets': 0, 'down_hosts': 0, 'nxdomain_names': 0}
+    subnets = (targets + SUBNET_SIZE - 1) // SUBNET_SIZE
+    site_rtt = [rng.uniform(0.5, 80.0) / 1000.0 for _ in range(subnets)]
+    outages = {subnet for subnet in range(subnets) if rng.random() < outage_rate}
+    counts['outage_subnets'] = len(outages)
+    recorder = TraceRecorder(f"{prefix}.trace.jsonl.gz", tool='net_replay scenario')
+
+    def latency(rtt):
+        value = rtt * rng.uniform(0.8, 1.5)
+        return value * rng.uniform(10, 50) if rng.random() < slow_rate else value
+
+    def probe_row(service, up, refused, rtt):
+        """(seconds, result row) of one test."""
+        kind, _, port = service.partition(':')
+        if kind == 'ping':
+            if up:
+                return latency(rtt), {'Status': 'SUCCESS', 'Details': 'Responded to ICMP echo request', 'SuccessBool': True}
+            return PROBE_TIMEOUT + 1.0, {'Status': 'FAILED', 'Details': 'Ping failed (Exit: 1), Host Unreachable / ICMP Blocked', 'SuccessBool': False}
+        if kind == 'tcp':
+            if not up:
+                return PROBE_TIMEOUT, {'Status': 'FAILED', 'Details': f'Timeout connecting to port {port}', 'SuccessBool': False}
+            if refused:
+                return latency(rtt), {'Status': 'FAILED', 'Details': f'Port {port} is closed or filtered (Error code: 111)', 'SuccessBool': False}
+            return latency(rtt), {'Status': 'SUCCESS', 'Details': f'Port {port} is open', 'SuccessBool': True}
+        if not up:
+            return HTTP_TIMEOUT, {'Status': 'FAILED', 'Details': 'Timeout', 'SuccessBool': False}
+        seconds = latency(rtt) * (4 if kind == 'https' else 2) # Handshake(s) plus the request
+        status = 503 if refused else 200
+        return seconds, {'Status': 'SUCCESS' if status == 200 else 'FAILED', 'Details': f'HTTP Status {status}',
+                         'Timing': f'{status} {seconds * 1000:.0f} ms', 'SuccessBool': status == 200}
+
+    services_cell = ','.join(services)
+    with open(f"{prefix}_targets.csv", 'w', encoding='utf-8', newline='') as targets_file, \
+            open(f"{prefix}_lookups.txt", 'w', encoding='utf-8') as lookups_file:
+        targets_file.write('hostname,services\n')
+        for index in range(targets):
+            subnet = index // SUBNET_SIZE
+            address = f"10.{subnet // 256 % 256}.{subnet % 256}.{index % SUBNET_SIZE + 1}"
+            name = f"host{index:06d}.site{subnet:04d}.example.net"
+            targets_file.write(f'{name},"{services_cell}"\n')
+            lookups_file.write(f"{name}\n{address}\n")
+            rtt = site_rtt[subnet]
+            resolves = rng.random() >= nxdomain_rate
+            down = rng.random() < down_rate
+            up = resolves and subnet not in outages and not down
+            counts['nxdomain_names'] += not resolves
+            counts['down_hosts'] += down
+            # Name resolution (network_test.py planning) and the lookup tool's A / PTR queries
+            recorder.record_resolve(name, rng.uniform(0.001, 0.02), address if resolves else None)
+            reverse_name = '.'.join(reversed(address.split('.'))) + '.in-addr.arpa'
+            for qname, rdtype, answers in ((name, 'A', [address] if resolves else []), (reverse_name, 'PTR', [name] if resolves else [])):
+                if rng.random() < dns_timeout_rate:
+                    recorder.record(LAYER_DNS, dns_key(qname, rdtype), 2.0, {'error': 'Timeout', 'message': 'The DNS operation timed out.'})
+                else:
+                    recorder.record_dns(qname, rdtype, rng.uniform(0.001, 0.03), dns_reply_wire(qname, rdtype, answers, rcode=0 if answers else 3), None)
+            # One test per service
+            for service in services:
+                if not resolves:
+                    seconds, row = rng.uniform(0.001, 0.02), {'Status': 'FAILED', 'Details': 'DNS Resolution Error', 'SuccessBool': False}
+                else:
+                    seconds, row = probe_row(service, up, rng.random() < refused_rate, rtt)
+                recorder.record(LAYER_PROBE, probe_key(name, service), round(seconds, 6), {'rows': [row], 'list': False})
+                counts['probes'] += 1
+                counts['failed_probes'] += not row['SuccessBool']
+    recorder.close()
+    return counts
+
+
+def summarize_trace(path):
+    """Counts per layer, failures and total latency of a trace file."""
+    layers = {}
+    for layer_name, _key, latency, text in read_trace(path):
+        layer = layers.setdefault(layer_name, {'operations': 0, 'failed': 0, 'latency': 0.0})
+        layer['operations'] += 1
+        layer['latency'] += latency
+        outcome = json.loads(text)
+        if layer_name == LAYER_PROBE:
+            failed = any(not row.get('SuccessBool', True) for row in outcome['rows'])
+        elif layer_name == LAYER_RESOLVE:
+            failed = not outcome['address']
+        else:
+            failed = 'wire' not in outcome or base64.b64decode(outcome['wire'])[3] & 0x0F != 0
+        layer['failed'] += failed
+    return layers
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generates synthetic traces for --replay, or summarizes a trace.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    scenario = commands.add_parser('scenario', help="Write a synthetic trace with matching inputs.",
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    scenario.add_argument('--prefix', default='scenario', help="Output files: <prefix>.trace.jsonl.gz, <prefix>_targets.csv, <prefix>_lookups.txt.")
+    scenario.add_argument('--targets', type=int, default=100000)
+    scenario.add_argument('--services', default=','.join(SCENARIO_SERVICES), help="Tests per target (ping, http, https, tcp:<port>).")
+    scenario.add_argument('--outage-rate', type=float, default=0.01, help="Fraction of /24 subnets that are down.")
+    scenario.add_argument('--down-rate', type=float, default=0.02, help="Fraction of single hosts that are down.")
+    scenario.add_argument('--refused-rate', type=float, default=0.03, help="Fraction of tcp tests refused (HTTP 503 for http/https).")
+    scenario.add_argument('--nxdomain-rate', type=float, default=0.005, help="Fraction of names that do not resolve.")
+    scenario.add_argument('--slow-rate', type=float, default=0.01, help="Fraction of probes 10-50x slower than usual.")
+    scenario.add_argument('--seed', type=int, default=1)
+    summary = commands.add_parser('summary', help="Describe a trace file.")
+    summary.add_argument('trace')
+    bench_args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        if bench_args.command == 'scenario':
+            counts = generate_scenario(bench_args.prefix, bench_args.targets, [s.strip() for s in bench_args.services.split(',') if s.strip()],
+                                       bench_args.seed, bench_args.outage_rate, bench_args.down_rate, bench_args.refused_rate,
+                                       bench_args.nxdomain_rate, bench_args.slow_rate)
+            print(f"{counts['targets']:,} target(s), {counts['probes']:,} test(s) ({counts['failed_probes']:,} failing): "
+                  f"{counts['outage_subnets']:,} subnet outage(s), {counts['down_hosts']:,} host(s) down, "
+                  f"{counts['nxdomain_names']:,} name(s) not resolving; written in {time.perf_counter() - started:.1f}s")
+            print(f"  python network_test.py --csv {bench_args.prefix}_targets.csv --replay {bench_args.prefix}.trace.jsonl.gz --progress")
+            print(f"  python ../_nslookup_tool.py -i {bench_args.prefix}_lookups.txt --pipeline --replay {bench_args.prefix}.trace.jsonl.gz --progress")
+        else:
+            for layer, counts in summarize_trace(bench_args.trace).items():
+                print(f"{layer:<8} {counts['operations']:>10,} operation(s), {counts['failed']:>9,} failed, "
+                      f"{counts['latency']:>12,.1f}s of latency")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
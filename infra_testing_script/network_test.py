@@ -6,26 +6,44 @@
 # Purpose: Tests network connectivity (Ping, HTTP/S, TCP Ports) for specified hosts.
 #          Supports input via CSV or command-line args, outputs to console and optionally CSV file.
 
-import subprocess
-import platform
-import requests
 import socket
-import argparse
 import csv
 import sys
 import os
+import io
+import contextlib
 import colorama # Import colorama
 from colorama import Fore, Style # Import specific objects
 from datetime import datetime # For timestamp
 import warnings
-warnings.filterwarnings("ignore")
-# --- Initialize Colorama ---
-colorama.init(autoreset=True)
+import time
+import progress_render # Local module: buffered result lines, --progress / --quiet
+import stage_profiler # Local module: --profile stage timings and stack sampling
+# Everything else is imported where it is used, so '--help' starts quickly and a run only loads
+# what its services and options need: requests, argparse, multiprocessing, subprocess/platform
+# (ping) and the local modules http_probe, address_probe, tls_probe, udp_probe, path_trace
+# (probes), host_patterns, endpoint_plan, job_deadline, probe_scheduler, result_writers,
+# result_diff and net_replay (options). colorama is initialized in main(), so importing this
+# module (run_probes()) has no side effects on the caller's stdout or warning filters.
 
 # --- Configuration (Defaults & Constants) ---
 REQUEST_TIMEOUT = 5 # Timeout for HTTP/HTTPS requests
 PING_TIMEOUT = 3    # Timeout for ping command execution
 TCP_TIMEOUT = 3     # Timeout for generic TCP port connections
+UDP_TIMEOUT = 3     # Timeout for UDP probes (udp/dns/ntp/snmp), retries included
+TRACE_TIMEOUT = 2   # Seconds each trace probe (one TTL of one round) is waited for
+HTTP_MAX_BODY_BYTES = 0     # Body bytes read per HTTP/S probe (0 = headers only), as http_probe.DEFAULT_MAX_BODY_BYTES
+HTTP_MATCH_BODY_BYTES = 65536 # Budget with --http-match and no --http-max-bytes (http_probe.DEFAULT_MATCH_BODY_BYTES)
+HTTP_MAX_REDIRECTS = 5      # http_probe.DEFAULT_MAX_REDIRECTS
+MONITOR_MAX_IN_FLIGHT = 256 # Upper bound on concurrent probes in --monitor mode
+# Defaults of the option modules, repeated here so building the parser does not import them
+EXPORT_FORMATS = ('csv', 'csv.gz', 'csv.zst', 'jsonl', 'jsonl.gz', 'parquet') # result_writers.FORMATS
+TLS_MIN_DAYS = 0                # tls_probe.DEFAULT_MIN_DAYS
+UDP_SERVICE_KINDS = ('udp', 'dns', 'ntp', 'snmp') # udp_probe.UDP_SERVICES
+SNMP_COMMUNITY = 'public'       # udp_probe.DEFAULT_SNMP_COMMUNITY
+TRACE_ROUNDS, TRACE_MAX_ROUNDS = 3, 30    # path_trace.DEFAULT_ROUNDS, MAX_ROUNDS_LIMIT
+TRACE_MAX_HOPS, TRACE_HOPS_LIMIT = 30, 64 # path_trace.DEFAULT_MAX_HOPS, MAX_HOPS_LIMIT
+MONITOR_MIN_INTERVAL, MONITOR_MAX_INTERVAL, MONITOR_MAX_RATE = 10.0, 300.0, 50.0 # probe_scheduler.DEFAULT_*
 
 # --- Colored Status Strings ---
 STATUS_SUCCESS = f"{Fore.GREEN}SUCCESS{Style.RESET_ALL}"
@@ -35,13 +53,36 @@ STATUS_SKIP = f"{Fore.YELLOW}SKIP{Style.RESET_ALL}"
 STATUS_ERROR = f"{Fore.RED}ERROR{Style.RESET_ALL}"
 
 # --- Field names for CSV output ---
-CSV_FIELDNAMES = ['Timestamp', 'TargetHost', 'Service', 'Status', 'Details']
+CSV_FIELDNAMES = ['Timestamp', 'TargetHost', 'Service', 'Status', 'Details', 'Timing']
+DICTIONARY_COLUMNS = ('TargetHost', 'Service', 'Status') # Dictionary-encoded in Parquet exports
+
+# --- Console Output ---
+# Per-test lines go through the renderer, which buffers them and applies --progress / --quiet.
+# main() replaces it with one that knows the run's mode and size.
+renderer = progress_render.ProgressRenderer()
+
+# --- Profiling (--profile) ---
+# Stages: parse_csv, probe:<type> (inclusive of dns and render), dns, render, export, diff.
+# A no-op unless main() installs a StageProfiler.
+profiler = stage_profiler.NULL_PROFILER
+
+# --- Record & Replay (--record / --replay) ---
+# main() installs a net_replay.TraceRecorder, which gets every test's outcome and latency, or a
+# net_replay.ReplayBackend, which serves them from a trace in place of ping, sockets and DNS.
+recorder = None
+replay = None
+
+def report(text, failed=False):
+    with profiler.stage('render'):
+        renderer.detail(text, failed)
 
 # --- Test Functions ---
 
-def test_ping(hostname):
+def test_ping(hostname, timeout=PING_TIMEOUT, limit=None, address=None):
     """
-    Tests reachability using the system's ping command.
+    Tests reachability using the system's ping command (timeout in whole seconds).
+    limit: seconds the ping process may run at most (with --deadline, the time the run has left).
+    address: IP address to ping instead of the name (the endpoint plan's address for it).
     Returns a dictionary with test result details.
     """
     result_data = {
@@ -53,14 +94,15 @@ def test_ping(hostname):
         'SuccessBool': False # Internal flag
     }
 
+    import platform, subprocess # Deferred, see imports at the top
     param = '-n' if platform.system().lower() == 'windows' else '-c'
     timeout_param = []
     if platform.system().lower() == 'windows':
-        timeout_param = ['-w', str(PING_TIMEOUT * 1000)]
+        timeout_param = ['-w', str(timeout * 1000)]
     else: # Linux, macOS - '-W' is timeout in seconds
-        timeout_param = ['-W', str(PING_TIMEOUT)]
+        timeout_param = ['-W', str(timeout)]
 
-    command = ['ping', param, '1'] + timeout_param + [hostname]
+    command = ['ping', param, '1'] + timeout_param + [address or hostname]
 
     try:
         # Use subprocess.run for better control
@@ -68,7 +110,7 @@ def test_ping(hostname):
             command,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
-            timeout=PING_TIMEOUT + 1, # Give subprocess slightly more time
+            timeout=timeout + 1 if limit is None else min(timeout + 1, limit), # Give subprocess slightly more time
             check=False # Don't raise exception on non-zero exit code
         )
         if result.returncode == 0:
@@ -98,16 +140,20 @@ def test_ping(hostname):
     # Print console output
     final_console_status = STATUS_SUCCESS if result_data['SuccessBool'] else STATUS_FAILED
     details_for_console = f"({result_data['Details']})" if not result_data['SuccessBool'] and result_data['Details'] else ""
-    print(f"  [PING]   {hostname:<25} -> {final_console_status} {details_for_console}")
+    report(f"  [PING]   {hostname:<25} -> {final_console_status} {details_for_console}", failed=not result_data['SuccessBool'])
 
     return result_data
 
 
-def test_http_https(hostname, service_type='https', timeout=REQUEST_TIMEOUT):
+def test_http_https(hostname, service_type='https', timeout=REQUEST_TIMEOUT, max_body_bytes=HTTP_MAX_BODY_BYTES,
+                    match=None, max_redirects=HTTP_MAX_REDIRECTS):
     """
     Tests HTTP or HTTPS connectivity and checks for a successful status code (2xx).
+    Only the headers (or max_body_bytes of the body) are downloaded; if match is given
+    it must appear within that budget. Redirects are capped at max_redirects and timed per hop.
     Returns a dictionary with test result details.
     """
+    import requests # Deferred, see imports at the top
     protocol = 'https' if service_type == 'https' else 'http'
     url = f"{protocol}://{hostname}"
 
@@ -125,20 +171,34 @@ def test_http_https(hostname, service_type='https', timeout=REQUEST_TIMEOUT):
         verify_ssl = False # Set to False for self-signed certs (use with caution)
         headers = {'User-Agent': 'Python-NetworkTestScript/1.3'} # Version bump
 
-        response = requests.get(
+        import http_probe # Local module: streamed HTTP probe with byte budget and redirect cap
+        probe = http_probe.probe_url(
             url,
             timeout=timeout,
-            verify=verify_ssl,
-            allow_redirects=True,
-            headers=headers
+            max_body_bytes=max_body_bytes,
+            match=match,
+            max_redirects=max_redirects,
+            headers=headers,
+            verify=verify_ssl
         )
 
-        result_data['Details'] = f"HTTP Status {response.status_code}"
-        if response.status_code >= 200 and response.status_code < 300:
+        result_data['Details'] = f"HTTP Status {probe.status_code}"
+        if probe.redirects:
+            result_data['Details'] += f" after {probe.redirects} redirect(s)"
+        result_data['Timing'] = probe.timing_summary()
+        if probe.status_code >= 200 and probe.status_code < 300:
             result_data['Status'] = 'SUCCESS'
             result_data['SuccessBool'] = True
         # else: Status remains FAILED
-
+        if probe.matched is False:
+            result_data['Details'] += f", '{match}' not found in first {probe.bytes_read} bytes"
+            result_data['Status'] = 'FAILED'
+            result_data['SuccessBool'] = False
+        elif probe.matched:
+            result_data['Details'] += ", content match found"
+
+    except requests.exceptions.TooManyRedirects:
+        result_data['Details'] = f"Too many redirects (limit {max_redirects})"
     except requests.exceptions.Timeout:
         result_data['Details'] = 'Timeout'
     except requests.exceptions.SSLError as e:
@@ -165,13 +225,17 @@ def test_http_https(hostname, service_type='https', timeout=REQUEST_TIMEOUT):
     if result_data['SuccessBool']:
          details_for_console = f"({result_data['Details']})"
 
-    print(f"  {service_tag:<7} {url:<28} -> {final_console_status} {details_for_console}")
+    timing_for_console = f" [{result_data['Timing']}]" if result_data.get('Timing') else ""
+
+    report(f"  {service_tag:<7} {url:<28} -> {final_console_status} {details_for_console}{timing_for_console}",
+           failed=not result_data['SuccessBool'])
 
     return result_data
 
-def test_tcp_port(hostname, port, timeout=TCP_TIMEOUT):
+def test_tcp_port(hostname, port, timeout=TCP_TIMEOUT, address=None):
     """
     Tests if a specific TCP port is open on the target host using sockets.
+    address: IPv4 address to connect to instead of resolving the name (the endpoint plan's address for it).
     Returns a dictionary with test result details.
     """
     service_name = f'tcp:{port}' # Original requested service name for logging
@@ -182,7 +246,7 @@ def test_tcp_port(hostname, port, timeout=TCP_TIMEOUT):
             raise ValueError("Port number must be between 1 and 65535")
     except ValueError as e:
          # Return error result immediately if port is invalid
-         print(f"  [TCP:{port:<4}] {hostname:<25} -> {STATUS_FAILED} (Invalid port: {e})")
+         report(f"  [TCP:{port:<4}] {hostname:<25} -> {STATUS_FAILED} (Invalid port: {e})", failed=True)
          return {
             'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'TargetHost': hostname,
@@ -205,7 +269,8 @@ def test_tcp_port(hostname, port, timeout=TCP_TIMEOUT):
 
     try:
         # Resolve hostname first to provide better DNS error context
-        ip_address = socket.gethostbyname(hostname)
+        with profiler.stage('dns'):
+            ip_address = address or socket.gethostbyname(hostname)
 
         # Create socket
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -246,16 +311,489 @@ def test_tcp_port(hostname, port, timeout=TCP_TIMEOUT):
          details_for_console = f"({result_data['Details']})"
 
     # Use port_int for aligned output tag
-    print(f"  [TCP:{str(port_int):<4}] {hostname:<25} -> {final_console_status} {details_for_console}")
+    report(f"  [TCP:{str(port_int):<4}] {hostname:<25} -> {final_console_status} {details_for_console}",
+           failed=not result_data['SuccessBool'])
+
+    return result_data
+
+
+def test_tcp_port_addresses(hostname, port, timeout=TCP_TIMEOUT, mode='all'):
+    """
+    Tests a TCP port on every IPv4/IPv6 address of the host at once ('all'), or races
+    them Happy Eyeballs style ('happy-eyeballs'). Returns a list of result dictionaries.
+    """
+    try:
+        port_int = int(port)
+        if not 0 < port_int < 65536:
+            raise ValueError("Port number must be between 1 and 65535")
+    except ValueError:
+        return [test_tcp_port(hostname, port, timeout=timeout)] # Reports the invalid port
+
+    import address_probe # Local module: all-addresses / Happy Eyeballs TCP probing
+    results = address_probe.tcp_address_results(hostname, port_int, timeout, mode=mode)
+    for result_data in results:
+        final_console_status = STATUS_SUCCESS if result_data['SuccessBool'] else STATUS_FAILED
+        timing_for_console = f" [{result_data['Timing']}]" if result_data.get('Timing') else ""
+        report(f"  [{result_data['Service'].upper()}] {hostname} -> {final_console_status} ({result_data['Details']}){timing_for_console}",
+               failed=not result_data['SuccessBool'])
+    return results
+
+
+def test_tls(hostname, port, timeout=TCP_TIMEOUT, resume=False, min_days=TLS_MIN_DAYS):
+    """
+    TLS handshake and certificate check on a port (see tls_probe.py).
+    Returns a dictionary with test result details; 'Timing' holds connect/handshake times.
+    """
+    try:
+        port_int = int(port)
+        if not 0 < port_int < 65536:
+            raise ValueError("Port number must be between 1 and 65535")
+    except ValueError as e:
+        report(f"  [TLS:{port:<4}] {hostname:<25} -> {STATUS_FAILED} (Invalid port: {e})", failed=True)
+        return {'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': hostname, 'Service': f'tls:{port}',
+                'Status': 'FAILED', 'Details': f'Invalid port number specified: {e}', 'SuccessBool': False}
+
+    import tls_probe # Local module: tls:<port> handshake and certificate inspection, certificate cache
+    with profiler.stage('tls'):
+        result_data = tls_probe.tls_result(hostname, port_int, timeout, resume=resume, min_days=min_days)
+    final_console_status = STATUS_SUCCESS if result_data['SuccessBool'] else STATUS_FAILED
+    timing_for_console = f" [{result_data['Timing']}]" if result_data['Timing'] else ""
+    report(f"  [TLS:{str(port_int):<4}] {hostname:<25} -> {final_console_status} ({result_data['Details']}){timing_for_console}",
+           failed=not result_data['SuccessBool'])
+    return result_data
+
+
+def probe_timeout(args, default):
+    """default, or with --deadline the time the run has left (at least job_deadline.MIN_PROBE_SECONDS)."""
+    deadline = getattr(args, 'job_deadline', None)
+    if deadline is None:
+        return default
+    import job_deadline # Local module: --deadline probe timeouts, round-robin order, SKIPPED (deadline)
+    return job_deadline.timeout_for(deadline, default) or job_deadline.MIN_PROBE_SECONDS
+
+
+def parse_udp_service(service):
+    """udp_probe.parse_service(), importing udp_probe only for udp/dns/ntp/snmp services."""
+    if service.strip().lower().partition(':')[0] not in UDP_SERVICE_KINDS:
+        return None
+    import udp_probe # Local module: batched udp:/dns:/ntp:/snmp:<port> probes
+    return udp_probe.parse_service(service)
+
+
+def report_udp_result(hostname, result_data):
+    """Prints a udp/dns/ntp/snmp result line and returns the result."""
+    kind, port = parse_udp_service(result_data['Service'])
+    final_console_status = STATUS_SUCCESS if result_data['SuccessBool'] else STATUS_FAILED
+    timing_for_console = f" [{result_data['Timing']}]" if result_data['Timing'] else ""
+    report(f"  [{kind.upper()}:{str(port):<4}] {hostname:<25} -> {final_console_status} ({result_data['Details']}){timing_for_console}",
+           failed=not result_data['SuccessBool'])
+    return result_data
+
 
+def batch_udp_tests(targets, args):
+    """
+    Sends every udp/dns/ntp/snmp test of the targets as one batch (see udp_probe.py) and keeps
+    the results in args.udp_results, where run_service_test() picks them up. Returns the batch
+    statistics, or None if there were no UDP tests.
+    """
+    udp_tests = [(target['host'], service) for target in targets for service in target['services'] if parse_udp_service(service)]
+    if not udp_tests or replay is not None: # Replayed test by test
+        return None
+
+    import udp_probe
+    batch = udp_probe.UdpBatch()
+    timeout = probe_timeout(args, UDP_TIMEOUT)
+    started = time.perf_counter()
+    with profiler.stage('udp_batch'):
+        args.udp_results = udp_probe.run_batch(udp_tests, timeout, community=args.snmp_community, batch=batch)
+    seconds = time.perf_counter() - started
+    if recorder is not None:
+        record_batch(args.udp_results, seconds)
+    return dict(batch.stats, tests=len(udp_tests), seconds=seconds)
+
+
+def report_trace_result(hostname, result_data):
+    """Prints a trace result line (hops in brackets) and returns the result."""
+    status = result_data['Status']
+    final_console_status = STATUS_SKIP if status == 'SKIPPED' else STATUS_SUCCESS if result_data['SuccessBool'] else STATUS_FAILED
+    timing_for_console = f" [{result_data['Timing']}]" if result_data['Timing'] else ""
+    report(f"  [TRACE]  {hostname:<25} -> {final_console_status} ({result_data['Details']}){timing_for_console}",
+           failed=not result_data['SuccessBool'])
     return result_data
 
 
+def report_replayed(hostname, result_data):
+    """Prints the line(s) of a result served by --replay and returns the result."""
+    for item in result_data if isinstance(result_data, list) else [result_data] if result_data else []:
+        success = item.get('SuccessBool', True)
+        final_console_status = STATUS_SKIP if item['Status'] == 'SKIPPED' else STATUS_SUCCESS if success else STATUS_FAILED
+        timing_for_console = f" [{item['Timing']}]" if item.get('Timing') else ""
+        report(f"  [{item['Service'].upper():<8}] {hostname:<25} -> {final_console_status} ({item['Details']}){timing_for_console}",
+               failed=not success)
+    return result_data
+
+
+def record_batch(results, seconds):
+    """--record: the tests of a batch, {(host, service): result}, each with its share of the batch's time."""
+    for (host, service), result_data in results.items():
+        recorder.record_probe(host, service, seconds / len(results), result_data)
+
+
+def trace_hosts(hosts, args):
+    """Traces the paths to hosts in one batch (see path_trace.py). Returns ({host: result}, batch statistics)."""
+    started = time.perf_counter()
+    if replay is not None:
+        results = {host: replay.probe(host, 'trace') for host in hosts}
+        return results, dict(targets=len(hosts), probes_sent=0, answers=0, seconds=time.perf_counter() - started)
+    import path_trace # Local module: 'trace' service, all TTLs of all targets in parallel
+    batch = path_trace.TraceBatch(rounds=args.trace_rounds, max_hops=args.trace_max_hops)
+    timeout = probe_timeout(args, TRACE_TIMEOUT)
+    with profiler.stage('trace_batch'):
+        results = path_trace.run_batch(hosts, timeout, batch)
+    seconds = time.perf_counter() - started
+    if recorder is not None:
+        record_batch({(host, 'trace'): result for host, result in results.items()}, seconds)
+    return results, dict(batch.stats, seconds=seconds)
+
+
+def batch_trace_tests(targets, args):
+    """
+    Traces every host with a 'trace' service as one batch and keeps the results in
+    args.trace_results, where run_service_test() picks them up. Returns the batch
+    statistics, or None if no host has a trace test.
+    """
+    hosts = [target['host'] for target in targets if any(service.lower() == 'trace' for service in target['services'])]
+    if not hosts or replay is not None: # Replayed test by test
+        return None
+    args.trace_results, stats = trace_hosts(hosts, args)
+    return stats
+
+
+def trace_failed_hosts(results, args):
+    """
+    --trace-failed: traces, in one batch, every host with a failed test (other than a trace or a
+    name that did not resolve). Prints the traces and returns their result dictionaries.
+    """
+    traced = {r['TargetHost'] for r in results if r.get('Service') == 'trace'}
+    hosts = list(dict.fromkeys(r['TargetHost'] for r in results
+                               if r.get('Status') == 'FAILED' and r.get('Service') != 'trace'
+                               and 'DNS Resolution' not in (r.get('Details') or '') and r['TargetHost'] not in traced))
+    if not hosts:
+        return []
+    print(f"\n{Style.BRIGHT}Tracing the paths to {len(hosts):,} host(s) with failed tests...{Style.RESET_ALL}")
+    trace_results, stats = trace_hosts(hosts, args)
+    for host in hosts:
+        report_trace_result(host, trace_results[host])
+
+    renderer.flush()
+    print(f"Trace batch: {stats['targets']:,} path(s), {stats['probes_sent']:,} probe(s) sent, {stats['answers']:,} answered in {stats['seconds']:.1f}s")
+    return [trace_results[host] for host in hosts]
+
+
+# --- Target Execution ---
+
+def run_service_test(host, service, args):
+    """
+    Runs one service test of a host. Returns a result dictionary, or a list of them (--all-addresses).
+    With an endpoint plan, a ping/tcp test of a name whose address was already probed for the
+    same service reuses that result instead of probing again. UDP and trace tests already run by
+    batch_udp_tests() / batch_trace_tests() just report their result.
+    """
+    plan = getattr(args, 'endpoint_plan', None)
+    key = plan.key(host, service) if plan else None
+    if key:
+        shared = plan.lookup(key)
+        if shared:
+            first_host, first_result = shared
+            result_data = plan.shared_result(key, host, first_host, first_result)
+            status = STATUS_SUCCESS if result_data['SuccessBool'] else STATUS_FAILED
+            tag = '[PING]  ' if key[1] == 'ping' else f"[TCP:{key[1][4:]:<4}]" # As test_ping() / test_tcp_port() print it
+            report(f"  {tag} {host:<25} -> {status} ({result_data['Details']})", failed=not result_data['SuccessBool'])
+            return result_data
+    udp_results = getattr(args, 'udp_results', None)
+    if udp_results and (host, service.lower()) in udp_results: # Sent with the other UDP tests before the run
+        return report_udp_result(host, udp_results[(host, service.lower())])
+    trace_results = getattr(args, 'trace_results', None)
+    if trace_results and service.lower() == 'trace' and host in trace_results: # Traced with the other hosts before the run
+        return report_trace_result(host, trace_results[host])
+    deadline = getattr(args, 'job_deadline', None)
+    if deadline is not None and deadline.expired():
+        return report_deadline_skip(host, service)
+    started = time.perf_counter()
+    # The plan's address, so the result shared with other names is for the address they resolved to
+    result_data = probe_service(host, service, args, address=key[0] if key else None)
+    if recorder is not None:
+        recorder.record_probe(host, service, time.perf_counter() - started, result_data)
+    if key and isinstance(result_data, dict):
+        plan.store(key, host, result_data)
+    return result_data
+
+
+def report_deadline_skip(host, service):
+    """Prints and returns the SKIPPED (deadline) result of a test --deadline left no time for."""
+    import job_deadline
+    report(f"  [{STATUS_SKIP}]   {service:<8} {host:<25} -> SKIPPED ({job_deadline.DEADLINE_DETAILS})")
+    return job_deadline.skipped_result(host, service, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def probe_service(host, service, args, address=None):
+    """
+    Dispatches one service test of a host. Returns a result dictionary, or a list of them (--all-addresses).
+    With --deadline, every timeout is cut to the time the run has left. With --replay, the result comes from the trace.
+    address: the endpoint plan's address of host, probed by ping and tcp:<port> instead of the name.
+    """
+    if replay is not None:
+        return report_replayed(host, replay.probe(host, service))
+    service_lower = service.lower() # Work with lowercase internally
+    result_data = None
+    deadline = getattr(args, 'job_deadline', None)
+    def timeout(default):
+        return probe_timeout(args, default)
+
+    if service_lower == 'ping':
+        seconds = PING_TIMEOUT if deadline is None else deadline.whole_seconds(PING_TIMEOUT)
+        if seconds is None: # Less than the whole second ping needs
+            result_data = report_deadline_skip(host, service)
+        else:
+            result_data = test_ping(host, timeout=seconds, limit=None if deadline is None else deadline.remaining(), address=address)
+    elif service_lower == 'http':
+        result_data = test_http_https(host, service_type='http', timeout=timeout(REQUEST_TIMEOUT), max_body_bytes=args.http_max_bytes,
+                                      match=args.http_match, max_redirects=args.max_redirects)
+    elif service_lower == 'https':
+        result_data = test_http_https(host, service_type='https', timeout=timeout(REQUEST_TIMEOUT), max_body_bytes=args.http_max_bytes,
+                                      match=args.http_match, max_redirects=args.max_redirects)
+    elif parse_udp_service(service_lower):
+        # Not part of a batch (e.g. --monitor): a batch of one
+        import udp_probe
+        result_data = report_udp_result(host, udp_probe.udp_result(host, service_lower, timeout(UDP_TIMEOUT), args.snmp_community))
+    elif service_lower == 'trace':
+        import path_trace
+        result_data = report_trace_result(host, path_trace.trace_result(host, timeout(TRACE_TIMEOUT), args.trace_rounds, args.trace_max_hops))
+    elif ':' in service_lower:
+        # Handle format like "tcp:port", "tls:port", etc.
+        try:
+            service_type, port_str = service_lower.split(':', 1)
+            if service_type == 'tcp' and args.address_mode:
+                result_data = test_tcp_port_addresses(host, port_str, timeout=timeout(TCP_TIMEOUT), mode=args.address_mode)
+            elif service_type == 'tcp':
+                result_data = test_tcp_port(host, port_str, timeout=timeout(TCP_TIMEOUT), address=address)
+
+            elif service_type == 'tls':
+                result_data = test_tls(host, port_str, timeout=timeout(TCP_TIMEOUT), resume=args.tls_resume, min_days=args.tls_min_days)
+            else:
+                report(f"  [{STATUS_SKIP}]   Unsupported service type '{service_type}' in '{service}' for host {host}")
+                # Create placeholder for CSV
+                result_data = {
+                    'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host,
+                    'Service': service, 'Status': 'SKIPPED',
+                    'Details': f'Unsupported service type {service_type}', 'SuccessBool': True
+                }
+        except ValueError: # Handle case where split fails (e.g., "tcp:")
+             report(f"  [{STATUS_SKIP}]   Invalid service format '{service}' for host {host}")
+             # Create placeholder for CSV
+             result_data = {
+                 'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host,
+                 'Service': service, 'Status': 'SKIPPED',
+                 'Details': 'Invalid service:port format', 'SuccessBool': True
+             }
+    else: # Service didn't match known types or format
+        report(f"  [{STATUS_SKIP}]   Unknown service type '{service}' for host {host}")
+        # Create placeholder for CSV
+        result_data = {
+            'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'TargetHost': host,
+            'Service': service,
+            'Status': 'SKIPPED',
+            'Details': 'Unknown service type',
+            'SuccessBool': True # Treat skip as not-a-failure
+        }
+    return result_data
+
+
+def run_target_tests(target, args):
+    """
+    Runs every service test of one target, reporting results as it goes.
+    Returns (list of result dictionaries, whether all non-skipped tests passed).
+    """
+    host = target.get('host')
+    services = target.get('services', []) # Default to empty list
+
+    report(f"\nTesting Target: {Fore.CYAN}{host}{Style.RESET_ALL}")
+    target_all_passed = True
+    target_results = []
+
+    for service in services:
+        with profiler.stage(f"probe:{service.lower().split(':', 1)[0]}"):
+            result_data = run_service_test(host, service, args)
+
+        # --- Store Result(s) and Check Status ---
+        for result_item in (result_data if isinstance(result_data, list) else [result_data] if result_data else []):
+            target_results.append(result_item)
+            # Check if this specific test failed (and wasn't skipped)
+            if not result_item.get('SuccessBool', True) and result_item.get('Status') != 'SKIPPED':
+                target_all_passed = False
+
+    # --- Optional: Print per-target summary ---
+    status_word = STATUS_SUCCESS if target_all_passed else STATUS_FAILED
+    report(f"Target Status [{Fore.CYAN}{host}{Style.RESET_ALL}]: {status_word}", failed=not target_all_passed)
+    report("-" * 50) # Separator between hosts
+
+    return target_results, target_all_passed
+
+
+def run_targets_by_priority(targets, args):
+    """
+    --deadline order: the first service of every target, then the second of every target, and so
+    on, so each host gets a check before any gets a second one. Result lines are printed as the
+    probes run; yields (results, all_passed) per target in input order once all have run.
+    targets (a list or TargetList) is iterated once per round, not copied into a list.
+    """
+    import job_deadline
+    slots = {} # (target index, service index) -> result, gathered per target below
+    report(f"\nTesting {len(targets)} target(s) in rounds of one service per host (--deadline)")
+    for target_index, target, service_index in job_deadline.priority_order(targets):
+        host, service = target['host'], target['services'][service_index]
+        with profiler.stage(f"probe:{service.lower().split(':', 1)[0]}"):
+            slots[target_index, service_index] = run_service_test(host, service, args)
+    for target_index, target in enumerate(targets):
+        target_results = []
+        for service_index in range(len(target['services'])):
+            result_data = slots.pop((target_index, service_index))
+            target_results.extend(result_data if isinstance(result_data, list) else [result_data] if result_data else [])
+        yield target_results, all(r.get('SuccessBool', True) or r.get('Status') == 'SKIPPED' for r in target_results)
+
+
+# --- Process-Pool Sharding (--processes) ---
+# Worker processes run whole targets and send back their results together with the console
+# output they produced; the main process is the single writer for the console and the CSV.
+# With --profile each worker also sends back its stage timings, which the main process merges.
+
+_worker_args = None
+
+def _init_worker(args):
+    global _worker_args, renderer, profiler, replay
+    _worker_args = args
+    if getattr(args, 'replay', None) and replay is None: # Spawned, not forked from main()
+        import net_replay # Local module: --record / --replay trace files, virtual network time
+        replay = net_replay.ReplayBackend.load(args.replay, speed=args.replay_speed, layers=(net_replay.LAYER_PROBE,))
+    if replay is not None:
+        replay.clock = args.replay_clock # The one this worker's --deadline counts against
+    renderer = progress_render.ProgressRenderer(mode=args.output_mode)
+    if getattr(args, 'profile', False):
+        profiler = stage_profiler.StageProfiler()
+    warnings.filterwarnings("ignore") # Same as main() (not inherited by spawned workers)
+
+def _run_target_captured(target):
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        target_results, target_all_passed = run_target_tests(target, _worker_args)
+        renderer.flush()
+    timings = None
+    if profiler.enabled:
+        timings = profiler.snapshot()
+        profiler.reset()
+    return buffer.getvalue(), target_results, target_all_passed, timings
+
+def run_targets_in_processes(targets, args):
+    """Yields (results, all_passed) per target in input order, running targets on args.processes workers."""
+    # Small chunks keep the output flowing; larger ones cut per-target IPC on huge target lists
+    import multiprocessing
+    chunksize = max(1, min(64, len(targets) // (args.processes * 8)))
+    with multiprocessing.Pool(processes=args.processes, initializer=_init_worker, initargs=(args,)) as pool:
+        outcomes = pool.imap(_run_target_captured, targets, chunksize=chunksize)
+        for output, target_results, target_all_passed, timings in profiler.timed_iter(outcomes, 'worker_results'):
+            renderer.write(output)
+            if timings:
+                profiler.merge(timings)
+            yield target_results, target_all_passed
+
+
+# --- Continuous Monitoring (--monitor) ---
+# Every (target, service) check is probed over and over on a thread pool. probe_scheduler picks
+# each check's next time from its history and caps the probes started per second; only state
+# changes are printed, under a status line.
+
+def _timed_probe(host, service, args):
+    start = time.perf_counter()
+    with profiler.stage(f"probe:{service.lower().split(':', 1)[0]}"):
+        result_data = run_service_test(host, service, args)
+    return result_data, time.perf_counter() - start
+
+def run_monitor(targets, args):
+    """
+    Monitors until Ctrl+C or --monitor-duration. Returns (whether every check was up at the end,
+    the result rows of every state change in order).
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    import probe_scheduler # Local module: --monitor probe intervals and probes/sec budget
+    global renderer
+    scheduler = probe_scheduler.AdaptiveScheduler(args.min_interval, args.max_interval, args.max_rate)
+    started = time.monotonic()
+    for target in targets:
+        for service in target['services']:
+            scheduler.add((target['host'], service), started)
+    # Enough threads to keep max_rate probes/sec going when each one waits out a full timeout
+    in_flight = max(8, min(MONITOR_MAX_IN_FLIGHT, int(args.max_rate * REQUEST_TIMEOUT)))
+    deadline = started + args.monitor_duration if args.monitor_duration else None
+    print(f"Monitoring {len(scheduler):,} check(s): intervals {args.min_interval:g}s-{args.max_interval:g}s, "
+          f"at most {args.max_rate:g} probes/s ({in_flight} in flight). Press Ctrl+C to stop.")
+    renderer = progress_render.ProgressRenderer(mode=progress_render.MODE_PROGRESS, unit='probes', failure_label='failed probes')
+    change_colors = {probe_scheduler.CHANGE_UP: Fore.GREEN, probe_scheduler.CHANGE_DOWN: Fore.RED, probe_scheduler.CHANGE_SLOW: Fore.YELLOW}
+    change_rows = []
+    pending = {} # future -> check key
+    pool = ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix='monitor')
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            now = time.monotonic()
+            for host, service in scheduler.take_due(now, limit=in_flight - len(pending)):
+                pending[pool.submit(_timed_probe, host, service, args)] = (host, service)
+            timeout = scheduler.next_wakeup(now)
+            timeout = 1.0 if timeout is None else min(max(timeout, 0.01), 1.0)
+            if deadline is not None:
+                timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+            if pending:
+                done, _not_done = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(timeout)
+                done = ()
+            for future in done:
+                key = pending.pop(future)
+                result_data, latency = future.result()
+                items = result_data if isinstance(result_data, list) else [result_data] if result_data else []
+                up = all(r.get('SuccessBool', True) or r.get('Status') == 'SKIPPED' for r in items)
+                change = scheduler.record(key, up, latency, time.monotonic())
+                renderer.advance(1, failed=0 if up else 1)
+                if change:
+                    details = '; '.join(r.get('Details', '') for r in items if r.get('Details'))
+                    if change == probe_scheduler.CHANGE_SLOW:
+                        details = f"{latency * 1000:.0f} ms; {details}"
+                    renderer.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {change_colors[change]}{change:<4}{Style.RESET_ALL} "
+                                   f"{key[0]:<25} {key[1]:<10} {details} (next check in {scheduler.interval(key):g}s)")
+                    change_rows.extend(items)
+    except KeyboardInterrupt:
+        renderer.write("Stopping...")
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+    renderer.close()
+    print(f"\nMonitoring summary: {scheduler.summary(time.monotonic() - started)}")
+    down = scheduler.count_down()
+    if down:
+        print(f"{STATUS_FAILED}: {down:,} check(s) down at the end")
+
+    return not down, change_rows
+
+
 # --- Argument Parsing & Target Loading ---
 
 def load_targets_from_csv(filepath):
-    """Loads target hosts and services from a CSV file."""
-    targets = []
+    """
+    Loads target hosts and services from a CSV file. Hosts and services may be patterns
+    (web[01-64].corp.local, tcp:{22,443}); the returned TargetList expands them as it is iterated.
+    """
+    import host_patterns # Local module: web[01-64] / tcp:{22,443} target patterns, expanded lazily
+    targets = host_patterns.TargetList()
     if not os.path.isfile(filepath):
         print(f"{STATUS_ERROR}: CSV file not found at '{filepath}'")
         sys.exit(1)
@@ -281,12 +819,11 @@ def load_targets_from_csv(filepath):
                     host = row[0].strip()
                     services_str = row[1].strip()
                     if host and services_str: # Only add if host and services are not empty
-                        # Split services string, strip whitespace, remove empty strings
-                        services_list = [s.strip().lower() for s in services_str.split(',') if s.strip()]
-                        if services_list: # Only add if there are actually services listed
-                            targets.append({'host': host, 'services': services_list})
-                        else:
-                             print(f"{STATUS_WARNING}: Skipping row {i+2} in CSV - No valid services found for host '{host}'.")
+                        try:
+                            if not targets.add(host, services_str): # Only counts if there are actually services listed
+                                print(f"{STATUS_WARNING}: Skipping row {i+2} in CSV - No valid services found for host '{host}'.")
+                        except host_patterns.PatternError as e:
+                            print(f"{STATUS_WARNING}: Skipping row {i+2} in CSV - {e}.")
                     elif host:
                          print(f"{STATUS_WARNING}: Skipping row {i+2} in CSV - Services column empty for host '{host}'.")
                     # Silently ignore rows with no host if desired, or add warning
@@ -303,22 +840,31 @@ def load_targets_from_csv(filepath):
 
     if not targets:
         print(f"{STATUS_WARNING}: No valid targets loaded from CSV file '{filepath}'.")
+    elif len(targets) > targets.pattern_rows():
+        print(f"Expanded {targets.pattern_rows()} row(s) to {len(targets)} target(s)")
 
     return targets
 
 
 def setup_arg_parser():
     """Configures and returns the argument parser."""
+    import argparse
     parser = argparse.ArgumentParser(
         description=f"{Style.BRIGHT}Network Service Test Script{Style.RESET_ALL}. Tests Ping, HTTP/S, and generic TCP ports.",
         epilog="Example Usage:\n"
                "  Single Host (Ping, HTTPS): python network_test.py --host google.com --services ping,https\n"
                "  Single Host (SSH Port):    python network_test.py --host my-server.local --services tcp:22\n"
                "  From CSV:                  python network_test.py --csv targets.csv\n"
-               "  Export Results:            python network_test.py --csv targets.csv --output-file results.csv\n\n"
+               "  Export Results:            python network_test.py --csv targets.csv --output-file results.csv\n"
+               "  Changes Since Last Run:    python network_test.py --csv targets.csv --diff-against results.csv\n"
+               "  Host/Service Patterns:     python network_test.py --host 'web[01-04].corp.local' --services 'ping,tcp:{22,443}'\n\n"
                "Service Format:\n"
                "  'ping', 'http', 'https'\n"
-               "  'tcp:<port>' (e.g., 'tcp:22', 'tcp:3389')",
+               "  'tcp:<port>' (e.g., 'tcp:22', 'tcp:3389')\n"
+               "  'tls:<port>' TLS handshake and certificate (e.g., 'tls:443'): protocol, cipher, SANs, days to expiry\n"
+               "  'udp:<port>', 'dns:<port>', 'ntp:<port>', 'snmp:<port>' (e.g., 'dns:53', 'ntp:123', 'snmp:161'), sent as one batch\n"
+               "  'trace' path to the host, all TTLs at once over several rounds (per-hop RTT and loss, like MTR); Linux only\n"
+               "  With --all-addresses every IPv4/IPv6 address is tested: python network_test.py --host lb.example.com --services tcp:443 --all-addresses",
         formatter_class=argparse.RawDescriptionHelpFormatter # Keep newlines in epilog
     )
 
@@ -334,21 +880,224 @@ def setup_arg_parser():
     # Optional output file argument
     parser.add_argument('--output-file', '--outfile', type=str, default=None,
                         help='Optional path to export detailed results to a CSV file.')
+    parser.add_argument('--output-format', choices=EXPORT_FORMATS, default=None,
+                        help='Export format (default: from the --output-file extension, else csv). '
+                             'csv.zst needs zstandard, parquet needs pyarrow.')
+    parser.add_argument('--rotate-mb', type=float, default=0, metavar='MB',
+                        help='Start a new export part file (results.1.csv, ...) once one reaches this size (0 = never).')
+
+    # HTTP/HTTPS probe options
+    parser.add_argument('--http-max-bytes', type=int, default=HTTP_MAX_BODY_BYTES, metavar='BYTES',
+                        help='Body bytes to read per HTTP/HTTPS test (0 = stop after the headers).')
+    parser.add_argument('--http-match', type=str, default=None, metavar='TEXT',
+                        help='Text that must appear in the response body (searched within --http-max-bytes, '
+                             f'or the first {HTTP_MATCH_BODY_BYTES} bytes if that is 0).')
+    parser.add_argument('--max-redirects', type=int, default=HTTP_MAX_REDIRECTS, metavar='N',
+                        help='Maximum redirects followed per HTTP/HTTPS test.')
+
+    # Parallelism
+    parser.add_argument('--processes', type=int, default=1, metavar='N',
+                        help='Shard targets across N worker processes (console and CSV output stay in input order).')
+
+    # TCP address selection (default: first IPv4 address only)
+    address_group = parser.add_mutually_exclusive_group()
+    address_group.add_argument('--all-addresses', dest='address_mode', action='store_const', const='all',
+                               help='Test tcp:<port> on every A/AAAA address of the host concurrently, one result per address.')
+    address_group.add_argument('--happy-eyeballs', dest='address_mode', action='store_const', const='happy-eyeballs',
+                               help='Race tcp:<port> connects over IPv6/IPv4 addresses (RFC 8305) and report the first to connect.')
+
+    # TLS probe options
+    parser.add_argument('--tls-resume', action='store_true',
+                        help='For tls:<port>, also time a second handshake that resumes the first one\'s session.')
+    parser.add_argument('--tls-min-days', type=int, default=TLS_MIN_DAYS, metavar='DAYS',
+                        help='Fail tls:<port> tests whose certificate expires in fewer days than this.')
+
+    # UDP probe options
+    parser.add_argument('--snmp-community', default=SNMP_COMMUNITY, metavar='NAME',
+                        help='SNMPv2c community for snmp:<port> tests.')
+
+    # Path tracing options
+    parser.add_argument('--trace-failed', action='store_true',
+                        help='After the run, trace the paths to all hosts with a failed test, in one batch (Linux only).')
+    parser.add_argument('--trace-rounds', type=int, default=TRACE_ROUNDS, metavar='N',
+                        help=f'Probes per hop for trace tests and --trace-failed (1-{TRACE_MAX_ROUNDS}).')
+    parser.add_argument('--trace-max-hops', type=int, default=TRACE_MAX_HOPS, metavar='N',
+                        help=f'Highest TTL probed by trace tests and --trace-failed (1-{TRACE_HOPS_LIMIT}).')
+
+    # Continuous monitoring
+    parser.add_argument('--monitor', action='store_true',
+                        help='Keep probing until Ctrl+C. Stable checks are probed less and less often (up to --max-interval), '
+                             'failing, changed or slowed-down ones every --min-interval; only state changes are printed.')
+    parser.add_argument('--monitor-duration', type=float, default=0, metavar='SECONDS',
+                        help='With --monitor, stop after this long (0 = run until Ctrl+C).')
+    parser.add_argument('--min-interval', type=float, default=MONITOR_MIN_INTERVAL, metavar='SECONDS',
+                        help='With --monitor, interval for new, failing and changed checks.')
+    parser.add_argument('--max-interval', type=float, default=MONITOR_MAX_INTERVAL, metavar='SECONDS',
+                        help='With --monitor, longest interval for a stable check (bounds how late a change is noticed).')
+    parser.add_argument('--max-rate', type=float, default=MONITOR_MAX_RATE, metavar='PROBES',
+                        help='With --monitor, most probes started per second across all checks.')
+
+    # Overall time limit
+    parser.add_argument('--deadline', type=float, default=0, metavar='SECONDS',
+                        help='Finish within this many seconds: probe timeouts are cut to the time left, every host gets one '
+                             'check before any gets a second, and probes not started in time are reported as SKIPPED (deadline).')
+
+    # Endpoint deduplication (default: one ping/tcp probe per resolved address)
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help='Probe ping/tcp services of every name, even when several names resolve to the same address.')
+
+    # Console output
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument('--progress', dest='output_mode', action='store_const', const=progress_render.MODE_PROGRESS,
+                              default=progress_render.MODE_LINES,
+                              help='Show one status line (tests done, rate, ETA, failures) instead of a line per test.')
+    output_group.add_argument('-q', '--quiet', dest='output_mode', action='store_const', const=progress_render.MODE_QUIET,
+                              help='Only print the lines of failed tests.')
+
+    # Record & replay
+    replay_group = parser.add_mutually_exclusive_group()
+    replay_group.add_argument('--record', type=str, default=None, metavar='TRACE',
+                              help='Save every test\'s outcome and latency, and the planning name lookups, to a trace file '
+                                   '(JSON Lines, gzip-compressed if it ends in .gz) for --replay.')
+    replay_group.add_argument('--replay', type=str, default=None, metavar='TRACE',
+                              help='Serve outcomes from a trace (--record, or net_replay.py scenario) instead of the network. '
+                                   'Latencies advance a virtual clock, which --deadline counts against, instead of being waited out.')
+    parser.add_argument('--replay-speed', type=float, default=0, metavar='FACTOR',
+                        help='With --replay, also sleep each recorded latency times FACTOR (1 = as recorded, 0 = not at all).')
+
+    # Profiling
+    parser.add_argument('--profile', action='store_true',
+                        help='Time each stage (CSV parsing, DNS, probes, rendering, export) and write a JSON report '
+                             'next to the output file (<output>.profile.json, else network_test_profile_<timestamp>.json).')
+    parser.add_argument('--profile-sample', action='store_true',
+                        help='Like --profile, and also sample the call stacks every '
+                             f'{stage_profiler.DEFAULT_SAMPLE_INTERVAL * 1000:g} ms (folded stacks in the report).')
+
+    # Optional change detection against an earlier export
+    parser.add_argument('--diff-against', type=str, default=None, metavar='PREVIOUS_CSV',
+                        help='Optional previous results CSV (from --output-file). Only rows added, removed or changed '
+                             'since then are reported; with --output-file they are also saved as <output>_diff.csv.')
 
     return parser
 
+# --- Library API ---
+
+def run_probes(targets, http_max_bytes=HTTP_MAX_BODY_BYTES, http_match=None, max_redirects=HTTP_MAX_REDIRECTS,
+               address_mode=None, processes=1, verbose=False, tls_resume=False, tls_min_days=TLS_MIN_DAYS,
+               snmp_community=SNMP_COMMUNITY, trace_rounds=TRACE_ROUNDS, trace_max_hops=TRACE_MAX_HOPS):
+    """
+    Runs the tests in-process and returns the result dictionaries (CSV columns plus 'SuccessBool').
+    targets: [{'host': ..., 'services': ['ping', 'https', 'tcp:22', ...]}], or the TargetList that
+    load_targets_from_csv() returns. Options mirror the command line flags. Console output is suppressed unless verbose
+    (by redirecting sys.stdout, so do not call this from several threads at once).
+    """
+    import argparse
+    import host_patterns
+    options = argparse.Namespace(http_max_bytes=http_max_bytes, http_match=http_match, max_redirects=max_redirects,
+                                 address_mode=address_mode, processes=processes, output_mode=progress_render.MODE_LINES,
+                                 tls_resume=tls_resume, tls_min_days=tls_min_days, snmp_community=snmp_community,
+                                 trace_rounds=trace_rounds, trace_max_hops=trace_max_hops)
+    if not isinstance(targets, host_patterns.TargetList):
+        targets = [{'host': t['host'].strip(), 'services': [s.strip().lower() for s in t['services'] if s.strip()]}
+                   for t in targets if t.get('host')]
+    results = []
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        batch_udp_tests(targets, options)
+        batch_trace_tests(targets, options)
+        if processes > 1 and len(targets) > 1:
+            target_outcomes = run_targets_in_processes(targets, options)
+        else:
+            target_outcomes = (run_target_tests(target, options) for target in targets)
+        for target_results, _target_all_passed in target_outcomes:
+            results.extend(target_results)
+        renderer.flush()
+    return results
+
+
 # --- Main Execution ---
 
-if __name__ == "__main__":
+def profile_report_path(args):
+    """<output>.profile.json next to the export, else network_test_profile_<timestamp>.json."""
+    if args.output_file:
+        import result_writers
+        root, _ext = result_writers.split_extension(args.output_file, args.output_format)
+        return f"{root}.profile.json"
+    return f"network_test_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+def main(argv=None):
+    """Command line entry point."""
+    global renderer, profiler, recorder, replay
+    colorama.init(autoreset=True)
+    warnings.filterwarnings("ignore") # urllib3 warns on every unverified HTTPS request
     parser = setup_arg_parser()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     targets_to_test = []
 
+    if args.processes < 1:
+        parser.error("--processes must be at least 1.")
+    if args.deadline < 0:
+        parser.error("--deadline must be positive (or 0 for none).")
+    if args.replay_speed < 0:
+        parser.error("--replay-speed must be 0 or more.")
+    if args.record and args.processes > 1:
+        parser.error("--record cannot be combined with --processes.")
+    if args.record or args.replay:
+        import net_replay # Local module: --record / --replay trace files, virtual network time
+    # A replayed run's time is the network time replayed so far
+    args.replay_clock = net_replay.VirtualClock() if args.replay else None
+    # Starts now, so loading and planning count against it too; travels with args to --processes workers
+    args.job_deadline = None
+    if args.deadline:
+        import job_deadline # Local module: --deadline probe timeouts, round-robin order, SKIPPED (deadline)
+        args.job_deadline = job_deadline.Deadline(args.deadline, clock=args.replay_clock.time if args.replay else time.time)
+    if args.monitor:
+        if args.processes > 1 or args.diff_against or args.deadline or args.trace_failed or args.record or args.replay:
+            parser.error("--monitor cannot be combined with --processes, --diff-against, --deadline, --trace-failed, --record or --replay.")
+        if not 0 < args.min_interval <= args.max_interval or args.max_rate <= 0:
+            parser.error("--monitor needs 0 < --min-interval <= --max-interval and a positive --max-rate.")
+    if not 1 <= args.trace_rounds <= TRACE_MAX_ROUNDS or not 1 <= args.trace_max_hops <= TRACE_HOPS_LIMIT:
+        parser.error(f"--trace-rounds must be 1-{TRACE_MAX_ROUNDS} and --trace-max-hops 1-{TRACE_HOPS_LIMIT}.")
+
+    if args.profile or args.profile_sample:
+        args.profile = True
+        profiler = stage_profiler.StageProfiler()
+        if args.profile_sample: # Main thread only; --processes workers are timed, not sampled
+            profiler.start_sampling()
+
+
+    if args.output_file:
+        import result_writers # Local module: CSV / compressed / JSON Lines / Parquet export writers
+        args.output_format = args.output_format or result_writers.format_for_path(args.output_file)
+        try:
+            result_writers.require_format(args.output_format) # Fail before the tests, not after
+        except result_writers.ExportFormatError as e:
+            print(f"{STATUS_ERROR}: {e}")
+            sys.exit(1)
+
+    if args.diff_against and not os.path.isfile(args.diff_against):
+        print(f"{STATUS_ERROR}: Previous results file not found at '{args.diff_against}'")
+        sys.exit(1)
+
+    try:
+        if args.replay:
+            print(f"Loading replay trace: {Fore.CYAN}{args.replay}{Style.RESET_ALL}")
+            with profiler.stage('replay_load'):
+                replay = net_replay.ReplayBackend.load(args.replay, clock=args.replay_clock, speed=args.replay_speed,
+                                                       layers=(net_replay.LAYER_PROBE, net_replay.LAYER_RESOLVE))
+        elif args.record:
+            recorder = net_replay.TraceRecorder(args.record, tool='network_test')
+    except (OSError, ValueError) as e:
+        print(f"{STATUS_ERROR}: Cannot use trace file '{args.record or args.replay}': {e}")
+        sys.exit(1)
+
     # Validate arguments and load targets
     if args.csv:
         print(f"Loading targets from CSV file: {Fore.CYAN}{args.csv}{Style.RESET_ALL}")
-        targets_to_test = load_targets_from_csv(args.csv)
+        with profiler.stage('parse_csv'):
+            targets_to_test = load_targets_from_csv(args.csv)
     elif args.host:
         # Load from command line arguments
         if not args.services:
@@ -356,11 +1105,15 @@ if __name__ == "__main__":
         host = args.host.strip()
         services_str = args.services.strip()
         if host and services_str:
-            # Split services string, strip whitespace, remove empty strings
-            services_list = [s.strip().lower() for s in services_str.split(',') if s.strip()]
-            if services_list:
-                targets_to_test = [{'host': host, 'services': services_list}]
-            else:
+            # --host and --services accept the same patterns as the CSV (web[01-04], tcp:{22,443})
+            import host_patterns # Local module: web[01-64] / tcp:{22,443} target patterns, expanded lazily
+            targets_to_test = host_patterns.TargetList()
+            try:
+                added = targets_to_test.add(host, services_str)
+            except host_patterns.PatternError as e:
+                print(f"{STATUS_ERROR}: {e}")
+                sys.exit(1)
+            if not added:
                  print(f"{STATUS_ERROR}: No valid services provided via --services argument.")
                  sys.exit(1)
         else:
@@ -372,6 +1125,32 @@ if __name__ == "__main__":
         print("No targets specified or loaded. Exiting.")
         sys.exit(0) # Exit gracefully if no targets loaded
 
+    # --- Planning: resolve names once, probe each (address, ping/tcp service) once ---
+    plan = None
+    if not args.no_dedupe and not args.monitor and len(targets_to_test) > 1: # A monitor must re-probe every name
+        import endpoint_plan # Local module: one ping/tcp probe per resolved (address, service)
+        with profiler.stage('plan'):
+            workers, resolver = endpoint_plan.DEFAULT_RESOLVE_WORKERS, socket.gethostbyname
+            if replay is not None: # No waiting, so no threads
+                workers, resolver = 1, replay.resolve
+            elif recorder is not None:
+                resolver = recorder.recording_resolver()
+            plan = endpoint_plan.EndpointPlan.build(targets_to_test, tcp=not args.address_mode, workers=workers, resolver=resolver)
+        args.endpoint_plan = plan # Travels with args to --processes workers
+        print(f"Endpoint plan: {plan.summary()}")
+
+    # --- UDP tests: sent up front as one batch, reported in target order during the run ---
+    udp_stats = None
+    if not args.monitor:
+        udp_stats = batch_udp_tests(targets_to_test, args)
+        if udp_stats:
+            print(f"UDP batch: {udp_stats['tests']:,} test(s) as {udp_stats['requests']:,} request(s), {udp_stats['datagrams_sent']:,} datagram(s) sent and "
+                  f"{udp_stats['replies']:,} received in {udp_stats['seconds']:.1f}s")
+        trace_stats = batch_trace_tests(targets_to_test, args)
+        if trace_stats:
+            print(f"Trace batch: {trace_stats['targets']:,} path(s), {trace_stats['probes_sent']:,} probe(s) sent, "
+                  f"{trace_stats['answers']:,} answered in {trace_stats['seconds']:.1f}s")
+
     print(f"\n{Style.BRIGHT}Starting Network Service Tests...{Style.RESET_ALL}")
     if args.output_file:
         print(f"(Results will also be exported to: {Fore.CYAN}{args.output_file}{Style.RESET_ALL})")
@@ -379,74 +1158,29 @@ if __name__ == "__main__":
     all_tests_passed = True
     all_results_data = [] # List to store result dictionaries for export
 
-    for target in targets_to_test:
-        host = target.get('host')
-        services = target.get('services', []) # Default to empty list
-
-        print(f"\nTesting Target: {Fore.CYAN}{host}{Style.RESET_ALL}")
-        target_all_passed = True
-
-        for service in services:
-            result_data = None # Reset for each service test
-            service_lower = service.lower() # Work with lowercase internally
-
-            # --- Service Test Dispatch ---
-            if service_lower == 'ping':
-                result_data = test_ping(host)
-            elif service_lower == 'http':
-                result_data = test_http_https(host, service_type='http', timeout=REQUEST_TIMEOUT)
-            elif service_lower == 'https':
-                result_data = test_http_https(host, service_type='https', timeout=REQUEST_TIMEOUT)
-            elif ':' in service_lower:
-                # Handle format like "tcp:port", "dns:port", etc.
-                try:
-                    service_type, port_str = service_lower.split(':', 1)
-                    # Currently only support 'tcp' type explicitly
-                    if service_type == 'tcp':
-                        result_data = test_tcp_port(host, port_str, timeout=TCP_TIMEOUT)
-                    # Add elif for other types like 'dns' or 'udp' if functions are added
-                    # elif service_type == 'dns':
-                    #    result_data = test_dns_port(host, port_str)
-                    else:
-                        print(f"  [{STATUS_SKIP}]   Unsupported service type '{service_type}' in '{service}' for host {host}")
-                        # Create placeholder for CSV
-                        result_data = {
-                            'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host,
-                            'Service': service, 'Status': 'SKIPPED',
-                            'Details': f'Unsupported service type {service_type}', 'SuccessBool': True
-                        }
-                except ValueError: # Handle case where split fails (e.g., "tcp:")
-                     print(f"  [{STATUS_SKIP}]   Invalid service format '{service}' for host {host}")
-                     # Create placeholder for CSV
-                     result_data = {
-                         'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': host,
-                         'Service': service, 'Status': 'SKIPPED',
-                         'Details': 'Invalid service:port format', 'SuccessBool': True
-                     }
-            else: # Service didn't match known types or format
-                print(f"  [{STATUS_SKIP}]   Unknown service type '{service}' for host {host}")
-                # Create placeholder for CSV
-                result_data = {
-                    'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'TargetHost': host,
-                    'Service': service,
-                    'Status': 'SKIPPED',
-                    'Details': 'Unknown service type',
-                    'SuccessBool': True # Treat skip as not-a-failure
-                }
-
-            # --- Store Result and Check Status ---
-            if result_data:
-                all_results_data.append(result_data)
-                # Check if this specific test failed (and wasn't skipped)
-                if not result_data.get('SuccessBool', True) and result_data.get('Status') != 'SKIPPED':
-                    target_all_passed = False
-                    all_tests_passed = False # Update overall script status
-
-        # --- Optional: Print per-target summary ---
-        status_word = STATUS_SUCCESS if target_all_passed else STATUS_FAILED
-        print(f"Target Status [{Fore.CYAN}{host}{Style.RESET_ALL}]: {status_word}")
-        print("-" * 50) # Separator between hosts
+    if args.monitor:
+        # Exports the state changes (not every probe) below
+        all_tests_passed, all_results_data = run_monitor(targets_to_test, args)
+    else:
+        if args.processes > 1 and len(targets_to_test) > 1:
+            print(f"(Sharding {len(targets_to_test)} targets across {args.processes} processes)")
+            target_outcomes = run_targets_in_processes(targets_to_test, args) # Each probe honours --deadline; no round-robin
+        elif args.job_deadline:
+            target_outcomes = run_targets_by_priority(targets_to_test, args)
+        else:
+            target_outcomes = (run_target_tests(target, args) for target in targets_to_test)
+
+        renderer = progress_render.ProgressRenderer(mode=args.output_mode, unit='tests',
+                                                    total=targets_to_test.count_services())
+        for target, (target_results, target_all_passed) in zip(targets_to_test, target_outcomes):
+            all_results_data.extend(target_results)
+            renderer.advance(len(target['services']), failed=sum(1 for r in target_results
+                                                                 if not r.get('SuccessBool', True) and r.get('Status') != 'SKIPPED'))
+            if not target_all_passed:
+                all_tests_passed = False # Update overall script status
+        renderer.close()
+        if args.trace_failed:
+            all_results_data.extend(trace_failed_hosts(all_results_data, args)) # Exported with the tests they explain
 
     # --- Export Results if requested ---
     if args.output_file:
@@ -459,14 +1193,14 @@ if __name__ == "__main__":
                     print(f"Creating output directory: {output_dir}")
                     os.makedirs(output_dir, exist_ok=True)
 
-                # Write to CSV using DictWriter
-                with open(args.output_file, mode='w', newline='', encoding='utf-8') as csvfile:
-                    # Use extrasaction='ignore' to handle the extra 'SuccessBool' key
-                    writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES, extrasaction='ignore')
-                    writer.writeheader()
-                    writer.writerows(all_results_data) # Ignores 'SuccessBool' automatically
+                # Written in batches; the writer ignores the extra 'SuccessBool' key
+                with profiler.stage('export'), result_writers.open_writer(
+                        args.output_file, CSV_FIELDNAMES, fmt=args.output_format, max_bytes=int(args.rotate_mb * 1024 * 1024),
+                        dictionary_columns=DICTIONARY_COLUMNS) as writer:
+                    writer.write_rows(all_results_data)
 
-                print(f"Export {Fore.GREEN}complete.{Style.RESET_ALL}")
+                parts_note = f" ({len(writer.paths)} part files)" if len(writer.paths) > 1 else ""
+                print(f"Export {Fore.GREEN}complete.{Style.RESET_ALL}{parts_note}")
             except IOError as e:
                 print(f"{STATUS_ERROR} writing to output file '{args.output_file}': {e}")
                 all_tests_passed = False # Mark overall status as failed if export fails
@@ -477,8 +1211,75 @@ if __name__ == "__main__":
             print(f"\n{STATUS_WARNING}: No results to export (list was empty).")
 
 
+    # --- Optional: Change Detection Against a Previous Run ---
+    if args.diff_against:
+        import result_diff # Local module next to this script
+        print(f"\n{Style.BRIGHT}Changes since {Fore.CYAN}{args.diff_against}{Style.RESET_ALL}{Style.BRIGHT}:{Style.RESET_ALL}")
+        change_colors = {result_diff.CHANGE_ADDED: Fore.GREEN, result_diff.CHANGE_REMOVED: Fore.RED,
+                         result_diff.CHANGE_CHANGED: Fore.YELLOW}
+        try:
+            key_columns, ignore_columns = result_diff.NETWORK_RESULT_KEYS
+            with profiler.stage('diff'):
+                changes = list(result_diff.diff_against_file(args.diff_against, all_results_data, CSV_FIELDNAMES,
+                                                             key_columns, ignore_columns))
+            for change, row, changed_fields in changes:
+                details = '; '.join(changed_fields) if changed_fields else f"{row.get('Status')} ({row.get('Details')})"
+                print(f"  {change_colors[change]}{change:<8}{Style.RESET_ALL} {row.get('TargetHost', ''):<25} "
+                      f"{row.get('Service', ''):<10} {details}")
+            counts = {change: sum(1 for c, _, _ in changes if c == change) for change in change_colors}
+            print(f"Added: {counts[result_diff.CHANGE_ADDED]}  Removed: {counts[result_diff.CHANGE_REMOVED]}  "
+                  f"Changed: {counts[result_diff.CHANGE_CHANGED]}")
+            if args.output_file:
+                root, ext = result_writers.split_extension(args.output_file, args.output_format)
+                diff_file = f"{root}_diff{ext if args.output_format == 'csv' and ext else '.csv'}"
+                result_diff.write_diff_csv(changes, CSV_FIELDNAMES, diff_file)
+                print(f"Changes exported to {Fore.CYAN}{diff_file}{Style.RESET_ALL}")
+        except (IOError, ValueError) as e:
+            print(f"{STATUS_ERROR} comparing with '{args.diff_against}': {e}")
+
+    # --- Optional: Profile Report ---
+    if args.profile:
+        profile_file = profile_report_path(args)
+        try:
+            profile = profiler.write_report(profile_file, tool='network_test', targets=len(targets_to_test),
+                                            tests=renderer.total, processes=args.processes,
+                                            endpoint_plan=plan.stats if plan else None)
+            print(f"\n{stage_profiler.format_summary(profile)}")
+            print(f"Profile written to {Fore.CYAN}{profile_file}{Style.RESET_ALL}")
+        except IOError as e:
+            print(f"{STATUS_ERROR} writing profile report '{profile_file}': {e}")
+
+    if recorder is not None:
+        recorder.close()
+
     # --- Final Summary ---
     print(f"\n{Style.BRIGHT}Testing Complete.{Style.RESET_ALL}")
+    if args.job_deadline:
+        skipped = sum(1 for r in all_results_data if r.get('Status') == 'SKIPPED' and r.get('Details') == job_deadline.DEADLINE_DETAILS)
+        if skipped:
+            print(f"{STATUS_WARNING}: Deadline of {args.deadline:g}s reached; {skipped:,} test(s) not started (SKIPPED (deadline)). Results are partial.")
+        else:
+            print(f"All tests finished within the {args.deadline:g}s deadline.")
+
+    if plan:
+        print(f"Endpoint plan: {plan.summary()}")
+        if args.processes == 1:
+            print(f"  {plan.shared:,} result(s) reused from another name with the same address")
+        else:
+            print(f"  (each of the {args.processes} worker processes reuses results among the targets it runs)")
+
+    tls_probe = sys.modules.get('tls_probe') # Only imported if there were tls:<port> tests
+    tls_stats = tls_probe.cert_cache.stats() if tls_probe else {'parsed': 0}
+    if tls_stats['parsed'] and args.processes == 1:
+        print(f"TLS certificates: {tls_stats['parsed']:,} parsed, {tls_stats['hits']:,} handshake(s) served from the fingerprint cache")
+    if replay is not None:
+        if args.processes == 1:
+            print(f"Replay: {replay.summary()}")
+        else:
+            print(f"Replay: each of the {args.processes} worker processes replays the tests it runs on its own virtual clock")
+
+    if recorder is not None:
+        print(f"Recorded {recorder.count:,} network operation(s) to {Fore.CYAN}{args.record}{Style.RESET_ALL}")
     if all_tests_passed:
         print(f"Overall Status: {Fore.GREEN}{Style.BRIGHT}All specified tests passed (and export successful if attempted).{Style.RESET_ALL}")
         sys.exit(0) # Exit code 0 for success
@@ -486,4 +1287,8 @@ if __name__ == "__main__":
         print(f"Overall Status: {Fore.RED}{Style.BRIGHT}One or more tests failed (or export failed).{Style.RESET_ALL}")
         sys.exit(1) # Exit code 1 for failure
 
+
+if __name__ == "__main__":
+    main()
+
 # --- End of Script ---
\ No newline at end of file
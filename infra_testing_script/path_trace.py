@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Parallel Path Tracing (trace) ---
+# Purpose: Shared by network_test.py ('trace' service, --trace-failed) and app.py. A classic
+#          traceroute sends one TTL at a time and waits for each hop; here every TTL of every
+#          target goes out at once, MTR-style in several rounds, and the answers are matched
+#          as they come back:
+#            - probes are UDP datagrams to high ports (BASE_PORT + probe number), one per TTL
+#            - routers answer a probe whose TTL runs out with ICMP Time Exceeded; the target
+#              answers with Port Unreachable, which ends its path
+#            - ICMP errors are read from the socket's error queue (IP_RECVERR, as tracepath
+#              does), so no raw socket and no root are needed; Linux only
+#            - after the first round, a target's probes stop at the hop that reached it
+#          Per hop: the addresses that answered, average RTT and loss across rounds. As with
+#          MTR, loss at a hop that does not carry on to the later hops is usually just a router
+#          rate-limiting its ICMP replies; loss that persists to the target is real.
+#          IPv4 only (names are resolved like the tcp:<port> probe).
+
+import heapq
+import selectors
+import socket
+import struct
+import sys
+import time
+from datetime import datetime
+
+import endpoint_plan # Local module: concurrent name resolution (resolve_names)
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_MAX_HOPS = 30
+DEFAULT_ROUNDS = 3
+DEFAULT_TIMEOUT = 2.0        # Seconds a probe is waited for
+DEFAULT_ROUND_INTERVAL = 0.5 # Seconds between the rounds of one target
+DEFAULT_SEND_RATE = 5000     # Probes per second, all targets together
+MAX_HOPS_LIMIT = 64
+MAX_ROUNDS_LIMIT = 30        # max hops x rounds ports above BASE_PORT are used per target
+BASE_PORT = 33434            # Traditional traceroute base port; nothing should listen from here up
+RECEIVE_BUFFER = 4 * 1024 * 1024
+NOT_SUPPORTED = 'trace needs Linux (IP_RECVERR)'
+
+_IP_RECVERR = getattr(socket, 'IP_RECVERR', 11)
+_SO_EE_ORIGIN_ICMP = 2
+_ICMP_UNREACHABLE = 3 # Time Exceeded (11) comes from routers on the way, which need no special case
+_UNREACHABLE_CODES = {0: 'Network unreachable', 1: 'Host unreachable', 2: 'Protocol unreachable', 3: 'Port unreachable',
+                      9: 'Network prohibited', 10: 'Host prohibited', 13: 'Administratively prohibited'}
+
+
+def supported():
+    return sys.platform.startswith('linux') and hasattr(socket, 'MSG_ERRQUEUE')
+
+
+class Hop:
+    """Answers to the probes of one TTL, over all rounds."""
+    __slots__ = ('sent', 'rtts', 'addresses')
+
+    def __init__(self):
+        self.sent = 0
+        self.rtts = []       # ms, one per answered probe
+        self.addresses = {}  # address -> answers (several with ECMP load balancing)
+
+    def loss(self):
+        return 1.0 - len(self.rtts) / self.sent if self.sent else 0.0
+
+    def label(self):
+        return '/'.join(sorted(self.addresses, key=self.addresses.get, reverse=True)) if self.addresses else '*'
+
+
+class TraceTarget:
+    """Path to one address: hops by TTL, and where (if anywhere) the target answered."""
+
+    def __init__(self, address, max_hops=DEFAULT_MAX_HOPS):
+        self.address = address
+        self.max_hops = max_hops
+        self.hops = {}           # ttl -> Hop
+        self.reached = None      # Lowest TTL the target itself answered
+        self.unreachable = None  # (ttl, reason) of a Destination Unreachable from a router
+
+    def hop(self, ttl):
+        hop = self.hops.get(ttl)
+        if hop is None:
+            hop = self.hops[ttl] = Hop()
+        return hop
+
+    def probe_limit(self):
+        """Highest TTL worth probing in the next round."""
+        if self.reached is not None:
+            return self.reached
+        if self.unreachable is not None:
+            return self.unreachable[0]
+        return self.max_hops
+
+    def record(self, ttl, address, rtt, icmp_type, icmp_code):
+        hop = self.hop(ttl)
+        hop.rtts.append(rtt)
+        hop.addresses[address] = hop.addresses.get(address, 0) + 1
+        if address == self.address:
+            if self.reached is None or ttl < self.reached:
+                self.reached = ttl
+        elif icmp_type == _ICMP_UNREACHABLE and (self.unreachable is None or ttl < self.unreachable[0]):
+            self.unreachable = (ttl, _UNREACHABLE_CODES.get(icmp_code, f"Unreachable (code {icmp_code})"))
+
+    def outcome(self):
+        """(success, details, per-hop timing) for the result row."""
+        end = self.probe_limit() if self.reached or self.unreachable else max((ttl for ttl, hop in self.hops.items() if hop.rtts), default=0)
+        rounds = max((hop.sent for hop in self.hops.values()), default=0)
+        if self.reached is not None:
+            loss = self.hops[self.reached].loss()
+            details = f"Reached in {self.reached} hop(s), {rounds} round(s)"
+            if loss:
+                start = self.reached # MTR reading: loss that carries on to the target starts at the first hop of the run
+                while start > 1 and self.hops.get(start - 1) and self.hops[start - 1].rtts and self.hops[start - 1].loss():
+                    start -= 1
+                details += f"; {loss:.0%} loss at the target, starting at hop {start} ({self.hops[start].label()})"
+        elif self.unreachable is not None:
+            ttl, reason = self.unreachable
+            details = f"{reason} from hop {ttl} ({self.hops[ttl].label()})"
+        elif end:
+            details = f"No reply from the target; last answering hop {end} ({self.hops[end].label()}) of {self.max_hops}, {rounds} round(s)"
+        else:
+            details = f"No reply from any hop within {self.max_hops}, {rounds} round(s)"
+        parts = []
+        for ttl in range(1, end + 1):
+            hop = self.hops.get(ttl)
+            if hop is None or not hop.rtts:
+                parts.append(f"{ttl} *")
+                continue
+            part = f"{ttl} {hop.label()} {sum(hop.rtts) / len(hop.rtts):.1f}ms"
+            if hop.loss():
+                part += f" {hop.loss():.0%}"
+            parts.append(part)
+        if self.reached is None and self.unreachable is None and end < self.max_hops:
+            parts.append(f"{end + 1}-{self.max_hops} *")
+        return self.reached is not None, details, ' | '.join(parts)
+
+
+class TraceBatch:
+    """
+    Traces many targets from one socket in one selector loop: every round of every target is
+    queued at once (rounds round_interval apart) and sent at send_rate. Not thread-safe.
+    """
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, max_hops=DEFAULT_MAX_HOPS, round_interval=DEFAULT_ROUND_INTERVAL,
+                 send_rate=DEFAULT_SEND_RATE):
+        if not 1 <= rounds <= MAX_ROUNDS_LIMIT:
+            raise ValueError(f"rounds must be 1 to {MAX_ROUNDS_LIMIT}")
+        if not 1 <= max_hops <= MAX_HOPS_LIMIT:
+            raise ValueError(f"max_hops must be 1 to {MAX_HOPS_LIMIT}")
+        self.rounds = rounds
+        self.max_hops = max_hops
+        self.round_interval = round_interval
+        self.send_rate = send_rate
+        self.stats = {'targets': 0, 'probes_sent': 0, 'answers': 0, 'unmatched': 0}
+
+    @staticmethod
+    def _open_socket():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_IP, _IP_RECVERR, 1)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        except OSError:
+            pass
+        return sock
+
+    def run(self, targets, timeout):
+        """Traces the TraceTargets; returns when every probe is answered or timeout has passed since it was sent."""
+        targets = list(targets)
+        self.stats['targets'] += len(targets)
+        if not targets:
+            return targets
+        sock = self._open_socket()
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        rounds = [(round_number * self.round_interval, round_number) for round_number in range(self.rounds)]
+        pending = {}    # (address, port) -> (target, ttl, sent at)
+        expiries = []   # (expiry, (address, port))
+        to_send = []    # (target, round, ttl), reversed: popped from the end
+        started, sent, current_ttl = time.perf_counter(), 0, None
+        try:
+            while rounds or to_send or pending:
+                now = time.perf_counter()
+                while rounds and rounds[0][0] <= now - started:
+                    _offset, round_number = rounds.pop(0)
+                    # Target by target, so the probes that hit the shared first hops are spread out
+                    queued = [(target, round_number, ttl) for target in targets for ttl in range(1, target.probe_limit() + 1)]
+                    to_send[:0] = reversed(queued)
+                allowed = len(to_send) if not self.send_rate else int((now - started) * self.send_rate) + 1 - sent
+                while to_send and allowed > 0:
+                    target, round_number, ttl = to_send.pop()
+                    if ttl > target.probe_limit():
+                        continue # The target answered at a lower TTL meanwhile
+                    key = (target.address, BASE_PORT + round_number * self.max_hops + ttl - 1)
+                    if ttl != current_ttl:
+                        sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+                        current_ttl = ttl
+                    if not self._send(sock, key):
+                        to_send.append((target, round_number, ttl))
+                        break
+                    sent_at = time.perf_counter()
+                    target.hop(ttl).sent += 1
+                    pending[key] = (target, ttl, sent_at)
+                    heapq.heappush(expiries, (sent_at + timeout, key))
+                    sent += 1
+                    allowed -= 1
+                # Wait for answers until the next expiry, send slot or round
+                wait = max(0.0, expiries[0][0] - time.perf_counter()) if expiries else 0.05
+                if to_send:
+                    wait = min(wait, 1.0 / self.send_rate if self.send_rate else 0.0)
+                if rounds:
+                    wait = min(wait, max(0.0, started + rounds[0][0] - time.perf_counter()))
+                for _key, _events in selector.select(wait):
+                    self._drain(sock, pending)
+                now = time.perf_counter()
+                while expiries and expiries[0][0] <= now:
+                    _expiry, key = heapq.heappop(expiries)
+                    pending.pop(key, None) # Lost, unless answered already
+        finally:
+            selector.close()
+            sock.close()
+        return targets
+
+    def _send(self, sock, key):
+        """Sends one probe; False if the socket buffer is full. A failed send counts as a lost probe."""
+        for _attempt in range(2):
+            try:
+                sock.sendto(b'', key)
+                self.stats['probes_sent'] += 1
+                return True
+            except BlockingIOError:
+                return False
+            except OSError:
+                continue # An earlier probe's ICMP error reported on this call; send again
+        self.stats['probes_sent'] += 1
+        return True
+
+    def _drain(self, sock, pending):
+        while True:
+            try:
+                _data, ancdata, _flags, key = sock.recvmsg(0, 512, socket.MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError):
+                break
+            received = time.perf_counter()
+            for level, kind, data in ancdata:
+                if level != socket.IPPROTO_IP or kind != _IP_RECVERR or len(data) < 24:
+                    continue
+                _errno, origin, icmp_type, icmp_code = struct.unpack_from('=IBBB', data)
+                if origin != _SO_EE_ORIGIN_ICMP:
+                    continue # Local error (e.g. message too long)
+                probe = pending.pop(key, None)
+                if probe is None:
+                    self.stats['unmatched'] += 1
+                    continue
+                target, ttl, sent_at = probe
+                offender = socket.inet_ntoa(data[20:24]) # sockaddr_in after the 16-byte sock_extended_err
+                target.record(ttl, offender, (received - sent_at) * 1000, icmp_type, icmp_code)
+                self.stats['answers'] += 1
+        while True: # A service listening on a probe port answers with data instead
+            try:
+                _data, key = sock.recvfrom(512)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue
+            probe = pending.pop(key, None)
+            if probe is None:
+                continue
+            target, ttl, sent_at = probe
+            target.record(ttl, key[0], (time.perf_counter() - sent_at) * 1000, None, None)
+            self.stats['answers'] += 1
+
+
+def run_batch(hosts, timeout=DEFAULT_TIMEOUT, batch=None, resolver=socket.gethostbyname):
+    """
+    Traces the paths to hosts (names or IPv4 addresses) together. Hosts that resolve to the same
+    address share one trace. Returns {host: result dictionary} with Service 'trace'.
+    """
+    batch = batch or TraceBatch()
+    hosts = list(dict.fromkeys(hosts))
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    def row(host, status, details, timing=''):
+        return {'Timestamp': timestamp, 'TargetHost': host, 'Service': 'trace', 'Status': status,
+                'Details': details, 'Timing': timing, 'SuccessBool': status != 'FAILED'}
+    if not supported():
+        return {host: row(host, 'SKIPPED', NOT_SUPPORTED) for host in hosts}
+    addresses = endpoint_plan.resolve_names({host.strip().lower() for host in hosts}, resolver=resolver)
+    traces = {}
+    for host in hosts:
+        address = addresses.get(host.strip().lower())
+        if address is not None and address not in traces:
+            traces[address] = TraceTarget(address, batch.max_hops)
+    batch.run(traces.values(), timeout)
+
+    results = {}
+    for host in hosts:
+        address = addresses.get(host.strip().lower())
+        if address is None:
+            results[host] = row(host, 'FAILED', 'DNS Resolution Error')
+            continue
+        ok, details, timing = traces[address].outcome()
+        results[host] = row(host, 'SUCCESS' if ok else 'FAILED', details, timing)
+    return results
+
+
+def trace_result(host, timeout=DEFAULT_TIMEOUT, rounds=DEFAULT_ROUNDS, max_hops=DEFAULT_MAX_HOPS):
+    """Result dictionary for a single trace (a batch of one)."""
+    return run_batch([host], timeout, TraceBatch(rounds=rounds, max_hops=max_hops))[host]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Traces the paths to the given hosts in parallel and prints the hops.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('hosts', nargs='+', help="Host names or IPv4 addresses.")
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument('--max-hops', type=int, default=DEFAULT_MAX_HOPS)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="Seconds a probe is waited for.")
+    parser.add_argument('--send-rate', type=int, default=DEFAULT_SEND_RATE, help="Probes per second (0 = unlimited).")
+    bench_args = parser.parse_args()
+
+    batch = TraceBatch(rounds=bench_args.rounds, max_hops=bench_args.max_hops, send_rate=bench_args.send_rate)
+    start = time.perf_counter()
+    results = run_batch(bench_args.hosts, bench_args.timeout, batch)
+    elapsed = time.perf_counter() - start
+    for host, result in results.items():
+        print(f"{host}: {result['Status']} ({result['Details']})")
+        for hop in filter(None, result['Timing'].split(' | ')):
+            print(f"  {hop}")
+    print(f"{batch.stats['targets']:,} path(s), {batch.stats['probes_sent']:,} probe(s) sent, {batch.stats['answers']:,} answered "
+          f"in {elapsed:.2f}s")
+    unanswered = batch.stats['probes_sent'] - batch.stats['answers']
+    print(f"Hop by hop, one path after another, the {unanswered:,} unanswered probe(s) alone would wait about "
+          f"{unanswered * bench_args.timeout:,.0f}s")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- In-Flight Probe Coalescing for the Flask Backend ---
+# Purpose: When several requests test the same (host, service) at the same time, only one
+#          probe is sent and every waiting request gets its result ("single flight").
+#          Finished results are also kept for a short freshness window in a small LRU
+#          cache, so bursts of overlapping CSVs during an incident do not multiply the
+#          outbound probe load.
+
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_FRESHNESS_SECONDS = 10.0 # How long a finished probe result is reused (0 disables the cache)
+DEFAULT_MAX_ENTRIES = 4096       # LRU size bound for finished results
+
+
+class WaitTimeout(Exception):
+    """A caller's wait for a probe another caller is running ran out (see ProbeCoalescer.run)."""
+
+
+def _copy(result):
+    if isinstance(result, list):
+        return [dict(item) for item in result]
+    return dict(result) if result is not None else None
+
+
+class _Flight:
+    """One probe in progress; waiters block on `done` until the leader stores the outcome."""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ProbeCoalescer:
+    """
+    Thread-safe single-flight layer with an LRU freshness cache.
+    Results are dicts (or lists of dicts); every caller gets its own shallow copies.
+    """
+
+    def __init__(self, freshness_seconds=DEFAULT_FRESHNESS_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.freshness_seconds = freshness_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._in_flight = {}           # key -> _Flight
+        self._fresh = OrderedDict()    # key -> (finished monotonic time, result), oldest first
+        self.probes = 0                # Probes actually executed
+        self.shared = 0                # Callers that joined a probe already in flight
+        self.cache_hits = 0            # Callers served from the freshness window
+
+    def run(self, key, probe, wait=None, share=True):
+        """
+        Returns probe()'s result for key, reusing an in-flight or recently finished probe.
+        wait: at most this many seconds spent waiting for an in-flight probe, then WaitTimeout.
+        share=False: a probe this caller has to run itself is neither joined by others nor cached
+        (e.g. one whose timeout a job deadline has cut short); reusing other callers' probes is fine.
+        """
+        with self._lock:
+            cached = self._fresh.get(key)
+            if cached is not None:
+                if time.monotonic() - cached[0] < self.freshness_seconds:
+                    self._fresh.move_to_end(key)
+                    self.cache_hits += 1
+                    return _copy(cached[1])
+                del self._fresh[key]
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                self.probes += 1
+                if share:
+                    flight = self._in_flight[key] = _Flight()
+            else:
+                self.shared += 1
+
+        if not leader:
+            if not flight.done.wait(wait):
+                raise WaitTimeout(f"probe still running after {wait:.1f}s")
+            if flight.error is not None:
+                raise flight.error
+            return _copy(flight.result)
+        if not share:
+            return probe()
+
+        try:
+            flight.result = probe()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if flight.error is None and self.freshness_seconds > 0:
+                    self._fresh[key] = (time.monotonic(), flight.result)
+                    self._fresh.move_to_end(key)
+                    while len(self._fresh) > self.max_entries:
+                        self._fresh.popitem(last=False)
+            flight.done.set()
+        return _copy(flight.result)
+
+    def stats(self):
+        with self._lock:
+            return {"probes": self.probes, "shared_in_flight": self.shared, "cache_hits": self.cache_hits,
+                    "cached_results": len(self._fresh), "freshness_seconds": self.freshness_seconds}
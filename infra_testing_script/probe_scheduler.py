@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Adaptive Probe Scheduling (--monitor) ---
+# Purpose: Used by network_test.py --monitor. Decides when each (target, service) check runs
+#          next, so that thousands of stable checks cost little while the few that flap are
+#          watched closely:
+#            - each success in a row past SUCCESS_STREAK multiplies the check's interval by
+#              BACKOFF_FACTOR, up to max_interval (the bound on how late a change is noticed)
+#            - a failure, a change of state, or a latency anomaly (slower than LATENCY_FACTOR x
+#              the check's running average) drops it back to min_interval
+#            - a check that keeps failing backs off too, but only to FAILING_MAX_FACTOR x
+#              min_interval, so its recovery is seen quickly
+#            - a token bucket caps the probes started per second across all checks (max_rate);
+#              checks that come due while the budget is used up wait their turn, oldest first
+#          Pure bookkeeping: callers pass in the clock and run the probes themselves.
+
+import heapq
+import random
+import time
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_MIN_INTERVAL = 10.0   # Seconds; new, failing and changed checks
+DEFAULT_MAX_INTERVAL = 300.0  # Seconds; a long-stable check is probed at least this often
+DEFAULT_MAX_RATE = 50.0       # Probes started per second, all checks together
+BACKOFF_FACTOR = 2.0
+SUCCESS_STREAK = 3            # Successes in a row before the interval starts growing
+FAILING_MAX_FACTOR = 4.0      # A failing check backs off to at most this x min_interval
+LATENCY_FACTOR = 3.0          # Slower than this x the running average is an anomaly...
+LATENCY_MIN_SAMPLES = 5       # ...once the average has this many samples
+LATENCY_MIN_ANOMALY = 0.05    # ...and the slowdown is at least this many seconds
+LATENCY_EWMA_WEIGHT = 0.2
+JITTER = 0.1                  # +/- fraction applied to every interval, so checks do not march in step
+
+CHANGE_UP = 'UP'
+CHANGE_DOWN = 'DOWN'
+CHANGE_SLOW = 'SLOW'
+
+
+class _Check:
+    __slots__ = ('interval', 'due', 'streak', 'up', 'latency', 'samples', 'probes')
+
+    def __init__(self, interval, due):
+        self.interval = interval
+        self.due = due
+        self.streak = 0     # Same result in a row
+        self.up = None      # Unknown until the first result
+        self.latency = 0.0  # Running average of successful probes (seconds)
+        self.samples = 0
+        self.probes = 0
+
+
+class AdaptiveScheduler:
+    """
+    Next-due times for a set of checks (any hashable keys) plus a global probe budget.
+    take_due() hands out the checks to probe now; record() feeds back each result and
+    reports whether the check changed state. Not thread-safe: call it from one thread.
+    """
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL, max_rate=DEFAULT_MAX_RATE,
+                 jitter=JITTER, rng=None):
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Need 0 < min_interval <= max_interval")
+        if max_rate <= 0:
+            raise ValueError("max_rate must be positive")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_rate = max_rate
+        self.jitter = jitter
+        self._random = (rng or random.Random()).random
+        self._checks = {}
+        self._heap = []   # (due, seq, key) of checks that are not in flight
+        self._seq = 0
+        self._tokens = min(max_rate, 1.0)
+        self._refilled = None
+        self.stats = {'probes': 0, 'changes': 0, 'anomalies': 0, 'late_probes': 0, 'max_late_s': 0.0}
+
+    def __len__(self):
+        return len(self._checks)
+
+    def add(self, key, now):
+        """Registers a check, due right away (the budget spreads out the first round)."""
+        if key in self._checks:
+            return
+        check = self._checks[key] = _Check(self.min_interval, now)
+        self._push(key, check)
+
+    def _push(self, key, check):
+        self._seq += 1
+        heapq.heappush(self._heap, (check.due, self._seq, key))
+
+    def _refill(self, now):
+        if self._refilled is not None:
+            self._tokens = min(max(self.max_rate, 1.0), self._tokens + (now - self._refilled) * self.max_rate)
+        self._refilled = now
+
+    def take_due(self, now, limit=None):
+        """Keys of checks to probe now: due, oldest first, within the budget and at most limit of them."""
+        self._refill(now)
+        keys = []
+        while self._heap and self._heap[0][0] <= now and self._tokens >= 1.0 and (limit is None or len(keys) < limit):
+            due, _seq, key = heapq.heappop(self._heap)
+            self._tokens -= 1.0
+            late = now - due
+            if late > 1.0:
+                self.stats['late_probes'] += 1
+            if late > self.stats['max_late_s']:
+                self.stats['max_late_s'] = late
+            keys.append(key)
+        self.stats['probes'] += len(keys)
+        return keys
+
+    def next_wakeup(self, now):
+        """Seconds until take_due() can return something (None if every check is in flight)."""
+        if not self._heap:
+            return None
+        wait = max(0.0, self._heap[0][0] - now)
+        if self._tokens < 1.0:
+            wait = max(wait, (1.0 - self._tokens) / self.max_rate)
+        return wait
+
+    def record(self, key, success, latency, now):
+        """
+        Feeds back one probe result and schedules the check's next probe. Returns CHANGE_UP /
+        CHANGE_DOWN when the check changed state (the first result counts as a change only if it is
+        a failure), CHANGE_SLOW for a latency anomaly, else None.
+        """
+        check = self._checks[key]
+        check.probes += 1
+        change = None
+        if check.up is None or check.up != success:
+            if check.up is not None or not success:
+                change = CHANGE_UP if success else CHANGE_DOWN
+            check.up, check.streak = success, 1
+            check.interval = self.min_interval
+        else:
+            check.streak += 1
+            if success and check.samples >= LATENCY_MIN_SAMPLES and latency > check.latency * LATENCY_FACTOR \
+                    and latency - check.latency >= LATENCY_MIN_ANOMALY:
+                change = CHANGE_SLOW
+                self.stats['anomalies'] += 1
+                check.interval, check.streak = self.min_interval, 1
+            elif check.streak > SUCCESS_STREAK:
+                ceiling = self.max_interval if success else min(self.max_interval, self.min_interval * FAILING_MAX_FACTOR)
+                check.interval = min(ceiling, check.interval * BACKOFF_FACTOR)
+        if success:
+            check.latency = latency if not check.samples else check.latency + LATENCY_EWMA_WEIGHT * (latency - check.latency)
+            check.samples += 1
+        if change in (CHANGE_UP, CHANGE_DOWN):
+            self.stats['changes'] += 1
+        check.due = now + check.interval * (1.0 + self.jitter * (2.0 * self._random() - 1.0))
+        self._push(key, check)
+        return change
+
+    def interval(self, key):
+        return self._checks[key].interval
+
+    def is_up(self, key):
+        return self._checks[key].up
+
+    def count_down(self):
+        """Checks whose latest result was a failure."""
+        return sum(1 for check in self._checks.values() if check.up is False)
+
+    def summary(self, elapsed):
+        """Probe volume against probing every check every min_interval for the same time."""
+        fixed = len(self._checks) * max(1.0, elapsed / self.min_interval)
+        probes = self.stats['probes']
+        return (f"{probes:,} probe(s) in {elapsed:,.0f}s ({probes / elapsed if elapsed else 0:,.1f}/s) for {len(self._checks):,} check(s); "
+                f"a fixed {self.min_interval:g}s interval would need {fixed:,.0f} ({fixed / probes if probes else 0:,.1f}x more). "
+                f"{self.stats['changes']:,} state change(s), {self.stats['anomalies']:,} latency anomal(ies), "
+                f"{self.stats['late_probes']:,} probe(s) delayed >1s by the budget (max {self.stats['max_late_s']:,.1f}s)")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulates --monitor scheduling on virtual time: probe volume and "
+                                                 "how late state changes are noticed.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--checks', type=int, default=10000, help="Simulated (target, service) checks.")
+    parser.add_argument('--flapping', type=int, default=20, help="Checks that change state now and then.")
+    parser.add_argument('--flap-every', type=float, default=600.0, help="Mean seconds between changes of a flapping check.")
+    parser.add_argument('--hours', type=float, default=2.0, help="Simulated duration.")
+    parser.add_argument('--min-interval', type=float, default=DEFAULT_MIN_INTERVAL)
+    parser.add_argument('--max-interval', type=float, default=DEFAULT_MAX_INTERVAL)
+    parser.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE)
+    parser.add_argument('--seed', type=int, default=1)
+    bench_args = parser.parse_args()
+
+    rng = random.Random(bench_args.seed)
+    scheduler = AdaptiveScheduler(bench_args.min_interval, bench_args.max_interval, bench_args.max_rate, rng=rng)
+    for key in range(bench_args.checks):
+        scheduler.add(key, 0.0)
+    # Flapping checks: the time their true state next flips; stable checks never flip
+    true_up = [True] * bench_args.checks
+    flips = {key: rng.expovariate(1.0 / bench_args.flap_every) for key in range(bench_args.flapping)}
+    changed_at = {}   # key -> virtual time of a flip not yet noticed
+    delays = []
+    end, now, step = bench_args.hours * 3600.0, 0.0, 0.05
+    started = time.perf_counter()
+    while now < end:
+        for key, at in flips.items():
+            if at <= now:
+                true_up[key] = not true_up[key]
+                changed_at.setdefault(key, at)
+                flips[key] = now + rng.expovariate(1.0 / bench_args.flap_every)
+        for key in scheduler.take_due(now):
+            up = true_up[key]
+            if key in changed_at and up != scheduler.is_up(key):
+                delays.append(now - changed_at.pop(key))
+            elif key in changed_at:
+                changed_at.pop(key) # Flipped back before it was seen
+            scheduler.record(key, up, 0.01, now)
+        wait = scheduler.next_wakeup(now)
+        now += max(step, wait if wait is not None else step)
+    print(scheduler.summary(end))
+    if delays:
+        delays.sort()
+        print(f"Detection delay over {len(delays)} change(s): median {delays[len(delays) // 2]:.1f}s, "
+              f"p95 {delays[int(len(delays) * 0.95)]:.1f}s, max {delays[-1]:.1f}s (bound: max interval {bench_args.max_interval:g}s + budget delay)")
+    print(f"Simulated {bench_args.hours:g}h in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Console Progress Rendering ---
+# Purpose: Shared by network_test.py and _nslookup_tool.py. Per-probe result lines are
+#          buffered and written in batches at a fixed refresh rate instead of one print (and,
+#          on a terminal, one write syscall) per probe. Three modes:
+#            lines    - every result line, as before (default)
+#            progress - one status line redrawn in place: counts, rate, ETA, failures so far
+#            quiet    - only the lines of failed probes
+#          When the output is not a terminal (CI logs), the progress status is printed as a
+#          plain line every LOG_REFRESH_SECONDS instead of being redrawn.
+
+import sys
+import time
+
+# --- Configuration (Defaults & Constants) ---
+MODE_LINES = 'lines'
+MODE_PROGRESS = 'progress'
+MODE_QUIET = 'quiet'
+
+REFRESH_SECONDS = 0.2      # Buffer flush / status redraw interval on a terminal
+LOG_REFRESH_SECONDS = 10.0 # Status line interval when the output is a file or pipe
+MAX_BUFFERED_LINES = 2000  # Flush early when this many lines are waiting
+
+
+def format_duration(seconds):
+    """E.g. 42s, 3m07s, 1h02m."""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class ProgressRenderer:
+    """
+    Buffers per-item console lines and tracks completed/failed counts for the status line.
+    Output goes to `stream`, or to whatever sys.stdout is at write time (so redirect_stdout
+    works). Not thread-safe: call it from the thread that reports results.
+    """
+
+    def __init__(self, mode=MODE_LINES, total=None, unit='probes', failure_label='failed', stream=None,
+                 refresh_seconds=None):
+        self.mode = mode
+        self.total = total
+        self.unit = unit
+        self.failure_label = failure_label
+        self._stream = stream
+        isatty = getattr(self.stream, 'isatty', None)
+        self._tty = bool(isatty and isatty())
+        self.refresh_seconds = refresh_seconds or (REFRESH_SECONDS if self._tty else LOG_REFRESH_SECONDS)
+        self.completed = 0
+        self.failed = 0
+        self._started = time.monotonic()
+        self._next_refresh = self._started + (REFRESH_SECONDS if mode == MODE_LINES else self.refresh_seconds)
+        self._buffer = []
+        self._status_width = 0 # Length of the status line currently on screen (tty only)
+
+    @property
+    def stream(self):
+        return self._stream or sys.stdout
+
+    def detail(self, text, failed=False):
+        """One result line: always shown in lines mode, only when failed in quiet mode, never in progress mode."""
+        if self.mode == MODE_PROGRESS or (self.mode == MODE_QUIET and not failed):
+            return
+        self._buffer.append(text)
+        if len(self._buffer) >= MAX_BUFFERED_LINES or time.monotonic() >= self._next_refresh:
+            self.flush()
+
+    def write(self, text):
+        """Already rendered output (e.g. captured from a worker process); shown in every mode."""
+        if text:
+            self._buffer.append(text[:-1] if text.endswith('\n') else text)
+
+    def advance(self, count=1, failed=0):
+        """Records finished items and redraws the status line when the refresh interval has passed."""
+        self.completed += count
+        self.failed += failed
+        if time.monotonic() >= self._next_refresh:
+            self.flush()
+
+    def status_line(self):
+        elapsed = time.monotonic() - self._started
+        rate = self.completed / elapsed if elapsed > 0 else 0.0
+        if self.total:
+            parts = [f"{self.completed:,}/{self.total:,} {self.unit} ({self.completed * 100 / self.total:.0f}%)"]
+        else:
+            parts = [f"{self.completed:,} {self.unit}"]
+        parts.append(f"{rate:,.0f}/s")
+        parts.append(f"{self.failed:,} {self.failure_label}")
+        if self.total and rate > 0 and self.completed < self.total:
+            parts.append(f"ETA {format_duration((self.total - self.completed) / rate)}")
+        parts.append(f"elapsed {format_duration(elapsed)}")
+        return " | ".join(parts)
+
+    def _clear_status(self, stream):
+        if self._status_width:
+            stream.write('\r' + ' ' * self._status_width + '\r')
+            self._status_width = 0
+
+    def flush(self, final=False):
+        """Writes buffered lines (and the status line in progress mode) in a single write."""
+        self._next_refresh = time.monotonic() + (REFRESH_SECONDS if self.mode == MODE_LINES else self.refresh_seconds)
+        stream = self.stream
+        if self._buffer:
+            self._clear_status(stream)
+            self._buffer.append('')
+            stream.write('\n'.join(self._buffer))
+            self._buffer.clear()
+        # No status before the first item: worker processes only buffer lines and never advance()
+        if self.mode == MODE_PROGRESS and (self.completed or final):
+            line = self.status_line()
+            if self._tty:
+                stream.write('\r' + line.ljust(self._status_width) + ('\n' if final else ''))
+                self._status_width = 0 if final else len(line)
+            else:
+                stream.write(line + '\n')
+        stream.flush()
+
+    def close(self):
+        """Flushes everything and ends the status line; call before printing anything else."""
+        self.flush(final=True)
+
+
+# --- Benchmark ---
+
+def run_benchmark(count, stream):
+    """Times rendering `count` result lines with print() per line vs. each renderer mode. Returns {label: seconds}."""
+    lines = [(f"  [TCP:443 ] host{i:06d}.bench.example      -> {'FAILED' if i % 50 == 0 else 'SUCCESS'} "
+              f"(Port 443 is {'closed' if i % 50 == 0 else 'open'})", i % 50 == 0) for i in range(count)]
+    timings = {}
+
+    start = time.perf_counter()
+    for text, _failed in lines:
+        print(text, file=stream)
+    stream.flush()
+    timings['print per line'] = time.perf_counter() - start
+
+    for mode in (MODE_LINES, MODE_PROGRESS, MODE_QUIET):
+        renderer = ProgressRenderer(mode=mode, total=count, stream=stream)
+        start = time.perf_counter()
+        for text, failed in lines:
+            renderer.detail(text, failed)
+            renderer.advance(1, int(failed))
+        renderer.close()
+        timings[f"renderer --{mode}" if mode != MODE_LINES else "renderer (lines)"] = time.perf_counter() - start
+    return timings
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import threading
+    parser = argparse.ArgumentParser(
+        description="Benchmark console rendering of probe results. Output goes to a pseudo-terminal "
+                    "(line buffered like an interactive console) when available.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+    parser.add_argument("-n", "--count", type=int, default=100000, help="Number of result lines to render.")
+    parser.add_argument("--devnull", action="store_true", help="Write to os.devnull instead of a pseudo-terminal.")
+    bench_args = parser.parse_args()
+
+    if bench_args.devnull or not hasattr(os, 'openpty'):
+        target, drain = open(os.devnull, 'w'), None
+    else:
+        master_fd, slave_fd = os.openpty()
+        target = open(slave_fd, 'w', buffering=1, encoding='utf-8') # Line buffered, like stdout on a terminal
+        def drain():
+            try:
+                while os.read(master_fd, 65536):
+                    pass
+            except OSError:
+                pass
+        threading.Thread(target=drain, daemon=True).start()
+
+    results = run_benchmark(bench_args.count, target)
+    target.close()
+    baseline = results['print per line']
+    print(f"Rendering {bench_args.count:,} result lines ({'pseudo-terminal' if drain else 'devnull'}):")
+    for label, seconds in results.items():
+        print(f"  {label:<20} {seconds:7.3f}s  ({baseline / seconds:5.1f}x)")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- HTTP Response Compression for the Flask Backend ---
+# Purpose: Used by app.py (after_request hook). Compresses JSON / CSV / text responses with
+#          Brotli or gzip, whichever the client prefers in its Accept-Encoding header (Brotli
+#          when both are equally acceptable). Result rows repeat the same keys, hosts and
+#          status words, so large /test and /jobs/<id>/results bodies shrink by 10x or more,
+#          which matters over slow links between sites. Small bodies, streamed responses and
+#          responses that already carry a Content-Encoding are left alone.
+
+# --- Optional Libraries ---
+# Brotli needs 'brotli' (pip install brotli) or 'brotlicffi'; without it only gzip is offered.
+
+import gzip
+
+# --- Configuration (Defaults & Constants) ---
+MIN_COMPRESS_BYTES = 1024 # Smaller bodies are sent as-is (headers would eat the saving)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5        # 0-11; 5 is close to gzip -6 in speed and noticeably smaller
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv', 'text/plain', 'text/html')
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',) # In order of preference
+
+
+def negotiate_encoding(accept_encoding, supported=SUPPORTED_ENCODINGS):
+    """
+    Content coding to use for an Accept-Encoding header value, or None for identity.
+    Honours q-values (q=0 refuses a coding) and '*'; ties go to the order of `supported`.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding):
+    """data (bytes) compressed with 'br' or 'gzip'."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0) # mtime=0: same bytes for the same body
+    raise ValueError(f"Unsupported content coding '{encoding}'")
+
+
+def compress_response(response, accept_encoding, min_bytes=MIN_COMPRESS_BYTES):
+    """Compresses a Flask/Werkzeug response in place when worthwhile; returns the response."""
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add('Accept-Encoding') # Caches must key on it even when this body is not compressed
+    if not 200 <= response.status_code < 300 or response.status_code == 204:
+        return response
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < min_bytes:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    if response.headers.get('ETag'): # A strong ETag names the uncompressed bytes; keep it but mark it weak
+        tag, weak = response.get_etag()
+        response.set_etag(tag, weak=True)
+    return response
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Compares response sizes and compression times for a synthetic results payload.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help="Result rows in the payload.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per encoding (best time is reported).")
+    bench_args = parser.parse_args()
+
+    statuses = ('SUCCESS', 'SUCCESS', 'SUCCESS', 'FAILED', 'SKIPPED')
+    services = ('ping', 'https', 'http', 'tcp:22', 'tcp:443')
+    payload = json.dumps({"job_id": "0" * 32, "status": "DONE", "results": [
+        {"Timestamp": f"2024-01-01 12:{i // 60 % 60:02d}:{i % 60:02d}", "TargetHost": f"host{i % 5000}.site{i % 7}.example.net",
+         "Service": services[i % len(services)], "Status": statuses[i % len(statuses)],
+         "Details": "Connection OK" if i % 5 < 3 else "Connection timed out", "Timing": f"{(i * 37) % 900 / 10:.1f}ms"}
+        for i in range(bench_args.rows)]}).encode('utf-8')
+
+    print(f"Payload: {bench_args.rows} rows, {len(payload) / 1e6:.2f} MB uncompressed")
+    for encoding in SUPPORTED_ENCODINGS:
+        best = None
+        for _ in range(bench_args.repeat):
+            start = time.perf_counter()
+            body = compress(payload, encoding)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"  {encoding:<5} {len(body) / 1e6:8.2f} MB  ({len(payload) / len(body):5.1f}x)  {best * 1000:8.1f} ms")
+    if brotli is None:
+        print("  (br skipped: pip install brotli)")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Purpose: Change detection between two result sets (DNS lookup or network test CSVs).
+#          Streams both sides through a hash join on a key (e.g. Input+LookupType or
+#          TargetHost+Service) and reports only ADDED, REMOVED and CHANGED rows.
+#          Large inputs are hash-partitioned into temporary bucket files first, so only
+#          one bucket of the previous run is held in memory at a time.
+
+import csv
+import math
+import os
+import sys
+import tempfile
+import zlib
+from collections import deque
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_MEMORY_BUDGET_MB = 32 # CSV bytes of the previous run held in memory per partition
+MAX_PARTITIONS = 256          # Keeps the number of open bucket files reasonable
+
+CHANGE_ADDED = 'ADDED'
+CHANGE_REMOVED = 'REMOVED'
+CHANGE_CHANGED = 'CHANGED'
+
+# Well-known result layouts: (key columns, columns never compared)
+DNS_RESULT_KEYS = (('Input', 'LookupType'), ('FromCache',))
+NETWORK_RESULT_KEYS = (('TargetHost', 'Service'), ('Timestamp', 'Timing'))
+
+
+def read_csv_rows(filepath):
+    """Yields each row of a CSV file as a dict. Raises OSError/ValueError for unreadable files."""
+    with open(filepath, mode='r', encoding='utf-8', newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        if not reader.fieldnames:
+            raise ValueError(f"'{filepath}' has no header row")
+        yield from reader
+
+
+def read_csv_header(filepath):
+    """Returns the header row of a CSV file (empty list for an empty file)."""
+    with open(filepath, mode='r', encoding='utf-8', newline='') as csvfile:
+        return next(csv.reader(csvfile), [])
+
+
+def _row_key(row, key_columns):
+    return tuple((row.get(col) or '').strip() for col in key_columns)
+
+
+def _changed_fields(previous, current, compare_columns):
+    """Returns 'Col: old -> new' strings for every compared column that differs."""
+    changes = []
+    for col in compare_columns:
+        old, new = previous.get(col) or '', current.get(col) or ''
+        if old != new:
+            changes.append(f"{col}: {old} -> {new}")
+    return changes
+
+
+def _join_in_memory(previous_rows, current_rows, key_columns, compare_columns):
+    """Hash join of one partition: build on the previous rows, probe with the current ones."""
+    build = {}
+    for row in previous_rows:
+        build.setdefault(_row_key(row, key_columns), deque()).append(row)
+    for row in current_rows:
+        matches = build.get(_row_key(row, key_columns))
+        if not matches:
+            yield CHANGE_ADDED, row, []
+            continue
+        previous = matches.popleft() # Duplicate keys are paired up in file order
+        changes = _changed_fields(previous, row, compare_columns)
+        if changes:
+            yield CHANGE_CHANGED, row, changes
+    for leftovers in build.values():
+        for row in leftovers:
+            yield CHANGE_REMOVED, row, []
+
+
+def _spill(rows, fieldnames, key_columns, partitions, prefix, tmp_dir):
+    """Writes rows into `partitions` bucket files by key hash. Returns the file paths."""
+    paths = [os.path.join(tmp_dir, f"{prefix}_{i}.csv") for i in range(partitions)]
+    files = [open(path, mode='w', encoding='utf-8', newline='') for path in paths]
+    try:
+        writers = [csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore') for f in files]
+        for writer in writers:
+            writer.writeheader()
+        for row in rows:
+            bucket = zlib.crc32('\x1f'.join(_row_key(row, key_columns)).encode('utf-8')) % partitions
+            writers[bucket].writerow(row)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def diff_rows(previous_rows, current_rows, key_columns, compare_columns,
+              previous_fieldnames=None, current_fieldnames=None, partitions=1, tmp_dir=None):
+    """
+    Yields (change, row, changed_fields) for rows that differ between two iterables of dicts.
+    change is ADDED/REMOVED/CHANGED; row is the current row (previous row for REMOVED) and
+    changed_fields lists 'Col: old -> new' for CHANGED rows.
+    With partitions > 1 both sides are first spilled to hash buckets on disk (fieldnames are
+    then required) so memory is bounded by one bucket of previous rows.
+    """
+    if partitions <= 1:
+        yield from _join_in_memory(previous_rows, current_rows, key_columns, compare_columns)
+        return
+    with tempfile.TemporaryDirectory(prefix='result_diff_', dir=tmp_dir) as work_dir:
+        previous_paths = _spill(previous_rows, previous_fieldnames, key_columns, partitions, 'previous', work_dir)
+        current_paths = _spill(current_rows, current_fieldnames, key_columns, partitions, 'current', work_dir)
+        for previous_path, current_path in zip(previous_paths, current_paths):
+            yield from _join_in_memory(read_csv_rows(previous_path), read_csv_rows(current_path),
+                                       key_columns, compare_columns)
+
+
+def partitions_for(filepath, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """Number of hash partitions needed to keep one partition of filepath within the budget."""
+    size = os.path.getsize(filepath)
+    return max(1, min(MAX_PARTITIONS, math.ceil(size / (memory_budget_mb * 1024 * 1024))))
+
+
+def diff_against_file(previous_path, current_rows, current_fieldnames, key_columns, ignore_columns=(),
+                      memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """
+    Diffs current_rows (an iterable of dicts with current_fieldnames) against a previous
+    results CSV. Columns outside the key and ignore lists that exist in both are compared.
+    Returns a generator of (change, row, changed_fields).
+    """
+    previous_fieldnames = read_csv_header(previous_path)
+    missing = [col for col in key_columns if col not in previous_fieldnames]
+    if missing:
+        raise ValueError(f"'{previous_path}' is missing key column(s): {', '.join(missing)}")
+    compare_columns = [col for col in current_fieldnames
+                       if col in previous_fieldnames and col not in key_columns and col not in ignore_columns]
+    return diff_rows(read_csv_rows(previous_path), current_rows, key_columns, compare_columns,
+                     previous_fieldnames=previous_fieldnames, current_fieldnames=current_fieldnames,
+                     partitions=partitions_for(previous_path, memory_budget_mb))
+
+
+def write_diff_csv(changes, fieldnames, output_path):
+    """
+    Streams (change, row, changed_fields) tuples into a CSV with 'Change' and 'ChangedFields'
+    columns around the result columns. Returns a dict of counts per change type.
+    """
+    counts = {CHANGE_ADDED: 0, CHANGE_REMOVED: 0, CHANGE_CHANGED: 0}
+    with open(output_path, mode='w', encoding='utf-8', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=['Change'] + list(fieldnames) + ['ChangedFields'],
+                                extrasaction='ignore')
+        writer.writeheader()
+        for change, row, changed_fields in changes:
+            counts[change] += 1
+            writer.writerow(dict(row, Change=change, ChangedFields='; '.join(changed_fields)))
+    return counts
+
+
+# --- Standalone Usage: diff two existing result files ---
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Show only added, removed and changed rows between two DNS lookup or network test result CSVs.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('previous', help='Older results CSV.')
+    parser.add_argument('current', help='Newer results CSV.')
+    parser.add_argument('--keys', help='Comma-separated key columns. Detected from the header if omitted.')
+    parser.add_argument('--ignore', default='', help='Comma-separated columns not to compare.')
+    parser.add_argument('--output-file', help='Write the diff to this CSV instead of the console.')
+    parser.add_argument('--memory-budget-mb', type=float, default=DEFAULT_MEMORY_BUDGET_MB,
+                        help='Approximate CSV bytes of the previous file held in memory at once.')
+    args = parser.parse_args()
+
+    try:
+        header = read_csv_header(args.current)
+        if args.keys:
+            keys, ignore = tuple(k.strip() for k in args.keys.split(',')), ()
+        elif 'TargetHost' in header:
+            keys, ignore = NETWORK_RESULT_KEYS
+        else:
+            keys, ignore = DNS_RESULT_KEYS
+        ignore = tuple(ignore) + tuple(c.strip() for c in args.ignore.split(',') if c.strip())
+        changes = diff_against_file(args.previous, read_csv_rows(args.current), header, keys, ignore,
+                                    memory_budget_mb=args.memory_budget_mb)
+        if args.output_file:
+            counts = write_diff_csv(changes, header, args.output_file)
+            print(f"Wrote diff to '{args.output_file}'")
+        else:
+            counts = {CHANGE_ADDED: 0, CHANGE_REMOVED: 0, CHANGE_CHANGED: 0}
+            for change, row, changed_fields in changes:
+                counts[change] += 1
+                detail = '; '.join(changed_fields)
+                print(f"{change:<8} {' / '.join(_row_key(row, keys))}" + (f"  ({detail})" if detail else ""))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Added: {counts[CHANGE_ADDED]}  Removed: {counts[CHANGE_REMOVED]}  Changed: {counts[CHANGE_CHANGED]}")
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Result Export Writers ---
+# Purpose: Shared by network_test.py, app.py and _nslookup_tool.py. One writer interface
+#          for every export format, selected by name or by the output file extension:
+#            csv, csv.gz, csv.zst   - CSV, optionally gzip or Zstandard compressed
+#            jsonl, jsonl.gz        - one JSON object per row
+#            parquet                - columnar, with dictionary-encoded low-cardinality
+#                                     columns (host, service, status, ...)
+#          Rows are collected into batches and written a batch at a time. With max_bytes
+#          set, output rotates to a new part file (results.1.csv.gz, results.2.csv.gz, ...)
+#          once a part reaches about that size; every part is a complete file on its own.
+
+# --- Optional Libraries ---
+# csv.zst needs 'zstandard' (pip install zstandard) unless Python has compression.zstd (3.14+),
+# parquet needs 'pyarrow' (pip install pyarrow). Both are imported only when used.
+
+import csv
+import gzip
+import io
+import json
+import os
+
+# --- Configuration (Defaults & Constants) ---
+FORMATS = ('csv', 'csv.gz', 'csv.zst', 'jsonl', 'jsonl.gz', 'parquet')
+DEFAULT_FORMAT = 'csv'
+DEFAULT_BATCH_ROWS = 10000 # Rows buffered per write (and per Parquet row group)
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+class ExportFormatError(Exception):
+    """Unknown format, or the library a format needs is not installed."""
+
+
+def format_for_path(path, default=DEFAULT_FORMAT):
+    """Export format implied by the file extension (longest match first), else default."""
+    lower = path.lower()
+    for fmt in sorted(FORMATS, key=len, reverse=True):
+        if lower.endswith('.' + fmt):
+            return fmt
+    return default
+
+
+def split_extension(path, fmt):
+    """('results', '.csv.gz') for ('results.csv.gz', 'csv.gz'); falls back to os.path.splitext()."""
+    if path.lower().endswith('.' + fmt):
+        return path[:-len(fmt) - 1], path[-len(fmt) - 1:]
+    return os.path.splitext(path)
+
+
+def part_path(path, fmt, index):
+    """Path of rotation part `index`: results.csv.gz, results.1.csv.gz, results.2.csv.gz, ..."""
+    if index == 0:
+        return path
+    stem, ext = split_extension(path, fmt)
+    return f"{stem}.{index}{ext}"
+
+
+def _import_zstd():
+    try:
+        from compression import zstd # Python 3.14+
+        return lambda raw: zstd.ZstdFile(raw, 'wb', level=ZSTD_LEVEL)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ExportFormatError("Format 'csv.zst' needs the 'zstandard' library: pip install zstandard")
+    return lambda raw: zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=False)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportFormatError("Format 'parquet' needs the 'pyarrow' library: pip install pyarrow")
+    return pyarrow
+
+
+def require_format(fmt):
+    """Raises ExportFormatError unless fmt is known and its library is importable (call before a long run)."""
+    if fmt not in FORMATS:
+        raise ExportFormatError(f"Unknown export format '{fmt}' (choose from: {', '.join(FORMATS)})")
+    if fmt == 'csv.zst':
+        _import_zstd()
+    elif fmt == 'parquet':
+        _import_pyarrow()
+
+
+class ResultWriter:
+    """
+    Batches rows (dicts keyed by fieldnames, or sequences in fieldnames order; extra dict
+    keys are ignored) and writes them to one or more part files. Use as a context manager
+    or call close(). `paths` lists the files written, `rows_written` counts the rows.
+    """
+
+    def __init__(self, path, fieldnames, max_bytes=0, batch_rows=DEFAULT_BATCH_ROWS):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.max_bytes = max_bytes
+        self.batch_rows = max(1, batch_rows)
+        self.paths = []
+        self.rows_written = 0
+        self._batch = []
+        self._raw = None
+
+    # Subclasses implement the format on top of the raw binary file
+    def _open_part(self):
+        raise NotImplementedError
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def _close_part(self):
+        raise NotImplementedError
+
+    def _start_part(self):
+        path = part_path(self.path, self.format, len(self.paths))
+        self._raw = open(path, 'wb')
+        self.paths.append(path)
+        self._open_part()
+
+    def write_row(self, row):
+        if isinstance(row, dict):
+            row = [row.get(name, '') for name in self.fieldnames]
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_rows:
+            self.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self):
+        """Writes the pending batch, then rotates if the current part reached max_bytes."""
+        if self._raw is None:
+            self._start_part() # The first part is created even for an empty result set
+        if self._batch:
+            self._write_batch(self._batch)
+            self.rows_written += len(self._batch)
+            self._batch = []
+        if self.max_bytes and self._raw.tell() >= self.max_bytes:
+            self._close_part()
+            self._raw.close()
+            self._raw = None
+
+    def close(self):
+        if self._batch or (self._raw is None and not self.paths):
+            self.flush()
+        if self._raw is not None:
+            self._close_part()
+            self._raw.close()
+            self._raw = None
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _TextWriter(ResultWriter):
+    """Text formats over an optional compression stream."""
+
+    def __init__(self, path, fieldnames, fmt, compressor=None, **kwargs):
+        super().__init__(path, fieldnames, **kwargs)
+        self.format = fmt
+        self._compressor = compressor # raw file -> binary stream, or None
+        self._stream = self._text = None
+
+    def _open_part(self):
+        self._stream = self._compressor(self._raw) if self._compressor else None
+        self._text = io.TextIOWrapper(self._stream or self._raw, encoding='utf-8', newline='')
+        self._write_header()
+
+    def _write_header(self):
+        pass
+
+    def _close_part(self):
+        self._text.flush()
+        self._text.detach()
+        if self._stream is not None:
+            self._stream.close() # Ends the gzip member / zstd frame; the raw file stays open
+
+
+class CsvResultWriter(_TextWriter):
+    def _write_header(self):
+        self._csv = csv.writer(self._text)
+        self._csv.writerow(self.fieldnames)
+
+    def _write_batch(self, batch):
+        self._csv.writerows(batch)
+
+
+class JsonLinesResultWriter(_TextWriter):
+    def _write_batch(self, batch):
+        names = self.fieldnames
+        self._text.write(''.join(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n' for row in batch))
+
+
+class ParquetResultWriter(ResultWriter):
+    """String columns; one row group per batch; Zstandard page compression."""
+    format = 'parquet'
+
+    def __init__(self, path, fieldnames, dictionary_columns=(), **kwargs):
+        super().__init__(path, fieldnames, **kwargs)
+        self._pa = _import_pyarrow()
+        self._schema = self._pa.schema([(name, self._pa.string()) for name in self.fieldnames])
+        self.dictionary_columns = [name for name in dictionary_columns if name in self.fieldnames]
+        self._writer = None
+
+    def _open_part(self):
+        self._writer = self._pa.parquet.ParquetWriter(self._raw, self._schema, compression='zstd',
+                                                      use_dictionary=self.dictionary_columns or False)
+
+    def _write_batch(self, batch):
+        columns = [self._pa.array([None if value is None else str(value) for value in column], type=self._pa.string())
+                   for column in zip(*batch)]
+        self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+
+    def _close_part(self):
+        self._writer.close() # Writes the footer; the raw file stays open
+
+
+def open_writer(path, fieldnames, fmt=None, max_bytes=0, batch_rows=DEFAULT_BATCH_ROWS, dictionary_columns=()):
+    """
+    Returns a ResultWriter for path. fmt defaults to the one implied by the extension (plain
+    CSV if none matches). dictionary_columns are dictionary-encoded in Parquet output.
+    Raises ExportFormatError for unknown formats or missing libraries.
+    """
+    fmt = fmt or format_for_path(path)
+    require_format(fmt)
+    options = {'max_bytes': max_bytes, 'batch_rows': batch_rows}
+    if fmt == 'parquet':
+        return ParquetResultWriter(path, fieldnames, dictionary_columns=dictionary_columns, **options)
+    compressor = None
+    if fmt.endswith('.gz'):
+        compressor = lambda raw: gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL)
+    elif fmt.endswith('.zst'):
+        compressor = _import_zstd()
+    writer_class = JsonLinesResultWriter if fmt.startswith('jsonl') else CsvResultWriter
+    return writer_class(path, fieldnames, fmt, compressor=compressor, **options)
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+# --- Benchmark ---
+
+def benchmark_rows(count):
+    """Synthetic network test results: 5,000 hosts x 20 services, ~3% failures, varied timings."""
+    import random
+    rng = random.Random(42)
+    services = ['ping', 'http', 'https'] + [f'tcp:{port}' for port in (22, 25, 53, 80, 110, 143, 443, 445, 993,
+                                                                      995, 1433, 3306, 3389, 5432, 8080, 8443, 9200)]
+    for i in range(count):
+        ok = rng.random() > 0.03
+        service = services[i % len(services)]
+        if service.startswith('tcp'):
+            details = f"Port {service[4:]} is open" if ok else f"Port {service[4:]} is closed or filtered (Error code: 111)"
+        else:
+            details = rng.choice(('HTTP Status 200', 'HTTP Status 200 after 1 redirect(s)')) if ok else 'Timeout'
+        yield {'Timestamp': f"2025-03-30 {14 + i // 3600000:02d}:{i // 60000 % 60:02d}:{i // 1000 % 60:02d}",
+               'TargetHost': f"host{i // len(services) % 5000:04d}.dc{rng.randint(1, 4)}.example.com", 'Service': service,
+               'Status': 'SUCCESS' if ok else 'FAILED', 'Details': details,
+               'Timing': f"{rng.lognormvariate(3, 1):.0f} ms" if service != 'ping' else ''}
+
+
+def run_benchmark(count, formats, out_dir, max_bytes=0):
+    import time
+    fieldnames = ['Timestamp', 'TargetHost', 'Service', 'Status', 'Details', 'Timing']
+    rows = list(benchmark_rows(count))
+    print(f"Writing {count:,} rows per format to {out_dir}:")
+    print(f"  {'Format':<10} {'Size':>10} {'vs csv':>8} {'Rows/s':>12} {'Parts':>6}")
+    csv_size = None
+    for fmt in formats:
+        try:
+            require_format(fmt)
+        except ExportFormatError as e:
+            print(f"  {fmt:<10} skipped: {e}")
+            continue
+        path = os.path.join(out_dir, f"bench.{fmt}")
+        start = time.perf_counter()
+        with open_writer(path, fieldnames, fmt=fmt, max_bytes=max_bytes,
+                         dictionary_columns=('TargetHost', 'Service', 'Status', 'Details')) as writer:
+            writer.write_rows(rows)
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(p) for p in writer.paths)
+        csv_size = csv_size or (size if fmt == 'csv' else None)
+        ratio = f"{size / csv_size:.2f}x" if csv_size else ''
+        print(f"  {fmt:<10} {format_size(size):>10} {ratio:>8} {count / elapsed:>12,.0f} {len(writer.paths):>6}")
+        for p in writer.paths:
+            os.remove(p)
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    parser = argparse.ArgumentParser(
+        description="Benchmark file size and write throughput of the export formats on synthetic results.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+    parser.add_argument("-n", "--count", type=int, default=1000000, help="Rows to write per format.")
+    parser.add_argument("--formats", default=','.join(FORMATS), help="Comma-separated formats to compare.")
+    parser.add_argument("--rotate-mb", type=float, default=0, help="Also rotate parts at this size (0 = one file).")
+    parser.add_argument("--dir", help="Directory for the output files (default: a temporary directory).")
+    bench_args = parser.parse_args()
+    with tempfile.TemporaryDirectory(dir=bench_args.dir) as out_dir:
+        run_benchmark(bench_args.count, [f.strip() for f in bench_args.formats.split(',') if f.strip()], out_dir,
+                      max_bytes=int(bench_args.rotate_mb * 1024 * 1024))
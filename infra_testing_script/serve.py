@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Production Server for the Flask Backend ---
+# Purpose: Pre-fork server for app.py. The master process binds the listening socket once
+#          and forks N worker processes that accept on it, each running a threaded WSGI
+#          server. Job state lives in the shared SQLite job store (job_store.py), so any
+#          worker can answer /jobs/<id> requests. Workers drain in-flight requests and
+#          background jobs on SIGTERM; SIGHUP restarts them one at a time.
+
+# --- Prerequisites ---
+# pip install Flask Flask-CORS requests colorama
+# (Unix only for multiple workers; on Windows a single threaded process is started.)
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5000
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_GRACEFUL_TIMEOUT = 30 # Seconds a worker gets to finish requests/jobs before SIGKILL
+LISTEN_BACKLOG = 1024
+RESPAWN_DELAY = 1.0           # Pause before replacing a worker that crashed
+
+
+# --- Worker Process ---
+
+def run_worker(sock, graceful_timeout):
+    """Serves app.py on the inherited socket until SIGTERM, then drains and exits."""
+    from werkzeug.serving import make_server # Imported after fork: each worker gets its own app state
+    import app as backend
+
+    server = make_server(sock.getsockname()[0], sock.getsockname()[1], backend.app, threaded=True, fd=sock.fileno())
+    server.daemon_threads = False # server_close() then waits for in-flight requests
+    server.block_on_close = True
+
+    def request_stop(signum, frame):
+        # shutdown() blocks until serve_forever() returns, so it cannot run on the serving thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C is handled by the master
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+    server.serve_forever()
+    server.server_close()
+    if not backend.wait_for_background_jobs(timeout=graceful_timeout):
+        print(f"Worker {os.getpid()}: background jobs still running after {graceful_timeout}s, exiting anyway.")
+        os._exit(1)
+    os._exit(0)
+
+
+# --- Master Process ---
+
+class Master:
+    """Forks and supervises the worker processes."""
+
+    def __init__(self, sock, workers, graceful_timeout):
+        self.sock = sock
+        self.num_workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.workers = {} # pid -> start time
+        self.stopping = False
+        self.reload_requested = False
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(self.sock, self.graceful_timeout)
+            except Exception as e:
+                print(f"Worker {os.getpid()} failed: {e}")
+            finally:
+                os._exit(1)
+        self.workers[pid] = time.monotonic()
+        print(f"Started worker {pid}")
+        return pid
+
+    def reap(self, block=False):
+        """Collects exited workers. Returns a list of (pid, exit status)."""
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if self.workers.pop(pid, None) is not None:
+                exited.append((pid, status))
+            if block:
+                break
+        return exited
+
+    def mark_interrupted(self, pid):
+        """Fails jobs a dead worker left behind so clients polling them do not wait forever."""
+        try:
+            import app as backend
+            backend.get_job_store().mark_interrupted(pid)
+        except Exception as e:
+            print(f"Warning: could not update jobs of worker {pid}: {e}")
+
+    def stop_worker(self, pid):
+        """SIGTERMs one worker and waits for it to drain (SIGKILL after the graceful timeout)."""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while pid in self.workers and time.monotonic() < deadline:
+            for exited_pid, status in self.reap():
+                if exited_pid != pid:
+                    self.handle_exit(exited_pid, status)
+            time.sleep(0.05)
+        if pid in self.workers:
+            print(f"Worker {pid} did not stop within {self.graceful_timeout}s, killing it.")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            self.workers.pop(pid, None)
+            self.mark_interrupted(pid)
+
+    def handle_exit(self, pid, status):
+        code = os.waitstatus_to_exitcode(status)
+        if code != 0:
+            print(f"Worker {pid} exited unexpectedly (code {code}).")
+            self.mark_interrupted(pid)
+
+    def rolling_restart(self):
+        """Replaces workers one at a time, starting the new one before draining the old one."""
+        print("SIGHUP received: restarting workers one at a time.")
+        for old_pid in list(self.workers):
+            if self.stopping:
+                break
+            self.spawn_worker()
+            self.stop_worker(old_pid)
+
+    def shutdown(self):
+        print(f"Stopping {len(self.workers)} worker(s) (graceful timeout {self.graceful_timeout}s)...")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            for pid, status in self.reap():
+                self.handle_exit(pid, status)
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            print(f"Worker {pid} did not stop within {self.graceful_timeout}s, killing it.")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            self.workers.pop(pid, None)
+            self.mark_interrupted(pid)
+
+    def run(self):
+        def on_stop(signum, frame):
+            self.stopping = True
+
+        def on_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_reload)
+
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+                continue
+            for pid, status in self.reap():
+                self.handle_exit(pid, status)
+            while not self.stopping and len(self.workers) < self.num_workers:
+                time.sleep(RESPAWN_DELAY)
+                self.spawn_worker()
+            time.sleep(0.2)
+        self.shutdown()
+        self.sock.close()
+        print("All workers stopped.")
+
+
+# --- Argument Parser ---
+
+def setup_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Serve the network test backend (app.py) with multiple worker processes.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Signals: SIGTERM/SIGINT drain and stop all workers, SIGHUP restarts workers one at a time."
+    )
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on.')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS, metavar='N',
+                        help='Number of worker processes.')
+    parser.add_argument('--probe-freshness', type=float, metavar='SECONDS',
+                        help='Reuse identical probe results for this long (0 disables). Default: see app.py.')
+    profile_group = parser.add_mutually_exclusive_group()
+    profile_group.add_argument('--profile', dest='profile_mode', action='store_const', const='1',
+                               help='Profile every /test job (stage timings in test_results/job_<id>.profile.json); '
+                                    'without it, requests can still ask with an "X-Profile: 1" header.')
+    profile_group.add_argument('--profile-sample', dest='profile_mode', action='store_const', const='sample',
+                               help='Like --profile, and also sample each job thread\'s call stacks.')
+    replay_group = parser.add_mutually_exclusive_group()
+    replay_group.add_argument('--record', metavar='TRACE',
+                              help='Append every probe\'s outcome and latency to a trace file (net_replay.py); '
+                                   'all workers write to it, so it cannot be gzip-compressed with more than one.')
+    replay_group.add_argument('--replay', metavar='TRACE',
+                              help='Serve probe outcomes from a trace file (--record, network_test.py --record or '
+                                   'net_replay.py scenario) instead of the network.')
+    parser.add_argument('--replay-speed', type=float, default=0, metavar='FACTOR',
+                        help='With --replay, sleep each recorded latency times FACTOR (0 = answer at once).')
+    parser.add_argument('--graceful-timeout', type=float, default=DEFAULT_GRACEFUL_TIMEOUT, metavar='SECONDS',
+                        help='Time workers get to finish in-flight requests and jobs when stopping.')
+    return parser
+
+
+# --- Main Execution Logic ---
+
+if __name__ == "__main__":
+    args = setup_arg_parser().parse_args()
+    if args.workers < 1:
+        print("Error: --workers must be at least 1.")
+        sys.exit(1)
+
+    if args.probe_freshness is not None:
+        os.environ['NETTEST_PROBE_FRESHNESS'] = str(args.probe_freshness) # Read by app.py when workers import it
+    if args.profile_mode:
+        os.environ['NETTEST_PROFILE'] = args.profile_mode
+    if args.record:
+        if args.record.endswith('.gz') and args.workers > 1:
+            print("Error: --record needs an uncompressed trace file with more than one worker.")
+            sys.exit(1)
+        os.environ['NETTEST_RECORD'] = os.path.abspath(args.record)
+    if args.replay:
+        if not os.path.isfile(args.replay):
+            print(f"Error: replay trace not found at '{args.replay}'")
+            sys.exit(1)
+        os.environ['NETTEST_REPLAY'] = os.path.abspath(args.replay)
+        os.environ['NETTEST_REPLAY_SPEED'] = str(args.replay_speed)
+
+    if not hasattr(os, 'fork'):
+        print("Note: os.fork() is not available on this platform; starting a single threaded process.")
+        from werkzeug.serving import run_simple
+        import app as backend
+        run_simple(args.host, args.port, backend.app, threaded=True)
+        sys.exit(0)
+
+    try:
+        listen_sock = socket.socket(socket.AF_INET6 if ':' in args.host else socket.AF_INET, socket.SOCK_STREAM)
+        listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_sock.bind((args.host, args.port))
+        listen_sock.listen(LISTEN_BACKLOG)
+        listen_sock.set_inheritable(True)
+        # Every worker selects on the same socket, and only one wins each connection: the others must get
+        # BlockingIOError (ignored by socketserver) instead of blocking in accept(), where SIGTERM's
+        # shutdown() would never reach them
+        listen_sock.setblocking(False)
+    except OSError as e:
+        print(f"Error: Could not listen on {args.host}:{args.port}: {e}")
+        sys.exit(1)
+
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} worker(s) (master pid {os.getpid()})")
+    Master(listen_sock, args.workers, args.graceful_timeout).run()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Stage Timing and Sampling Profiler ---
+# Purpose: Shared by network_test.py, _nslookup_tool.py and app.py (--profile, X-Profile header).
+#          Code marks its stages (CSV parsing, DNS, probes, rendering, export, ...) with
+#          `with profiler.stage('name'):`; each stage accumulates call count, wall time and
+#          CPU time of the calling thread. Time spent blocked on a queue or on another worker
+#          is recorded separately as waits. An optional sampling profiler thread snapshots the
+#          stacks of the profiled threads every few milliseconds and reports them in "folded"
+#          form (one 'outer;inner;leaf' line per distinct stack, flame-graph tools read it).
+#          When profiling is off, NULL_PROFILER makes every hook a no-op.
+
+import json
+import os
+import sys
+import threading
+import time
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_SAMPLE_INTERVAL = 0.005 # Seconds between stack samples
+MAX_STACK_DEPTH = 64
+MAX_REPORTED_STACKS = 500       # Most frequent distinct stacks kept in the report
+
+
+class _Stage:
+    """Context manager returned by StageProfiler.stage()."""
+    __slots__ = ('profiler', 'name', 'wall', 'cpu')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.record(self.name, time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+_NULL_STAGE = _NullStage()
+
+
+class StageProfiler:
+    """
+    Per-stage wall/CPU totals and wait times for one run. Stages may nest (wall time is
+    inclusive). Safe to use from several threads; CPU time is that of the calling thread.
+    """
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {} # name -> [count, wall seconds, cpu seconds, max wall seconds]
+        self._waits = {}  # name -> [count, seconds, max seconds]
+        self._started_wall = time.perf_counter()
+        self._started_cpu = time.process_time()
+        self.sampler = None
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def record(self, name, wall, cpu=0.0):
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                self._stages[name] = [1, wall, cpu, wall]
+            else:
+                entry[0] += 1
+                entry[1] += wall
+                entry[2] += cpu
+                if wall > entry[3]:
+                    entry[3] = wall
+
+    def wait(self, name, seconds):
+        """Records time spent blocked waiting for another thread, process or queue."""
+        with self._lock:
+            entry = self._waits.get(name)
+            if entry is None:
+                self._waits[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+
+    def timed_iter(self, iterable, wait_name):
+        """Yields from iterable, recording the time each next() blocks as a wait."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.wait(wait_name, time.perf_counter() - start)
+            yield item
+
+    # Worker processes profile on their own and hand back snapshots to merge
+    def snapshot(self):
+        with self._lock:
+            return {'stages': {k: list(v) for k, v in self._stages.items()}, 'waits': {k: list(v) for k, v in self._waits.items()}}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._waits.clear()
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, (count, wall, cpu, max_wall) in snapshot['stages'].items():
+                entry = self._stages.setdefault(name, [0, 0.0, 0.0, 0.0])
+                entry[0] += count
+                entry[1] += wall
+                entry[2] += cpu
+                entry[3] = max(entry[3], max_wall)
+            for name, (count, seconds, max_seconds) in snapshot['waits'].items():
+                entry = self._waits.setdefault(name, [0, 0.0, 0.0])
+                entry[0] += count
+                entry[1] += seconds
+                entry[2] = max(entry[2], max_seconds)
+
+    def start_sampling(self, interval=DEFAULT_SAMPLE_INTERVAL, thread_ids=None):
+        """Starts a SamplingProfiler over thread_ids (default: the calling thread)."""
+        self.sampler = SamplingProfiler(interval, thread_ids or [threading.get_ident()])
+        self.sampler.start()
+        return self.sampler
+
+    def report(self, **meta):
+        """Machine-readable report (JSON-serializable dict); stops the sampler if one is running."""
+        wall = time.perf_counter() - self._started_wall
+        with self._lock:
+            stages = {name: {'count': count, 'wall_s': round(total, 6), 'cpu_s': round(cpu, 6),
+                             'avg_wall_ms': round(total * 1000 / count, 3), 'max_wall_ms': round(max_wall * 1000, 3)}
+                      for name, (count, total, cpu, max_wall) in sorted(self._stages.items(), key=lambda kv: -kv[1][1])}
+            waits = {name: {'count': count, 'wait_s': round(total, 6), 'avg_ms': round(total * 1000 / count, 3),
+                            'max_ms': round(max_wait * 1000, 3)}
+                     for name, (count, total, max_wait) in sorted(self._waits.items(), key=lambda kv: -kv[1][1])}
+        report = dict(meta, total_wall_s=round(wall, 6), total_cpu_s=round(time.process_time() - self._started_cpu, 6),
+                      stages=stages, waits=waits)
+        if self.sampler is not None:
+            self.sampler.stop()
+            report['samples'] = self.sampler.report()
+        return report
+
+    def write_report(self, path, **meta):
+        """Writes report() as JSON to path and returns the report."""
+        report = self.report(**meta)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+class _NullProfiler:
+    """Stands in for StageProfiler when profiling is off; every hook is a no-op."""
+    enabled = False
+    sampler = None
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def record(self, name, wall, cpu=0.0):
+        pass
+
+    def wait(self, name, seconds):
+        pass
+
+    def timed_iter(self, iterable, wait_name):
+        return iterable
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+class SamplingProfiler(threading.Thread):
+    """Daemon thread counting the stacks of the given threads every `interval` seconds."""
+
+    def __init__(self, interval, thread_ids):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.interval = interval
+        self.thread_ids = set(thread_ids)
+        self.counts = {} # 'module:function;...' (outermost first) -> samples
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None and len(names) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack = ';'.join(reversed(names))
+                self.counts[stack] = self.counts.get(stack, 0) + 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def report(self):
+        top = sorted(self.counts.items(), key=lambda kv: -kv[1])[:MAX_REPORTED_STACKS]
+        return {'interval_ms': self.interval * 1000, 'total': self.samples, 'distinct_stacks': len(self.counts),
+                'folded': [f"{stack} {count}" for stack, count in top]}
+
+
+def format_summary(report, limit=12):
+    """Console table of the slowest stages and waits in a report."""
+    lines = [f"Profile: {report['total_wall_s']:.3f}s wall, {report['total_cpu_s']:.3f}s CPU"]
+    if report['stages']:
+        lines.append(f"  {'Stage':<24} {'Calls':>8} {'Wall s':>9} {'CPU s':>9} {'Avg ms':>9} {'Max ms':>9}")
+        for name, s in list(report['stages'].items())[:limit]:
+            lines.append(f"  {name:<24} {s['count']:>8} {s['wall_s']:>9.3f} {s['cpu_s']:>9.3f} {s['avg_wall_ms']:>9.2f} {s['max_wall_ms']:>9.2f}")
+    if report['waits']:
+        lines.append(f"  {'Wait':<24} {'Count':>8} {'Total s':>9} {'':>9} {'Avg ms':>9} {'Max ms':>9}")
+        for name, w in list(report['waits'].items())[:limit]:
+            lines.append(f"  {name:<24} {w['count']:>8} {w['wait_s']:>9.3f} {'':>9} {w['avg_ms']:>9.2f} {w['max_ms']:>9.2f}")
+    if 'samples' in report:
+        lines.append(f"  {report['samples']['total']} stack samples ({report['samples']['distinct_stacks']} distinct) in the report")
+    return '\n'.join(lines)
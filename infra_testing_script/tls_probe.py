@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- TLS Handshake and Certificate Probe (tls:<port>) ---
+# Purpose: Shared by network_test.py and app.py. Connects, performs only the TLS handshake
+#          (no HTTP request) and reports protocol, cipher, the certificate's subject, issuer,
+#          SANs, days to expiry and whether it covers the host name, plus connect and
+#          handshake time. Certificates are not verified against a trust store (like the
+#          verify=False HTTP probes); the point is auditing what each endpoint serves.
+#            - Parsed certificates are cached by SHA-256 fingerprint, so thousands of vhosts
+#              behind one certificate (and the intermediates every chain shares) are parsed once
+#            - Optionally a second handshake resumes the first one's session, to measure the
+#              resumed handshake time and whether the server supports resumption at all
+#          The certificate fields are read with a minimal DER walker (stdlib only).
+
+import hashlib
+import ipaddress
+import socket
+import ssl
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# --- Configuration (Defaults & Constants) ---
+DEFAULT_CACHE_SIZE = 10000  # Parsed certificates kept (LRU)
+DEFAULT_MIN_DAYS = 0        # A certificate with fewer days left than this fails the test
+TICKET_WAIT = 0.2           # Seconds to wait for TLS 1.3 session tickets before a resumption
+
+_OID_COMMON_NAME = bytes([0x55, 0x04, 0x03])       # 2.5.4.3
+_OID_ORGANIZATION = bytes([0x55, 0x04, 0x0a])      # 2.5.4.10
+_OID_SUBJECT_ALT_NAME = bytes([0x55, 0x1d, 0x11])  # 2.5.29.17
+
+
+class CertificateError(ValueError):
+    """DER data that is not an X.509 certificate this module can read."""
+
+
+# --- Minimal DER Reading ---
+
+def _der_items(data, start=0, end=None):
+    """Yields (tag, content start, content end) for each DER element in data[start:end]."""
+    end = len(data) if end is None else end
+    i = start
+    while i < end:
+        if i + 2 > end:
+            raise CertificateError("Truncated DER element")
+        tag, length = data[i], data[i + 1]
+        i += 2
+        if length & 0x80:
+            size = length & 0x7f
+            if not 0 < size <= 4 or i + size > end:
+                raise CertificateError("Bad DER length")
+            length = int.from_bytes(data[i:i + size], 'big')
+            i += size
+        if i + length > end:
+            raise CertificateError("Truncated DER element")
+        yield tag, i, i + length
+        i += length
+
+
+def _children(data, item):
+    return list(_der_items(data, item[1], item[2]))
+
+
+def _name_attribute(data, name, oid):
+    """Value of the first attribute with oid in a Name (SEQUENCE of SET of SEQUENCE {OID, value})."""
+    for rdn in _children(data, name):
+        for attribute in _children(data, rdn):
+            parts = _children(data, attribute)
+            if len(parts) >= 2 and data[parts[0][1]:parts[0][2]] == oid:
+                return bytes(data[parts[1][1]:parts[1][2]]).decode('utf-8', 'replace')
+    return None
+
+
+def _der_time(data, item):
+    text = bytes(data[item[1]:item[2]]).decode('ascii').rstrip('Z')
+    if item[0] == 0x17: # UTCTime: YYMMDDHHMM[SS]
+        year = int(text[:2])
+        text = f"{1900 + year if year >= 50 else 2000 + year}{text[2:]}"
+    return datetime.strptime(text[:14].ljust(14, '0'), '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc)
+
+
+def _subject_alt_names(data, extensions):
+    """DNS names and IP addresses from the subjectAltName extension, in certificate order."""
+    for extension in _children(data, _children(data, extensions)[0]):
+        parts = _children(data, extension)
+        if parts and data[parts[0][1]:parts[0][2]] == _OID_SUBJECT_ALT_NAME:
+            names = []
+            for tag, start, end in _der_items(data, *_children(data, parts[-1])[0][1:]):
+                if tag == 0x82:
+                    names.append(bytes(data[start:end]).decode('ascii', 'replace'))
+                elif tag == 0x87 and end - start in (4, 16):
+                    names.append(str(ipaddress.ip_address(bytes(data[start:end]))))
+            return tuple(names)
+    return ()
+
+
+class CertInfo:
+    """The fields of one certificate that the probe reports."""
+    __slots__ = ('fingerprint', 'subject', 'issuer', 'organization', 'san', 'not_before', 'not_after')
+
+    def __init__(self, der, fingerprint=None):
+        self.fingerprint = fingerprint or hashlib.sha256(der).hexdigest()
+        data = memoryview(der)
+        try:
+            certificate = list(_der_items(data))[0]
+            tbs = _children(data, _children(data, certificate)[0])
+            if tbs[0][0] == 0xa0:
+                tbs = tbs[1:] # Explicit version
+            issuer, validity, subject = tbs[2], tbs[3], tbs[4]
+            extensions = next((item for item in tbs[6:] if item[0] == 0xa3), None)
+            self.subject = _name_attribute(data, subject, _OID_COMMON_NAME) or ''
+            self.organization = _name_attribute(data, subject, _OID_ORGANIZATION) or ''
+            self.issuer = _name_attribute(data, issuer, _OID_COMMON_NAME) or _name_attribute(data, issuer, _OID_ORGANIZATION) or ''
+            self.not_before, self.not_after = (_der_time(data, item) for item in _children(data, validity)[:2])
+            self.san = _subject_alt_names(data, extensions) if extensions else ()
+        except (IndexError, ValueError, UnicodeDecodeError) as e:
+            raise CertificateError(f"Unreadable certificate: {e}") from None
+
+    def days_left(self, now=None):
+        return (self.not_after - (now or datetime.now(timezone.utc))).total_seconds() / 86400
+
+    def matches(self, hostname):
+        """Whether the certificate covers hostname (SAN, else CN; one leading '*.' label wildcard)."""
+        hostname = hostname.rstrip('.').lower()
+        try:
+            address = str(ipaddress.ip_address(hostname.strip('[]')))
+            return address in self.san
+        except ValueError:
+            pass
+        for name in (self.san or (self.subject,)):
+            name = name.lower()
+            if name == hostname:
+                return True
+            if name.startswith('*.') and '.' in hostname and hostname.split('.', 1)[1] == name[2:]:
+                return True
+        return False
+
+
+class CertCache:
+    """CertInfo by SHA-256 fingerprint of the DER certificate (LRU, thread-safe)."""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, der):
+        fingerprint = hashlib.sha256(der).hexdigest()
+        with self._lock:
+            info = self._entries.get(fingerprint)
+            if info is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return info
+        info = CertInfo(der, fingerprint) # Parsed outside the lock; a rare duplicate parse is harmless
+        with self._lock:
+            self.misses += 1
+            self._entries[fingerprint] = info
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return info
+
+    def stats(self):
+        with self._lock:
+            return {'certificates': len(self._entries), 'hits': self.hits, 'parsed': self.misses}
+
+
+cert_cache = CertCache()
+_context = None
+
+
+def client_context():
+    """One shared client context: sessions can only be resumed within the context that made them."""
+    global _context
+    if _context is None:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        _context = context
+    return _context
+
+
+def _chain_der(tls_sock):
+    """DER certificates the server sent, leaf first (only the leaf before Python 3.13)."""
+    get_chain = getattr(tls_sock, 'get_unverified_chain', None)
+    if get_chain is not None:
+        chain = get_chain() or []
+        return [c if isinstance(c, bytes) else ssl.PEM_cert_to_DER_cert(c.public_bytes()) for c in chain]
+    leaf = tls_sock.getpeercert(binary_form=True)
+    return [leaf] if leaf else []
+
+
+def _connect(address, timeout):
+    """Returns (connected socket, milliseconds)."""
+    started = time.perf_counter()
+    sock = socket.create_connection(address, timeout=timeout)
+    return sock, (time.perf_counter() - started) * 1000
+
+
+def _handshake(sock, server_name, context, session=None):
+    """Performs the handshake on a connected socket (closed on failure). Returns (TLS socket, milliseconds)."""
+    started = time.perf_counter()
+    try:
+        tls_sock = context.wrap_socket(sock, server_hostname=server_name, do_handshake_on_connect=False, session=session)
+        tls_sock.do_handshake()
+    except BaseException:
+        sock.close()
+        raise
+    return tls_sock, (time.perf_counter() - started) * 1000
+
+
+def _server_name(hostname):
+    try:
+        ipaddress.ip_address(hostname.strip('[]'))
+        return None # No SNI for IP literals
+    except ValueError:
+        return hostname
+
+
+class TlsProbeResult:
+    """Outcome of probe_tls()."""
+    __slots__ = ('ok', 'error', 'protocol', 'cipher', 'chain', 'connect_ms', 'handshake_ms',
+                 'resumed_ms', 'resumed', 'name_matches', 'days_left')
+
+    def __init__(self):
+        self.ok = False
+        self.error = None
+        self.protocol = None
+        self.cipher = None
+        self.chain = []          # CertInfo, leaf first
+        self.connect_ms = None
+        self.handshake_ms = None
+        self.resumed_ms = None   # Second handshake, when resume was asked for
+        self.resumed = None      # Whether the server accepted the session
+        self.name_matches = None
+        self.days_left = None
+
+    @property
+    def leaf(self):
+        return self.chain[0] if self.chain else None
+
+    def details(self):
+        if self.error:
+            return self.error
+        leaf = self.leaf
+        parts = [f"{self.protocol} {self.cipher}"]
+        if leaf is not None:
+            parts.append(f"CN={leaf.subject or '-'}" + (f" (issuer {leaf.issuer})" if leaf.issuer else ""))
+            if leaf.san:
+                shown = ', '.join(leaf.san[:5])
+                parts.append(f"{len(leaf.san)} SAN(s): {shown}" + (", ..." if len(leaf.san) > 5 else ""))
+            parts.append(f"expires {leaf.not_after:%Y-%m-%d} ({self.days_left:.0f} days)")
+            if self.name_matches is False:
+                parts.append("name not covered by certificate")
+        if len(self.chain) > 1:
+            parts.append(f"chain {len(self.chain)}: {' < '.join(c.subject or '?' for c in self.chain)}")
+        if self.resumed is False:
+            parts.append("session not resumed")
+        return '; '.join(parts)
+
+    def timing_summary(self):
+        if self.connect_ms is None:
+            return ''
+        text = f"connect {self.connect_ms:.0f} ms, handshake {self.handshake_ms:.0f} ms" if self.handshake_ms is not None \
+            else f"connect {self.connect_ms:.0f} ms"
+        if self.resumed_ms is not None:
+            text += f", {'resumed' if self.resumed else 'full (resumption refused)'} {self.resumed_ms:.0f} ms"
+        return text
+
+
+def probe_tls(hostname, port, timeout, resume=False, min_days=DEFAULT_MIN_DAYS, cache=None, context=None):
+    """
+    Handshakes with hostname:port and inspects the certificate. ok means the handshake
+    succeeded, the certificate covers the name (not checked for IP targets) and has at
+    least min_days left. Returns a TlsProbeResult.
+    """
+    cache = cache or cert_cache
+    context = context or client_context()
+    result = TlsProbeResult()
+    server_name = _server_name(hostname)
+    try:
+        address = socket.getaddrinfo(hostname.strip('[]'), port, socket.AF_UNSPEC, socket.SOCK_STREAM)[0][4][:2]
+    except socket.gaierror:
+        result.error = 'DNS Resolution Error'
+        return result
+    try:
+        sock, result.connect_ms = _connect(address, timeout)
+        tls_sock, result.handshake_ms = _handshake(sock, server_name, context)
+    except socket.timeout:
+        result.error = f'Timeout during TLS handshake on port {port}' if result.connect_ms is not None else f'Timeout connecting to port {port}'
+        return result
+    except ssl.SSLError as e:
+        result.error = f'TLS handshake failed: {e.reason or e}'
+        return result
+    except OSError as e:
+        result.error = f'Port {port} is closed or filtered ({e.strerror or e})'
+        return result
+
+    try:
+        result.protocol = tls_sock.version()
+        result.cipher = (tls_sock.cipher() or ('?',))[0]
+        try:
+            result.chain = [cache.get(der) for der in _chain_der(tls_sock)]
+        except CertificateError as e:
+            result.error = f"{result.protocol} {result.cipher}; {e}"
+        session = None
+        if resume:
+            if result.protocol == 'TLSv1.3':
+                # TLS 1.3 tickets arrive after the handshake; a short read processes them
+                tls_sock.settimeout(min(timeout, TICKET_WAIT))
+                try:
+                    tls_sock.recv(1)
+                except (socket.timeout, ssl.SSLError, OSError):
+                    pass
+            session = tls_sock.session
+    finally:
+        tls_sock.close()
+
+    if resume and session is not None:
+        try:
+            resumed_sock, result.resumed_ms = _handshake(_connect(address, timeout)[0], server_name, context, session)
+            result.resumed = resumed_sock.session_reused
+            resumed_sock.close()
+        except (OSError, ssl.SSLError):
+            result.resumed = False
+    elif resume:
+        result.resumed = False
+
+    leaf = result.leaf
+    if result.error or leaf is None:
+        result.error = result.error or f"{result.protocol} {result.cipher}; no certificate sent"
+        return result
+    result.days_left = leaf.days_left()
+    result.name_matches = True if server_name is None else leaf.matches(server_name)
+    result.ok = result.name_matches and result.days_left >= min_days
+    return result
+
+
+def tls_result(hostname, port, timeout, resume=False, min_days=DEFAULT_MIN_DAYS):
+    """Result dictionary for a tls:<port> test (same layout as test_tcp_port, plus 'Timing')."""
+    probe = probe_tls(hostname, port, timeout, resume=resume, min_days=min_days)
+    details = probe.details()
+    if probe.days_left is not None and probe.days_left < min_days:
+        details = f"Certificate expires in {probe.days_left:.0f} days (minimum {min_days}); {details}" if probe.days_left >= 0 \
+            else f"Certificate expired {-probe.days_left:.0f} days ago; {details}"
+    return {'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'TargetHost': hostname, 'Service': f'tls:{port}',
+            'Status': 'SUCCESS' if probe.ok else 'FAILED', 'Details': details, 'Timing': probe.timing_summary(),
+            'SuccessBool': probe.ok}
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+    import sys
+
+    parser = argparse.ArgumentParser(description="Probes TLS endpoints, or measures certificate parsing with and without the cache.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('targets', nargs='*', help="host[:port] to probe (port 443 if omitted).")
+    parser.add_argument('--resume', action='store_true', help="Also time a resumed handshake.")
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--bench-vhosts', type=int, default=5000,
+                        help="Without targets: simulated vhosts sharing the certificates in --cert-glob.")
+    parser.add_argument('--cert-glob', default='/etc/ssl/certs/*.pem', help="PEM files used for the parsing benchmark.")
+    bench_args = parser.parse_args()
+
+    if bench_args.targets:
+        for target in bench_args.targets:
+            host, _, port = target.rpartition(':') if target.count(':') == 1 else (target, '', '443')
+            row = tls_result(host, int(port or 443), bench_args.timeout, resume=bench_args.resume)
+            print(f"{row['Status']:<8} {host}:{port or 443}  {row['Details']}  [{row['Timing']}]")
+        print(f"Certificate cache: {cert_cache.stats()}")
+        sys.exit(0)
+
+    ders = []
+    for path in sorted(glob.glob(bench_args.cert_glob))[:50]:
+        try:
+            with open(path) as f:
+                ders.append(ssl.PEM_cert_to_DER_cert(f.read()))
+        except (OSError, ValueError):
+            continue
+    if not ders:
+        sys.exit(f"No PEM certificates matched {bench_args.cert_glob}")
+    handshakes = [ders[i % len(ders)] for i in range(bench_args.bench_vhosts)]
+    start = time.perf_counter()
+    for der in handshakes:
+        CertInfo(der)
+    uncached = time.perf_counter() - start
+    cache = CertCache()
+    start = time.perf_counter()
+    for der in handshakes:
+        cache.get(der)
+    cached = time.perf_counter() - start
+    print(f"{len(handshakes):,} handshakes over {len(ders)} distinct certificate(s): parse every time {uncached * 1000:.1f} ms, "
+          f"with the fingerprint cache {cached * 1000:.1f} ms ({cache.stats()['parsed']} parsed)")
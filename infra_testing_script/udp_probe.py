@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# --- Batched UDP Service Probes (udp / dns / ntp / snmp) ---
+# Purpose: Shared by network_test.py and app.py. UDP checks are mostly waiting: a request
+#          goes out and a reply comes back, or never does. Instead of one socket and one
+#          timeout wait per check, run_batch() sends every UDP test of a run from a few
+#          non-blocking sockets and matches the replies as they arrive:
+#            udp:<port>   any datagram back from (address, port) counts; silence is reported
+#                         as 'open or filtered', since UDP has no handshake to tell them apart
+#            dns:<port>   a '. NS' query, matched on the 16-bit query id; any well-formed
+#                         answer except SERVFAIL means the server is working
+#            ntp:<port>   an NTPv4 client request, matched on the transmit timestamp the
+#                         server echoes back; reports stratum and clock offset
+#            snmp:<port>  an SNMPv2c GET of sysDescr.0, matched on the request id
+#          A request that gets no reply is sent again (retries) within the same timeout.
+#          On Linux, ICMP errors are read from the sockets' error queue (IP_RECVERR, as in
+#          path_trace.py), so a closed port ('port unreachable') fails at once instead of
+#          waiting out the timeout as 'open or filtered'.
+#          Tests of the same (address, service) share one request. IPv4 only (names are
+#          resolved with gethostbyname, like the tcp:<port> probe).
+
+import heapq
+import os
+import selectors
+import socket
+import struct
+import sys
+import time
+from datetime import datetime
+
+import endpoint_plan # Local module: concurrent name resolution (resolve_names)
+
+# --- Configuration (Defaults & Constants) ---
+UDP_SERVICES = ('udp', 'dns', 'ntp', 'snmp')
+DEFAULT_TIMEOUT = 3.0        # Seconds per test, retries included
+DEFAULT_RETRIES = 1          # Extra sends to a target that has not answered yet
+DEFAULT_SOCKETS = 4          # Requests are spread over this many source ports
+DEFAULT_SEND_RATE = 5000     # Datagrams per second, so bursts do not overrun socket buffers
+DEFAULT_SNMP_COMMUNITY = 'public'
+RECEIVE_BUFFER = 4 * 1024 * 1024
+MAX_DATAGRAM = 4096
+REKEY_TRIES = 16             # New ids tried when one is already waiting for a reply from the same endpoint
+
+_NTP_EPOCH_OFFSET = 2208988800 # Seconds from 1900 (NTP) to 1970 (Unix)
+_DNS_RCODES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED'}
+_SNMP_SYS_DESCR = bytes([0x2b, 6, 1, 2, 1, 1, 1, 0]) # 1.3.6.1.2.1.1.1.0
+_ERROR_QUEUE = sys.platform.startswith('linux') and hasattr(socket, 'MSG_ERRQUEUE')
+_IP_RECVERR = getattr(socket, 'IP_RECVERR', 11)
+_SO_EE_ORIGIN_ICMP = 2
+_ICMP_UNREACHABLE = 3
+_PORT_UNREACHABLE = 3
+_UNREACHABLE_CODES = {0: 'Network unreachable', 1: 'Host unreachable', 2: 'Protocol unreachable',
+                      9: 'Network prohibited', 10: 'Host prohibited', 13: 'Administratively prohibited'}
+
+
+def parse_service(service):
+    """(kind, port) for 'udp:<port>', 'dns:<port>', 'ntp:<port>' or 'snmp:<port>', else None."""
+    kind, _, port = service.strip().lower().partition(':')
+    if kind in UDP_SERVICES and port.isdigit() and 0 < int(port) < 65536:
+        return kind, int(port)
+    return None
+
+
+# --- Protocol Messages ---
+
+def _ber(tag, content):
+    length = len(content)
+    if length < 0x80:
+        return bytes([tag, length]) + content
+    size = (length.bit_length() + 7) // 8
+    return bytes([tag, 0x80 | size]) + length.to_bytes(size, 'big') + content
+
+
+def _ber_int(value):
+    return _ber(0x02, value.to_bytes(value.bit_length() // 8 + 1, 'big', signed=True))
+
+
+def _ber_items(data, start=0, end=None):
+    """Yields (tag, content start, content end) for each BER element in data[start:end]."""
+    end = len(data) if end is None else end
+    i = start
+    while i + 2 <= end:
+        tag, length = data[i], data[i + 1]
+        i += 2
+        if length & 0x80:
+            size = length & 0x7f
+            length = int.from_bytes(data[i:i + size], 'big')
+            i += size
+        if i + length > end:
+            raise ValueError("Truncated BER element")
+        yield tag, i, i + length
+        i += length
+
+
+def _ber_children(data, item):
+    return list(_ber_items(data, item[1], item[2]))
+
+
+def _ntp_time(raw):
+    seconds, fraction = struct.unpack('>II', raw)
+    return seconds - _NTP_EPOCH_OFFSET + fraction / 2 ** 32
+
+
+class UdpRequest:
+    """One datagram exchange, shared by every test of the same (address, kind, port)."""
+    __slots__ = ('kind', 'address', 'port', 'community', 'payload', 'token', 'attempts', 'sent_at', 'sent_wall',
+                 'first_sent_at', 'deadline', 'outcome')
+
+    def __init__(self, kind, address, port, community=DEFAULT_SNMP_COMMUNITY):
+        self.kind, self.address, self.port, self.community = kind, address, port, community
+        self.attempts = 0
+        self.sent_at = self.sent_wall = self.first_sent_at = self.deadline = None
+        self.outcome = None # (ok, details, round trip ms) once answered or given up
+        self.rekey()
+
+    def rekey(self):
+        """Picks a new random id (token) and rebuilds the payload around it."""
+        nonce = os.urandom(8)
+        kind = self.kind
+        if kind == 'dns':
+            self.token = nonce[:2]
+            self.payload = self.token + struct.pack('>HHHHH', 0x0100, 1, 0, 0, 0) + b'\x00' + struct.pack('>HH', 2, 1) # . NS IN
+        elif kind == 'ntp':
+            self.token = nonce # Random transmit timestamp; the reply carries it as its originate timestamp
+            self.payload = b'\x23' + bytes(39) + self.token
+        elif kind == 'snmp':
+            self.token = int.from_bytes(nonce[:4], 'big') & 0x7fffffff
+            varbind = _ber(0x30, _ber(0x06, _SNMP_SYS_DESCR) + b'\x05\x00')
+            pdu = _ber(0xa0, _ber_int(self.token) + _ber_int(0) + _ber_int(0) + _ber(0x30, varbind))
+            self.payload = _ber(0x30, _ber_int(1) + _ber(0x04, self.community.encode('utf-8')) + pdu)
+        else:
+            self.token = None
+            self.payload = b'\r\n' # Draws an answer from many line-based services (echo, daytime, ...)
+
+    @staticmethod
+    def reply_token(kind, data):
+        """The token a reply of this kind carries (what match() compares), or None if it has none."""
+        if kind == 'dns':
+            return bytes(data[:2]) if len(data) >= 12 else None
+        if kind == 'ntp':
+            return bytes(data[24:32]) if len(data) >= 48 else None
+        if kind == 'snmp':
+            try:
+                pdu = _ber_children(data, next(_ber_items(data)))[2]
+                request_id = _ber_children(data, pdu)[0]
+                return int.from_bytes(data[request_id[1]:request_id[2]], 'big', signed=True)
+            except (StopIteration, IndexError, ValueError):
+                return None
+        return None
+
+    def match(self, data, received_wall):
+        """(ok, details) if data is the reply to this request, else None."""
+        if self.kind == 'dns':
+            if len(data) < 12 or data[:2] != self.token or not data[2] & 0x80:
+                return None
+            rcode, answers = data[3] & 0x0f, struct.unpack('>H', data[6:8])[0]
+            return rcode != 2, f"DNS reply {_DNS_RCODES.get(rcode, f'RCODE {rcode}')}, {answers} answer(s)"
+        if self.kind == 'ntp':
+            if len(data) < 48 or data[24:32] != self.token or data[0] & 0x07 != 4:
+                return None
+            stratum = data[1]
+            if stratum == 0 or stratum >= 16:
+                return False, f"NTP server unsynchronized (stratum {stratum})"
+            receive, transmit = _ntp_time(data[32:40]), _ntp_time(data[40:48])
+            offset = ((receive - self.sent_wall) + (transmit - received_wall)) / 2
+            return True, f"NTP stratum {stratum}, offset {offset * 1000:+.1f} ms"
+        if self.kind == 'snmp':
+            try:
+                pdu = _ber_children(data, next(_ber_items(data)))[2]
+                if pdu[0] != 0xa2:
+                    return None
+                request_id, error_status, _error_index, varbinds = _ber_children(data, pdu)[:4]
+                if int.from_bytes(data[request_id[1]:request_id[2]], 'big', signed=True) != self.token:
+                    return None
+                status = int.from_bytes(data[error_status[1]:error_status[2]], 'big')
+                if status:
+                    return False, f"SNMP error-status {status}"
+                value = _ber_children(data, _ber_children(data, varbinds)[0])[1]
+                if value[0] != 0x04:
+                    return True, "SNMP agent answered (sysDescr.0 not available)"
+                descr = bytes(data[value[1]:value[2]]).decode('utf-8', 'replace').strip().split('\n')[0]
+                return True, f"SNMP sysDescr: {descr[:80]}"
+            except (StopIteration, IndexError, ValueError):
+                return None
+        return True, f"Port {self.port} answered ({len(data)} bytes)"
+
+    def unreachable(self, code, offender):
+        """Details for an ICMP destination unreachable (code) about this request, from offender."""
+        if code == _PORT_UNREACHABLE and offender == self.address:
+            return f"Port {self.port} closed (ICMP port unreachable)"
+        reason = _UNREACHABLE_CODES.get(code, f'Destination unreachable (code {code})')
+        return f"{reason} (ICMP from {offender})"
+
+    def no_reply(self):
+        if self.kind == 'udp':
+            return f"No reply from port {self.port} (open or filtered)"
+        if self.kind == 'snmp':
+            return "No SNMP reply (agent down, filtered or wrong community)"
+        return f"No {self.kind.upper()} reply on port {self.port}"
+
+
+# --- Batch Engine ---
+
+class UdpBatch:
+    """
+    Sends requests from a few non-blocking sockets and matches replies by (address, port)
+    and protocol id, all in one selector loop. Not thread-safe; use one batch per thread.
+    """
+
+    def __init__(self, sockets=DEFAULT_SOCKETS, send_rate=DEFAULT_SEND_RATE, retries=DEFAULT_RETRIES):
+        self.sockets = max(1, sockets)
+        self.send_rate = send_rate
+        self.retries = max(0, retries)
+        self.stats = {'requests': 0, 'datagrams_sent': 0, 'replies': 0, 'unmatched': 0, 'unreachable': 0}
+
+    def _open_sockets(self, count):
+        socks = []
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            if _ERROR_QUEUE:
+                sock.setsockopt(socket.IPPROTO_IP, _IP_RECVERR, 1)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+            except OSError:
+                pass
+            socks.append(sock)
+        return socks
+
+    def run(self, requests, timeout):
+        """Runs the requests until each has an outcome or timeout (split across retries) has passed."""
+        requests = list(requests)
+        self.stats['requests'] += len(requests)
+        if not requests:
+            return requests
+        attempt_timeout = timeout / (self.retries + 1)
+        socks = self._open_sockets(min(self.sockets, len(requests)))
+        selector = selectors.DefaultSelector()
+        for sock in socks:
+            selector.register(sock, selectors.EVENT_READ)
+        pending = {}    # (address, port) -> {kind: {token: request awaiting a reply}}
+        expiries = []   # (attempt deadline, seq, request, attempt number)
+        to_send = list(reversed(requests)) # Popped from the end: first request first
+        started, sent, seq = time.perf_counter(), 0, 0
+        try:
+            while to_send or expiries:
+                now = time.perf_counter()
+                # Send what the rate allows
+                allowed = len(to_send) if not self.send_rate else int((now - started) * self.send_rate) + 1 - sent
+                while to_send and allowed > 0:
+                    request = to_send.pop()
+                    if request.outcome is not None:
+                        continue # Answered or refused while queued for a retry
+                    if not request.attempts:
+                        waiting = pending.setdefault((request.address, request.port), {}).setdefault(request.kind, {})
+                        for _ in range(REKEY_TRIES):
+                            if request.token is None or request.token not in waiting:
+                                break
+                            request.rekey() # Id already in use towards this endpoint
+                        waiting[request.token] = request
+                    try:
+                        self._sendto(socks[sent % len(socks)], request)
+                    except BlockingIOError:
+                        to_send.append(request)
+                        break
+                    except OSError as e:
+                        request.outcome = (False, f"Send failed: {e.strerror or e}", None)
+                        self._forget(pending, request)
+                        continue
+                    sent += 1
+                    self.stats['datagrams_sent'] += 1
+                    allowed -= 1
+                    request.attempts += 1
+                    request.sent_at, request.sent_wall = time.perf_counter(), time.time()
+                    if request.first_sent_at is None:
+                        request.first_sent_at = request.sent_at
+                        request.deadline = request.sent_at + timeout
+                    seq += 1
+                    heapq.heappush(expiries, (min(request.sent_at + attempt_timeout, request.deadline), seq, request, request.attempts))
+                # Wait for replies until the next expiry (or the next send slot)
+                wait = max(0.0, expiries[0][0] - time.perf_counter()) if expiries else 0.0
+                if to_send:
+                    wait = min(wait, 1.0 / self.send_rate if self.send_rate else 0.0)
+                for key, _events in selector.select(wait):
+                    self._drain(key.fileobj, pending)
+                # Retry or give up on requests whose attempt timed out
+                now = time.perf_counter()
+                while expiries and expiries[0][0] <= now:
+                    _expiry, _seq, request, attempt = heapq.heappop(expiries)
+                    if request.outcome is not None or attempt != request.attempts:
+                        continue # Answered, or sent again since
+                    if request.attempts <= self.retries and now < request.deadline:
+                        to_send.append(request)
+                    else:
+                        request.outcome = (False, request.no_reply(), None)
+                        self._forget(pending, request)
+                while expiries and expiries[0][2].outcome is not None: # Nothing left to wait for on these
+                    heapq.heappop(expiries)
+        finally:
+            selector.close()
+            for sock in socks:
+                sock.close()
+        return requests
+
+    @staticmethod
+    def _sendto(sock, request):
+        try:
+            sock.sendto(request.payload, (request.address, request.port))
+        except (BlockingIOError, InterruptedError):
+            raise
+        except OSError:
+            if not _ERROR_QUEUE:
+                raise
+            # An earlier request's ICMP error reported on this call (it is also in the error queue); send again
+            sock.sendto(request.payload, (request.address, request.port))
+
+    def _drain_errors(self, sock, pending):
+        """Fails the requests an ICMP destination unreachable was returned for (Linux error queue)."""
+        while True:
+            try:
+                _data, ancdata, _flags, destination = sock.recvmsg(0, 512, socket.MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError):
+                return
+            received = time.perf_counter()
+            for level, kind, data in ancdata:
+                if level != socket.IPPROTO_IP or kind != _IP_RECVERR or len(data) < 24:
+                    continue
+                _errno, origin, icmp_type, icmp_code = struct.unpack_from('=IBBB', data)
+                if origin != _SO_EE_ORIGIN_ICMP or icmp_type != _ICMP_UNREACHABLE:
+                    continue
+                offender = socket.inet_ntoa(data[20:24]) # sockaddr_in after the 16-byte sock_extended_err
+                self.stats['unreachable'] += 1
+                for waiting in list(pending.get(destination[:2], {}).values()):
+                    for request in list(waiting.values()): # Every kind sent to this (address, port)
+                        request.outcome = (False, request.unreachable(icmp_code, offender), (received - request.sent_at) * 1000)
+                        self._forget(pending, request)
+
+    def _drain(self, sock, pending):
+        if _ERROR_QUEUE:
+            self._drain_errors(sock, pending)
+        while True:
+            try:
+                data, (address, port) = sock.recvfrom(MAX_DATAGRAM)[:2]
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # Linux: the ICMP error just read from the error queue is reported once more here.
+                # Windows: an ICMP port unreachable fails recvfrom without saying for which address.
+                continue
+            received, received_wall = time.perf_counter(), time.time()
+            self.stats['replies'] += 1
+            matched = None
+            for kind, waiting in pending.get((address, port), {}).items():
+                request = waiting.get(UdpRequest.reply_token(kind, data))
+                matched = request.match(data, received_wall) if request is not None else None
+                if matched is not None:
+                    request.outcome = (matched[0], matched[1], (received - request.sent_at) * 1000)
+                    self._forget(pending, request)
+                    break
+            if matched is None:
+                self.stats['unmatched'] += 1
+
+    @staticmethod
+    def _forget(pending, request):
+        kinds = pending.get((request.address, request.port))
+        waiting = kinds.get(request.kind) if kinds else None
+        if waiting is not None and waiting.get(request.token) is request:
+            del waiting[request.token]
+            if not waiting:
+                del kinds[request.kind]
+            if not kinds:
+                del pending[(request.address, request.port)]
+
+
+def run_batch(tests, timeout=DEFAULT_TIMEOUT, community=DEFAULT_SNMP_COMMUNITY, batch=None, resolver=socket.gethostbyname):
+    """
+    Runs UDP tests together. tests: iterable of (host, service) with services parse_service()
+    accepts. Returns {(host, service lower case): result dictionary}.
+    """
+    batch = batch or UdpBatch()
+    tests = [(host, service.strip().lower()) for host, service in tests]
+    addresses = endpoint_plan.resolve_names({host.strip().lower() for host, _service in tests}, resolver=resolver)
+    requests, by_test = {}, {}
+    for host, service in tests:
+        kind, port = parse_service(service)
+        address = addresses.get(host.strip().lower())
+        if address is None:
+            by_test[(host, service)] = None
+            continue
+        key = (address, kind, port)
+        if key not in requests:
+            requests[key] = UdpRequest(kind, address, port, community)
+        by_test[(host, service)] = requests[key]
+    batch.run(requests.values(), timeout)
+
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    results = {}
+    for (host, service), request in by_test.items():
+        if request is None:
+            ok, details, rtt = False, 'DNS Resolution Error', None
+        else:
+            ok, details, rtt = request.outcome or (False, request.no_reply(), None)
+        results[(host, service)] = {'Timestamp': timestamp, 'TargetHost': host, 'Service': service,
+                                    'Status': 'SUCCESS' if ok else 'FAILED', 'Details': details,
+                                    'Timing': f"{rtt:.0f} ms" if rtt is not None else '', 'SuccessBool': ok}
+    return results
+
+
+def udp_result(host, service, timeout=DEFAULT_TIMEOUT, community=DEFAULT_SNMP_COMMUNITY):
+    """Result dictionary for a single UDP test (a batch of one)."""
+    return run_batch([(host, service)], timeout, community)[(host, service.strip().lower())]
+
+
+if __name__ == '__main__':
+    import argparse
+    import random
+    import threading
+
+    parser = argparse.ArgumentParser(description="Sends a batch of DNS queries to a local responder that drops some of them, "
+                                                 "and compares the time with one socket and one timeout wait per probe.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--probes', type=int, default=20000, help="Queries in the batch.")
+    parser.add_argument('--loss', type=float, default=0.05, help="Fraction of queries the responder ignores.")
+    parser.add_argument('--timeout', type=float, default=1.0, help="Seconds per probe, retries included.")
+    parser.add_argument('--sockets', type=int, default=DEFAULT_SOCKETS)
+    parser.add_argument('--send-rate', type=int, default=50000, help="Datagrams per second (0 = unlimited).")
+    bench_args = parser.parse_args()
+
+    responder = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    responder.bind(('127.0.0.1', 0))
+    responder.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+    port = responder.getsockname()[1]
+    rng = random.Random(1)
+
+    def respond():
+        while True:
+            try:
+                data, peer = responder.recvfrom(MAX_DATAGRAM)
+            except OSError:
+                return
+            if rng.random() >= bench_args.loss:
+                responder.sendto(data[:2] + b'\x81\x80' + data[4:], peer) # Same id, QR bit set, NOERROR
+
+    threading.Thread(target=respond, daemon=True).start()
+    requests = [UdpRequest('dns', '127.0.0.1', port) for _ in range(bench_args.probes)]
+    batch = UdpBatch(sockets=bench_args.sockets, send_rate=bench_args.send_rate)
+    start = time.perf_counter()
+    batch.run(requests, bench_args.timeout)
+    elapsed = time.perf_counter() - start
+    answered = sum(1 for request in requests if request.outcome and request.outcome[0])
+    retried = sum(1 for request in requests if request.attempts > 1)
+    print(f"{len(requests):,} queries from {min(bench_args.sockets, len(requests))} socket(s): {answered:,} answered, "
+          f"{retried:,} sent again, {len(requests) - answered:,} without reply, in {elapsed:.2f}s")
+    print(f"  {batch.stats['datagrams_sent']:,} datagrams sent, {batch.stats['replies']:,} received, {batch.stats['unmatched']:,} unmatched")
+    lost = len(requests) - answered
+    print(f"One probe at a time would wait about {lost * bench_args.timeout:,.0f}s on the unanswered ones alone")
+    responder.close()
@@ -0,0 +1,9 @@
+# The tools are flat scripts, not packages: put both script directories on sys.path so the
+# tests import their modules the way the scripts do.
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'infra_testing_script')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,62 @@
+import pytest
+
+for requirement in ('flask', 'flask_cors', 'requests'): # app.py's prerequisites, not installed by CI
+    pytest.importorskip(requirement)
+import app
+import job_deadline
+import probe_coalescer
+
+
+@pytest.fixture
+def probe_cache(monkeypatch):
+    cache = probe_coalescer.ProbeCoalescer(freshness_seconds=60)
+    monkeypatch.setattr(app, 'probe_cache', cache)
+    monkeypatch.setattr(app, 'test_ping', lambda host, timeout, limit=None: {
+        'Timestamp': '2026-01-01 00:00:00', 'TargetHost': host, 'Service': 'ping', 'Status': app.STATUS_SUCCESS,
+        'Details': f'timeout {timeout}', 'SuccessBool': True})
+    return cache
+
+
+def test_results_cut_short_by_a_deadline_are_not_cached(probe_cache):
+    # Under a second left: ping is not started and reported SKIPPED (deadline)
+    [skipped] = app.test_service('127.0.0.1', 'ping', deadline=job_deadline.Deadline(0.8))
+    assert (skipped['Status'], skipped['Details']) == (app.STATUS_SKIPPED, job_deadline.DEADLINE_DETAILS)
+    [shortened] = app.test_service('127.0.0.1', 'ping', deadline=job_deadline.Deadline(2.5))
+    assert shortened['Details'] == 'timeout 2'
+    [full] = app.test_service('127.0.0.1', 'ping')
+    assert (full['Status'], full['Details']) == (app.STATUS_SUCCESS, f'timeout {app.PING_TIMEOUT}')
+    assert probe_cache.stats()['cache_hits'] == 0
+    # A job with a deadline may still reuse a full result
+    [reused] = app.test_service('127.0.0.1', 'ping', deadline=job_deadline.Deadline(2.5))
+    assert reused['Details'] == f'timeout {app.PING_TIMEOUT}' and probe_cache.cache_hits == 1
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    store = app.job_store.JobStore(str(tmp_path / app.job_store.DEFAULT_DB_FILENAME))
+    monkeypatch.setattr(app, '_job_store', store)
+    return app.app.test_client(), store
+
+
+def test_finished_results_revalidate_with_304(client):
+    http, store = client
+    job_id = store.create_job()
+    store.finish_job(job_id, [{'TargetHost': f'host{i}', 'Status': 'FAILED' if i % 3 else 'SUCCESS'} for i in range(100)])
+    first = http.get(f'/jobs/{job_id}/results', headers={'Accept-Encoding': 'gzip'})
+    assert first.status_code == 200 and first.headers['Content-Encoding'] == 'gzip'
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+    again = http.get(f'/jobs/{job_id}/results', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b'' and again.headers['ETag'] == etag
+    # Another query is another representation
+    page = http.get(f'/jobs/{job_id}/results?limit=10&status=failed', headers={'If-None-Match': etag})
+    assert page.status_code == 200 and page.headers['ETag'] != etag
+    assert page.json['matched'] == 66 and page.json['next_cursor'] == 14
+    assert http.get(f'/jobs/{job_id}/results?limit=0').status_code == 400
+
+
+def test_unfinished_results_are_not_cached(client):
+    http, store = client
+    job_id = store.create_job()
+    response = http.get(f'/jobs/{job_id}/results')
+    assert response.status_code == 409 and 'ETag' not in response.headers
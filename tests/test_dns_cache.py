@@ -0,0 +1,95 @@
+import pytest
+
+pytest.importorskip('dns') # dnspython: installed with _nslookup_tool.py, not by CI
+import dns.message
+import dns.name
+import dns.rcode
+import dns.resolver
+import dns.rrset
+
+import _dns_cache
+import _dns_pipeline
+import _nslookup_tool
+
+KEY = _dns_cache.DnsAnswerCache.make_key('10.0.0.53', 'Host.Example.', 'A')
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = _dns_cache.DnsAnswerCache(str(tmp_path / 'answers.sqlite'), max_entries=3)
+    yield cache
+    cache.conn.close()
+
+
+def test_key_is_per_server_and_case_insensitive():
+    assert KEY == _dns_cache.DnsAnswerCache.make_key('10.0.0.53', 'host.example.', 'A')
+    assert KEY != _dns_cache.DnsAnswerCache.make_key('10.0.0.54', 'host.example.', 'A')
+
+
+def test_entry_expires_after_its_ttl(cache):
+    cache.put(KEY, {'Result': '192.0.2.1'}, ttl=60, now=1000)
+    cache.flush()
+    assert cache.get(KEY, now=1059) == {'Result': '192.0.2.1'}
+    assert cache.get(KEY, now=1060) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_max_age_replaces_the_ttl(tmp_path):
+    cache = _dns_cache.DnsAnswerCache(str(tmp_path / 'answers.sqlite'), max_age=10)
+    cache.put(KEY, 'x', ttl=3600, now=1000)
+    cache.flush()
+    assert cache.get(KEY, now=1009) == 'x'
+    assert cache.get(KEY, now=1010) is None
+    cache.conn.close()
+
+
+def test_eviction_drops_the_least_recently_used(cache):
+    for i in range(4):
+        cache.put(f"key{i}", i, ttl=3600, now=1000 + i)
+    cache.flush()
+    assert cache.get('key0', now=2000) == 0 # Touched: now the most recently used
+    assert cache.evict() == 1
+    assert cache.get('key1', now=2001) is None
+    assert [cache.get(f"key{i}", now=2002) for i in (0, 2, 3)] == [0, 2, 3]
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / 'answers.sqlite')
+    cache = _dns_cache.DnsAnswerCache(path)
+    cache.put(KEY, ['a', 1], ttl=3600)
+    cache.close()
+    cache = _dns_cache.DnsAnswerCache(path)
+    assert cache.get(KEY) == ['a', 1]
+    cache.close()
+
+
+def nxdomain_reply(soa_ttl, minimum):
+    query = dns.message.make_query('missing.example.', 'A')
+    response = dns.message.make_response(query)
+    response.set_rcode(dns.rcode.NXDOMAIN)
+    response.authority.append(dns.rrset.from_text('example.', soa_ttl, 'IN', 'SOA',
+                                                  f'ns.example. admin.example. 1 3600 600 86400 {minimum}'))
+    return response.to_wire()
+
+
+@pytest.fixture
+def nslookup(monkeypatch):
+    """_nslookup_tool with the modules it imports on first use, as a run with --cache sets them up."""
+    _nslookup_tool.import_dnspython()
+    monkeypatch.setattr(_nslookup_tool, '_dns_cache', _dns_cache)
+    monkeypatch.setattr(_nslookup_tool, '_dns_pipeline', _dns_pipeline)
+    monkeypatch.setattr(_nslookup_tool, 'answer_cache', object()) # NXDOMAIN replies are parsed only with --cache
+    return _nslookup_tool
+
+
+def test_negative_ttl_is_the_soa_minimum(nslookup):
+    with pytest.raises(dns.resolver.NXDOMAIN) as raised:
+        nslookup.answer_from_reply('missing.example.', 'A', (nxdomain_reply(3600, 60), None), 'test')
+    assert nslookup.negative_ttl(raised.value) == 60
+    with pytest.raises(dns.resolver.NXDOMAIN) as raised:
+        nslookup.answer_from_reply('missing.example.', 'A', (nxdomain_reply(30, 60), None), 'test')
+    assert nslookup.negative_ttl(raised.value) == 30 # RFC 2308: the lower of the SOA TTL and minimum
+
+
+def test_negative_ttl_without_soa_uses_the_default(nslookup):
+    assert nslookup.negative_ttl(dns.resolver.NXDOMAIN(qnames=[dns.name.from_text('x.')])) == _dns_cache.DEFAULT_NEGATIVE_TTL
@@ -0,0 +1,139 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+pytest.importorskip('dns') # dnspython: installed with _nslookup_tool.py, not by CI
+import dns.exception
+import dns.flags
+import dns.message
+
+import _dns_pipeline
+
+ANSWER_A = b'\xc0\x0c\x00\x01\x00\x01\x00\x00\x01\x2c\x00\x04\x7f\x00\x00\x01' # 127.0.0.1, TTL 300
+
+
+def answer(query, truncated=False):
+    """A reply to query: one A record, or an empty truncated (TC) reply."""
+    qend = query.index(b'\x00', 12) + 5
+    if truncated:
+        return query[:2] + b'\x83\x80\x00\x01\x00\x00\x00\x00\x00\x00' + query[12:qend]
+    return query[:2] + b'\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00' + query[12:qend] + ANSWER_A
+
+
+class StubResponder:
+    """UDP (and TCP) DNS responder on a loopback address; drops the first `drop` datagrams of every question."""
+
+    def __init__(self, address='127.0.0.1', family=socket.AF_INET, port=0, drop=0, truncate=False):
+        self.drop, self.truncate = drop, truncate
+        self.seen = {} # question bytes -> datagrams received
+        self.tcp_queries = 0
+        self.udp = socket.socket(family, socket.SOCK_DGRAM)
+        self.udp.bind((address, port))
+        self.address, self.port = address, self.udp.getsockname()[1]
+        self.tcp = socket.socket(family, socket.SOCK_STREAM)
+        self.tcp.bind((address, self.port))
+        self.tcp.listen()
+        threading.Thread(target=self._serve_udp, daemon=True).start()
+        threading.Thread(target=self._serve_tcp, daemon=True).start()
+
+    def _serve_udp(self):
+        while True:
+            try:
+                data, source = self.udp.recvfrom(4096)
+            except OSError:
+                return
+            question = data[12:]
+            self.seen[question] = self.seen.get(question, 0) + 1
+            if self.seen[question] > self.drop:
+                self.udp.sendto(answer(data, self.truncate), source)
+
+    def _serve_tcp(self):
+        while True:
+            try:
+                conn, _source = self.tcp.accept()
+            except OSError:
+                return
+            with conn:
+                length = struct.unpack('!H', conn.recv(2))[0]
+                data = conn.recv(length)
+                self.tcp_queries += 1
+                reply = answer(data)
+                conn.sendall(struct.pack('!H', len(reply)) + reply)
+
+    def close(self):
+        self.udp.close()
+        self.tcp.close()
+
+
+@pytest.fixture
+def responder():
+    stubs = []
+
+    def start(**kwargs):
+        stubs.append(StubResponder(**kwargs))
+        return stubs[-1]
+    yield start
+    for stub in stubs:
+        stub.close()
+
+
+def test_build_query_wire_matches_dnspython():
+    message = dns.message.make_query('www.example.com.', 'AAAA')
+    message.id = 0
+    assert _dns_pipeline.build_query_wire('www.example.com', 'AAAA') == message.to_wire()
+
+
+def test_results_come_back_in_input_order_with_placeholders(responder):
+    stub = responder()
+    queries = [(f"host{i}.example.", 'A') if i % 5 else None for i in range(200)]
+    results = list(_dns_pipeline.iter_resolve_pipelined(queries, [stub.address], port=stub.port, window=16))
+    assert [query for query, _reply in results] == queries
+    for query, (wire, error) in results:
+        if query is None:
+            assert (wire, error) == (None, None)
+            continue
+        assert error is None
+        response = _dns_pipeline.parse_response(wire)
+        assert str(response.question[0].name) == query[0]
+        assert response.answer[0][0].address == '127.0.0.1'
+
+
+def test_dropped_query_is_retransmitted(responder):
+    stub = responder(drop=1)
+    [(wire, error)] = _dns_pipeline.resolve_pipelined([('lost.example.', 'A')], [stub.address], port=stub.port,
+                                                      timeout=0.2, retries=2)
+    assert error is None and wire is not None
+    assert list(stub.seen.values()) == [2]
+
+
+def test_gives_up_after_the_retries(responder):
+    stub = responder(drop=99)
+    [(wire, error)] = _dns_pipeline.resolve_pipelined([('gone.example.', 'A')], [stub.address], port=stub.port,
+                                                      timeout=0.1, retries=2)
+    assert wire is None
+    assert isinstance(error, dns.exception.Timeout)
+    assert list(stub.seen.values()) == [3]
+
+
+def test_truncated_reply_is_retried_over_tcp(responder):
+    stub = responder(truncate=True)
+    [(wire, error)] = _dns_pipeline.resolve_pipelined([('big.example.', 'TXT')], [stub.address], port=stub.port, timeout=1)
+    assert error is None
+    response = _dns_pipeline.parse_response(wire)
+    assert not response.flags & dns.flags.TC
+    assert response.answer
+    assert stub.tcp_queries == 1
+
+
+def test_mixed_ipv4_and_ipv6_nameservers(responder):
+    try:
+        silent6 = responder(address='::1', family=socket.AF_INET6, drop=99)
+        stub4 = responder(port=silent6.port) # Every nameserver is asked on the same port
+    except OSError:
+        pytest.skip("needs IPv6 loopback and a port free on both families")
+    results = _dns_pipeline.resolve_pipelined([(f"host{i}.example.", 'A') for i in range(20)], ['::1', '127.0.0.1'],
+                                              port=stub4.port, timeout=0.2, retries=1)
+    assert all(error is None for _wire, error in results) # First sent to ::1, answered on the retransmit to 127.0.0.1
+    assert set(silent6.seen.values()) == {1} and set(stub4.seen.values()) == {1}
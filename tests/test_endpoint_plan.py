@@ -0,0 +1,88 @@
+import pickle
+import socket
+
+import pytest
+
+import endpoint_plan
+from endpoint_plan import EndpointPlan
+
+ADDRESSES = {'www.example.net': '192.0.2.10', 'shop.example.net': '192.0.2.10', 'db.example.net': '192.0.2.20'}
+TARGETS = [
+    {'host': 'www.example.net', 'services': ['ping', 'tcp:443', 'https']},
+    {'host': 'Shop.Example.NET ', 'services': ['ping', 'TCP:0443', 'https', 'http']},
+    {'host': 'db.example.net', 'services': ['tcp:5432']},
+    {'host': 'gone.example.net', 'services': ['ping', 'tcp:22']},
+    {'host': 'web.example.net', 'services': ['http']}, # No ping/tcp: never resolved
+]
+
+
+class FakeResolver:
+    def __init__(self, addresses=ADDRESSES):
+        self.addresses, self.calls = addresses, []
+
+    def __call__(self, name):
+        self.calls.append(name)
+        if name not in self.addresses:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return self.addresses[name]
+
+
+@pytest.fixture
+def resolver():
+    return FakeResolver()
+
+
+@pytest.mark.parametrize('service, tcp, expected', [
+    ('ping', True, 'ping'), (' PING ', True, 'ping'), ('tcp:0443', True, 'tcp:443'), ('tcp:443', False, None),
+    ('tcp:0', True, None), ('tcp:70000', True, None), ('tcp:x', True, None), ('http', True, None), ('https', True, None),
+])
+def test_endpoint_service(service, tcp, expected):
+    assert endpoint_plan.endpoint_service(service, tcp) == expected
+
+
+def test_names_are_resolved_once_and_grouped_by_address(resolver):
+    plan = EndpointPlan.build(TARGETS, workers=4, resolver=resolver)
+    assert sorted(resolver.calls) == ['db.example.net', 'gone.example.net', 'shop.example.net', 'www.example.net']
+    assert plan.stats == {'names': 4, 'unresolved': 1, 'addresses': 2, 'tests': 7, 'endpoint_tests': 5}
+    assert plan.key('www.example.net', 'tcp:443') == plan.key(' SHOP.example.net', 'tcp:0443') == ('192.0.2.10', 'tcp:443')
+    assert plan.key('db.example.net', 'tcp:5432') == ('192.0.2.20', 'tcp:5432')
+    assert "did not resolve" in plan.summary()
+
+
+def test_http_unresolved_and_unknown_names_are_probed_on_their_own(resolver):
+    plan = EndpointPlan.build(TARGETS, workers=1, resolver=resolver)
+    assert plan.key('www.example.net', 'https') is None
+    assert plan.key('shop.example.net', 'http') is None
+    assert plan.key('gone.example.net', 'ping') is None
+    assert plan.key('other.example.net', 'ping') is None
+
+
+def test_tcp_false_keeps_tcp_per_name(resolver):
+    plan = EndpointPlan.build(TARGETS, tcp=False, resolver=resolver)
+    assert 'db.example.net' not in resolver.calls # Its only service is tcp
+    assert plan.key('www.example.net', 'tcp:443') is None
+    assert plan.key('shop.example.net', 'ping') == ('192.0.2.10', 'ping')
+    assert plan.stats['tests'] == 3
+
+
+def test_first_result_is_shared_with_a_note(resolver):
+    plan = EndpointPlan.build(TARGETS, resolver=resolver)
+    key = plan.key('www.example.net', 'ping')
+    assert plan.lookup(key) is None
+    result = {'TargetHost': 'www.example.net', 'Service': 'ping', 'Status': 'SUCCESS', 'Details': 'Responded'}
+    plan.store(key, 'www.example.net', result)
+    plan.store(key, 'shop.example.net', dict(result, Status='FAILED')) # The first one stays
+    first_host, stored = plan.lookup(key)
+    shared = plan.shared_result(key, 'shop.example.net', first_host, stored)
+    assert shared == dict(result, TargetHost='shop.example.net',
+                          Details='Responded; same endpoint as www.example.net (192.0.2.10)')
+    assert result['TargetHost'] == 'www.example.net' and plan.shared == 1
+    empty = plan.shared_result(key, 'shop.example.net', first_host, dict(result, Details=''))
+    assert empty['Details'] == 'same endpoint as www.example.net (192.0.2.10)'
+
+
+def test_plan_survives_pickling(resolver):
+    plan = EndpointPlan.build(TARGETS, resolver=resolver)
+    copy = pickle.loads(pickle.dumps(plan))
+    assert copy.addresses == plan.addresses and copy.stats == plan.stats
+    copy.store(('192.0.2.10', 'ping'), 'www.example.net', {'Details': ''}) # Has a working lock of its own
@@ -0,0 +1,65 @@
+import pytest
+
+import host_patterns
+
+
+@pytest.mark.parametrize('pattern, expected', [
+    ('plain.example', ['plain.example']),
+    ('web[1-3]', ['web1', 'web2', 'web3']),
+    ('web[08-10].corp', ['web08.corp', 'web09.corp', 'web10.corp']), # Leading zero pads to the start's width
+    ('db[1-2,7,10-11]', ['db1', 'db2', 'db7', 'db10', 'db11']),
+    ('{web,app}-[1-2]', ['web-1', 'web-2', 'app-1', 'app-2']),
+    ('10.1.[0-1].[1-2]', ['10.1.0.1', '10.1.0.2', '10.1.1.1', '10.1.1.2']),
+    ('tcp:{22,443}', ['tcp:22', 'tcp:443']),
+    ('[::1]', ['[::1]']),      # Not a number list: literal IPv6
+    ('{single}', ['{single}']), # Braces without a comma: literal
+])
+def test_expand(pattern, expected):
+    assert list(host_patterns.expand(pattern)) == expected
+
+
+def test_backwards_range_is_an_error():
+    with pytest.raises(host_patterns.PatternError, match='backwards'):
+        list(host_patterns.expand('web[9-1]'))
+
+
+def test_expansion_limit(monkeypatch):
+    monkeypatch.setattr(host_patterns, 'MAX_PATTERN_EXPANSION', 100)
+    with pytest.raises(host_patterns.PatternError, match='more than 100'):
+        list(host_patterns.expand('h[1-11].[1-10]'))
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('ping,https', ['ping', 'https']),
+    ('ping, tcp:{22,443} ,web[1,3]', ['ping', 'tcp:{22,443}', 'web[1,3]']),
+    (' , ping,,', ['ping']),
+    ('', []),
+])
+def test_split_list_ignores_commas_inside_patterns(text, expected):
+    assert host_patterns.split_list(text) == expected
+
+
+def test_target_list_expands_lazily_and_counts_without_expanding():
+    targets = host_patterns.TargetList()
+    assert targets.add('web[01-03]', 'ping,TCP:{22,443}', site='east') == 3
+    assert targets.add('db', ['HTTPS'], lower_services=False) == 1
+    assert targets.add('empty', ' , ') == 0 # No services: not added
+    targets.set_option('address_mode', 'all')
+    assert len(targets) == 4
+    assert targets.count_services() == 3 * 3 + 1
+    assert targets.pattern_rows() == 2
+    assert list(targets) == [
+        {'host': 'web01', 'services': ['ping', 'tcp:22', 'tcp:443'], 'site': 'east', 'address_mode': 'all'},
+        {'host': 'web02', 'services': ['ping', 'tcp:22', 'tcp:443'], 'site': 'east', 'address_mode': 'all'},
+        {'host': 'web03', 'services': ['ping', 'tcp:22', 'tcp:443'], 'site': 'east', 'address_mode': 'all'},
+        {'host': 'db', 'services': ['HTTPS'], 'address_mode': 'all'},
+    ]
+    assert list(targets) == list(targets) # Re-iterable
+
+
+def test_target_list_rejects_oversized_rows(monkeypatch):
+    monkeypatch.setattr(host_patterns, 'MAX_PATTERN_EXPANSION', 10)
+    targets = host_patterns.TargetList()
+    with pytest.raises(host_patterns.PatternError):
+        targets.add('h[1-11]', 'ping')
+    assert len(targets) == 0
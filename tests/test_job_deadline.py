@@ -0,0 +1,71 @@
+import pickle
+
+import pytest
+
+import host_patterns
+import job_deadline
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def order(targets):
+    return [(target['host'], target['services'][service_index])
+            for _target_index, target, service_index in job_deadline.priority_order(targets)]
+
+
+def test_priority_order_gives_every_host_one_check_first():
+    targets = [{'host': 'a', 'services': ['ping', 'tcp:22', 'https']},
+               {'host': 'b', 'services': ['ping']},
+               {'host': 'c', 'services': []},
+               {'host': 'd', 'services': ['tcp:22', 'https']}]
+    assert order(targets) == [('a', 'ping'), ('b', 'ping'), ('d', 'tcp:22'),
+                              ('a', 'tcp:22'), ('d', 'https'),
+                              ('a', 'https')]
+
+
+def test_priority_order_keeps_input_indexes_and_iterates_a_target_list():
+    targets = host_patterns.TargetList()
+    targets.add('web[1-2]', 'ping,tcp:22')
+    targets.add('db', 'ping')
+    pairs = [(index, service_index) for index, _target, service_index in job_deadline.priority_order(targets)]
+    assert pairs == [(0, 0), (1, 0), (2, 0), (0, 1), (1, 1)]
+    assert order([]) == []
+
+
+def test_timeout_is_cut_to_the_time_left():
+    clock = FakeClock()
+    deadline = job_deadline.Deadline(10, clock=clock)
+    assert deadline.timeout(3) == 3
+    clock.now += 8.5
+    assert deadline.timeout(3) == pytest.approx(1.5)
+    clock.now += 1.1
+    assert deadline.expired()
+    assert deadline.timeout(3) is None
+    assert job_deadline.timeout_for(None, 3) == 3
+
+
+@pytest.mark.parametrize('left, expected', [(9.0, 5), (4.9, 4), (1.0, 1), (0.99, None), (0.6, None), (0.2, None)])
+def test_whole_seconds_rounds_down(left, expected):
+    clock = FakeClock()
+    deadline = job_deadline.Deadline(left, clock=clock)
+    assert deadline.whole_seconds(5) == expected
+
+
+def test_deadline_counts_from_now_and_pickles():
+    deadline = job_deadline.Deadline(30, now=500.0, clock=FakeClock(520.0))
+    assert deadline.remaining() == 10
+    assert pickle.loads(pickle.dumps(deadline)).remaining() == 10
+    with pytest.raises(ValueError):
+        job_deadline.Deadline(0)
+
+
+def test_skipped_result():
+    result = job_deadline.skipped_result('a', 'ping', '2025-01-01 00:00:00')
+    assert result['Status'] == 'SKIPPED' and result['Details'] == job_deadline.DEADLINE_DETAILS
+    assert result['SuccessBool'] is True # Partial, not failed
@@ -0,0 +1,205 @@
+import os
+import threading
+
+import pytest
+
+import job_store
+from job_store import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / job_store.DEFAULT_DB_FILENAME))
+
+
+def leased(items):
+    return [(item['host'], item['service']) for item in items]
+
+
+def test_lease_prefers_the_agents_own_site(store):
+    store.create_sweep([('any1', 'ping', None), ('lon1', 'ping', 'lon'), ('nyc1', 'ping', 'nyc'), ('lon2', 'tcp:22', 'lon')])
+    assert leased(store.lease_work('a', 'lon', 2, 60, now=1000)) == [('lon1', 'ping'), ('lon2', 'tcp:22')]
+    assert leased(store.lease_work('b', 'lon', 10, 60, now=1000)) == [('any1', 'ping')] # Never another site's items
+    assert leased(store.lease_work('c', 'nyc', 10, 60, now=1000)) == [('nyc1', 'ping')]
+
+
+def test_expired_lease_is_handed_out_again(store):
+    job_id = store.create_sweep([('h1', 'ping', None)])
+    [item] = store.lease_work('a', None, 10, 60, now=1000)
+    assert store.get_job(job_id)['status'] == job_store.JOB_RUNNING
+    assert store.lease_work('b', None, 10, 60, now=1059) == []
+    assert store.lease_work('b', None, 10, 60, now=1060) == [item]
+
+
+def test_items_fail_after_max_lease_attempts(store):
+    job_id = store.create_sweep([('h1', 'ping', None), ('h2', 'ping', None)])
+    now = 1000
+    for _ in range(job_store.MAX_LEASE_ATTEMPTS):
+        items = store.lease_work('a', None, 1, 60, now=now) # Only ever h1: the agent never answers
+        assert leased(items) == [('h1', 'ping')]
+        now += 60
+    assert leased(store.lease_work('a', None, 1, 60, now=now)) == [('h2', 'ping')]
+    store.complete_work([(job_id, 1, [{'TargetHost': 'h2', 'Status': 'SUCCESS'}])])
+    [failed, ok] = store.get_results(job_id)
+    assert (failed['TargetHost'], failed['Status']) == ('h1', 'FAILED')
+    assert str(job_store.MAX_LEASE_ATTEMPTS) in failed['Details']
+    assert ok['Status'] == 'SUCCESS' and store.get_job(job_id)['status'] == job_store.JOB_DONE
+
+
+def test_complete_work_ignores_duplicates_and_keeps_input_order(store):
+    job_id = store.create_sweep([('h1', 'ping', None), ('h2', 'tcp:22', None), ('h3', 'http', None)])
+    items = store.lease_work('a', None, 10, 60, now=1000)
+    rows = {item['seq']: [{'TargetHost': item['host'], 'Service': item['service']}] for item in items}
+    assert store.complete_work([(job_id, 2, rows[2]), (job_id, 0, rows[0])]) == 2
+    assert store.get_job(job_id)['completed'] == 2 and store.get_results(job_id) == []
+    # A late agent whose lease had expired sends item 0 again: ignored
+    assert store.complete_work([(job_id, 0, [{'TargetHost': 'late'}]), (job_id, 1, rows[1] * 2)]) == 1
+    assert [row['TargetHost'] for row in store.get_results(job_id)] == ['h1', 'h2', 'h2', 'h3']
+    assert store.get_job(job_id)['status'] == job_store.JOB_DONE
+
+
+def test_empty_sweep_is_done_at_once(store):
+    job_id = store.create_sweep([])
+    assert store.get_job(job_id)['status'] == job_store.JOB_DONE
+
+
+def test_mark_interrupted_fails_the_workers_unfinished_jobs(store):
+    running, queued, done = store.create_job(3), store.create_job(1), store.create_job(1)
+    store.set_running(running)
+    store.finish_job(done, [{'Status': 'SUCCESS'}])
+    sweep = store.create_sweep([('h1', 'ping', None)]) # Belongs to no worker
+    store.mark_interrupted(os.getpid() + 1)
+    assert store.get_job(running)['status'] == job_store.JOB_RUNNING
+    store.mark_interrupted(os.getpid())
+    for job_id in (running, queued):
+        job = store.get_job(job_id)
+        assert job['status'] == job_store.JOB_FAILED and job['error'] and job['finished']
+    assert store.get_job(done)['status'] == job_store.JOB_DONE
+    assert store.get_job(sweep)['status'] == job_store.JOB_QUEUED
+
+
+# --- Chunked uploads ---
+
+@pytest.fixture
+def upload(store):
+    return store.create_upload('hostname,services', {'output_filename': 'out.csv'})
+
+
+def test_chunks_are_recorded_once(store, upload):
+    assert store.add_chunk(upload, 1, 3)
+    assert not store.add_chunk(upload, 1, 3) # Re-sent
+    assert store.add_chunk(upload, 0, 2)
+    job = store.get_job(upload)
+    assert (job['status'], job['total']) == (job_store.JOB_RUNNING, 5)
+
+
+def test_seal_rejects_conflicting_chunk_counts(store, upload):
+    store.add_chunk(upload, 2, 1)
+    assert store.seal_upload(upload, 2) is None # Chunk 2 already arrived
+    assert store.seal_upload(upload, 4) == ([0, 1, 3], False)
+    assert store.seal_upload(upload, 4) == ([0, 1, 3], False) # Repeating the same count is fine
+    assert store.seal_upload(upload, 5) is None
+    assert store.get_upload(upload)['total_chunks'] == 4
+
+
+def test_exactly_one_caller_finishes_the_upload(store, upload):
+    for index in range(3):
+        store.add_chunk(upload, index, 1)
+    assert store.complete_chunk(upload, 0, [{'row': 0}]) is False # Not sealed yet
+    assert store.seal_upload(upload, 3) == ([], False)
+    assert store.complete_chunk(upload, 2, [{'row': 2}]) is False
+    assert store.complete_chunk(upload, 1, [{'row': 1}, {'row': 1.5}]) is True
+    assert store.seal_upload(upload, 3) == ([], False) # Already claimed
+    assert store.upload_results(upload) == [{'row': 0}, {'row': 1}, {'row': 1.5}, {'row': 2}]
+    assert store.get_job(upload)['completed'] == 3
+
+
+def test_concurrent_last_chunks_finish_once(store, upload):
+    chunks = 8
+    for index in range(chunks):
+        store.add_chunk(upload, index, 1)
+    store.seal_upload(upload, chunks)
+    finished = []
+    threads = [threading.Thread(target=lambda index=index: finished.append(store.complete_chunk(upload, index, [])))
+               for index in range(chunks)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(finished) == [False] * (chunks - 1) + [True]
+
+
+def test_seal_finishes_an_upload_whose_chunks_are_all_probed(store, upload):
+    store.add_chunk(upload, 0, 1)
+    assert store.complete_chunk(upload, 0, []) is False
+    assert store.seal_upload(upload, 1) == ([], True)
+    assert store.get_upload(upload)['finished']
+
+
+def test_resume_from_get_upload(store, upload):
+    assert store.get_upload('unknown') is None
+    store.add_chunk(upload, 0, 1)
+    store.add_chunk(upload, 3, 1)
+    store.complete_chunk(upload, 3, [])
+    state = store.get_upload(upload)
+    assert state == {'header': 'hostname,services', 'options': {'output_filename': 'out.csv'}, 'total_chunks': None,
+                     'finished': False, 'received': [0, 3], 'probed': [3]}
+    # The client sends only what did not arrive, then completes
+    for index in set(range(4)) - set(state['received']):
+        assert store.add_chunk(upload, index, 1)
+    assert store.seal_upload(upload, 4) == ([], False)
+
+
+def test_mark_interrupted_forgets_unprobed_chunks(store, upload):
+    store.add_chunk(upload, 0, 2)
+    store.add_chunk(upload, 1, 3)
+    store.complete_chunk(upload, 0, [])
+    store.mark_interrupted(os.getpid())
+    assert store.get_upload(upload)['received'] == [0] # Chunk 1 must be sent again
+    job = store.get_job(upload)
+    assert (job['status'], job['total']) == (job_store.JOB_RUNNING, 2) # Uploads belong to no worker
+    assert store.add_chunk(upload, 1, 3)
+
+
+# --- Result pages ---
+
+@pytest.fixture
+def finished_job(store):
+    job_id = store.create_job()
+    rows = [{'TargetHost': host, 'Status': status} for host, status in [
+        ('web01', 'SUCCESS'), ('web02', 'FAILED'), ('DB_1', 'FAILED'), ('dbx1', 'SKIPPED'), ('web03', 'FAILED'),
+        ('db%2', 'SUCCESS')]]
+    store.finish_job(job_id, rows)
+    return job_id
+
+
+def hosts(rows):
+    return [row['TargetHost'] for row in rows]
+
+
+def test_pages_follow_the_cursor(store, finished_job):
+    rows, cursor = store.get_results_page(finished_job, limit=4)
+    assert hosts(rows) == ['web01', 'web02', 'DB_1', 'dbx1'] and cursor == 3
+    rows, cursor = store.get_results_page(finished_job, after_seq=cursor, limit=2)
+    assert hosts(rows) == ['web03', 'db%2'] and cursor is None # Exactly the last rows: no empty extra page
+    rows, cursor = store.get_results_page(finished_job)
+    assert len(rows) == 6 and cursor is None
+
+
+def test_pages_filter_by_status_and_host_prefix(store, finished_job):
+    rows, cursor = store.get_results_page(finished_job, limit=1, statuses=['FAILED'])
+    assert hosts(rows) == ['web02'] and cursor == 1
+    rows, cursor = store.get_results_page(finished_job, after_seq=cursor, limit=1, statuses=['FAILED'])
+    assert hosts(rows) == ['DB_1'] and cursor == 2
+    rows, cursor = store.get_results_page(finished_job, after_seq=cursor, limit=1, statuses=['FAILED'])
+    assert hosts(rows) == ['web03'] and cursor is None
+    assert store.count_results(finished_job, statuses=['FAILED', 'SKIPPED']) == 4
+    assert hosts(store.get_results_page(finished_job, statuses=['FAILED'], host_prefix='WEB')[0]) == ['web02', 'web03']
+    assert store.count_results(finished_job, host_prefix='web') == 3
+    assert store.count_results(finished_job) == 6
+
+
+def test_host_prefix_wildcards_match_literally(store, finished_job):
+    assert hosts(store.get_results_page(finished_job, host_prefix='db_')[0]) == ['DB_1'] # Not 'dbx1'
+    assert hosts(store.get_results_page(finished_job, host_prefix='db%')[0]) == ['db%2']
+    assert store.count_results(finished_job, host_prefix='%') == 0
@@ -0,0 +1,113 @@
+import json
+import pickle
+import socket
+
+import pytest
+
+import net_replay
+from net_replay import LAYER_DNS, LAYER_PROBE, ReplayBackend, TraceRecorder, VirtualClock
+
+UP = {'Timestamp': '2026-01-01 00:00:00', 'TargetHost': 'web01', 'Service': 'ping', 'Status': 'SUCCESS',
+      'Details': 'Responded to ICMP echo request', 'Timing': '', 'SuccessBool': True}
+DOWN = dict(UP, Status='FAILED', Details='Ping failed (Exit: 1)', SuccessBool=False)
+
+
+@pytest.fixture(params=['trace.jsonl', 'trace.jsonl.gz'])
+def trace(tmp_path, request):
+    return str(tmp_path / request.param)
+
+
+def record(path, *operations):
+    recorder = TraceRecorder(path, tool='test')
+    for method, *args in operations:
+        getattr(recorder, method)(*args)
+    recorder.close()
+    return recorder
+
+
+def test_probe_results_round_trip(trace):
+    per_address = [dict(UP, Service='tcp:22@192.0.2.1'), dict(DOWN, Service='tcp:22@2001:db8::1')]
+    recorder = record(trace, ('record_probe', 'Web01', 'PING', 0.25, UP),
+                      ('record_probe', 'web01', 'tcp:22', 0.5, per_address))
+    assert recorder.count == 2
+    backend = ReplayBackend.load(trace, clock=VirtualClock(start=1000.0))
+    replayed = backend.probe('WEB01 ', 'ping')
+    assert {key: replayed[key] for key in net_replay.RESULT_FIELDS} == {key: UP[key] for key in net_replay.RESULT_FIELDS}
+    assert (replayed['TargetHost'], replayed['Service']) == ('WEB01 ', 'ping') # As asked, not as recorded
+    rows = backend.probe('web01', 'tcp:22')
+    assert [(row['Service'], row['Status']) for row in rows] == [('tcp:22@192.0.2.1', 'SUCCESS'), ('tcp:22@2001:db8::1', 'FAILED')]
+    assert backend.clock.time() == pytest.approx(1000.75) # Latencies advance the virtual clock, nothing is slept
+    assert backend.stats == {'operations': 2, 'served': 2, 'missing': 0}
+
+
+def test_repeated_operations_are_replayed_in_turn(trace):
+    record(trace, ('record_probe', 'web01', 'ping', 0.1, UP), ('record_probe', 'web01', 'ping', 3.0, DOWN),
+           ('record_probe', 'web01', 'ping', 0.2, UP))
+    backend = ReplayBackend.load(trace)
+    statuses = [backend.probe('web01', 'ping')['Status'] for _ in range(5)]
+    assert statuses == ['SUCCESS', 'FAILED', 'SUCCESS', 'SUCCESS', 'FAILED'] # Then from the start again
+    assert backend.clock.elapsed == pytest.approx(0.1 + 3.0 + 0.2 + 0.1 + 3.0)
+
+
+def test_missing_operations_fail(trace):
+    record(trace, ('record_resolve', 'Known.Example', 0.01, '192.0.2.7'), ('record_resolve', 'bad.example', 0.02, None))
+    backend = ReplayBackend.load(trace)
+    missing = backend.probe('web01', 'ping')
+    assert (missing['Status'], missing['Details'], missing['SuccessBool']) == ('FAILED', net_replay.NOT_RECORDED, False)
+    assert backend.resolve('known.example') == '192.0.2.7'
+    with pytest.raises(socket.gaierror, match='Name or service not known'):
+        backend.resolve('bad.example')
+    with pytest.raises(socket.gaierror, match=net_replay.NOT_RECORDED):
+        backend.resolve('other.example')
+    assert backend.dns('known.example', 'A') is None
+    assert backend.stats['missing'] == 3 and backend.stats['served'] == 2
+
+
+def test_dns_scope_falls_back_to_a_trace_recorded_without_sites(trace):
+    reply = net_replay.dns_reply_wire('web01.example', 'A', ['192.0.2.1'])
+    lon_reply = net_replay.dns_reply_wire('web01.example', 'A', ['192.0.2.99'])
+    record(trace, ('record_dns', 'WEB01.example.', 'A', 0.03, reply, None),
+           ('record_dns', 'web01.example', 'A', 0.04, lon_reply, None, 'lon'),
+           ('record_dns', 'gone.example', 'A', 2.0, None, TimeoutError('timed out')))
+    backend = ReplayBackend.load(trace)
+    assert backend.dns('web01.example', 'A', scope='nyc') == (reply, None)
+    assert backend.dns('web01.example', 'A', scope='lon') == (lon_reply, None) # Its own scope first
+    assert backend.dns('web01.example.', 'A') == (reply, None)
+    assert backend.dns('gone.example', 'A', scope='nyc') == (None, ('TimeoutError', 'timed out'))
+    assert backend.dns('web01.example', 'PTR') is None
+
+
+def test_recording_resolver_records_failures_too(trace):
+    def resolve(name):
+        if name != 'a.example':
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return '192.0.2.1'
+    recorder = TraceRecorder(trace, tool='test')
+    resolver = recorder.recording_resolver(resolve)
+    assert resolver('a.example') == '192.0.2.1'
+    with pytest.raises(socket.gaierror):
+        resolver('b.example')
+    recorder.close()
+    backend = ReplayBackend.load(trace)
+    assert backend.resolve('a.example') == '192.0.2.1'
+    with pytest.raises(socket.gaierror):
+        backend.resolve('b.example')
+
+
+def test_layers_filter_and_format_check(trace, tmp_path):
+    record(trace, ('record_probe', 'web01', 'ping', 0.1, UP), ('record_resolve', 'web01', 0.01, '192.0.2.1'))
+    backend = ReplayBackend.load(trace, layers=(LAYER_PROBE,))
+    assert backend.stats['operations'] == 1 and backend.has(LAYER_PROBE, 'web01 ping')
+    assert not backend.has(LAYER_DNS, '* web01 A')
+    old = tmp_path / 'old.jsonl'
+    old.write_text(json.dumps({'net_replay': net_replay.FORMAT_VERSION + 1}) + '\n')
+    with pytest.raises(ValueError, match='trace format'):
+        list(net_replay.read_trace(str(old)))
+
+
+def test_virtual_clock_survives_pickling():
+    clock = VirtualClock(start=50.0)
+    clock.advance(2.5)
+    copy = pickle.loads(pickle.dumps(clock))
+    copy.advance(1.0)
+    assert (clock.time(), copy.time()) == (52.5, 53.5)
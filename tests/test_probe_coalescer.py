@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+import probe_coalescer
+
+
+def slow_probe(release, calls, result):
+    def probe():
+        calls.append(1)
+        release.wait(5)
+        return result
+    return probe
+
+
+def test_concurrent_callers_share_one_probe():
+    coalescer = probe_coalescer.ProbeCoalescer(freshness_seconds=0)
+    release, calls, results = threading.Event(), [], []
+    probe = slow_probe(release, calls, {'Status': 'SUCCESS'})
+    threads = [threading.Thread(target=lambda: results.append(coalescer.run('k', probe))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while coalescer.stats()['shared_in_flight'] < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{'Status': 'SUCCESS'}] * 5
+    assert len({id(result) for result in results}) == 5 # Every caller gets its own copy
+
+
+def test_fresh_result_is_reused_then_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(probe_coalescer.time, 'monotonic', lambda: now[0])
+    coalescer = probe_coalescer.ProbeCoalescer(freshness_seconds=10)
+    calls = []
+    probe = lambda: calls.append(1) or [{'Service': 'tcp:22@a'}]
+    assert coalescer.run('k', probe) == [{'Service': 'tcp:22@a'}]
+    now[0] += 9.9
+    coalescer.run('k', probe)
+    assert len(calls) == 1 and coalescer.cache_hits == 1
+    now[0] += 0.1
+    coalescer.run('k', probe)
+    assert len(calls) == 2
+
+
+def test_cache_is_bounded_least_recently_used_first():
+    coalescer = probe_coalescer.ProbeCoalescer(freshness_seconds=60, max_entries=2)
+    calls = []
+    for key in ('a', 'b', 'a', 'c', 'a', 'b'):
+        coalescer.run(key, lambda key=key: calls.append(key) or {'key': key})
+    assert calls == ['a', 'b', 'c', 'b'] # 'b' was the least recently used when 'c' came in
+    assert coalescer.stats()['cached_results'] == 2
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    coalescer = probe_coalescer.ProbeCoalescer(freshness_seconds=60)
+    release, errors = threading.Event(), []
+
+    def failing():
+        release.wait(5)
+        raise OSError('boom')
+
+    def call():
+        try:
+            coalescer.run('k', failing)
+        except OSError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while coalescer.stats()['shared_in_flight'] < 2:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    assert coalescer.run('k', lambda: {'ok': True}) == {'ok': True}
+
+
+def test_waiter_gives_up_after_its_wait_bound():
+    coalescer = probe_coalescer.ProbeCoalescer()
+    release = threading.Event()
+    leader = threading.Thread(target=coalescer.run, args=('k', slow_probe(release, [], {})))
+    leader.start()
+    while not coalescer.probes:
+        time.sleep(0.01)
+    started = time.monotonic()
+    with pytest.raises(probe_coalescer.WaitTimeout):
+        coalescer.run('k', lambda: {}, wait=0.1)
+    assert time.monotonic() - started < 1
+    release.set()
+    leader.join()
+
+
+def test_unshared_probe_is_neither_joined_nor_cached():
+    coalescer = probe_coalescer.ProbeCoalescer(freshness_seconds=60)
+    release, calls, results = threading.Event(), [], []
+    cut_short = threading.Thread(target=lambda: results.append(
+        coalescer.run('k', slow_probe(release, calls, {'Status': 'SKIPPED'}), share=False)))
+    cut_short.start()
+    while not calls:
+        time.sleep(0.01)
+    # A full probe for the same key runs on its own instead of joining the unshared one
+    assert coalescer.run('k', lambda: calls.append(1) or {'Status': 'SUCCESS'}) == {'Status': 'SUCCESS'}
+    release.set()
+    cut_short.join()
+    assert results == [{'Status': 'SKIPPED'}]
+    assert coalescer.run('k', lambda: {'Status': 'other'}) == {'Status': 'SUCCESS'} # Only the shared result was cached
+    assert coalescer.stats()['probes'] == 2 and coalescer.shared == 0
+
+
+def test_unshared_caller_still_reuses_a_cached_result():
+    coalescer = probe_coalescer.ProbeCoalescer(freshness_seconds=60)
+    coalescer.run('k', lambda: {'Status': 'SUCCESS'})
+    assert coalescer.run('k', lambda: {'Status': 'SKIPPED'}, share=False) == {'Status': 'SUCCESS'}
+    assert coalescer.cache_hits == 1
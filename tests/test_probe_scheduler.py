@@ -0,0 +1,97 @@
+import pytest
+
+import probe_scheduler
+from probe_scheduler import AdaptiveScheduler, CHANGE_DOWN, CHANGE_SLOW, CHANGE_UP
+
+MIN, MAX = 10.0, 100.0
+
+
+class FixedRandom:
+    """rng stand-in: random() always returns value (0.5 means no jitter)."""
+
+    def __init__(self, value=0.5):
+        self.value = value
+
+    def random(self):
+        return self.value
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = AdaptiveScheduler(MIN, MAX, max_rate=1000, rng=FixedRandom())
+    scheduler.add('web', 0.0)
+    return scheduler
+
+
+def feed(scheduler, results, latency=0.02):
+    """Records results (True/False) one interval apart; returns (changes, intervals)."""
+    changes, intervals, now = [], [], 0.0
+    for success in results:
+        changes.append(scheduler.record('web', success, latency, now))
+        intervals.append(scheduler.interval('web'))
+        now += scheduler.interval('web')
+    return changes, intervals
+
+
+def test_stable_check_backs_off_after_the_success_streak(scheduler):
+    changes, intervals = feed(scheduler, [True] * 8)
+    assert changes == [None] * 8 # A first success is not a change
+    assert intervals == [MIN] * probe_scheduler.SUCCESS_STREAK + [20.0, 40.0, 80.0, MAX, MAX]
+
+
+def test_failure_drops_back_to_the_minimum_interval(scheduler):
+    changes, intervals = feed(scheduler, [True] * 5 + [False, True])
+    assert changes[5:] == [CHANGE_DOWN, CHANGE_UP]
+    assert intervals[4] == 40.0 and intervals[5:] == [MIN, MIN]
+    assert scheduler.stats['changes'] == 2 and scheduler.is_up('web')
+
+
+def test_failing_check_backs_off_only_to_its_cap(scheduler):
+    changes, intervals = feed(scheduler, [False] * 8)
+    assert changes == [CHANGE_DOWN] + [None] * 7 # A first failure is reported
+    assert max(intervals) == MIN * probe_scheduler.FAILING_MAX_FACTOR
+    assert intervals[-1] == 40.0 and scheduler.count_down() == 1
+
+
+def test_latency_anomaly_resets_the_interval(scheduler):
+    feed(scheduler, [True] * 5)
+    assert scheduler.interval('web') == 40.0
+    assert scheduler.record('web', True, 0.065, 500.0) is None # Over 3x, but less than LATENCY_MIN_ANOMALY slower
+    assert scheduler.record('web', True, 0.2, 600.0) == CHANGE_SLOW
+    assert scheduler.interval('web') == MIN and scheduler.stats['anomalies'] == 1
+
+
+def test_jitter_comes_from_the_injected_rng():
+    scheduler = AdaptiveScheduler(MIN, MAX, jitter=0.1, rng=FixedRandom(1.0))
+    scheduler.add('web', 0.0)
+    scheduler.take_due(0.0)
+    scheduler.record('web', True, 0.02, 0.0)
+    assert scheduler.next_wakeup(0.0) == pytest.approx(MIN * 1.1)
+    assert scheduler.take_due(MIN * 1.1 - 0.01) == [] and scheduler.take_due(MIN * 1.1) == ['web']
+
+
+def test_token_bucket_caps_probe_starts():
+    scheduler = AdaptiveScheduler(MIN, MAX, max_rate=2, rng=FixedRandom())
+    for key in range(5):
+        scheduler.add(key, 0.0)
+    assert scheduler.take_due(0.0) == [0] # The bucket starts with one token
+    assert scheduler.next_wakeup(0.0) == pytest.approx(0.5)
+    assert scheduler.take_due(0.25) == []
+    assert scheduler.take_due(0.5) == [1]
+    assert scheduler.take_due(5.0) == [2, 3] # Refilled to at most max_rate tokens, oldest first
+    assert scheduler.take_due(5.0, limit=1) == []
+    assert scheduler.stats['late_probes'] == 2 and scheduler.stats['max_late_s'] == 5.0
+    assert scheduler.next_wakeup(5.0) == pytest.approx(0.5)
+
+
+def test_in_flight_checks_are_not_handed_out_again(scheduler):
+    assert scheduler.take_due(0.0) == ['web']
+    assert scheduler.next_wakeup(0.0) is None and scheduler.take_due(50.0) == []
+    scheduler.record('web', True, 0.02, 50.0)
+    assert scheduler.take_due(50.0 + MIN) == ['web']
+
+
+@pytest.mark.parametrize('kwargs', [{'min_interval': 0}, {'min_interval': 20, 'max_interval': 10}, {'max_rate': 0}])
+def test_invalid_settings(kwargs):
+    with pytest.raises(ValueError):
+        AdaptiveScheduler(**kwargs)
@@ -0,0 +1,36 @@
+import gzip
+
+import pytest
+
+import response_compression
+from response_compression import negotiate_encoding
+
+BOTH = ('br', 'gzip')
+
+
+@pytest.mark.parametrize('header, supported, expected', [
+    (None, BOTH, None),
+    ('', BOTH, None),
+    ('identity', BOTH, None),
+    ('gzip', BOTH, 'gzip'),
+    ('gzip, br', BOTH, 'br'),                  # Tie: server preference
+    ('gzip;q=1.0, br;q=0.5', BOTH, 'gzip'),
+    ('br;q=0, gzip;q=0.1', BOTH, 'gzip'),      # q=0 refuses br
+    ('br;q=0, gzip;q=0', BOTH, None),
+    ('*', BOTH, 'br'),
+    ('*;q=0.5, gzip', BOTH, 'gzip'),
+    ('*;q=0.5, br;q=0', BOTH, 'gzip'),         # An explicit coding overrides '*'
+    ('*;q=0', BOTH, None),
+    ('br', ('gzip',), None),                   # Without the brotli module
+    ('GZIP ; Q=0.8 , , br;q=oops', BOTH, 'gzip'), # Case, spacing, empty items and malformed q-values
+])
+def test_negotiate_encoding(header, supported, expected):
+    assert negotiate_encoding(header, supported) == expected
+
+
+def test_gzip_output_is_deterministic():
+    data = b'{"Status": "SUCCESS"}' * 200
+    first = response_compression.compress(data, 'gzip')
+    assert first == response_compression.compress(data, 'gzip') and gzip.decompress(first) == data
+    with pytest.raises(ValueError):
+        response_compression.compress(data, 'deflate')
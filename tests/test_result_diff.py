@@ -0,0 +1,80 @@
+import csv
+
+import pytest
+
+import result_diff
+
+FIELDS = ['Timestamp', 'TargetHost', 'Service', 'Status', 'Details']
+KEYS, IGNORED = result_diff.NETWORK_RESULT_KEYS
+
+
+def row(host, service, status, details='', timestamp='2025-01-01 00:00:00'):
+    return {'Timestamp': timestamp, 'TargetHost': host, 'Service': service, 'Status': status, 'Details': details}
+
+
+PREVIOUS = [row('a', 'ping', 'SUCCESS'), row('b', 'tcp:22', 'SUCCESS'), row('c', 'https', 'FAILED', 'Timeout'),
+            row('d', 'ping', 'SUCCESS')]
+CURRENT = [row('a', 'ping', 'SUCCESS', timestamp='2025-01-02 00:00:00'), # Only an ignored column differs
+           row('b', 'tcp:22', 'FAILED', 'Refused'), row('c', 'https', 'FAILED', 'Timeout'), row('e', 'ping', 'SUCCESS')]
+COMPARED = ['Status', 'Details']
+
+
+def as_set(changes):
+    return {(change, r['TargetHost'], tuple(fields)) for change, r, fields in changes}
+
+
+EXPECTED = {('CHANGED', 'b', ('Status: SUCCESS -> FAILED', 'Details:  -> Refused')),
+            ('ADDED', 'e', ()), ('REMOVED', 'd', ())}
+
+
+def test_in_memory_diff_reports_only_changes():
+    assert as_set(result_diff.diff_rows(PREVIOUS, CURRENT, KEYS, COMPARED)) == EXPECTED
+
+
+def test_partitioned_diff_matches_in_memory(tmp_path):
+    changes = result_diff.diff_rows(PREVIOUS, CURRENT, KEYS, COMPARED, previous_fieldnames=FIELDS,
+                                    current_fieldnames=FIELDS, partitions=3, tmp_dir=str(tmp_path))
+    assert as_set(changes) == EXPECTED
+
+
+def test_duplicate_keys_are_paired_in_order():
+    previous = [row('a', 'tcp:22@x', 'SUCCESS'), row('a', 'tcp:22@x', 'FAILED')]
+    current = [row('a', 'tcp:22@x', 'SUCCESS'), row('a', 'tcp:22@x', 'SUCCESS')]
+    assert as_set(result_diff.diff_rows(previous, current, KEYS, COMPARED)) == {
+        ('CHANGED', 'a', ('Status: FAILED -> SUCCESS',))}
+
+
+def write_csv(path, fieldnames, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_diff_against_file_compares_shared_columns(tmp_path):
+    previous_path = tmp_path / 'previous.csv'
+    write_csv(previous_path, FIELDS + ['Timing'], [dict(r, Timing='5 ms') for r in PREVIOUS])
+    changes = list(result_diff.diff_against_file(str(previous_path), CURRENT, FIELDS, KEYS, IGNORED))
+    assert as_set(changes) == EXPECTED
+
+    diff_path = tmp_path / 'diff.csv'
+    counts = result_diff.write_diff_csv(changes, FIELDS, str(diff_path))
+    assert counts == {'ADDED': 1, 'REMOVED': 1, 'CHANGED': 1}
+    with open(diff_path, encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert {r['Change'] for r in rows} == {'ADDED', 'REMOVED', 'CHANGED'}
+    assert next(r for r in rows if r['Change'] == 'CHANGED')['ChangedFields'] == 'Status: SUCCESS -> FAILED; Details:  -> Refused'
+
+
+def test_diff_against_file_needs_the_key_columns(tmp_path):
+    previous_path = tmp_path / 'previous.csv'
+    write_csv(previous_path, ['Input', 'LookupType'], [])
+    with pytest.raises(ValueError, match='missing key column'):
+        result_diff.diff_against_file(str(previous_path), CURRENT, FIELDS, KEYS, IGNORED)
+
+
+def test_partitions_follow_the_memory_budget(tmp_path):
+    path = tmp_path / 'big.csv'
+    path.write_bytes(b'x' * (3 * 1024 * 1024 + 1))
+    assert result_diff.partitions_for(str(path), memory_budget_mb=1) == 4
+    assert result_diff.partitions_for(str(path), memory_budget_mb=32) == 1
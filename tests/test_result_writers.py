@@ -0,0 +1,107 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import result_writers
+from result_writers import format_for_path, open_writer, part_path
+
+FIELDS = ['TargetHost', 'Service', 'Status', 'Details']
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('results.csv', 'csv'), ('results.CSV.GZ', 'csv.gz'), ('out/results.csv.zst', 'csv.zst'),
+    ('results.jsonl', 'jsonl'), ('results.jsonl.gz', 'jsonl.gz'), ('results.parquet', 'parquet'),
+    ('results.gz', 'csv'), ('results.txt', 'csv'), ('results', 'csv'),
+])
+def test_format_for_path(path, expected):
+    assert format_for_path(path) == expected
+
+
+@pytest.mark.parametrize('path, fmt, index, expected', [
+    ('results.csv.gz', 'csv.gz', 0, 'results.csv.gz'),
+    ('results.csv.gz', 'csv.gz', 2, 'results.2.csv.gz'),
+    ('dir.v1/results.jsonl', 'jsonl', 1, 'dir.v1/results.1.jsonl'),
+    ('results.out', 'csv', 3, 'results.3.out'), # Extension does not match the format
+])
+def test_part_path(path, fmt, index, expected):
+    assert part_path(path, fmt, index) == expected
+
+
+def rows(count):
+    return [{'TargetHost': f'host{i:04d}.example.net', 'Service': 'tcp:443', 'Status': 'SUCCESS' if i % 7 else 'FAILED',
+             'Details': f'Port 443 is open, "quoted", row {i}', 'Extra': 'ignored'} for i in range(count)]
+
+
+def read_part(path, fmt):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if fmt.endswith('.gz'):
+        data = gzip.decompress(data) # Fails on a truncated member
+    text = data.decode('utf-8')
+    if fmt.startswith('jsonl'):
+        return [json.loads(line) for line in text.splitlines()]
+    reader = csv.reader(io.StringIO(text, newline=''))
+    assert next(reader) == FIELDS # Every part has its own header
+    return [dict(zip(FIELDS, row)) for row in reader]
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'csv.gz', 'jsonl', 'jsonl.gz'])
+def test_rotated_parts_are_complete_files(tmp_path, fmt):
+    # Compressed output reaches the file in blocks, so those parts need more rows to fill
+    path, count = str(tmp_path / f'results.{fmt}'), 20000 if fmt.endswith('.gz') else 2000
+    expected = [{name: row[name] for name in FIELDS} for row in rows(count)]
+    with open_writer(path, FIELDS, max_bytes=8 * 1024, batch_rows=100) as writer:
+        writer.write_rows(rows(count))
+    assert len(writer.paths) > 2 and writer.paths[:2] == [path, part_path(path, fmt, 1)]
+    assert writer.rows_written == count
+    parts = [read_part(p, fmt) for p in writer.paths]
+    assert all(parts) and [row for part in parts for row in part] == expected
+
+
+def test_without_max_bytes_there_is_one_file(tmp_path):
+    path = str(tmp_path / 'results.csv.gz')
+    with open_writer(path, FIELDS, batch_rows=10) as writer:
+        writer.write_rows(rows(500))
+        writer.write_row(['h', 'ping', 'SUCCESS', 'sequence row'])
+    assert writer.paths == [path]
+    assert read_part(path, 'csv.gz')[-1] == dict(zip(FIELDS, ['h', 'ping', 'SUCCESS', 'sequence row']))
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl.gz'])
+def test_empty_result_set_still_writes_a_file(tmp_path, fmt):
+    path = str(tmp_path / f'results.{fmt}')
+    assert open_writer(path, FIELDS).close() == [path]
+    assert read_part(path, fmt) == []
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(result_writers.ExportFormatError, match='Unknown export format'):
+        open_writer(str(tmp_path / 'results.xml'), FIELDS, fmt='xml')
+
+
+def test_zstd_parts(tmp_path):
+    zstandard = pytest.importorskip('zstandard')
+    path = str(tmp_path / 'results.csv.zst')
+    with open_writer(path, FIELDS, max_bytes=4 * 1024, batch_rows=100) as writer:
+        writer.write_rows(rows(10000))
+    total = 0
+    for part in writer.paths:
+        with open(part, 'rb') as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            lines = reader.read().decode('utf-8').splitlines()
+        assert lines[0] == ','.join(FIELDS)
+        total += len(lines) - 1
+    assert len(writer.paths) > 1 and total == 10000
+
+
+def test_parquet_parts(tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    path = str(tmp_path / 'results.parquet')
+    with open_writer(path, FIELDS, max_bytes=1, batch_rows=300, dictionary_columns=('Status', 'Unknown')) as writer:
+        writer.write_rows(rows(1000))
+    tables = [pyarrow.parquet.read_table(part) for part in writer.paths]
+    assert len(tables) == 4 and sum(table.num_rows for table in tables) == 1000
+    assert tables[0].column_names == FIELDS
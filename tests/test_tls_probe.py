@@ -0,0 +1,61 @@
+import ssl
+from datetime import datetime, timezone
+
+import pytest
+
+import tls_probe
+
+# Leaf certificate issued by a throwaway test CA: CN www.example.test, O Example Org,
+# SAN DNS:www.example.test, DNS:*.api.example.test, IP:192.0.2.10. notBefore is a UTCTime,
+# notAfter (2052) a GeneralizedTime.
+LEAF_PEM = """-----BEGIN CERTIFICATE-----
+MIIByDCCAW6gAwIBAgIUPXmHz7DdDHx+VqcwQcL2LXFXIBswCgYIKoZIzj0EAwIw
+GjEYMBYGA1UEAwwPRXhhbXBsZSBUZXN0IENBMCAXDTI2MTAxOTAyNTIzNVoYDzIw
+NTIxMDIyMDI1MjM1WjAxMRkwFwYDVQQDDBB3d3cuZXhhbXBsZS50ZXN0MRQwEgYD
+VQQKDAtFeGFtcGxlIE9yZzBZMBMGByqGSM49AgEGCCqGSM49AwEHA0IABFtg6Gz2
+iOQjy9Lh4irlK8zCeLK65iiG3hAwkakPgl3wESmPvNsfnBtdOc00/5iK5kEVyc11
+1luhyhogRemdILmjeTB3MDUGA1UdEQQuMCyCEHd3dy5leGFtcGxlLnRlc3SCEiou
+YXBpLmV4YW1wbGUudGVzdIcEwAACCjAdBgNVHQ4EFgQU65TQ4GYG2BG7jXIFLA02
+kBK0uL8wHwYDVR0jBBgwFoAU0ETht0y5HgHYANfFEplFJPb1EwQwCgYIKoZIzj0E
+AwIDSAAwRQIgduhLLs6IUSBFT7IUJWh434+qqUf8zoBgXQiRoxlajwYCIQC5c9ZL
+z2biixdQQBMNRJ2Y50JA3PA1DEi4Bw0s2ia/3A==
+-----END CERTIFICATE-----
+"""
+LEAF_DER = ssl.PEM_cert_to_DER_cert(LEAF_PEM)
+
+
+def test_der_fields():
+    info = tls_probe.CertInfo(LEAF_DER)
+    assert info.subject == 'www.example.test'
+    assert info.organization == 'Example Org'
+    assert info.issuer == 'Example Test CA'
+    assert info.san == ('www.example.test', '*.api.example.test', '192.0.2.10')
+    assert info.not_before == datetime(2026, 10, 19, 2, 52, 35, tzinfo=timezone.utc)
+    assert info.not_after == datetime(2052, 10, 22, 2, 52, 35, tzinfo=timezone.utc)
+    assert info.days_left(now=datetime(2052, 10, 21, 2, 52, 35, tzinfo=timezone.utc)) == 1
+
+
+@pytest.mark.parametrize('hostname, covered', [
+    ('www.example.test', True),
+    ('WWW.Example.Test.', True),
+    ('v1.api.example.test', True),
+    ('a.v1.api.example.test', False), # The wildcard covers one label only
+    ('api.example.test', False),
+    ('192.0.2.10', True),
+    ('192.0.2.11', False),
+    ('example.test', False),
+])
+def test_host_name_match(hostname, covered):
+    assert tls_probe.CertInfo(LEAF_DER).matches(hostname) is covered
+
+
+@pytest.mark.parametrize('der', [b'', b'\x30', b'\x30\x85\x01\x02\x03\x04\x05', LEAF_DER[:200], b'\x04\x03abc'])
+def test_malformed_der_raises_certificate_error(der):
+    with pytest.raises(tls_probe.CertificateError):
+        tls_probe.CertInfo(der)
+
+
+def test_cache_parses_each_certificate_once():
+    cache = tls_probe.CertCache(max_entries=1)
+    assert cache.get(LEAF_DER) is cache.get(LEAF_DER)
+    assert cache.stats() == {'certificates': 1, 'hits': 1, 'parsed': 1}
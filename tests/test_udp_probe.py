@@ -0,0 +1,137 @@
+import socket
+import struct
+import sys
+import threading
+import time
+
+import pytest
+
+import udp_probe
+from udp_probe import UdpRequest, _ber, _ber_int
+
+
+def dns_reply(token, rcode=0, answers=1, qr=True):
+    flags = (0x8180 if qr else 0x0100) | rcode
+    return token + struct.pack('>HHHHH', flags, 1, answers, 0, 0) + b'\x00\x00\x02\x00\x01'
+
+
+def ntp_timestamp(unix_time):
+    ntp_time = unix_time + 2208988800
+    return struct.pack('>II', int(ntp_time), int((ntp_time % 1) * 2 ** 32))
+
+
+def ntp_reply(originate, stratum=2, receive=0.0, transmit=0.0, mode=4):
+    return bytes([0x20 | mode, stratum]) + bytes(22) + originate + ntp_timestamp(receive) + ntp_timestamp(transmit)
+
+
+def snmp_reply(request_id, value=b'Linux edge01 5.15\nsecond line', error_status=0, community=b'public'):
+    varbind = _ber(0x30, _ber(0x06, udp_probe._SNMP_SYS_DESCR) + _ber(0x04, value))
+    pdu = _ber(0xa2, _ber_int(request_id) + _ber_int(error_status) + _ber_int(0) + _ber(0x30, varbind))
+    return _ber(0x30, _ber_int(1) + _ber(0x04, community) + pdu)
+
+
+@pytest.mark.parametrize('service, parsed', [
+    ('udp:9', ('udp', 9)), (' DNS:53 ', ('dns', 53)), ('ntp:123', ('ntp', 123)), ('snmp:161', ('snmp', 161)),
+    ('udp:0', None), ('udp:65536', None), ('dns', None), ('tcp:53', None), ('udp:x', None),
+])
+def test_parse_service(service, parsed):
+    assert udp_probe.parse_service(service) == parsed
+
+
+def test_dns_match_and_token():
+    request = UdpRequest('dns', '192.0.2.1', 53)
+    assert request.payload[:2] == request.token
+    reply = dns_reply(request.token, answers=2)
+    assert UdpRequest.reply_token('dns', reply) == request.token
+    assert request.match(reply, time.time()) == (True, "DNS reply NOERROR, 2 answer(s)")
+    assert request.match(dns_reply(request.token, rcode=3, answers=0), time.time()) == (True, "DNS reply NXDOMAIN, 0 answer(s)")
+    assert request.match(dns_reply(request.token, rcode=2, answers=0), time.time())[0] is False # SERVFAIL
+    other = bytes([request.token[0] ^ 0xff, request.token[1]])
+    assert request.match(dns_reply(other), time.time()) is None
+    assert request.match(dns_reply(request.token, qr=False), time.time()) is None # A query, not a reply
+    assert UdpRequest.reply_token('dns', b'\x00' * 11) is None
+
+
+def test_ntp_match_and_token():
+    request = UdpRequest('ntp', '192.0.2.1', 123)
+    assert request.payload[40:48] == request.token and len(request.payload) == 48
+    request.sent_wall = 1000.0
+    reply = ntp_reply(request.token, receive=1000.5, transmit=1000.5) # Server clock 0.5 s ahead, no delay
+    assert UdpRequest.reply_token('ntp', reply) == request.token
+    ok, details = request.match(reply, 1000.0)
+    assert ok and details == "NTP stratum 2, offset +500.0 ms"
+    assert request.match(ntp_reply(request.token, stratum=0), 1000.0) == (False, "NTP server unsynchronized (stratum 0)")
+    assert request.match(ntp_reply(request.token, mode=3), 1000.0) is None # Client mode: not a server reply
+    assert request.match(ntp_reply(bytes(8)), 1000.0) is None
+    assert UdpRequest.reply_token('ntp', reply[:47]) is None
+
+
+def test_snmp_match_and_token():
+    request = UdpRequest('snmp', '192.0.2.1', 161, community='private')
+    assert b'private' in request.payload
+    reply = snmp_reply(request.token)
+    assert UdpRequest.reply_token('snmp', reply) == request.token
+    assert request.match(reply, time.time()) == (True, "SNMP sysDescr: Linux edge01 5.15")
+    assert request.match(snmp_reply(request.token, error_status=2), time.time()) == (False, "SNMP error-status 2")
+    assert request.match(snmp_reply(request.token + 1), time.time()) is None
+    assert UdpRequest.reply_token('snmp', b'\x30\x05\x02\x01') is None # Truncated
+
+
+def test_plain_udp_matches_any_datagram():
+    request = UdpRequest('udp', '192.0.2.1', 7)
+    assert request.token is None
+    assert UdpRequest.reply_token('udp', b'hello') is None
+    assert request.match(b'hello', time.time()) == (True, "Port 7 answered (5 bytes)")
+
+
+def test_rekey_changes_the_token():
+    request = UdpRequest('dns', '192.0.2.1', 53)
+    tokens = {request.token}
+    for _ in range(5):
+        request.rekey()
+        tokens.add(request.token)
+        assert request.payload[:2] == request.token
+    assert len(tokens) > 1
+
+
+@pytest.fixture
+def echo_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(0.05)
+    yield sock
+    sock.close()
+
+
+def test_batch_against_local_ports(echo_port):
+    closed = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    closed.bind(('127.0.0.1', 0))
+    closed_port = closed.getsockname()[1]
+    closed.close() # Nothing listens there any more
+    port = echo_port.getsockname()[1]
+    stop = threading.Event()
+
+    def echo():
+        while not stop.is_set():
+            try:
+                data, source = echo_port.recvfrom(4096)
+            except OSError:
+                continue
+            echo_port.sendto(dns_reply(data[:2]), source)
+    thread = threading.Thread(target=echo, daemon=True)
+    thread.start()
+    try:
+        started = time.perf_counter()
+        results = udp_probe.run_batch([('127.0.0.1', f'dns:{port}'), ('localhost', f'DNS:{port}'),
+                                       ('127.0.0.1', f'udp:{closed_port}')], timeout=2)
+        elapsed = time.perf_counter() - started
+    finally:
+        stop.set()
+        thread.join()
+    assert results[('127.0.0.1', f'dns:{port}')]['Status'] == 'SUCCESS'
+    assert results[('localhost', f'dns:{port}')]['Details'] == "DNS reply NOERROR, 1 answer(s)"
+    closed_result = results[('127.0.0.1', f'udp:{closed_port}')]
+    assert closed_result['Status'] == 'FAILED'
+    if sys.platform.startswith('linux'): # ICMP port unreachable is read from the error queue
+        assert closed_result['Details'] == f"Port {closed_port} closed (ICMP port unreachable)"
+        assert elapsed < 1